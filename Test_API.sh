@@ -1,12 +1,12 @@
 export API_KEY="sk-YsqbaPD2sDcftsjdJG6FIA"
 
-# python utils/chat_gen_img.py
-# python utils/edit_img_from_prompt.py
-# python utils/gen_single_img.py
-# python utils/gen_video_async_from_btc.py
-# python utils/video_generator.py
-# python utils/text_to_speech_gemini_multi.py
-# python utils/text_to_speech_gemini_single.py
-# python utils/text_to_speech.py
+# python -m utils.chat_gen_img
+# python -m utils.edit_img_from_prompt
+# python -m utils.gen_single_img
+# python -m utils.gen_video_async_from_btc
+# python -m utils.video_generator
+# python -m utils.text_to_speech_gemini_multi
+# python -m utils.text_to_speech_gemini_single
+# python -m utils.text_to_speech
 
-python utils/text_to_speech_gemini_2_person.py
\ No newline at end of file
+python -m utils.text_to_speech_gemini_2_person
\ No newline at end of file
@@ -0,0 +1,215 @@
+"""
+So sánh utils/audio_post.stitch_wav() (NumPy vector hóa trên memmap) với một cài
+đặt "ngây thơ" xử lý từng mẫu bằng vòng lặp Python (kiểu script hậu xử lý cũ).
+
+Với mỗi cấu hình: ghép --segments đoạn giọng nói tổng hợp (PCM 16-bit mono
+24kHz, âm lượng khác nhau, khoảng lặng đầu/cuối) có tổng độ dài cho trước, đo:
+- thời gian của bản vector hóa và của bản ngây thơ (chỉ chạy với độ dài
+  <= --naive-max-minutes vì rất chậm), hệ số nhanh hơn;
+- đỉnh bộ nhớ Python cấp phát (tracemalloc) của bản vector hóa: không phụ
+  thuộc độ dài âm thanh. Mức tăng RSS có tính cả các trang của file đầu vào
+  được memmap (page cache, hệ điều hành thu hồi được), nên tăng theo kích
+  thước file dù bộ nhớ cấp phát không đổi;
+- chênh lệch lớn nhất giữa hai kết quả (tính theo mẫu int16, do làm tròn).
+
+Chạy từ thư mục gốc của dự án:
+    python benchmarks/audio_post.py
+    python benchmarks/audio_post.py --minutes 1,10,60 --crossfade-ms 40 --sample-rate 16000
+"""
+
+import argparse
+import array
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import wave
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from utils.audio_io import open_pcm_wav  # noqa: E402
+from utils.audio_post import stitch_wav  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+RATE = 24000
+
+
+def synthetic_segments(out_dir: str, minutes: float, segments: int, seed: int = 0) -> list:
+    """Các file WAV "giọng nói" tổng hợp: tiếng ồn điều biến, âm lượng khác nhau, có khoảng lặng đầu/cuối."""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    paths = []
+    frames_each = int(minutes * 60 * RATE / segments)
+    block = 1 << 20
+    for k in range(segments):
+        path = os.path.join(out_dir, f"segment_{k}.wav")
+        level = 10 ** (rng.uniform(-30, -6) / 20) * 32767
+        silence = int(rng.uniform(0.2, 0.8) * RATE)
+        with open_pcm_wav(path) as wf:
+            wf.writeframesraw(bytes(2 * silence))
+            for s in range(0, frames_each, block):
+                n = min(block, frames_each - s)
+                t = np.arange(s, s + n) / RATE
+                envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 3.1 * t)  # nhịp âm tiết
+                x = rng.standard_normal(n) * envelope * level / 3
+                wf.writeframesraw(np.clip(x, -32768, 32767).astype("<i2").tobytes())
+            wf.writeframesraw(bytes(2 * silence))
+        paths.append(path)
+    return paths
+
+
+# ---- Cài đặt ngây thơ: từng mẫu, list/array của Python ----
+
+def naive_stitch(inputs, output_path, silence_db=-50.0, keep_silence_ms=80.0, gap_ms=250.0, crossfade_ms=0.0,
+                 fade_ms=5.0, normalize="rms", target_db=None, peak_ceiling_db=-1.0, sample_rate=None):
+    if target_db is None and normalize:
+        target_db = {"peak": -1.0, "rms": -20.0}[normalize]
+    threshold = int(32768 * 10 ** (silence_db / 20))
+    ceiling = 32768 * 10 ** (peak_ceiling_db / 20)
+    segments = []
+    out_rate = sample_rate
+    for path in inputs:
+        with wave.open(path, "rb") as wf:
+            rate = wf.getframerate()
+            samples = array.array("h", wf.readframes(wf.getnframes()))
+        out_rate = out_rate or rate
+        loud = [i for i, v in enumerate(samples) if v > threshold or v < -threshold]
+        if not loud:
+            continue
+        keep = int(keep_silence_ms * rate / 1000)
+        samples = samples[max(0, loud[0] - keep):min(len(samples), loud[-1] + 1 + keep)]
+        gain = 1.0
+        if normalize:
+            peak = max(abs(v) for v in samples)
+            rms = math.sqrt(sum(v * v for v in samples) / len(samples))
+            if peak:
+                level = peak if normalize == "peak" else rms
+                gain = min(32768 * 10 ** (target_db / 20) / level, ceiling / peak)
+        if rate != out_rate:
+            step = rate / out_rate
+            frames = len(samples) * out_rate // rate
+            resampled = []
+            for j in range(frames):
+                p = j * step
+                i = int(p)
+                a = samples[i]
+                b = samples[min(i + 1, len(samples) - 1)]
+                resampled.append(a + (b - a) * (p - i))
+            samples = resampled
+        segments.append([v * gain for v in samples])
+
+    fade = int(fade_ms * out_rate / 1000)
+    overlap = int(crossfade_ms * out_rate / 1000)
+    gap = 0 if overlap else int(gap_ms * out_rate / 1000)
+    out = []
+    head = 0
+    for k, seg in enumerate(segments):
+        n = len(seg)
+        last = k == len(segments) - 1
+        hold = 0 if last or not overlap else min(overlap, n // 2, len(segments[k + 1]) // 2)
+        fade_in = min(fade, n // 2) if not head else 0
+        fade_out = min(fade, n // 2) if not hold else 0
+        for i in range(fade_in):
+            seg[i] *= (i + 0.5) / fade_in
+        for i in range(n - fade_out, n):
+            seg[i] *= 1 - (i - (n - fade_out) + 0.5) / fade_out
+        if k and gap:
+            out.extend([0.0] * gap)
+        if head:
+            tail = out[len(out) - head:]
+            del out[len(out) - head:]
+            for i in range(head):
+                t = (i + 0.5) / head * (math.pi / 2)
+                seg[i] = tail[i] * math.cos(t) + seg[i] * math.sin(t)
+        out.extend(seg)
+        head = hold
+    with open_pcm_wav(output_path, 1, 2, out_rate) as wf:
+        wf.writeframesraw(array.array("h", (max(-32768, min(32767, round(v))) for v in out)).tobytes())
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _max_diff(a_path: str, b_path: str) -> int:
+    import numpy as np
+
+    with wave.open(a_path) as a, wave.open(b_path) as b:
+        x = np.frombuffer(a.readframes(a.getnframes()), "<i2").astype(np.int32)
+        y = np.frombuffer(b.readframes(b.getnframes()), "<i2").astype(np.int32)
+    if len(x) != len(y):
+        return -1
+    return int(np.abs(x - y).max()) if len(x) else 0
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", default="1,10,60", help="Tổng độ dài âm thanh của các cấu hình, ví dụ 1,10,60")
+    parser.add_argument("--segments", type=int, default=12, help="Số đoạn được ghép")
+    parser.add_argument("--naive-max-minutes", type=float, default=1.0, help="Chỉ chạy bản ngây thơ tới độ dài này")
+    parser.add_argument("--normalize", choices=["rms", "peak", "none"], default="rms")
+    parser.add_argument("--crossfade-ms", type=float, default=0.0)
+    parser.add_argument("--gap-ms", type=float, default=250.0)
+    parser.add_argument("--sample-rate", type=int, default=None, help="Đổi tần số lấy mẫu đầu ra")
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    args = parser.parse_args(argv)
+
+    options = dict(normalize=None if args.normalize == "none" else args.normalize, crossfade_ms=args.crossfade_ms,
+                   gap_ms=args.gap_ms, sample_rate=args.sample_rate)
+    results = []
+    if not args.json:
+        print(f"{'phút':>6} {'numpy (s)':>10} {'ngây thơ (s)':>13} {'nhanh hơn':>10} {'alloc MB':>9} "
+              f"{'+RSS MB':>8} {'lệch':>5}")
+    for minutes in [float(m) for m in args.minutes.split(",")]:
+        with tempfile.TemporaryDirectory(prefix="audio-post-") as tmp_dir:
+            inputs = synthetic_segments(tmp_dir, minutes, args.segments)
+            out_fast = os.path.join(tmp_dir, "fast.wav")
+            rss_before = _peak_rss_mb()
+            start = time.perf_counter()
+            stitch_wav(inputs, out_fast, **options)
+            fast_s = time.perf_counter() - start
+            rss_after = _peak_rss_mb()
+
+            tracemalloc.start()
+            stitch_wav(inputs, os.path.join(tmp_dir, "traced.wav"), **options)
+            alloc_mb = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+
+            naive_s = diff = None
+            if minutes <= args.naive_max_minutes:
+                out_naive = os.path.join(tmp_dir, "naive.wav")
+                start = time.perf_counter()
+                naive_stitch(inputs, out_naive, **options)
+                naive_s = time.perf_counter() - start
+                diff = _max_diff(out_fast, out_naive)
+
+        r = {"minutes": minutes, "numpy_s": round(fast_s, 3), "naive_s": round(naive_s, 3) if naive_s else None,
+             "speedup": round(naive_s / fast_s, 1) if naive_s else None, "alloc_peak_mb": round(alloc_mb, 1),
+             "rss_growth_mb": round(rss_after - rss_before, 1) if rss_after is not None else None,
+             "max_diff": diff}
+        results.append(r)
+        if not args.json:
+            print(f"{minutes:6g} {fast_s:10.3f} {naive_s if naive_s else float('nan'):13.3f} "
+                  f"{r['speedup'] or float('nan'):9.1f}x {alloc_mb:9.1f} {r['rss_growth_mb'] or 0:8.1f} "
+                  f"{'-' if diff is None else diff:>5}", flush=True)
+    if args.json:
+        print(json.dumps({"options": options, "segments": args.segments, "results": results}, indent=2))
+    # Làm tròn float32/float64 khác nhau: lệch tối đa 1 mẫu int16 là bình thường
+    return 1 if any(r["max_diff"] is not None and not 0 <= r["max_diff"] <= 2 for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+Đo tác dụng của hedged request (utils/hedging.py) lên độ trễ đuôi.
+
+Server giả lập (benchmarks/mock_server.py, chạy trong thread nền) có độ trễ
+lognormal quanh --latency-ms, và --stall-rate request bị treo thêm --stall-ms
+(một replica quá tải). Với mỗi generator, chạy --requests lời gọi (tối đa
+--concurrency lời gọi cùng lúc) hai lần: tắt rồi bật hedging, mỗi lần sau
+--warmup lời gọi làm nóng (để hedging có đủ mẫu độ trễ) không tính vào kết
+quả. Báo p50/p95/p99/max (ms), tỉ lệ request gửi thêm và số lần bản sao về trước.
+
+Chạy từ thư mục gốc của dự án:
+    python benchmarks/hedging.py
+    python benchmarks/hedging.py --stall-rate 0.03 --percentile 90 --budget-ratio 0.1 --json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_server import add_config_arguments, config_from_args, start_mock_server  # noqa: E402
+from throughput import API_KEY, GENERATORS, ROOT, percentile  # noqa: E402
+
+
+HEDGED_GENERATORS = ("gemini_tts", "gemini_image")
+
+
+async def _run(fn, requests: int, concurrency: int, out_dir: str) -> list:
+    tag = uuid.uuid4().hex[:8]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = bool(await fn(i, out_dir, tag))
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return latencies
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--generators", default=",".join(HEDGED_GENERATORS),
+                        help=f"Danh sách generator ({', '.join(HEDGED_GENERATORS)})")
+    parser.add_argument("--requests", type=int, default=400, help="Số lời gọi được đo mỗi chế độ")
+    parser.add_argument("--warmup", type=int, default=40, help="Số lời gọi làm nóng (không tính)")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--percentile", type=float, default=95.0, help="Gửi bản sao sau phân vị độ trễ này")
+    parser.add_argument("--budget-ratio", type=float, default=0.05, help="Tỉ lệ request gửi thêm tối đa")
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    add_config_arguments(parser)
+    parser.set_defaults(latency_ms=200.0, latency_spread=0.25, stall_rate=0.02, stall_ms=2000.0,
+                        audio_seconds=2.0, image_px=256)
+    args = parser.parse_args(argv)
+
+    generators = [g.strip() for g in args.generators.split(",") if g.strip()]
+    unknown = [g for g in generators if g not in HEDGED_GENERATORS]
+    if unknown:
+        parser.error(f"generator không dùng hedging: {', '.join(unknown)}")
+
+    server, base_url = start_mock_server(config_from_args(args))
+    # Cấu hình trước khi import utils: server giả lập, không cache/nhật ký lâu dài
+    os.environ["API_BASE_URL"] = base_url
+    os.environ["API_KEY"] = API_KEY
+    os.environ["JOB_JOURNAL_PATH"] = ""
+    os.environ.pop("ARTIFACT_CACHE_DIR", None)
+    sys.path.insert(0, ROOT)
+
+    from utils.hedging import configure_hedging, disable_hedging, hedging_metrics, reset_hedging_metrics
+    from utils.http_client import close_http_client, configure_http_client, run_sync
+
+    configure_http_client(max_connections=max(args.concurrency * 4, 100))
+    results = []
+    if not args.json:
+        print(f"{'generator':14} {'hedging':>8} {'ok/req':>9} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} "
+              f"{'max (ms)':>9} {'thêm':>6} {'thắng':>6}")
+    try:
+        for generator in generators:
+            fn = GENERATORS[generator]
+            for hedged in (False, True):
+                if hedged:
+                    configure_hedging(percentile=args.percentile, budget_ratio=args.budget_ratio)
+                else:
+                    disable_hedging()
+                with tempfile.TemporaryDirectory(prefix="bench-hedge-") as out_dir, \
+                        open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                    run_sync(_run(fn, args.warmup, args.concurrency, out_dir))
+                    reset_hedging_metrics()
+                    latencies = run_sync(_run(fn, args.requests, args.concurrency, out_dir))
+                metrics = hedging_metrics()
+                r = {"generator": generator, "hedging": hedged, "requests": args.requests, "ok": len(latencies),
+                     **{f"p{q}_ms": round(percentile(latencies, q) * 1000, 1) for q in (50, 95, 99)},
+                     "max_ms": round(max(latencies, default=float("nan")) * 1000, 1),
+                     "extra_ratio": metrics["extra_ratio"], "hedge_wins": metrics["hedge_wins"],
+                     "budget_exhausted": metrics["budget_exhausted"]}
+                results.append(r)
+                if not args.json:
+                    print(f"{generator:14} {'bật' if hedged else 'tắt':>8} {r['ok']:>4}/{r['requests']:<4} "
+                          f"{r['p50_ms']:9.1f} {r['p95_ms']:9.1f} {r['p99_ms']:9.1f} {r['max_ms']:9.1f} "
+                          f"{r['extra_ratio']:6.1%} {r['hedge_wins']:6d}", flush=True)
+    finally:
+        disable_hedging()
+        close_http_client()
+        server.shutdown()
+
+    if args.json:
+        print(json.dumps({"mock": {k: getattr(args, k) for k in ("latency_ms", "latency_spread", "stall_rate",
+                                                                  "stall_ms")},
+                          "percentile": args.percentile, "budget_ratio": args.budget_ratio,
+                          "results": results}, indent=2))
+    return 1 if any(r["ok"] == 0 for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+"""
+Đo thời gian import các module trong utils/ và giữ "ngân sách" khởi động.
+
+Mỗi module được import trong một process Python mới (lặp lại --repeat lần,
+lấy trung vị) để đo đúng chi phí khởi động của một worker. Script thất bại
+(exit code 1) khi:
+- thời gian import vượt --budget-ms, hoặc
+- việc import kéo theo một thư viện nặng (cv2, matplotlib, PIL, numpy) —
+  các thư viện này chỉ được nạp khi một đường code thực sự cần tới.
+
+Chạy từ thư mục gốc của dự án:
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --budget-ms 300 --repeat 9
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+MODULES = [
+    "utils",
+    "utils.__main__",
+    "utils.http_client",
+    "utils.rate_limit",
+    "utils.hedging",
+    "utils.routing",
+    "utils.instrumentation",
+    "utils.artifact_cache",
+    "utils.job_journal",
+    "utils.single_flight",
+    "utils.image_prep",
+    "utils.file_refs",
+    "utils.tts_stream",
+    "utils.audio_post",
+    "utils.text_to_speech_gemini_single",
+    "utils.text_to_speech_gemini_multi",
+    "utils.text_to_speech_gemini_2_person",
+    "utils.text_to_speech",
+    "utils.edit_img_from_prompt",
+    "utils.gen_single_img",
+    "utils.chat_gen_img",
+    "utils.video_generator",
+    "utils.gen_video_async_from_btc",
+    "utils.veo_batch",
+]
+
+HEAVY_MODULES = ["cv2", "matplotlib", "PIL", "numpy"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(module: str, repeat: int) -> dict:
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    samples, heavy = [], set()
+    for _ in range(repeat):
+        out = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, heavy=HEAVY_MODULES)],
+            cwd=root, capture_output=True, text=True, check=True,
+        )
+        result = json.loads(out.stdout.strip().splitlines()[-1])
+        samples.append(result["ms"])
+        heavy.update(result["heavy"])
+    return {"module": module, "median_ms": statistics.median(samples), "heavy": sorted(heavy)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--budget-ms", type=float, default=500.0, help="Thời gian import tối đa cho mỗi module")
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần đo mỗi module")
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    args = parser.parse_args(argv)
+
+    results = [measure(module, args.repeat) for module in MODULES]
+    failed = [r for r in results if r["median_ms"] > args.budget_ms or r["heavy"]]
+
+    if args.json:
+        print(json.dumps({"budget_ms": args.budget_ms, "results": results}, indent=2))
+    else:
+        print(f"{'module':40} {'median (ms)':>12}  thư viện nặng")
+        for r in results:
+            mark = "❌" if r in failed else "✅"
+            print(f"{r['module']:40} {r['median_ms']:12.1f}  {', '.join(r['heavy']) or '-'} {mark}")
+        print(f"\nNgân sách: {args.budget_ms:.0f} ms/module, {len(failed)} module vượt ngưỡng")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,255 @@
+"""
+Micro-benchmark các đường xử lý cục bộ (không qua mạng) của utils/ và so với baseline.
+
+Mỗi phép đo chạy trên dữ liệu tổng hợp có kích thước thực tế:
+- inline_decode    : InlineDataDecoder giải mã inlineData (PCM 24kHz 16-bit mono) theo từng đoạn 64 KB
+- b64decode        : base64.b64decode cả chuỗi một lần (như b64_json của /images/generations)
+- wav_write        : open_pcm_wav() + writeframesraw() theo từng đoạn 64 KB
+- image_save       : save_image_bytes() PNG -> .png (ghi nguyên bytes)
+- image_transcode  : save_image_bytes() PNG -> .jpg (Pillow; bỏ qua nếu chưa cài)
+- image_payload    : đọc ảnh + base64 + json.dumps payload generateContent/predictLongRunning
+- image_prep       : prepare_input_image() PNG -> JPEG 1280x720 cho image-to-video (Pillow; không qua cache)
+- audio_stitch     : stitch_wav() ghép 12 đoạn WAV (cắt lặng, chuẩn hóa RMS, khoảng lặng giữa đoạn; NumPy)
+với âm thanh 1/10/60 phút và ảnh 1/4 MP (--quick: bỏ các kích thước lớn nhất).
+
+Với mỗi phép đo: thời gian trung vị của --repeat lần chạy, và đỉnh bộ nhớ Python
+được cấp phát thêm (tracemalloc, đo ở một lần chạy riêng để không làm sai thời gian).
+
+So với baseline đã lưu (benchmarks/micro_baseline.json): script thất bại (exit
+code 1) khi một phép đo chậm hơn baseline quá --time-tolerance hoặc cấp phát
+nhiều hơn quá --memory-tolerance. Thời gian phụ thuộc máy: tạo lại baseline
+trên máy của bạn trước khi so sánh.
+
+Chạy từ thư mục gốc của dự án:
+    python benchmarks/micro.py                    # so với baseline
+    python benchmarks/micro.py --save-baseline    # ghi baseline mới
+    python benchmarks/micro.py --quick --only wav_write,inline_decode
+"""
+
+import argparse
+import base64
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_server import random_bytes, synthetic_png  # noqa: E402
+from utils.audio_io import open_pcm_wav  # noqa: E402
+from utils.inline_data_stream import InlineDataDecoder  # noqa: E402
+from utils.media_sink import save_image_bytes  # noqa: E402
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "micro_baseline.json")
+AUDIO_MINUTES = [1, 10, 60]
+IMAGE_MEGAPIXELS = [1, 4]
+CHUNK = 64 * 1024
+
+
+def _pcm(minutes: int) -> bytes:
+    return random_bytes(minutes * 60 * 24000 * 2, random.Random(minutes))
+
+
+def _png(megapixels: int) -> bytes:
+    return synthetic_png(int((megapixels * 1_000_000) ** 0.5), random.Random(megapixels))
+
+
+def _chunks(data: bytes):
+    view = memoryview(data)
+    return [view[i:i + CHUNK] for i in range(0, len(data), CHUNK)]
+
+
+# ---- Các phép đo: setup(size, tmp_dir) trả về hàm không tham số cần đo ----
+
+def setup_inline_decode(minutes, tmp_dir):
+    body = (b'{"candidates": [{"content": {"parts": [{"inlineData": {"mimeType": "audio/L16;codec=pcm;rate=24000", '
+            b'"data": "' + base64.b64encode(_pcm(minutes)) + b'"}}]}}]}')
+    chunks = _chunks(body)
+
+    def run():
+        decoder = InlineDataDecoder()
+        for chunk in chunks:
+            decoder.feed(bytes(chunk))  # httpx trả về bytes, không phải memoryview
+        decoder.close()
+    return run
+
+
+def setup_b64decode(minutes, tmp_dir):
+    encoded = base64.b64encode(_pcm(minutes)).decode("ascii")
+    return lambda: base64.b64decode(encoded)
+
+
+def setup_wav_write(minutes, tmp_dir):
+    chunks = _chunks(_pcm(minutes))
+    path = os.path.join(tmp_dir, "out.wav")
+
+    def run():
+        with open_pcm_wav(path) as wf:
+            for chunk in chunks:
+                wf.writeframesraw(chunk)
+    return run
+
+
+def setup_image_save(megapixels, tmp_dir):
+    data = _png(megapixels)
+    path = os.path.join(tmp_dir, "out.png")
+    return lambda: save_image_bytes(data, path)
+
+
+def setup_image_transcode(megapixels, tmp_dir):
+    import PIL  # noqa: F401  (ImportError -> phép đo bị bỏ qua)
+    data = _png(megapixels)
+    path = os.path.join(tmp_dir, "out.jpg")
+    return lambda: save_image_bytes(data, path)
+
+
+def setup_image_payload(megapixels, tmp_dir):
+    from utils.media_sink import ImageData
+    path = os.path.join(tmp_dir, "input.png")
+    with open(path, "wb") as f:
+        f.write(_png(megapixels))
+
+    def run():
+        with open(path, "rb") as f:
+            img_base64 = ImageData(f.read(), "image/png").base64()
+        json.dumps({"instances": [{"prompt": "p", "image": {"bytesBase64Encoded": img_base64,
+                                                            "mimeType": "image/png"}}], "parameters": {}})
+        json.dumps({"contents": [{"parts": [{"text": "p"}, {"inline_data": {"mime_type": "image/png",
+                                                                            "data": img_base64}}]}]})
+    return run
+
+
+def setup_image_prep(megapixels, tmp_dir):
+    import PIL  # noqa: F401  (ImportError -> phép đo bị bỏ qua)
+    from utils.image_prep import _process, video_target
+    data = _png(megapixels)
+    target = video_target()
+    return lambda: _process(data, target)
+
+
+def setup_audio_stitch(minutes, tmp_dir):
+    from audio_post import synthetic_segments  # ImportError nếu chưa cài numpy -> bỏ qua
+    from utils.audio_post import stitch_wav
+    inputs = synthetic_segments(tmp_dir, minutes, 12)
+    path = os.path.join(tmp_dir, "episode.wav")
+    return lambda: stitch_wav(inputs, path)
+
+
+CASES = {
+    "inline_decode": (setup_inline_decode, AUDIO_MINUTES, "min"),
+    "b64decode": (setup_b64decode, AUDIO_MINUTES, "min"),
+    "wav_write": (setup_wav_write, AUDIO_MINUTES, "min"),
+    "image_save": (setup_image_save, IMAGE_MEGAPIXELS, "MP"),
+    "image_transcode": (setup_image_transcode, IMAGE_MEGAPIXELS, "MP"),
+    "image_payload": (setup_image_payload, IMAGE_MEGAPIXELS, "MP"),
+    "image_prep": (setup_image_prep, IMAGE_MEGAPIXELS, "MP"),
+    "audio_stitch": (setup_audio_stitch, AUDIO_MINUTES, "min"),
+}
+
+
+def measure(run, repeat: int) -> dict:
+    run()  # làm nóng (import lười, cache của hệ điều hành)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"ms": statistics.median(samples) * 1000, "alloc_peak_mb": peak / (1024 * 1024)}
+
+
+def compare(result: dict, baseline: dict, time_tolerance: float, memory_tolerance: float) -> list:
+    """Các lý do hồi quy của một phép đo so với baseline (rỗng = đạt)."""
+    problems = []
+    if result["ms"] > baseline["ms"] * (1 + time_tolerance):
+        problems.append(f"thời gian {result['ms']:.1f} ms > {baseline['ms']:.1f} ms × {1 + time_tolerance:g}")
+    # Cộng thêm 1 MB để các phép đo cấp phát rất ít không báo lỗi vì nhiễu
+    limit = baseline["alloc_peak_mb"] * (1 + memory_tolerance) + 1
+    if result["alloc_peak_mb"] > limit:
+        problems.append(f"cấp phát {result['alloc_peak_mb']:.1f} MB > {limit:.1f} MB")
+    return problems
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", default=None, help=f"Chỉ chạy các phép đo này ({', '.join(CASES)})")
+    parser.add_argument("--quick", action="store_true", help="Bỏ kích thước lớn nhất của mỗi phép đo")
+    parser.add_argument("--repeat", type=int, default=5, help="Số lần đo mỗi phép đo")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="File baseline JSON")
+    parser.add_argument("--save-baseline", action="store_true", help="Ghi kết quả làm baseline mới")
+    parser.add_argument("--time-tolerance", type=float, default=0.5, help="Chậm hơn baseline tối đa (0.5 = 50%%)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.2, help="Cấp phát nhiều hơn baseline tối đa")
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    args = parser.parse_args(argv)
+
+    names = args.only.split(",") if args.only else list(CASES)
+    unknown = [n for n in names if n not in CASES]
+    if unknown:
+        parser.error(f"phép đo không tồn tại: {', '.join(unknown)}")
+
+    baseline = {}
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+
+    results, failed = {}, []
+    if not args.json:
+        print(f"{'phép đo':26} {'ms':>10} {'baseline':>10} {'alloc MB':>9} {'baseline':>9}")
+    with tempfile.TemporaryDirectory(prefix="micro-") as tmp_dir:
+        for name in names:
+            setup, sizes, unit = CASES[name]
+            for size in (sizes[:-1] if args.quick else sizes):
+                key = f"{name}[{size}{unit}]"
+                try:
+                    run = setup(size, tmp_dir)
+                except ImportError as e:
+                    if not args.json:
+                        print(f"{key:26} bỏ qua ({e})")
+                    continue
+                result = results[key] = measure(run, args.repeat)
+                base = baseline.get(key)
+                problems = compare(result, base, args.time_tolerance, args.memory_tolerance) if base else []
+                if problems:
+                    failed.append((key, problems))
+                if not args.json:
+                    mark = "❌" if problems else ("✅" if base else "(mới)")
+                    print(f"{key:26} {result['ms']:10.1f} {base['ms'] if base else float('nan'):10.1f} "
+                          f"{result['alloc_peak_mb']:9.1f} {base['alloc_peak_mb'] if base else float('nan'):9.1f} {mark}",
+                          flush=True)
+                del run
+
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "machine": platform.machine(),
+                       "results": {k: {m: round(v, 2) for m, v in r.items()} for k, r in results.items()}},
+                      f, indent=2)
+            f.write("\n")
+
+    if args.json:
+        print(json.dumps({"results": results, "regressions": dict(failed)}, indent=2))
+    else:
+        for key, problems in failed:
+            print(f"❌ {key}: {'; '.join(problems)}")
+        if args.save_baseline:
+            print(f"\nĐã ghi baseline: {args.baseline}")
+        elif baseline:
+            print(f"\n{len(failed)} phép đo hồi quy so với baseline")
+        else:
+            print(f"\nChưa có baseline ({args.baseline}); tạo bằng --save-baseline")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
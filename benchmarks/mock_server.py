@@ -0,0 +1,485 @@
+"""
+Server giả lập api.thucchien.ai để đo hiệu năng phía client mà không cần API key hay mạng.
+
+Cài đặt các endpoint mà utils/ dùng, với phản hồi đúng định dạng:
+- POST /audio/speech                                   -> bytes âm thanh (audio/wav)
+- POST /images/generations                             -> {"data": [{"b64_json": ...}] * n}
+- POST /chat/completions                               -> ảnh dạng data URL trong choices[0].message.images
+- POST /gemini/v1beta/models/<model>:generateContent   -> inlineData âm thanh (khi payload có
+                                                          speechConfig / responseModalities AUDIO) hoặc ảnh PNG
+- POST /gemini/v1beta/models/<model>:streamGenerateContent?alt=sse
+                                                       -> SSE, âm thanh chia thành --stream-chunks sự kiện
+                                                          (chunked), độ trễ của request rải đều giữa các sự kiện;
+                                                          --stream-error-after chèn sự kiện lỗi giữa stream,
+                                                          --stream-json trả mảng JSON thay vì SSE
+- POST /gemini/v1beta/models/<model>:predictLongRunning -> {"name": "models/<model>/operations/<id>"}
+- GET  /gemini/v1beta/models/<model>/operations/<id>   -> done sau --video-seconds giây
+- GET  /gemini/download/v1beta/files/<id>:download     -> video (hỗ trợ Range trừ khi --no-video-ranges,
+                                                          ETag; --download-drop-rate cắt ngang phản hồi)
+- POST /gemini/upload/v1beta/files                     -> {"file": {"name", "uri", "expirationTime", ...}};
+                                                          generateContent/chat trả 400 với file URI
+                                                          chưa tải lên hoặc đã hết hạn (--file-ttl)
+- GET  /__stats                                        -> số request theo route, lỗi/treo đã chèn
+
+Kích thước phản hồi, phân bố độ trễ (kèm tỉ lệ request bị treo thêm
+--stall-ms để tạo đuôi dài), tỉ lệ lỗi 500 và 429 (kèm Retry-After) và các
+route luôn trả 503 (--degraded-routes, thử utils/routing.py) đều cấu hình được;
+--tts-ms-per-char làm TTS chậm dần theo độ dài văn bản như API thật. Phản hồi được dựng sẵn một lần lúc khởi động để server tốn
+ít CPU nhất có thể (thời gian đo được là của phía client).
+
+Chạy riêng (API key bất kỳ):
+    python benchmarks/mock_server.py --port 8900 --latency-ms 300 --error-rate 0.02 --rate-limit-rate 0.05
+    API_BASE_URL=http://127.0.0.1:8900 python -m utils tts "Xin chào" -o logs/hello.wav
+
+Hoặc dùng trong code (chạy trong thread nền):
+    server, base_url = start_mock_server(MockConfig(latency_ms=100))
+    ...
+    server.shutdown()
+"""
+
+import argparse
+import base64
+import json
+import math
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+from urllib.parse import urlsplit
+
+
+_OPERATION = re.compile(r"^/gemini/v1beta/(models/[^/]+/operations/[^/]+)$")
+_DOWNLOAD = re.compile(r"^/gemini/download/v1beta/files/([^/:]+):download$")
+_RANGE = re.compile(r"bytes=(\d+)-(\d*)$")
+
+
+@dataclass
+class MockConfig:
+    latency_ms: float = 50.0            # độ trễ trung vị của mỗi request
+    latency_dist: str = "lognormal"     # fixed | uniform | lognormal
+    latency_spread: float = 0.5         # uniform: ±spread×latency; lognormal: sigma
+    stall_rate: float = 0.0             # tỉ lệ request bị treo thêm stall_ms (đuôi độ trễ dài)
+    stall_ms: float = 2000.0
+    degraded_routes: str = ""           # route (hoặc route@model) luôn trả 503, cách nhau bởi dấu phẩy
+    error_rate: float = 0.0             # tỉ lệ phản hồi 500
+    rate_limit_rate: float = 0.0        # tỉ lệ phản hồi 429
+    retry_after: float = 1.0            # Retry-After (giây) của phản hồi 429
+    audio_seconds: float = 5.0          # độ dài âm thanh (PCM 16-bit mono 24kHz)
+    tts_ms_per_char: float = 0.0        # generateContent âm thanh: thêm chừng này ms cho mỗi ký tự văn bản
+    image_px: int = 512                 # cạnh ảnh PNG (RGB nhiễu, gần như không nén được)
+    video_mb: float = 8.0               # kích thước video
+    video_seconds: float = 3.0          # thời gian "sinh" video
+    video_ranges: bool = True           # tải video hỗ trợ Range (False: luôn trả cả file với 200)
+    download_drop_rate: float = 0.0     # tỉ lệ phản hồi tải video bị ngắt kết nối sau nửa body
+    file_ttl: float = 48 * 3600.0       # thời hạn của file tải lên qua route upload
+    stream_chunks: int = 10             # số sự kiện SSE của streamGenerateContent
+    stream_error_after: Optional[int] = None  # gửi sự kiện lỗi sau chừng này sự kiện âm thanh (None: không)
+    stream_json: bool = False           # streamGenerateContent trả một mảng JSON (như proxy bỏ qua alt=sse)
+    seed: Optional[int] = None
+
+
+class MockState:
+    """Phản hồi dựng sẵn, các operation đang chạy và thống kê request."""
+
+    def __init__(self, config: MockConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.lock = threading.Lock()
+        self.operations = {}  # operation name -> (thời điểm tạo, video id)
+        self.files = {}       # file URI -> thời điểm hết hạn
+        self.stats = {"requests": {}, "errors_injected": 0, "rate_limited": 0, "stalled": 0, "degraded": 0,
+                      "downloads_dropped": 0}
+
+        pcm = random_bytes(int(config.audio_seconds * 24000) * 2, self.random)
+        self.pcm_b64 = base64.b64encode(pcm).decode("ascii")
+        step = -(-len(pcm) // max(config.stream_chunks, 1)) // 2 * 2 or 2  # chia đúng biên mẫu 16-bit
+        self.pcm_stream_b64 = [base64.b64encode(pcm[i:i + step]).decode("ascii") for i in range(0, len(pcm), step)]
+        self.wav = _wav(pcm, 24000)
+        self.png = synthetic_png(config.image_px, self.random)
+        self.png_b64 = base64.b64encode(self.png).decode("ascii")
+        self.video = random_bytes(int(config.video_mb * 1024 * 1024), self.random)
+        self.video_etag = f'"{zlib.crc32(self.video):08x}"'
+
+    def count(self, route: str) -> None:
+        with self.lock:
+            self.stats["requests"][route] = self.stats["requests"].get(route, 0) + 1
+
+    def latency(self) -> float:
+        c = self.config
+        with self.lock:
+            if c.latency_dist == "fixed":
+                ms = c.latency_ms
+            elif c.latency_dist == "uniform":
+                ms = c.latency_ms * (1 + self.random.uniform(-c.latency_spread, c.latency_spread))
+            else:
+                ms = self.random.lognormvariate(math.log(max(c.latency_ms, 1e-3)), c.latency_spread)
+            if c.stall_rate and self.random.random() < c.stall_rate:
+                ms += c.stall_ms
+                self.stats["stalled"] += 1
+        return max(ms, 0.0) / 1000
+
+    def fault(self, route: str, model: Optional[str] = None) -> Optional[int]:
+        """Mã lỗi được chèn cho request này (429/500, 503 nếu route bị đánh dấu xuống cấp) hoặc None."""
+        degraded = {name.strip() for name in self.config.degraded_routes.split(",")}
+        with self.lock:
+            if route in degraded or f"{route}@{model}" in degraded:
+                self.stats["degraded"] += 1
+                return 503
+            x = self.random.random()
+            if x < self.config.rate_limit_rate:
+                self.stats["rate_limited"] += 1
+                return 429
+            if x < self.config.rate_limit_rate + self.config.error_rate:
+                self.stats["errors_injected"] += 1
+                return 500
+        return None
+
+    def drop_download(self) -> bool:
+        """Có cắt ngang phản hồi tải video này không (theo download_drop_rate)."""
+        with self.lock:
+            if self.config.download_drop_rate and self.random.random() < self.config.download_drop_rate:
+                self.stats["downloads_dropped"] += 1
+                return True
+        return False
+
+    def create_operation(self, model: str) -> str:
+        name = f"models/{model}/operations/{uuid.uuid4().hex[:16]}"
+        with self.lock:
+            self.operations[name] = (time.time(), uuid.uuid4().hex[:12])
+        return name
+
+    def create_file(self, size: int, mime_type: str) -> dict:
+        file_id = uuid.uuid4().hex[:12]
+        uri = f"https://generativelanguage.googleapis.com/v1beta/files/{file_id}"
+        expires_at = time.time() + self.config.file_ttl
+        with self.lock:
+            self.files[uri] = expires_at
+        return {"name": f"files/{file_id}", "uri": uri, "mimeType": mime_type, "sizeBytes": str(size),
+                "state": "ACTIVE", "expirationTime": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(expires_at))}
+
+    def file_usable(self, uri: str) -> bool:
+        with self.lock:
+            return self.files.get(uri, 0) > time.time()
+
+    def operation(self, name: str) -> Optional[dict]:
+        with self.lock:
+            entry = self.operations.get(name)
+        if entry is None:
+            return None
+        created_at, video_id = entry
+        if time.time() - created_at < self.config.video_seconds:
+            return {"name": name, "done": False}
+        uri = f"https://generativelanguage.googleapis.com/v1beta/files/{video_id}:download?alt=media"
+        return {"name": name, "done": True, "response": {
+            "generateVideoResponse": {"generatedSamples": [{"video": {"uri": uri}}]}}}
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, giống API thật
+    server_version = "litellm-note-mock"
+
+    @property
+    def state(self) -> MockState:
+        return self.server.state
+
+    def log_message(self, format, *args):  # không in log mỗi request
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("content-length") or 0))
+        path = urlsplit(self.path).path
+        if path == "/gemini/upload/v1beta/files":
+            return self._serve("upload", lambda: self._upload(body))
+        try:
+            payload = json.loads(body or b"{}")
+        except ValueError:
+            return self._json(400, {"error": {"message": "invalid JSON"}})
+
+        if path == "/audio/speech":
+            return self._serve("audio/speech", lambda: self._bytes(200, self.state.wav, "audio/wav"),
+                               model=payload.get("model"))
+        if path == "/images/generations":
+            n = int(payload.get("n") or 1)
+            return self._serve("images/generations", lambda: self._json_text(
+                '{"data": [' + ", ".join(['{"b64_json": "%s"}' % self.state.png_b64] * n) + "]}"),
+                model=payload.get("model"))
+        missing = [uri for uri in _file_uris(payload) if not self.state.file_usable(uri)]
+        if missing:
+            self.state.count("file_rejected")
+            return self._json(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT",
+                                              "message": f"File {missing[0]} not found or expired"}})
+        if path == "/chat/completions":
+            return self._serve("chat/completions", lambda: self._json_text(
+                '{"choices": [{"message": {"role": "assistant", "images": [{"type": "image_url", '
+                '"image_url": {"url": "data:image/png;base64,%s"}}]}}]}' % self.state.png_b64),
+                model=payload.get("model"))
+        m = re.match(r"^/gemini/v1beta/models/([^/:]+):(generateContent|predictLongRunning|streamGenerateContent)$",
+                     path)
+        if m and m.group(2) == "streamGenerateContent":
+            return self._serve("streamGenerateContent", self._audio_events, delay=False)
+        if m and m.group(2) == "generateContent":
+            extra = 0.0
+            if _wants_audio(payload):
+                mime, data = "audio/L16;codec=pcm;rate=24000", self.state.pcm_b64
+                extra = self.state.config.tts_ms_per_char * _text_chars(payload) / 1000
+            else:
+                mime, data = "image/png", self.state.png_b64
+            return self._serve("generateContent", lambda: self._json_text(
+                '{"candidates": [{"content": {"role": "model", "parts": [{"inlineData": '
+                '{"mimeType": "%s", "data": "%s"}}]}, "finishReason": "STOP"}]}' % (mime, data)),
+                model=m.group(1), extra_delay=extra)
+        if m:
+            return self._serve("predictLongRunning", lambda: self._json(
+                200, {"name": self.state.create_operation(m.group(1))}))
+        self._json(404, {"error": {"message": f"unknown route {path}"}})
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == "/__stats":
+            with self.state.lock:
+                return self._json(200, self.state.stats)
+        m = _OPERATION.match(path)
+        if m:
+            def poll():
+                operation = self.state.operation(m.group(1))
+                if operation is None:
+                    return self._json(404, {"error": {"code": 404, "message": "operation not found"}})
+                self._json(200, operation)
+            return self._serve("operations", poll)
+        if _DOWNLOAD.match(path):
+            return self._serve("download", self._video)
+        self._json(404, {"error": {"message": f"unknown route {path}"}})
+
+    def _serve(self, route: str, respond, delay: bool = True, model: Optional[str] = None,
+               extra_delay: float = 0.0) -> None:
+        self.state.count(route)
+        if delay:
+            time.sleep(self.state.latency() + extra_delay)
+        status = self.state.fault(route, model)
+        if status == 429:
+            self.send_response(429)
+            body = b'{"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}'
+            self.send_header("Retry-After", f"{self.state.config.retry_after:g}")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        elif status:
+            self._json(status, {"error": {"code": status, "status": "UNAVAILABLE" if status == 503 else "INTERNAL"}})
+        else:
+            respond()
+
+    def _upload(self, body: bytes) -> None:
+        # multipart/related: phần 1 là metadata JSON, phần 2 là nội dung file
+        m = re.search(rb"boundary=([^;\s]+)", self.headers.get("content-type", "").encode())
+        parts = body.split(b"--" + m.group(1)) if m else []
+        if len(parts) < 3:
+            return self._json(400, {"error": {"code": 400, "message": "expected multipart/related upload"}})
+        head, _, content = parts[2].partition(b"\r\n\r\n")
+        mime = re.search(rb"content-type:\s*([^\r\n]+)", head, re.I)
+        self._json(200, {"file": self.state.create_file(len(content) - 2, mime.group(1).decode() if mime else
+                                                       "application/octet-stream")})
+
+    def _audio_events(self) -> None:
+        # Như generateContent nhưng mỗi đoạn âm thanh được gửi ngay khi "sinh" xong
+        chunks = self.state.pcm_stream_b64
+        events = ['{"candidates": [{"content": {"role": "model", "parts": [{"inlineData": {"mimeType": '
+                  '"audio/L16;codec=pcm;rate=24000", "data": "%s"}}]}%s}]}'
+                  % (data, ', "finishReason": "STOP"' if i == len(chunks) - 1 else "")
+                  for i, data in enumerate(chunks)]
+        error_after = self.state.config.stream_error_after
+        if error_after is not None:
+            events[error_after:] = ['{"error": {"code": 500, "message": "Internal error encountered.", '
+                                    '"status": "INTERNAL"}}']
+        if self.state.config.stream_json:
+            time.sleep(self.state.latency())
+            return self._json_text("[" + ", ".join(events) + "]")
+        pause = self.state.latency() / len(events)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for event in events:
+                time.sleep(pause)
+                data = b"data: %s\r\n\r\n" % event.encode()
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):  # client dừng stream giữa chừng
+            self.close_connection = True
+
+    def _video(self) -> None:
+        video = self.state.video
+        ranges = self.state.config.video_ranges
+        m = _RANGE.match(self.headers.get("range", "")) if ranges else None
+        if not m:
+            return self._bytes(200, video, "video/mp4",
+                               {"ETag": self.state.video_etag, **({"Accept-Ranges": "bytes"} if ranges else {})},
+                               drop=self.state.drop_download())
+        start = int(m.group(1))
+        end = min(int(m.group(2)) if m.group(2) else len(video) - 1, len(video) - 1)
+        if start >= len(video) or start > end:
+            return self._bytes(416, b"", "video/mp4", {"Content-Range": f"bytes */{len(video)}"})
+        self._bytes(206, memoryview(video)[start:end + 1], "video/mp4", {
+            "Content-Range": f"bytes {start}-{end}/{len(video)}", "ETag": self.state.video_etag,
+            "Accept-Ranges": "bytes"}, drop=self.state.drop_download())
+
+    def _json(self, status: int, data) -> None:
+        self._bytes(status, json.dumps(data).encode(), "application/json")
+
+    def _json_text(self, text: str) -> None:
+        self._bytes(200, text.encode("ascii"), "application/json")
+
+    def _bytes(self, status: int, body, content_type: str, headers: Optional[dict] = None,
+               drop: bool = False) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if drop:
+            # Rớt mạng giữa chừng: gửi nửa đầu body rồi đóng kết nối
+            self.wfile.write(body[:len(body) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+        self.wfile.write(body)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address: Tuple[str, int], config: MockConfig):
+        self.state = MockState(config)
+        super().__init__(address, MockHandler)
+
+    def handle_error(self, request, client_address) -> None:
+        # Client hủy request giữa chừng (hedged request thua, timeout): không phải lỗi của server
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+
+def start_mock_server(config: Optional[MockConfig] = None, host: str = "127.0.0.1",
+                      port: int = 0) -> Tuple[MockServer, str]:
+    """Chạy server trong thread nền; trả về (server, base_url). Dừng bằng server.shutdown()."""
+    server = MockServer((host, port), config or MockConfig())
+    threading.Thread(target=server.serve_forever, name="mock-api", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def _file_uris(payload: dict) -> list:
+    """File URI mà payload tham chiếu (file_data của Gemini, image_url có "format" của chat)."""
+    uris = []
+    for content in payload.get("contents") or []:
+        for part in content.get("parts") or []:
+            data = part.get("file_data") or part.get("fileData")
+            if data:
+                uris.append(data.get("file_uri") or data.get("fileUri"))
+    for message in payload.get("messages") or []:
+        for part in message.get("content") if isinstance(message.get("content"), list) else []:
+            url = (part.get("image_url") or {}).get("url", "")
+            if url.startswith("https://"):
+                uris.append(url)
+    return uris
+
+
+def _wants_audio(payload: dict) -> bool:
+    config = payload.get("generationConfig") or payload.get("generation_config") or {}
+    modalities = [m.upper() for m in config.get("responseModalities") or config.get("response_modalities") or []]
+    return "AUDIO" in modalities or "speechConfig" in config or "speech_config" in config
+
+
+def _text_chars(payload: dict) -> int:
+    return sum(len(part.get("text") or "") for content in payload.get("contents") or ()
+               for part in content.get("parts") or ())
+
+
+def random_bytes(size: int, rng: random.Random) -> bytes:
+    return rng.randbytes(size) if hasattr(rng, "randbytes") else bytes(rng.getrandbits(8) for _ in range(size))
+
+
+def _wav(pcm: bytes, sample_rate: int) -> bytes:
+    header = struct.pack("<4sI4s4sIHHIIHH4sI", b"RIFF", 36 + len(pcm), b"WAVE", b"fmt ", 16, 1, 1,
+                         sample_rate, sample_rate * 2, 2, 16, b"data", len(pcm))
+    return header + pcm
+
+
+def synthetic_png(side: int, rng: random.Random) -> bytes:
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    rows = b"".join(b"\x00" + random_bytes(side * 3, rng) for _ in range(side))
+    return (b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", struct.pack(">IIBBBBB", side, side, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows, 1))
+            + chunk(b"IEND", b""))
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    """Các tùy chọn dòng lệnh của MockConfig (dùng chung với benchmarks/throughput.py)."""
+    defaults = MockConfig()
+    parser.add_argument("--latency-ms", type=float, default=defaults.latency_ms, help="Độ trễ trung vị mỗi request")
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "lognormal"], default=defaults.latency_dist)
+    parser.add_argument("--latency-spread", type=float, default=defaults.latency_spread,
+                        help="uniform: ±tỉ lệ quanh latency; lognormal: sigma")
+    parser.add_argument("--stall-rate", type=float, default=defaults.stall_rate,
+                        help="Tỉ lệ request bị treo thêm --stall-ms (mô phỏng đuôi độ trễ)")
+    parser.add_argument("--stall-ms", type=float, default=defaults.stall_ms)
+    parser.add_argument("--degraded-routes", default=defaults.degraded_routes,
+                        help="Route (hoặc route@model) luôn trả 503, ví dụ images/generations,audio/speech")
+    parser.add_argument("--error-rate", type=float, default=defaults.error_rate, help="Tỉ lệ phản hồi 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=defaults.rate_limit_rate, help="Tỉ lệ phản hồi 429")
+    parser.add_argument("--retry-after", type=float, default=defaults.retry_after, help="Retry-After của phản hồi 429 (giây)")
+    parser.add_argument("--audio-seconds", type=float, default=defaults.audio_seconds, help="Độ dài âm thanh trả về")
+    parser.add_argument("--tts-ms-per-char", type=float, default=defaults.tts_ms_per_char,
+                        help="TTS generateContent chậm thêm chừng này ms mỗi ký tự văn bản")
+    parser.add_argument("--image-px", type=int, default=defaults.image_px, help="Cạnh ảnh PNG trả về")
+    parser.add_argument("--video-mb", type=float, default=defaults.video_mb, help="Kích thước video")
+    parser.add_argument("--video-seconds", type=float, default=defaults.video_seconds, help="Thời gian sinh video")
+    parser.add_argument("--no-video-ranges", dest="video_ranges", action="store_false",
+                        help="Tải video bỏ qua header Range (luôn trả cả file)")
+    parser.add_argument("--download-drop-rate", type=float, default=defaults.download_drop_rate,
+                        help="Tỉ lệ phản hồi tải video bị ngắt kết nối giữa chừng")
+    parser.add_argument("--file-ttl", type=float, default=defaults.file_ttl, help="Thời hạn file tải lên (giây)")
+    parser.add_argument("--stream-chunks", type=int, default=defaults.stream_chunks,
+                        help="Số sự kiện SSE âm thanh của streamGenerateContent")
+    parser.add_argument("--stream-error-after", type=int, default=None,
+                        help="streamGenerateContent gửi sự kiện lỗi sau chừng này sự kiện âm thanh")
+    parser.add_argument("--stream-json", action="store_true",
+                        help="streamGenerateContent trả mảng JSON thay vì SSE (như proxy bỏ qua alt=sse)")
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def config_from_args(args: argparse.Namespace) -> MockConfig:
+    return MockConfig(**{name: getattr(args, name) for name in MockConfig.__dataclass_fields__})
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    server = MockServer((args.host, args.port), config_from_args(args))
+    print(f"Mock API: http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+"""
+Đo thông lượng đầu-cuối của các hàm sinh media trên server giả lập (benchmarks/mock_server.py).
+
+Với mỗi generator và mỗi mức đồng thời, một process Python mới chạy --requests
+lời gọi (prompt khác nhau để không bị artifact cache/single-flight gộp lại, tối
+đa --concurrency lời gọi cùng lúc) và báo:
+- throughput: số lời gọi thành công mỗi giây;
+- p50 / p99: độ trễ của từng lời gọi (ms);
+- first chunk: trung vị thời gian tới đoạn PCM đầu tiên (chỉ với gemini_tts_stream);
+- dialogue_one_call / dialogue: cùng một kịch bản 24 lượt nói đọc bằng một request
+  tts_multi_speakers hay theo lô song song bằng tts_dialogue (nên chạy với
+  --tts-ms-per-char để độ trễ tăng theo độ dài văn bản);
+- peak RSS: bộ nhớ đỉnh của process, và mức tăng so với lúc vừa import xong;
+- với --tracemalloc: đỉnh bộ nhớ do Python cấp phát trong lúc chạy (chậm hơn).
+
+Server giả lập được chạy trong một process riêng (trừ khi truyền --base-url)
+với độ trễ, kích thước phản hồi, tỉ lệ lỗi 500/429 theo các tùy chọn bên dưới.
+
+Chạy từ thư mục gốc của dự án:
+    python benchmarks/throughput.py
+    python benchmarks/throughput.py --generators gemini_tts,imagen --concurrency 1,8,32 --requests 64
+    python benchmarks/throughput.py --latency-ms 300 --rate-limit-rate 0.05 --audio-seconds 60 --json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_server import add_config_arguments  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+API_KEY = "sk-bench"
+VIDEO_MODEL = "veo-3.0-generate-preview"
+SPEAKERS = [{"speaker": "Minh Anh", "voice": "Kore"}, {"speaker": "Quốc Trung", "voice": "Puck"}]
+DIALOGUE_TURNS = 24
+
+
+def _dialogue_script(tag, i) -> str:
+    """Kịch bản DIALOGUE_TURNS lượt nói (~100 ký tự mỗi lượt) luân phiên giữa hai người trong SPEAKERS."""
+    return "\n".join(f"{SPEAKERS[turn % 2]['speaker']}: Lượt {turn} của tập {tag} {i}, "
+                     "nói về cách đo hiệu năng một dịch vụ sinh giọng nói qua mạng."
+                     for turn in range(DIALOGUE_TURNS))
+
+
+# ---- Các generator (chạy trong process con) ----
+
+async def _openai_tts(i, out_dir, tag):
+    from utils.text_to_speech import text_to_speech_async
+    return await text_to_speech_async(f"Xin chào {tag} {i}", os.path.join(out_dir, f"speech_{i}.wav"))
+
+
+async def _gemini_tts(i, out_dir, tag):
+    from utils.text_to_speech_gemini_single import gemini_tts_async
+    return await gemini_tts_async(API_KEY, f"Xin chào {tag} {i}", output_path=os.path.join(out_dir, f"tts_{i}.wav"))
+
+
+async def _gemini_tts_stream(i, out_dir, tag):
+    from utils.text_to_speech_gemini_single import gemini_tts_stream
+    stream = gemini_tts_stream(API_KEY, f"Xin chào {tag} {i}", output_path=os.path.join(out_dir, f"stream_{i}.wav"))
+    async for _ in stream:
+        pass
+    return stream.audio_bytes
+
+
+async def _gemini_tts_multi(i, out_dir, tag):
+    from utils.text_to_speech_gemini_multi import tts_multi_speakers_async
+    output_path = os.path.join(out_dir, f"multi_{i}.wav")
+    await tts_multi_speakers_async(API_KEY, "gemini-2.5-flash-preview-tts", SPEAKERS,
+                                   f"Minh Anh: Xin chào {tag} {i}\nQuốc Trung: Chào bạn", output_path=output_path)
+    return os.path.exists(output_path)
+
+
+async def _dialogue_one_call(i, out_dir, tag):
+    from utils.text_to_speech_gemini_multi import tts_multi_speakers_async
+    output_path = os.path.join(out_dir, f"dialogue1_{i}.wav")
+    await tts_multi_speakers_async(API_KEY, "gemini-2.5-flash-preview-tts", SPEAKERS, _dialogue_script(tag, i),
+                                   output_path=output_path)
+    return os.path.exists(output_path)
+
+
+async def _dialogue(i, out_dir, tag):
+    from utils.text_to_speech_gemini_multi import tts_dialogue_async
+    stats = await tts_dialogue_async(API_KEY, "gemini-2.5-flash-preview-tts", SPEAKERS, _dialogue_script(tag, i),
+                                     output_path=os.path.join(out_dir, f"dialogue_{i}.wav"), max_chars=500)
+    return stats["audio_s"] > 0
+
+
+async def _imagen(i, out_dir, tag):
+    from utils.gen_single_img import generate_image_from_prompt_async
+    return await generate_image_from_prompt_async(f"a gray cat {tag} {i}", os.path.join(out_dir, f"imagen_{i}.png"), API_KEY)
+
+
+async def _imagen_x16(i, out_dir, tag):
+    from utils.gen_single_img import generate_image_from_prompt_async
+    images = await generate_image_from_prompt_async(f"a gray cat {tag} {i}", os.path.join(out_dir, f"imagen16_{i}.png"),
+                                                    API_KEY, n=16)
+    return len(images) == 16
+
+
+async def _gemini_image(i, out_dir, tag):
+    from utils.edit_img_from_prompt import generate_or_modify_image_gemini_async
+    return await generate_or_modify_image_gemini_async(f"a gray cat {tag} {i}", os.path.join(out_dir, f"gemini_{i}.png"), API_KEY)
+
+
+async def _chat_image(i, out_dir, tag):
+    from utils.chat_gen_img import api_chat_completions_async
+    return await api_chat_completions_async(f"a gray cat {tag} {i}", os.path.join(out_dir, f"chat_{i}.png"), API_KEY)
+
+
+async def _veo(i, out_dir, tag):
+    from utils.gen_video_async_from_btc import VeoVideoGenerator
+    generator = VeoVideoGenerator(api_key=API_KEY, model=VIDEO_MODEL)
+    return await generator.generate_and_download_async(f"a flag flying {tag} {i}", os.path.join(out_dir, f"veo_{i}.mp4"))
+
+
+GENERATORS = {
+    "openai_tts": _openai_tts,
+    "gemini_tts": _gemini_tts,
+    "gemini_tts_stream": _gemini_tts_stream,
+    "gemini_tts_multi": _gemini_tts_multi,
+    "dialogue_one_call": _dialogue_one_call,
+    "dialogue": _dialogue,
+    "imagen": _imagen,
+    "imagen_x16": _imagen_x16,
+    "gemini_image": _gemini_image,
+    "chat_image": _chat_image,
+    "veo": _veo,
+}
+VIDEO_GENERATORS = {"veo"}
+
+
+def percentile(samples, q: float) -> float:
+    """Phân vị theo nearest-rank (q trong [0, 100])."""
+    ordered = sorted(samples)
+    if not ordered:
+        return float("nan")
+    rank = max(int(-(-q * len(ordered) // 100)), 1)  # làm tròn lên
+    return ordered[rank - 1]
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024  # macOS: byte, Linux: KB
+
+
+async def _run_cell(fn, requests: int, concurrency: int, out_dir: str):
+    tag = uuid.uuid4().hex[:8]
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], 0
+
+    async def one(i):
+        nonlocal failures
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                ok = bool(await fn(i, out_dir, tag))
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - start)
+            else:
+                failures += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(requests)))
+    return time.perf_counter() - start, latencies, failures
+
+
+def run_worker(args) -> dict:
+    """Một ô (generator, concurrency) trong process hiện tại; trả về kết quả dạng dict."""
+    # Cấu hình trước khi import utils: server giả lập, không cache/nhật ký lâu dài
+    os.environ["API_BASE_URL"] = args.base_url
+    os.environ["API_KEY"] = API_KEY
+    os.environ["JOB_JOURNAL_PATH"] = ""
+    os.environ.pop("ARTIFACT_CACHE_DIR", None)
+    os.environ.pop("POLL_HISTORY_PATH", None)
+    sys.path.insert(0, ROOT)
+
+    from utils.http_client import close_http_client, configure_http_client, run_sync
+    from utils.polling import get_poll_history, poll_profile_key
+    from utils.rate_limit import rate_limit_metrics
+    from utils.tts_stream import tts_stream_metrics
+
+    configure_http_client(max_connections=max(args.concurrency * 4, 100))
+    if args.worker in VIDEO_GENERATORS:
+        # Lịch sử giả định giống thời gian sinh của server để poll theo lịch thích ứng ngay từ đầu
+        for _ in range(get_poll_history().min_samples):
+            get_poll_history().record(poll_profile_key(VIDEO_MODEL), args.video_seconds)
+    fn = GENERATORS[args.worker]
+
+    rss_before = _peak_rss_mb()
+    if args.tracemalloc:
+        tracemalloc.start()
+    with tempfile.TemporaryDirectory(prefix="bench-") as out_dir, \
+            open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        wall, latencies, failures = run_sync(_run_cell(fn, args.requests, args.concurrency, out_dir))
+        traced_peak = tracemalloc.get_traced_memory()[1] if args.tracemalloc else None
+        tracemalloc.stop()
+        close_http_client()
+
+    retries = rate_limit_metrics()["retries"]
+    first_chunk = tts_stream_metrics()["first_chunk_p50_s"]
+    rss_after = _peak_rss_mb()
+    return {
+        "generator": args.worker,
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+        "ok": len(latencies),
+        "failed": failures,
+        "retries": retries,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "first_chunk_p50_ms": round(first_chunk * 1000, 1) if first_chunk is not None else None,
+        "peak_rss_mb": round(rss_after, 1) if rss_after is not None else None,
+        "rss_growth_mb": round(rss_after - rss_before, 1) if rss_after is not None else None,
+        "tracemalloc_peak_mb": round(traced_peak / (1024 * 1024), 1) if traced_peak is not None else None,
+    }
+
+
+# ---- Process điều phối ----
+
+@contextlib.contextmanager
+def mock_server(args):
+    """Chạy benchmarks/mock_server.py trong process riêng; yield base URL."""
+    if args.base_url:
+        yield args.base_url
+        return
+    cmd = [sys.executable, os.path.join(ROOT, "benchmarks", "mock_server.py"), "--port", "0"]
+    for name in ("latency_ms", "latency_dist", "latency_spread", "stall_rate", "stall_ms", "degraded_routes", "error_rate", "rate_limit_rate",
+                 "retry_after", "audio_seconds", "tts_ms_per_char", "image_px", "video_mb", "video_seconds", "download_drop_rate",
+                 "file_ttl", "stream_chunks", "stream_error_after", "seed"):
+        value = getattr(args, name)
+        if value is not None:
+            cmd += [f"--{name.replace('_', '-')}", str(value)]
+    if not args.video_ranges:
+        cmd.append("--no-video-ranges")
+    if args.stream_json:
+        cmd.append("--stream-json")
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    try:
+        line = proc.stdout.readline()
+        if not line.startswith("Mock API: "):
+            raise RuntimeError(f"Không khởi động được server giả lập: {line!r}")
+        yield line.split(": ", 1)[1].strip()
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def run_cell(args, base_url: str, generator: str, concurrency: int) -> dict:
+    requests = args.video_requests if generator in VIDEO_GENERATORS else args.requests
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", generator, "--base-url", base_url,
+           "--concurrency", str(concurrency), "--requests", str(requests),
+           "--video-seconds", str(args.video_seconds)]
+    if args.tracemalloc:
+        cmd.append("--tracemalloc")
+    out = subprocess.run(cmd, cwd=ROOT, capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(f"{generator} @ {concurrency} lỗi:\n{out.stderr}")
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--generators", default=",".join(GENERATORS),
+                        help=f"Danh sách generator, cách nhau bởi dấu phẩy ({', '.join(GENERATORS)})")
+    parser.add_argument("--concurrency", default="1,4,16", help="Các mức đồng thời, ví dụ 1,4,16")
+    parser.add_argument("--requests", type=int, default=32, help="Số lời gọi mỗi ô (TTS/ảnh)")
+    parser.add_argument("--video-requests", type=int, default=8, help="Số lời gọi mỗi ô (video)")
+    parser.add_argument("--base-url", default=None, help="Dùng server có sẵn thay vì tự chạy server giả lập")
+    parser.add_argument("--tracemalloc", action="store_true", help="Đo thêm đỉnh bộ nhớ Python (chậm hơn)")
+    parser.add_argument("--json", action="store_true", help="In kết quả dạng JSON")
+    parser.add_argument("--worker", choices=sorted(GENERATORS), help=argparse.SUPPRESS)
+    add_config_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        args.concurrency = int(args.concurrency)
+        print(json.dumps(run_worker(args)))
+        return 0
+
+    generators = [g.strip() for g in args.generators.split(",") if g.strip()]
+    unknown = [g for g in generators if g not in GENERATORS]
+    if unknown:
+        parser.error(f"generator không tồn tại: {', '.join(unknown)}")
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    results = []
+    with mock_server(args) as base_url:
+        if not args.json:
+            print(f"{'generator':18} {'conc':>5} {'ok/req':>8} {'retry':>6} {'req/s':>8} "
+                  f"{'p50 (ms)':>9} {'p99 (ms)':>9} {'1st (ms)':>9} {'peak RSS':>9} {'+RSS':>7}"
+                  + (f" {'tracemalloc':>11}" if args.tracemalloc else ""))
+        for generator in generators:
+            for concurrency in levels:
+                r = run_cell(args, base_url, generator, concurrency)
+                results.append(r)
+                if not args.json:
+                    print(f"{r['generator']:18} {r['concurrency']:5d} {r['ok']:>4}/{r['requests']:<3} "
+                          f"{r['retries']:6d} {r['throughput_rps']:8.2f} {r['p50_ms']:9.1f} {r['p99_ms']:9.1f} "
+                          f"{r['first_chunk_p50_ms'] if r['first_chunk_p50_ms'] is not None else '-':>9} "
+                          f"{r['peak_rss_mb'] or 0:8.1f}M {r['rss_growth_mb'] or 0:6.1f}M"
+                          + (f" {r['tracemalloc_peak_mb']:10.1f}M" if args.tracemalloc else ""), flush=True)
+
+    if args.json:
+        print(json.dumps({"mock": {k: getattr(args, k) for k in ("latency_ms", "latency_dist", "error_rate",
+                                                                  "rate_limit_rate", "audio_seconds", "image_px",
+                                                                  "video_mb", "video_seconds")},
+                          "results": results}, indent=2))
+    return 1 if any(r["ok"] == 0 for r in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
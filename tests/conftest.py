@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# utils/ và benchmarks/mock_server.py import được khi chạy pytest từ bất kỳ thư mục nào
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+# Không đụng tới nhật ký tác vụ, artifact cache hay lịch sử poll của người dùng
+os.environ["JOB_JOURNAL_PATH"] = ""
+os.environ.pop("ARTIFACT_CACHE_DIR", None)
+os.environ.pop("POLL_HISTORY_PATH", None)
+
+from mock_server import MockConfig, start_mock_server  # noqa: E402
+
+
+@pytest.fixture
+def mock_api():
+    """Khởi động server giả lập (không độ trễ) với MockConfig(**options); trả về (server, base_url)."""
+    servers = []
+
+    def start(**options):
+        options = {"latency_ms": 0.0, "latency_dist": "fixed", "seed": 1, **options}
+        server, base_url = start_mock_server(MockConfig(**options))
+        servers.append(server)
+        return server, base_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture(autouse=True, scope="session")
+def _close_http_client():
+    yield
+    from utils.http_client import close_http_client
+    close_http_client()
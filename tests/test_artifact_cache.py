@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from utils.artifact_cache import ArtifactCache, make_cache_key
+
+DATA = b"\x00artifact\xff" * 100
+
+
+@pytest.fixture
+def key():
+    return make_cache_key("gemini_tts", "gemini-2.5-flash-preview-tts", "Xin chào", {"voice": "Kore"})
+
+
+def test_memory_hit_creates_missing_directory(tmp_path, key):
+    cache = ArtifactCache()
+    cache.put(key, DATA)
+    output_path = str(tmp_path / "out" / "nested" / "hello.wav")
+
+    assert cache.get_to_file(key, output_path)
+
+    with open(output_path, "rb") as f:
+        assert f.read() == DATA
+    assert not os.path.exists(output_path + ".tmp")
+    assert cache.stats()["memory_hits"] == 1
+
+
+def test_disk_hit_creates_missing_directory(tmp_path, key):
+    ArtifactCache(str(tmp_path / "cache")).put(key, DATA)
+    cache = ArtifactCache(str(tmp_path / "cache"))  # tầng bộ nhớ trống: đọc từ đĩa
+    output_path = str(tmp_path / "out" / "hello.wav")
+
+    assert cache.get_to_file(key, output_path)
+
+    with open(output_path, "rb") as f:
+        assert f.read() == DATA
+    assert not os.path.exists(output_path + ".tmp")
+    stats = cache.stats()
+    assert (stats["disk_hits"], stats["misses"]) == (1, 0)
+
+
+def test_missing_artifact_is_a_miss(tmp_path, key):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    output_path = str(tmp_path / "hello.wav")
+
+    assert not cache.get_to_file(key, output_path)
+
+    assert not os.path.exists(output_path)
+    assert cache.stats()["misses"] == 1
+
+
+def test_output_error_is_raised_not_a_miss(tmp_path, key):
+    ArtifactCache(str(tmp_path / "cache")).put(key, DATA)
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    (tmp_path / "blocker").write_bytes(b"")  # một file chặn chỗ của thư mục đích
+
+    with pytest.raises(OSError):
+        cache.get_to_file(key, str(tmp_path / "blocker" / "hello.wav"))
+
+    assert cache.stats()["misses"] == 0
+
+
+def test_existing_output_is_replaced_whole(tmp_path, key):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    cache.put(key, DATA)
+    output_path = tmp_path / "hello.wav"
+    output_path.write_bytes(b"x" * (len(DATA) * 2))
+
+    assert cache.get_to_file(key, str(output_path))
+
+    assert output_path.read_bytes() == DATA
@@ -0,0 +1,109 @@
+import json
+import os
+
+import httpx
+import pytest
+
+from utils.downloader import download_file
+
+PART_SIZE = 64 * 1024
+VIDEO_PATH = "/gemini/download/v1beta/files/abc123:download?alt=media"
+
+
+def _downloads(server) -> int:
+    with server.state.lock:
+        return server.state.stats["requests"].get("download", 0)
+
+
+def _assert_complete(server, output_path):
+    with open(output_path, "rb") as f:
+        assert f.read() == server.state.video
+    assert not os.path.exists(f"{output_path}.part")
+    assert not os.path.exists(f"{output_path}.part.json")
+
+
+def test_multi_range_download(mock_api, tmp_path):
+    server, base_url = mock_api(video_mb=0.5)
+    output_path = str(tmp_path / "video.mp4")
+    progress = []
+
+    size = download_file(base_url + VIDEO_PATH, output_path, part_size=PART_SIZE, max_connections=4,
+                         progress=lambda done, total: progress.append((done, total)))
+
+    assert size == len(server.state.video)
+    _assert_complete(server, output_path)
+    parts = -(-size // PART_SIZE)
+    assert _downloads(server) == 1 + parts  # request dò kích thước + mỗi đoạn một request
+    assert len(progress) == parts
+    assert progress[-1] == (size, size)
+
+
+def test_connection_dropped_mid_range_is_retried(mock_api, tmp_path):
+    server, base_url = mock_api(video_mb=0.5, download_drop_rate=0.3)
+    output_path = str(tmp_path / "video.mp4")
+
+    size = download_file(base_url + VIDEO_PATH, output_path, part_size=PART_SIZE, max_retries=10)
+
+    assert size == len(server.state.video)
+    _assert_complete(server, output_path)
+    assert server.state.stats["downloads_dropped"] > 0
+
+
+def test_resumes_from_part_file(mock_api, tmp_path):
+    server, base_url = mock_api(video_mb=0.5)
+    output_path = str(tmp_path / "video.mp4")
+    size = len(server.state.video)
+    parts = -(-size // PART_SIZE)
+
+    def cut_after_first_part(done, total):
+        server.state.config.download_drop_rate = 1.0
+
+    with pytest.raises(httpx.TransportError):
+        download_file(base_url + VIDEO_PATH, output_path, part_size=PART_SIZE, max_connections=1,
+                      max_retries=0, progress=cut_after_first_part)
+    assert not os.path.exists(output_path)
+    assert os.path.getsize(f"{output_path}.part") == size
+    with open(f"{output_path}.part.json", encoding="utf-8") as f:
+        assert json.load(f)["done"] == [0]
+
+    server.state.config.download_drop_rate = 0.0
+    before = _downloads(server)
+    assert download_file(base_url + VIDEO_PATH, output_path, part_size=PART_SIZE) == size
+    _assert_complete(server, output_path)
+    assert _downloads(server) - before == 1 + parts - 1  # đoạn 0 không được tải lại
+
+
+def test_part_file_discarded_when_file_changed(mock_api, tmp_path):
+    server, base_url = mock_api(video_mb=0.25)
+    output_path = str(tmp_path / "video.mp4")
+    with open(f"{output_path}.part", "wb") as f:
+        f.write(b"\xff" * len(server.state.video))
+    with open(f"{output_path}.part.json", "w", encoding="utf-8") as f:
+        json.dump({"url": base_url + VIDEO_PATH, "size": len(server.state.video), "validator": '"stale"',
+                   "part_size": PART_SIZE, "done": [0, 1]}, f)
+
+    download_file(base_url + VIDEO_PATH, output_path, part_size=PART_SIZE)
+
+    _assert_complete(server, output_path)
+
+
+def test_server_ignoring_range(mock_api, tmp_path):
+    server, base_url = mock_api(video_mb=0.25, video_ranges=False)
+    output_path = str(tmp_path / "video.mp4")
+
+    size = download_file(base_url + VIDEO_PATH, output_path, part_size=PART_SIZE)
+
+    assert size == len(server.state.video)
+    _assert_complete(server, output_path)
+    assert _downloads(server) == 1  # phản hồi của request dò chính là cả file
+
+
+def test_zero_byte_file(mock_api, tmp_path):
+    server, base_url = mock_api(video_mb=0)
+    output_path = str(tmp_path / "empty.mp4")
+
+    assert download_file(base_url + VIDEO_PATH, output_path, part_size=PART_SIZE) == 0
+
+    assert os.path.getsize(output_path) == 0
+    assert not os.path.exists(f"{output_path}.part")
+    assert not os.path.exists(f"{output_path}.part.json")
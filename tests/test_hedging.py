@@ -0,0 +1,76 @@
+import asyncio
+
+import httpx
+import pytest
+
+from utils import hedging
+from utils.hedging import HedgedTransport, configure_hedging, hedging_metrics
+
+GENERATE_URL = "https://api.test/gemini/v1beta/models/gemini-2.5-flash:generateContent"
+
+
+@pytest.fixture
+def hedge(monkeypatch):
+    """Bật hedging với ngưỡng thấp trên trạng thái riêng; khôi phục cấu hình sau test."""
+    saved = dict(hedging._config)
+    monkeypatch.setattr(hedging, "_state", hedging._HedgeState())
+    configure_hedging(min_samples=3, min_delay=0.01, percentile=50, budget_ratio=0.0, budget_burst=1.0)
+    yield
+    configure_hedging(**saved)
+
+
+def _run(delays: list, requests: int = 1) -> dict:
+    """
+    Gửi lần lượt `requests` request qua HedgedTransport sau 3 request nhanh để
+    có mẫu độ trễ; delays[i] là thời gian phản hồi của lần gửi thứ i (kể cả bản sao).
+    """
+    log = {"sent": 0, "cancelled": 0, "served": []}
+
+    async def handler(request):
+        index = log["sent"]
+        log["sent"] += 1
+        try:
+            await asyncio.sleep(delays[index] if index < len(delays) else 0.005)
+        except asyncio.CancelledError:
+            log["cancelled"] += 1
+            raise
+        return httpx.Response(200, json={"index": index})
+
+    async def main():
+        async with httpx.AsyncClient(transport=HedgedTransport(httpx.MockTransport(handler))) as client:
+            for _ in range(3 + requests):
+                response = await client.post(GENERATE_URL, json={"contents": []})
+                log["served"].append(response.json()["index"])
+
+    asyncio.run(main())
+    return log
+
+
+def test_slow_request_is_hedged_and_loser_cancelled(hedge):
+    log = _run([0.005, 0.005, 0.005, 1.0, 0.005])
+
+    assert log["served"][-1] == 4  # bản sao về trước
+    assert log["cancelled"] == 1   # request gốc bị hủy
+    metrics = hedging_metrics()
+    assert (metrics["hedged"], metrics["hedge_wins"], metrics["losers_cancelled"]) == (1, 1, 1)
+
+
+def test_budget_limits_hedges(hedge):
+    log = _run([0.005, 0.005, 0.005, 0.3, 0.005, 0.1], requests=2)
+
+    assert log["served"][3:] == [4, 5]  # lượt duy nhất dùng cho request đầu; request sau chờ bản gốc
+    assert log["sent"] == 6
+    metrics = hedging_metrics()
+    assert (metrics["hedged"], metrics["budget_exhausted"]) == (1, 1)
+
+
+def test_fast_requests_are_not_hedged(hedge):
+    log = _run([0.005] * 5, requests=2)
+
+    assert log["sent"] == 5
+    assert hedging_metrics()["hedged"] == 0
+
+
+def test_predict_long_running_cannot_be_hedged(hedge):
+    with pytest.raises(ValueError):
+        configure_hedging(endpoints=("generateContent", "predictLongRunning"))
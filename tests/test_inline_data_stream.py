@@ -0,0 +1,173 @@
+import asyncio
+import base64
+import json
+import os
+import wave
+
+import httpx
+import pytest
+
+import utils.inline_data_stream as inline_data_stream
+from utils.http_client import run_sync
+from utils.inline_data_stream import (InlineDataDecoder, InlineDataNotFound, stream_inline_data_async,
+                                      stream_segments_to_wav_async)
+
+PAYLOAD = os.urandom(3001)  # độ dài không chia hết cho 3: base64 có padding
+
+
+def _body(data: bytes = PAYLOAD, camel_case: bool = True, escape_slashes: bool = False) -> bytes:
+    inline, mime = ("inlineData", "mimeType") if camel_case else ("inline_data", "mime_type")
+    body = json.dumps({"candidates": [{"content": {"parts": [
+        {"text": "đây là ảnh"},
+        {inline: {mime: "image/png", "data": base64.b64encode(data).decode("ascii")}},
+    ]}}]})
+    if escape_slashes:
+        body = body.replace("/", "\\/")
+    return body.encode("utf-8")
+
+
+def _decode_in_chunks(body: bytes, size: int) -> tuple:
+    decoder = InlineDataDecoder()
+    out = b"".join(decoder.feed(body[i:i + size]) for i in range(0, len(body), size))
+    decoder.close()
+    return out, decoder
+
+
+@pytest.fixture
+def fake_segments(monkeypatch):
+    """Thay request TTS của từng đoạn bằng behavior(index, write) (đoạn i là payload {"i": i})."""
+    calls = []
+
+    def install(behavior):
+        async def fake_stream(url, headers, payload, write, chunk_size=64 * 1024):
+            calls.append(payload["i"])
+            await behavior(payload["i"], write)
+            return "audio/L16;codec=pcm;rate=24000"
+
+        monkeypatch.setattr(inline_data_stream, "stream_inline_data_async", fake_stream)
+        return calls
+
+    return install
+
+
+def _run(n, output_path, **options):
+    return run_sync(stream_segments_to_wav_async("http://mock/tts", {}, [{"i": i} for i in range(n)],
+                                                 str(output_path), **options))
+
+
+def test_segments_written_in_order(fake_segments, tmp_path):
+    async def behavior(i, write):
+        if i % 2:
+            await asyncio.sleep(0.01)  # đoạn lẻ xong sau đoạn chẵn kế tiếp
+        write(bytes([i]) * 4)
+
+    fake_segments(behavior)
+    stats = _run(6, tmp_path / "out.wav")
+
+    assert stats["segments"] == 6
+    with wave.open(str(tmp_path / "out.wav"), "rb") as wf:
+        assert wf.readframes(wf.getnframes()) == b"".join(bytes([i]) * 4 for i in range(6))
+
+
+def test_slow_first_segment_bounds_buffered_segments(fake_segments, tmp_path):
+    release_first = None
+
+    async def behavior(i, write):
+        if i == 0:
+            await release_first.wait()
+        write(b"\0\0")
+
+    calls = fake_segments(behavior)
+
+    async def scenario():
+        nonlocal release_first
+        release_first = asyncio.Event()
+        task = asyncio.ensure_future(stream_segments_to_wav_async(
+            "http://mock/tts", {}, [{"i": i} for i in range(50)], str(tmp_path / "out.wav"), max_workers=2))
+        for _ in range(50):
+            await asyncio.sleep(0)
+        started_while_blocked = len(calls)
+        release_first.set()
+        await task
+        return started_while_blocked
+
+    assert run_sync(scenario()) == 4  # cửa sổ 2 * max_workers
+    assert sorted(calls) == list(range(50))
+
+
+def test_client_error_is_not_retried(fake_segments, tmp_path):
+    async def behavior(i, write):
+        request = httpx.Request("POST", "http://mock/tts")
+        httpx.Response(400, request=request).raise_for_status()
+
+    calls = fake_segments(behavior)
+    with pytest.raises(httpx.HTTPStatusError):
+        _run(1, tmp_path / "out.wav")
+    assert calls == [0]
+    assert not (tmp_path / "out.wav").exists()
+
+
+def test_drop_mid_body_is_retried(fake_segments, tmp_path):
+    attempts = []
+
+    async def behavior(i, write):
+        attempts.append(i)
+        write(b"\1\1")
+        if len(attempts) == 1:
+            raise httpx.ReadError("connection dropped")
+
+    fake_segments(behavior)
+    stats = _run(1, tmp_path / "out.wav")
+
+    assert len(attempts) == 2
+    assert stats["audio_s"] == pytest.approx(1 / 24000)  # PCM của lần thử hỏng không bị ghi
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 64, 4096, 1 << 20])
+def test_decoder_base64_split_across_chunks(size):
+    out, decoder = _decode_in_chunks(_body(), size)
+
+    assert out == PAYLOAD
+    assert decoder.mime_type == "image/png"
+    assert decoder.decoded_bytes == len(PAYLOAD)
+
+
+@pytest.mark.parametrize("size", [1, 5, 4096])
+def test_decoder_snake_case_fields(size):
+    out, decoder = _decode_in_chunks(_body(camel_case=False), size)
+
+    assert out == PAYLOAD
+    assert decoder.mime_type == "image/png"
+
+
+@pytest.mark.parametrize("size", [1, 2, 11])
+def test_decoder_escaped_slashes(size):
+    body = _body(escape_slashes=True)
+    assert b"\\/" in body
+
+    out, decoder = _decode_in_chunks(body, size)
+
+    assert out == PAYLOAD
+    assert decoder.mime_type == "image/png"
+
+
+def test_decoder_without_inline_data():
+    decoder = InlineDataDecoder()
+    body = b'{"candidates": [{"finishReason": "SAFETY"}]}'
+
+    assert decoder.feed(body) == b""
+    with pytest.raises(InlineDataNotFound) as excinfo:
+        decoder.close()
+    assert "SAFETY" in excinfo.value.preview
+
+
+def test_stream_inline_data_from_server(mock_api):
+    server, base_url = mock_api(image_px=64)
+    url = base_url + "/gemini/v1beta/models/gemini-2.5-flash-image-preview:generateContent"
+    received = []
+
+    mime_type = run_sync(stream_inline_data_async(url, {}, {"contents": [{"parts": [{"text": "mèo"}]}]},
+                                                  received.append, chunk_size=7))
+
+    assert mime_type == "image/png"
+    assert b"".join(received) == server.state.png
@@ -0,0 +1,62 @@
+import os
+import sqlite3
+import time
+
+import pytest
+
+from utils.gen_video_async_from_btc import VeoVideoGenerator
+from utils.job_journal import OPERATION_TTL, JobJournal
+from utils.veo_batch import resume_jobs
+
+MODEL = "veo-3.0-generate-preview"
+
+
+@pytest.fixture
+def journal(tmp_path):
+    journal = JobJournal(str(tmp_path / "jobs.sqlite3"))
+    yield journal
+    journal.close()
+
+
+def _age(journal, operation_name, seconds):
+    with sqlite3.connect(journal.path) as conn:
+        conn.execute("UPDATE veo_jobs SET created_at = ? WHERE operation_name = ?",
+                     (time.time() - seconds, operation_name))
+
+
+def test_claim_skips_rows_held_by_this_process(journal):
+    journal.record_submission("op-1", MODEL, "a cat")
+
+    assert journal.claim_resumable(MODEL, "a cat")["operation_name"] == "op-1"
+    assert journal.claim_resumable(MODEL, "a cat") is None  # lời gọi khác trong cùng process
+    assert journal.claim("op-1") is False
+    journal.release("op-1")
+    assert journal.claim("op-1") is True
+
+
+def test_expired_rows_are_not_resumable(journal):
+    journal.record_submission("op-old", MODEL, "a cat")
+    _age(journal, "op-old", OPERATION_TTL + 60)
+
+    assert journal.find_resumable(MODEL, "a cat") is None
+    assert journal.claim_resumable(MODEL, "a cat") is None
+    assert journal.claim_in_flight() == []
+
+
+def test_resume_jobs_skips_expired_rows(mock_api, journal, tmp_path):
+    server, base_url = mock_api(video_mb=0.1, video_seconds=0)
+    fresh = server.state.create_operation(MODEL)
+    journal.record_submission(fresh, MODEL, "a cat", output_path=str(tmp_path / "fresh.mp4"))
+    journal.record_submission("models/veo/operations/expired", MODEL, "a dog",
+                              output_path=str(tmp_path / "expired.mp4"))
+    _age(journal, "models/veo/operations/expired", OPERATION_TTL + 60)
+
+    generator = VeoVideoGenerator(base_url=base_url + "/gemini/v1beta", api_key="sk-test", model=MODEL)
+    jobs = resume_jobs(generator, journal, poll_interval=0.05)
+
+    assert [job.operation_name for job in jobs] == [fresh]
+    assert jobs[0].state == "succeeded"
+    assert os.path.getsize(tmp_path / "fresh.mp4") == len(server.state.video)
+    assert journal.get("models/veo/operations/expired")["state"] == "running"
+    with server.state.lock:
+        assert server.state.stats["requests"].get("predictLongRunning", 0) == 0  # không gửi lại gì
@@ -0,0 +1,91 @@
+import pytest
+
+from utils.polling import (AdaptivePoller, CompletionHistory, poll_profile_key, polling_metrics,
+                           register_operation, reset_polling_metrics)
+
+KEY = poll_profile_key("veo-3.0-generate-preview", {"resolution": "720p", "aspectRatio": "16:9"})
+STARTED_AT = 1000.0
+
+
+@pytest.fixture
+def history():
+    reset_polling_metrics()
+    history = CompletionHistory()
+    for seconds in (60, 70, 80, 90, 100):
+        history.record(KEY, seconds)
+    return history
+
+
+def _poller(history, **options) -> AdaptivePoller:
+    return AdaptivePoller(KEY, started_at=STARTED_AT, history=history, jitter=0, **options)
+
+
+def test_backoff_schedule_without_history():
+    poller = _poller(CompletionHistory())
+
+    delays = [poller.next_delay(now=STARTED_AT) for _ in range(8)]
+
+    assert delays[:3] == pytest.approx([10, 12, 14.4])
+    assert delays[-1] == 30  # tối đa max_interval
+
+
+def test_schedule_follows_completion_window(history):
+    assert history.quantiles(KEY) == (60, 80, 100)
+    poller = _poller(history)
+
+    assert poller.next_delay(now=STARTED_AT) == 60          # nhảy thẳng tới đầu cửa sổ
+    assert poller.next_delay(now=STARTED_AT + 55) == 8      # trong cửa sổ: (p90 - p10) / 5
+    assert poller.next_delay(now=STARTED_AT + 100) == 8
+    assert poller.next_delay(now=STARTED_AT + 116) == pytest.approx(8 * 1.2 ** 2)  # quá p90: giãn dần
+    assert poller.next_delay(now=STARTED_AT + 1000) == 30
+
+
+def test_sparse_wait_is_capped(history):
+    poller = _poller(history, sparse_max_interval=20)
+
+    assert poller.next_delay(now=STARTED_AT) == 20
+
+
+def test_completion_records_midpoint_of_detection_window():
+    reset_polling_metrics()
+    history = CompletionHistory(min_samples=1)
+    poller = _poller(history)
+
+    poller.observe(False, now=STARTED_AT + 50)
+    poller.observe(True, now=STARTED_AT + 60)
+    poller.observe(True, now=STARTED_AT + 70)  # phản hồi "xong" lặp lại không được ghi thêm
+
+    assert history.quantiles(KEY) == (55, 55, 55)
+    metrics = polling_metrics()
+    assert (metrics["status_requests"], metrics["completed_operations"]) == (3, 1)
+    assert metrics["detection_window_mean_s"] == 10
+    assert metrics["by_profile"][KEY] == {"completed": 1, "polls": 2}
+
+
+def test_unknown_start_time_is_not_recorded():
+    history = CompletionHistory(min_samples=1)
+    poller = AdaptivePoller(KEY, history=history)
+
+    poller.observe(True)
+
+    assert history.quantiles(KEY) is None
+
+
+def test_for_operation_uses_registered_profile(history):
+    name = "models/veo-3.0-generate-preview/operations/abc123"
+    register_operation(name, "veo-3.0-generate-preview", {"resolution": "720p", "aspectRatio": "16:9"},
+                       submitted_at=STARTED_AT)
+
+    poller = AdaptivePoller.for_operation(name, history=history, jitter=0)
+
+    assert (poller.key, poller.started_at, poller.record_duration) == (KEY, STARTED_AT, True)
+    assert poller.next_delay(now=STARTED_AT + 70) == 8
+
+
+def test_history_persists_between_instances(tmp_path):
+    path = str(tmp_path / "poll" / "history.json")
+    history = CompletionHistory(path)
+    for seconds in (40, 50, 60):
+        history.record(KEY, seconds)
+
+    assert CompletionHistory(path).quantiles(KEY) == (40, 50, 60)
@@ -0,0 +1,127 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from utils import rate_limit
+from utils.rate_limit import RateLimitedTransport, RateLimiter, TokenBucket
+
+GENERATE_URL = "https://api.test/gemini/v1beta/models/gemini-2.5-flash:generateContent"
+VIDEO_URL = "https://api.test/gemini/v1beta/models/veo-3.0:predictLongRunning"
+POLL_URL = "https://api.test/gemini/v1beta/models/veo-3.0/operations/abc"
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """Limiter riêng cho test, backoff rất ngắn; thay limiter dùng chung của transport."""
+    limiter = RateLimiter(base_delay=0.001, max_delay=0.01)
+    monkeypatch.setattr(rate_limit, "_default_limiter", limiter)
+    return limiter
+
+
+def _send(method: str, url: str, replies: list) -> tuple:
+    """
+    Gửi một request qua RateLimitedTransport; replies[i] là phản hồi (mã trạng
+    thái, header) hoặc lớp lỗi transport của lần gửi thứ i. Trả về (phản hồi
+    hoặc lỗi, số lần gửi).
+    """
+    calls = []
+
+    def handler(request):
+        reply = replies[min(len(calls), len(replies) - 1)]
+        calls.append(request)
+        if isinstance(reply, type):
+            raise reply("giả lập", request=request)
+        status, headers = reply
+        return httpx.Response(status, headers=headers, json={})
+
+    async def send():
+        async with httpx.AsyncClient(transport=RateLimitedTransport(httpx.MockTransport(handler))) as client:
+            try:
+                return await client.request(method, url, json={"contents": []})
+            except httpx.TransportError as e:
+                return e
+
+    return asyncio.run(send()), len(calls)
+
+
+def test_token_bucket_allows_burst_then_spaces_requests():
+    bucket = TokenBucket(rate=10, burst=3)
+
+    waits = [bucket.reserve() for _ in range(5)]
+
+    assert waits[:3] == pytest.approx([0, 0, 0], abs=0.01)
+    assert waits[3:] == pytest.approx([0.1, 0.2], abs=0.01)
+
+
+def test_token_bucket_pause():
+    bucket = TokenBucket()
+    assert bucket.reserve() == pytest.approx(0, abs=0.01)
+
+    bucket.pause(0.5)
+
+    assert bucket.reserve() == pytest.approx(0.5, abs=0.01)
+
+
+def test_post_read_error_is_not_retried(limiter):
+    result, calls = _send("POST", GENERATE_URL, [httpx.ReadError, (200, {})])
+
+    assert isinstance(result, httpx.ReadError)
+    assert calls == 1
+
+
+def test_post_connect_error_is_retried(limiter):
+    result, calls = _send("POST", GENERATE_URL, [httpx.ConnectError, (200, {})])
+
+    assert result.status_code == 200
+    assert calls == 2
+
+
+def test_get_read_error_is_retried(limiter):
+    result, calls = _send("GET", POLL_URL, [httpx.ReadError, (200, {})])
+
+    assert result.status_code == 200
+    assert calls == 2
+
+
+def test_server_errors_retried_except_for_predict_long_running(limiter):
+    result, calls = _send("POST", GENERATE_URL, [(500, {}), (200, {})])
+    assert (result.status_code, calls) == (200, 2)
+
+    result, calls = _send("POST", VIDEO_URL, [(500, {}), (200, {})])
+    assert (result.status_code, calls) == (500, 1)  # có thể đã tạo video
+
+    result, calls = _send("POST", VIDEO_URL, [(503, {}), (200, {})])
+    assert (result.status_code, calls) == (200, 2)
+
+
+def test_retry_after_is_honored(limiter):
+    started = time.monotonic()
+    result, calls = _send("POST", GENERATE_URL, [(429, {"retry-after": "0.2"}), (200, {})])
+
+    assert (result.status_code, calls) == (200, 2)
+    assert time.monotonic() - started >= 0.2
+    metrics = limiter.metrics()
+    assert metrics["retry_after_honored"] == 1
+    assert metrics["retries_by_reason"] == {"429": 1}
+    assert metrics["buckets"]["generateContent@gemini-2.5-flash"]["throttled"] == 1
+
+
+def test_retry_after_too_long_is_returned(limiter):
+    limiter.configure_retries(max_retry_after=1.0)
+
+    result, calls = _send("POST", GENERATE_URL, [(429, {"retry-after": "60"}), (200, {})])
+
+    assert (result.status_code, calls) == (429, 1)
+
+
+def test_retry_budget_caps_retries(limiter):
+    limiter.configure_retries(max_retries=5, budget_ratio=0.0, budget_initial=2)
+
+    first, first_calls = _send("POST", GENERATE_URL, [(503, {})])
+    second, second_calls = _send("POST", GENERATE_URL, [(503, {})])
+
+    assert (first.status_code, first_calls) == (503, 3)  # hai lượt trong ngân sách
+    assert (second.status_code, second_calls) == (503, 1)
+    assert limiter.metrics()["retry_budget_exhausted"] == 2
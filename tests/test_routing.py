@@ -0,0 +1,105 @@
+import time
+
+import pytest
+
+from utils import routing
+from utils.http_client import get_async_http_client, run_sync
+from utils.routing import configure_routing, reset_routing, routing_metrics
+
+PRIMARY = "generateContent@model-a"
+FALLBACK = "generateContent@model-b"
+GENERATE_PATH = "/gemini/v1beta/models/{}:generateContent"
+PROMPT = {"contents": [{"parts": [{"text": "Một con mèo"}]}]}
+
+
+@pytest.fixture
+def router():
+    """Router sạch với cấu hình mở breaker nhanh; khôi phục cấu hình sau test."""
+    saved = dict(routing._config)
+    reset_routing()
+    configure_routing(min_requests=2, min_health=0.5, open_s=0.05, max_open_s=1.0, half_open_probes=1)
+    yield routing._router
+    configure_routing(**saved)
+    reset_routing()
+
+
+def _call(router, send, routes=(PRIMARY, FALLBACK)):
+    return run_sync(router.call(list(routes), send))
+
+
+def _generate(base_url, route, **request):
+    model = route.partition("@")[2]
+    return get_async_http_client().post(base_url + GENERATE_PATH.format(model), **(request or {"json": PROMPT}))
+
+
+def _route(name: str) -> dict:
+    return routing_metrics()["routes"][name]
+
+
+def test_generation_4xx_does_not_fail_over(router, mock_api):
+    _, base_url = mock_api()
+    sent = []
+
+    async def send(route):
+        sent.append(route)
+        response = await _generate(base_url, route, content=b"not json")  # server trả 400
+        return response.json() if response.status_code == 200 else None
+
+    assert _call(router, send) is None
+    assert sent == [PRIMARY]
+    metrics = routing_metrics()
+    assert metrics["client_errors"] == 1
+    assert metrics["failed"] == 0
+    assert _route(PRIMARY)["requests"] == 0  # không tính vào sức khỏe của route
+
+
+def test_auxiliary_4xx_fails_over(router, mock_api):
+    _, base_url = mock_api()
+    sent = []
+
+    async def send(route):
+        sent.append(route)
+        response = await _generate(base_url, route)
+        if route == PRIMARY:
+            # request sinh nội dung thành công, nhưng request phụ (ví dụ tải kết quả) bị 404
+            await get_async_http_client().get(base_url + "/gemini/upload/v1beta/files/missing")
+            return None
+        return response.json()
+
+    assert _call(router, send)["candidates"]
+    assert sent == [PRIMARY, FALLBACK]
+    metrics = routing_metrics()
+    assert metrics["client_errors"] == 0
+    assert metrics["fallback"] == 1
+    assert _route(PRIMARY)["failures"] == 1
+
+
+def test_breaker_opens_probes_and_closes(router):
+    healthy = {PRIMARY: False, FALLBACK: True}
+    sent = []
+
+    async def send(route):
+        sent.append(route)
+        return route if healthy[route] else None
+
+    for _ in range(2):
+        assert _call(router, send) == FALLBACK
+    assert _route(PRIMARY)["state"] == "open"
+
+    sent.clear()
+    assert _call(router, send) == FALLBACK
+    assert sent == [FALLBACK]  # route đang mở bị bỏ qua
+    assert routing_metrics()["skipped_open"] == 1
+
+    time.sleep(0.06)
+    sent.clear()
+    assert _call(router, send) == FALLBACK
+    assert sent == [PRIMARY, FALLBACK]  # lời gọi thử half-open lỗi: mở lại với thời gian gấp đôi
+    assert _route(PRIMARY)["state"] == "open"
+    assert _route(PRIMARY)["opened"] == 2
+
+    time.sleep(0.15)
+    healthy[PRIMARY] = True
+    assert _call(router, send) == PRIMARY
+    assert _route(PRIMARY)["state"] == "closed"
+    assert _route(PRIMARY)["probes"] == 2
@@ -0,0 +1,98 @@
+import asyncio
+import os
+
+import pytest
+
+from utils.single_flight import SingleFlight, share_file_async
+
+KEY = "tts:xin-chao"
+
+
+def test_concurrent_calls_share_one_request():
+    flight = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return b"audio"
+
+    async def main():
+        return await asyncio.gather(*(flight.do_async(KEY, fn, kind="gemini_tts") for _ in range(5)))
+
+    assert asyncio.run(main()) == [b"audio"] * 5
+    assert len(calls) == 1
+    metrics = flight.metrics()
+    assert (metrics["upstream_calls"], metrics["saved_calls"], metrics["in_flight"]) == (1, 4, 0)
+    assert metrics["by_kind"]["gemini_tts"]["saved_calls"] == 4
+
+
+def test_error_is_raised_to_every_waiter_and_not_cached():
+    flight = SingleFlight()
+    calls = []
+
+    async def failing():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("503 từ upstream")
+
+    async def ok():
+        calls.append(1)
+        return b"audio"
+
+    async def main():
+        results = await asyncio.gather(*(flight.do_async(KEY, failing) for _ in range(3)), return_exceptions=True)
+        return results, await flight.do_async(KEY, ok)
+
+    results, retried = asyncio.run(main())
+
+    assert [str(e) for e in results] == ["503 từ upstream"] * 3
+    assert retried == b"audio"  # lỗi không bị giữ lại: lời gọi sau gửi request mới
+    assert len(calls) == 2
+    assert flight.metrics()["failures"] == 1
+
+
+def test_shared_request_cancelled_only_when_last_waiter_leaves():
+    flight = SingleFlight()
+    state = {"started": 0, "cancelled": False}
+
+    async def fn():
+        state["started"] += 1
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    async def main():
+        first = asyncio.create_task(flight.do_async(KEY, fn))
+        second = asyncio.create_task(flight.do_async(KEY, fn))
+        await asyncio.sleep(0.01)
+
+        first.cancel()
+        await asyncio.sleep(0.01)
+        still_running = not state["cancelled"]
+
+        second.cancel()
+        await asyncio.sleep(0.01)
+        for task in (first, second):
+            with pytest.raises(asyncio.CancelledError):
+                await task
+        return still_running
+
+    assert asyncio.run(main())
+    assert state == {"started": 1, "cancelled": True}
+    metrics = flight.metrics()
+    assert (metrics["cancelled"], metrics["in_flight"]) == (1, 0)
+
+
+def test_share_file_async_copies_atomically(tmp_path):
+    src_path = tmp_path / "shared.wav"
+    src_path.write_bytes(b"RIFF" + b"\x01" * 1000)
+    output_path = tmp_path / "users" / "b" / "hello.wav"
+
+    asyncio.run(share_file_async(str(src_path), str(output_path)))
+    asyncio.run(share_file_async(str(src_path), str(src_path)))  # cùng đường dẫn: không làm gì
+
+    assert output_path.read_bytes() == src_path.read_bytes()
+    assert os.listdir(output_path.parent) == ["hello.wav"]  # không còn file tạm
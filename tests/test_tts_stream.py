@@ -0,0 +1,127 @@
+import base64
+import os
+import struct
+import wave
+
+import pytest
+
+from utils.http_client import api_url, configure_api_base_url, run_sync
+from utils.text_to_speech_gemini_single import gemini_tts_stream
+from utils.tts_stream import TTSStreamError, reset_tts_stream_metrics, tts_stream_metrics
+
+API_KEY = "sk-test"
+
+
+@pytest.fixture
+def tts_api(mock_api):
+    """Server giả lập làm API gốc cho gemini_tts_stream; trả về server."""
+    default_base_url = api_url()
+
+    def start(**options):
+        server, base_url = mock_api(**options)
+        configure_api_base_url(base_url)
+        return server
+
+    reset_tts_stream_metrics()
+    yield start
+    configure_api_base_url(default_base_url)
+
+
+def _expected_chunks(server) -> list:
+    return [base64.b64decode(data) for data in server.state.pcm_stream_b64]
+
+
+def test_chunks_arrive_in_order(tts_api):
+    server = tts_api(stream_chunks=8)
+    stream = gemini_tts_stream(API_KEY, "Xin chào")
+
+    chunks = list(stream)
+
+    assert chunks == _expected_chunks(server)
+    assert len(chunks) == 8
+    assert stream.audio_bytes == sum(map(len, chunks))
+    assert 0 < stream.first_chunk_s <= stream.elapsed_s
+    metrics = tts_stream_metrics()
+    assert metrics["streams"] == 1
+    assert metrics["first_chunk_p50_s"] == stream.first_chunk_s
+
+
+def test_wav_header_patched_on_close(tts_api, tmp_path):
+    server = tts_api(stream_chunks=5)
+    output_path = str(tmp_path / "stream.wav")
+    stream = gemini_tts_stream(API_KEY, "Xin chào", output_path=output_path)
+
+    async def consume():
+        return [pcm async for pcm in stream]
+
+    pcm = b"".join(run_sync(consume()))
+
+    assert pcm == b"".join(_expected_chunks(server))
+    with wave.open(output_path, "rb") as wf:
+        assert (wf.getnchannels(), wf.getsampwidth(), wf.getframerate()) == (1, 2, 24000)
+        assert wf.getnframes() == len(pcm) // 2
+        assert wf.readframes(wf.getnframes()) == pcm
+    with open(output_path, "rb") as f:
+        riff_size = struct.unpack("<4sI", f.read(8))[1]
+    assert riff_size == os.path.getsize(output_path) - 8
+
+
+def test_partial_wav_removed_on_break(tts_api, tmp_path):
+    tts_api(stream_chunks=8)
+    output_path = str(tmp_path / "stream.wav")
+    stream = gemini_tts_stream(API_KEY, "Xin chào", output_path=output_path)
+
+    for _ in stream:
+        assert os.path.exists(output_path)
+        break
+
+    assert not os.path.exists(output_path)
+    assert tts_stream_metrics()["cancelled"] == 1
+
+
+def test_partial_wav_removed_on_aclose(tts_api, tmp_path):
+    tts_api(stream_chunks=8)
+    output_path = str(tmp_path / "stream.wav")
+    stream = gemini_tts_stream(API_KEY, "Xin chào", output_path=output_path)
+
+    async def consume_two():
+        received = []
+        async for pcm in stream:
+            received.append(pcm)
+            if len(received) == 2:
+                break
+        await stream.aclose()
+        return received
+
+    assert len(run_sync(consume_two())) == 2
+    assert not os.path.exists(output_path)
+    assert tts_stream_metrics()["cancelled"] == 1
+
+
+def test_error_event_mid_stream(tts_api, tmp_path):
+    server = tts_api(stream_chunks=8, stream_error_after=3)
+    output_path = str(tmp_path / "stream.wav")
+    stream = gemini_tts_stream(API_KEY, "Xin chào", output_path=output_path)
+    received = []
+
+    with pytest.raises(TTSStreamError) as excinfo:
+        for pcm in stream:
+            received.append(pcm)
+
+    assert received == _expected_chunks(server)[:3]
+    assert excinfo.value.error["status"] == "INTERNAL"
+    assert not os.path.exists(output_path)
+    assert tts_stream_metrics()["failures"] == 1
+
+
+def test_json_array_fallback(tts_api, tmp_path):
+    server = tts_api(stream_chunks=4, stream_json=True)
+    output_path = str(tmp_path / "stream.wav")
+    stream = gemini_tts_stream(API_KEY, "Xin chào", output_path=output_path)
+
+    chunks = list(stream)
+
+    assert chunks == _expected_chunks(server)
+    assert stream.first_chunk_s is not None
+    with wave.open(output_path, "rb") as wf:
+        assert wf.getnframes() == stream.audio_bytes // 2
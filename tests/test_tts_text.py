@@ -0,0 +1,108 @@
+import pytest
+
+from utils.tts_text import batch_dialogue_turns, parse_dialogue, split_text_for_tts
+
+SENTENCE = "Hôm nay trời đẹp, chúng ta đi dạo trong công viên."
+SPEAKERS = ["An", "Anh Ba"]
+SCRIPT = """# Podcast số 1
+
+*   **An:** người dẫn chương trình
+*   **Anh Ba:** khách mời
+
+**An:** Chào mừng các bạn.
+Hôm nay có khách đặc biệt.
+**Anh Ba**: Chào An!
+
+Anh Ba: Rất vui được tới đây.
+An:
+Bình: tên này không có trong danh sách
+"""
+
+
+def _words(chunks) -> list:
+    return " ".join(chunks).split()
+
+
+def test_short_text_is_one_chunk():
+    assert split_text_for_tts("  Xin chào.\n  Tạm biệt.  ") == ["Xin chào. Tạm biệt."]
+    assert split_text_for_tts(" \n\n ") == []
+
+
+def test_paragraphs_merged_when_they_fit():
+    text = "Đoạn một.\n\nĐoạn hai.\n\n\nĐoạn ba."
+
+    assert split_text_for_tts(text, max_chars=25) == ["Đoạn một.\n\nĐoạn hai.", "Đoạn ba."]
+
+
+def test_long_paragraph_cut_at_sentence_boundaries():
+    text = " ".join([SENTENCE] * 10)
+
+    chunks = split_text_for_tts(text, max_chars=120)
+
+    assert all(len(chunk) <= 120 for chunk in chunks)
+    assert all(chunk.endswith(".") for chunk in chunks)  # không câu nào bị cắt đôi
+    assert len(chunks) == 5
+    assert _words(chunks) == text.split()
+
+
+def test_sentence_end_with_closing_quote():
+    text = 'Cô ấy nói: "Đi thôi!" Rồi cả nhóm lên đường.'
+
+    assert split_text_for_tts(text, max_chars=25) == ['Cô ấy nói: "Đi thôi!"', "Rồi cả nhóm lên đường."]
+
+
+def test_long_sentence_cut_at_comma_then_space():
+    sentence = ", ".join(["một hai ba bốn năm"] * 12) + "."
+
+    chunks = split_text_for_tts(sentence, max_chars=50)
+
+    assert all(len(chunk) <= 50 for chunk in chunks)
+    assert all(chunk.endswith((",", ".")) for chunk in chunks)
+    assert _words(chunks) == sentence.split()
+
+
+@pytest.mark.parametrize("max_chars", [1, 7, 20])
+def test_word_longer_than_limit_is_hard_cut(max_chars):
+    text = "x" * 45
+
+    chunks = split_text_for_tts(text, max_chars=max_chars)
+
+    assert all(len(chunk) <= max_chars for chunk in chunks)
+    assert "".join(chunks) == text
+
+
+def test_parse_dialogue_turn_formats():
+    turns = parse_dialogue(SCRIPT, SPEAKERS)
+
+    assert turns == [
+        ("An", "Chào mừng các bạn. Hôm nay có khách đặc biệt."),  # dòng tiếp theo được nối vào lượt
+        ("Anh Ba", "Chào An!"),
+        ("Anh Ba", "Rất vui được tới đây."),
+        ("An", "Bình: tên này không có trong danh sách"),  # lượt trống nhận dòng sau; tên lạ không mở lượt
+    ]
+
+
+def test_parse_dialogue_prefers_longest_speaker_name():
+    assert parse_dialogue("Anh Ba: xin chào", ["An", "Anh", "Anh Ba"]) == [("Anh Ba", "xin chào")]
+
+
+def test_parse_dialogue_without_turns():
+    assert parse_dialogue("Chỉ là một đoạn văn.", SPEAKERS) == []
+
+
+def test_batch_dialogue_turns_limits_speakers_and_size():
+    turns = [("An", "Một."), ("Anh Ba", "Hai."), ("An", "Ba."), ("Chi", "Bốn."), ("An", "Năm.")]
+
+    assert batch_dialogue_turns(turns, max_speakers=2) == [turns[:3], turns[3:]]
+    assert batch_dialogue_turns(turns, max_chars=25) == [turns[:2], turns[2:4], turns[4:]]
+
+
+def test_batch_dialogue_turns_splits_long_turn():
+    words = " ".join([SENTENCE] * 4)
+
+    batches = batch_dialogue_turns([("An", words)], max_chars=120)
+
+    assert all(sum(len(s) + 2 + len(w) + 1 for s, w in batch) <= 120 for batch in batches)
+    pieces = [turn for batch in batches for turn in batch]
+    assert {speaker for speaker, _ in pieces} == {"An"}
+    assert " ".join(w for _, w in pieces) == words
@@ -0,0 +1,49 @@
+import json
+import os
+
+import pytest
+
+import utils.gen_video_async_from_btc as gen_video
+from utils.gen_video_async_from_btc import VeoVideoGenerator
+
+MODEL = "veo-3.0-generate-preview"
+
+
+@pytest.fixture
+def generator(mock_api, monkeypatch):
+    """VeoVideoGenerator trên server giả lập, poll mỗi 10 ms."""
+    monkeypatch.setattr(gen_video.AdaptivePoller, "next_delay", lambda self, now=None: 0.01)
+
+    def create(**options):
+        server, base_url = mock_api(**{"video_mb": 0.1, "video_seconds": 0.05, **options})
+        return server, VeoVideoGenerator(base_url=base_url + "/gemini/v1beta", api_key="sk-test", model=MODEL)
+
+    return create
+
+
+def test_generate_and_download(generator, tmp_path):
+    server, veo = generator()
+    output_path = str(tmp_path / "video.mp4")
+
+    assert veo.generate_and_download(prompt="a flag", output_filename=output_path) is True
+    with open(output_path, "rb") as f:
+        assert f.read() == server.state.video
+
+
+def test_bad_poll_body_is_polled_again(generator, monkeypatch, tmp_path):
+    server, veo = generator()
+    poll = VeoVideoGenerator.poll_operation_async
+    bad_bodies = []
+
+    async def flaky_poll(self, operation_name):
+        if not bad_bodies:
+            bad_bodies.append(operation_name)
+            return json.loads('{"name": "trunc')  # body bị cắt ngang
+        return await poll(self, operation_name)
+
+    monkeypatch.setattr(VeoVideoGenerator, "poll_operation_async", flaky_poll)
+    output_path = str(tmp_path / "video.mp4")
+
+    assert veo.generate_and_download(prompt="a flag", output_filename=output_path) is True
+    assert len(bad_bodies) == 1
+    assert os.path.getsize(output_path) == len(server.state.video)
@@ -1 +1,110 @@
 # This file makes the 'utils' directory a Python package.
+#
+# Các hàm chính được re-export ở đây nhưng chỉ import module con khi được dùng
+# lần đầu (PEP 562), nên `import utils` không kéo theo httpx, PIL, matplotlib, ...
+# và không gửi request nào.
+
+import importlib
+
+_EXPORTS = {
+    # TTS
+    "gemini_tts": "text_to_speech_gemini_single",
+    "gemini_tts_async": "text_to_speech_gemini_single",
+    "gemini_tts_long": "text_to_speech_gemini_single",
+    "gemini_tts_long_async": "text_to_speech_gemini_single",
+    "gemini_tts_stream": "text_to_speech_gemini_single",
+    "tts_multi_speakers": "text_to_speech_gemini_multi",
+    "tts_multi_speakers_async": "text_to_speech_gemini_multi",
+    "tts_multi_speakers_stream": "text_to_speech_gemini_multi",
+    "tts_dialogue": "text_to_speech_gemini_multi",
+    "tts_dialogue_async": "text_to_speech_gemini_multi",
+    "tts_two_speakers": "text_to_speech_gemini_2_person",
+    "tts_two_speakers_async": "text_to_speech_gemini_2_person",
+    "tts_two_speakers_stream": "text_to_speech_gemini_2_person",
+    "PCMStream": "tts_stream",
+    "tts_stream_metrics": "tts_stream",
+    "text_to_speech": "text_to_speech",
+    "text_to_speech_async": "text_to_speech",
+    "split_text_for_tts": "tts_text",
+    "stitch_wav": "audio_post",
+    "stitch_wav_async": "audio_post",
+    "postprocess_wav": "audio_post",
+    "text_to_speech_routed": "routing",
+    "text_to_speech_routed_async": "routing",
+    # Ảnh
+    "generate_or_modify_image_gemini": "edit_img_from_prompt",
+    "generate_or_modify_image_gemini_async": "edit_img_from_prompt",
+    "generate_image_from_prompt": "gen_single_img",
+    "generate_image_from_prompt_async": "gen_single_img",
+    "iter_images_from_prompt": "gen_single_img",
+    "iter_images_from_prompt_async": "gen_single_img",
+    "api_chat_completions": "chat_gen_img",
+    "api_chat_completions_async": "chat_gen_img",
+    "generate_image_routed": "routing",
+    "generate_image_routed_async": "routing",
+    "ImageResult": "media_sink",
+    "ImageData": "media_sink",
+    "configure_image_prep": "image_prep",
+    "prepare_input_image": "image_prep",
+    "prepare_input_image_async": "image_prep",
+    "configure_file_refs": "file_refs",
+    "disable_file_refs": "file_refs",
+    "file_ref_metrics": "file_refs",
+    # Video
+    "start_video_generation": "video_generator",
+    "start_video_generation_async": "video_generator",
+    "check_video_status": "video_generator",
+    "check_video_status_async": "video_generator",
+    "download_video": "video_generator",
+    "download_video_async": "video_generator",
+    "start_video_with_image": "video_generator",
+    "start_video_with_image_async": "video_generator",
+    "VeoVideoGenerator": "gen_video_async_from_btc",
+    "VeoBatchScheduler": "veo_batch",
+    "VeoJob": "veo_batch",
+    "resume_jobs": "veo_batch",
+    "resume_jobs_async": "veo_batch",
+    # Cấu hình dùng chung
+    "configure_http_client": "http_client",
+    "configure_api_base_url": "http_client",
+    "close_http_client": "http_client",
+    "configure_rate_limit": "rate_limit",
+    "configure_retries": "rate_limit",
+    "rate_limit_metrics": "rate_limit",
+    "configure_hedging": "hedging",
+    "disable_hedging": "hedging",
+    "hedging_metrics": "hedging",
+    "configure_poll_history": "polling",
+    "polling_metrics": "polling",
+    "reset_polling_metrics": "polling",
+    "configure_routing": "routing",
+    "routing_metrics": "routing",
+    "configure_artifact_cache": "artifact_cache",
+    "disable_artifact_cache": "artifact_cache",
+    "get_artifact_cache": "artifact_cache",
+    "configure_job_journal": "job_journal",
+    "disable_job_journal": "job_journal",
+    "get_job_journal": "job_journal",
+    "single_flight_metrics": "single_flight",
+    "configure_instrumentation": "instrumentation",
+    "disable_instrumentation": "instrumentation",
+    "add_instrumentation_callback": "instrumentation",
+    "remove_instrumentation_callback": "instrumentation",
+    "instrumentation_metrics": "instrumentation",
+    "prometheus_metrics": "instrumentation",
+}
+
+__all__ = sorted(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{module_name}", __name__), name)
+    globals()[name] = value  # các lần truy cập sau không qua __getattr__ nữa
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
@@ -0,0 +1,265 @@
+"""
+CLI cho mọi generator trong utils/.
+
+    python -m utils tts "Xin chào!" -o logs/hello.wav --voice Kore --style cheerful
+    python -m utils tts -f bai_doc.txt -o logs/bai_doc.wav --long
+    python -m utils dialogue -f podcast.md --speaker "Minh Anh=Kore" --speaker "Quốc Trung=Puck" -o logs/podcast.wav
+    python -m utils speech "Hello world" -o logs/hello.wav
+    python -m utils stitch logs/intro.wav logs/part_1.wav logs/part_2.wav -o logs/episode.wav --gap-ms 400
+    python -m utils image "a gray cat" -o assets/cat.png -n 2
+    python -m utils edit-image "make the cat orange" -o assets/cat_2.png --input assets/cat_1.png
+    python -m utils chat-image "a detective in Hanoi" -o assets/detective.png
+    python -m utils video "Vietnamese flag flying in Ba Dinh Square" -o assets/flag.mp4
+    python -m utils video-batch -f prompts.txt --out-dir assets/videos
+    python -m utils jobs --all
+    python -m utils jobs --resume
+
+API key lấy từ --api-key hoặc biến môi trường API_KEY. Module của từng lệnh chỉ
+được import khi lệnh đó chạy, nên `python -m utils --help` khởi động rất nhanh.
+"""
+
+import argparse
+import os
+import sys
+import time
+
+
+def _read_text(args) -> str:
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            return f.read()
+    if args.text in (None, "-"):
+        return sys.stdin.read()
+    return args.text
+
+
+def _add_text_args(parser):
+    parser.add_argument("text", nargs="?", help="Văn bản/prompt ('-' hoặc bỏ trống để đọc từ stdin)")
+    parser.add_argument("-f", "--file", help="Đọc văn bản/prompt từ file")
+
+
+def _cmd_tts(args) -> bool:
+    from .text_to_speech_gemini_single import gemini_tts, gemini_tts_long
+
+    options = dict(model=args.model, voice_name=args.voice, style=args.style, output_path=args.output)
+    if args.long:
+        gemini_tts_long(args.api_key, _read_text(args), max_chars=args.max_chars,
+                        max_workers=args.workers, **options)
+    else:
+        gemini_tts(args.api_key, _read_text(args), **options)
+    return True
+
+
+def _cmd_dialogue(args) -> bool:
+    from .text_to_speech_gemini_multi import tts_dialogue, tts_multi_speakers
+
+    speakers_config = []
+    for item in args.speaker:
+        name, sep, voice = item.rpartition("=")
+        if not sep or not name or not voice:
+            raise SystemExit(f"--speaker phải có dạng 'Tên=Giọng', nhận được: {item!r}")
+        speakers_config.append({"speaker": name.strip(), "voice": voice.strip()})
+
+    text = _read_text(args)
+    if args.single_call:
+        tts_multi_speakers(args.api_key, args.model, speakers_config, text, output_path=args.output)
+    else:
+        tts_dialogue(args.api_key, args.model, speakers_config, text, output_path=args.output,
+                     max_chars=args.max_chars, max_workers=args.workers)
+    return True
+
+
+def _cmd_speech(args) -> bool:
+    from .text_to_speech import text_to_speech
+
+    return text_to_speech(_read_text(args), args.output, model=args.model, voice=args.voice, api_key=args.api_key)
+
+
+def _cmd_stitch(args) -> bool:
+    from .audio_post import stitch_wav
+
+    stats = stitch_wav(args.inputs, args.output, trim_silence=not args.no_trim, silence_db=args.silence_db,
+                       gap_ms=args.gap_ms, crossfade_ms=args.crossfade_ms,
+                       normalize=None if args.normalize == "none" else args.normalize, target_db=args.target_db,
+                       sample_rate=args.sample_rate)
+    print(f"✅ {args.output}: {stats['segments']} đoạn, {stats['output_s']:.1f}s âm thanh "
+          f"(cắt {stats['trimmed_s']:.1f}s khoảng lặng) sau {stats['elapsed_s']:.2f}s")
+    return stats["segments"] > 0
+
+
+def _cmd_image(args) -> bool:
+    from .gen_single_img import generate_image_from_prompt
+
+    saved = generate_image_from_prompt(_read_text(args), args.output, args.api_key, n=args.n,
+                                       aspect_ratio=args.aspect_ratio, show=args.show)
+    return bool(saved)
+
+
+def _cmd_edit_image(args) -> bool:
+    from .edit_img_from_prompt import generate_or_modify_image_gemini
+
+    saved = generate_or_modify_image_gemini(_read_text(args), args.output, args.api_key,
+                                            input_image_path=args.input, aspect_ratio=args.aspect_ratio,
+                                            show=args.show)
+    return bool(saved)
+
+
+def _cmd_chat_image(args) -> bool:
+    from .chat_gen_img import api_chat_completions
+
+    saved = api_chat_completions(_read_text(args), args.output, args.api_key,
+                                 input_image_path=args.input, show=args.show)
+    return bool(saved)
+
+
+def _cmd_video(args) -> bool:
+    from .gen_video_async_from_btc import VeoVideoGenerator
+
+    generator = VeoVideoGenerator(api_key=args.api_key, model=args.model)
+    return generator.generate_and_download(_read_text(args), args.output, image_path=args.image,
+                                           aspectRatio=args.aspect_ratio)
+
+
+def _cmd_video_batch(args) -> bool:
+    from .gen_video_async_from_btc import VeoVideoGenerator
+    from .veo_batch import VeoBatchScheduler, VeoJob
+
+    prompts = [line.strip() for line in _read_text(args).splitlines() if line.strip()]
+    os.makedirs(args.out_dir, exist_ok=True)
+    jobs = [
+        VeoJob(prompt, os.path.join(args.out_dir, f"video_{i:03d}.mp4"), params={"aspectRatio": args.aspect_ratio})
+        for i, prompt in enumerate(prompts)
+    ]
+    generator = VeoVideoGenerator(api_key=args.api_key, model=args.model)
+    jobs = VeoBatchScheduler(generator, max_in_flight=args.max_in_flight).run(jobs)
+    return all(job.state == "succeeded" for job in jobs)
+
+
+def _cmd_jobs(args) -> bool:
+    from .job_journal import configure_job_journal, get_job_journal
+
+    journal = configure_job_journal(args.journal) if args.journal else get_job_journal()
+    if journal is None:
+        raise SystemExit("Nhật ký tác vụ đang tắt (JOB_JOURNAL_PATH rỗng)")
+
+    if args.resume:
+        from .gen_video_async_from_btc import VeoVideoGenerator
+        from .veo_batch import resume_jobs
+
+        jobs = resume_jobs(VeoVideoGenerator(api_key=args.api_key), journal, max_in_flight=args.max_in_flight)
+        return all(job.state == "succeeded" for job in jobs)
+
+    entries = journal.jobs(limit=args.limit) if args.all else journal.in_flight()
+    for entry in entries:
+        updated = time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["updated_at"]))
+        print(f"{entry['state']:10} {updated}  {entry['operation_name']}")
+        print(f"{'':10} {entry['model']}: {entry['prompt'][:60]!r} -> {entry['output_path'] or '-'}"
+              + (f" ({entry['error']})" if entry["error"] else ""))
+    print(f"{len(entries)} tác vụ trong {journal.path}")
+    return True
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m utils", description="Gọi các API TTS/ảnh/video của AI Thực Chiến.")
+    parser.add_argument("--api-key", default=os.getenv("API_KEY", "sk-1234"),
+                        help="API key (mặc định: biến môi trường API_KEY)")
+    parser.add_argument("--cache-dir", default=None,
+                        help="Bật artifact cache tại thư mục này (xem utils/artifact_cache.py)")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser("tts", help="Đọc văn bản bằng một giọng (Gemini TTS)")
+    _add_text_args(p)
+    p.add_argument("-o", "--output", default="output.wav")
+    p.add_argument("--model", default="gemini-2.5-flash-preview-tts")
+    p.add_argument("--voice", default="Kore")
+    p.add_argument("--style", default=None)
+    p.add_argument("--long", action="store_true", help="Chia văn bản dài thành đoạn và đọc song song")
+    p.add_argument("--max-chars", type=int, default=1500)
+    p.add_argument("--workers", type=int, default=4)
+    p.set_defaults(func=_cmd_tts)
+
+    p = commands.add_parser("dialogue", help="Đọc kịch bản hội thoại nhiều người nói")
+    _add_text_args(p)
+    p.add_argument("-o", "--output", default="output.wav")
+    p.add_argument("--model", default="gemini-2.5-flash-preview-tts")
+    p.add_argument("--speaker", action="append", required=True, metavar="TÊN=GIỌNG",
+                   help="Tên người nói trong kịch bản và giọng tương ứng (lặp lại cho mỗi người)")
+    p.add_argument("--single-call", action="store_true", help="Gửi cả kịch bản trong một request")
+    p.add_argument("--max-chars", type=int, default=1500)
+    p.add_argument("--workers", type=int, default=4)
+    p.set_defaults(func=_cmd_dialogue)
+
+    p = commands.add_parser("speech", help="Đọc văn bản qua endpoint /audio/speech")
+    _add_text_args(p)
+    p.add_argument("-o", "--output", default="output.wav")
+    p.add_argument("--model", default="gemini-2.5-pro-preview-tts")
+    p.add_argument("--voice", default="Puck")
+    p.set_defaults(func=_cmd_speech)
+
+    p = commands.add_parser("stitch", help="Ghép/hậu xử lý các file WAV (cắt lặng, chuẩn hóa, khoảng nghỉ)")
+    p.add_argument("inputs", nargs="+", help="Các file WAV PCM 16-bit theo thứ tự")
+    p.add_argument("-o", "--output", required=True)
+    p.add_argument("--gap-ms", type=float, default=250.0, help="Khoảng lặng giữa hai đoạn")
+    p.add_argument("--crossfade-ms", type=float, default=0.0, help="Chồng hai đoạn thay cho khoảng lặng")
+    p.add_argument("--normalize", choices=["rms", "peak", "none"], default="rms")
+    p.add_argument("--target-db", type=float, default=None, help="Mức đích (dBFS); mặc định rms -20, peak -1")
+    p.add_argument("--silence-db", type=float, default=-50.0, help="Ngưỡng khoảng lặng (dBFS)")
+    p.add_argument("--no-trim", action="store_true", help="Không cắt khoảng lặng đầu/cuối mỗi đoạn")
+    p.add_argument("--sample-rate", type=int, default=None, help="Đổi tần số lấy mẫu đầu ra")
+    p.set_defaults(func=_cmd_stitch)
+
+    for name, func, help_text in (
+        ("image", _cmd_image, "Sinh ảnh bằng imagen-4 (/images/generations)"),
+        ("edit-image", _cmd_edit_image, "Sinh/sửa ảnh bằng Gemini (generateContent)"),
+        ("chat-image", _cmd_chat_image, "Sinh ảnh kiểu trò chuyện (/chat/completions)"),
+    ):
+        p = commands.add_parser(name, help=help_text)
+        _add_text_args(p)
+        p.add_argument("-o", "--output", required=True)
+        if name == "image":
+            p.add_argument("-n", type=int, default=1, help="Số ảnh cần sinh")
+        if name != "chat-image":
+            p.add_argument("--aspect-ratio", default="1:1")
+        if name != "image":
+            p.add_argument("--input", default=None, help="Ảnh đầu vào")
+        p.add_argument("--show", action="store_true", help="Hiển thị ảnh bằng matplotlib sau khi lưu")
+        p.set_defaults(func=func)
+
+    p = commands.add_parser("video", help="Sinh một video bằng Veo")
+    _add_text_args(p)
+    p.add_argument("-o", "--output", default=None)
+    p.add_argument("--image", default=None, help="Ảnh đầu vào (image-to-video)")
+    p.add_argument("--model", default="veo-3.0-generate-001")
+    p.add_argument("--aspect-ratio", default="16:9")
+    p.set_defaults(func=_cmd_video)
+
+    p = commands.add_parser("video-batch", help="Sinh nhiều video song song (mỗi dòng một prompt)")
+    _add_text_args(p)
+    p.add_argument("--out-dir", default="assets/videos")
+    p.add_argument("--model", default="veo-3.0-generate-001")
+    p.add_argument("--aspect-ratio", default="16:9")
+    p.add_argument("--max-in-flight", type=int, default=8)
+    p.set_defaults(func=_cmd_video_batch)
+
+    p = commands.add_parser("jobs", help="Xem/tiếp tục các tác vụ video trong nhật ký tác vụ")
+    p.add_argument("--all", action="store_true", help="Liệt kê cả các tác vụ đã xong (mặc định: chỉ tác vụ đang dở)")
+    p.add_argument("--limit", type=int, default=50, help="Số tác vụ tối đa khi dùng --all")
+    p.add_argument("--resume", action="store_true", help="Tiếp tục poll/tải các tác vụ đang dở")
+    p.add_argument("--max-in-flight", type=int, default=8)
+    p.add_argument("--journal", default=None, help="File nhật ký (mặc định: JOB_JOURNAL_PATH hoặc ~/.cache/litellm-note/jobs.sqlite3)")
+    p.set_defaults(func=_cmd_jobs)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.cache_dir:
+        from .artifact_cache import configure_artifact_cache
+
+        configure_artifact_cache(args.cache_dir)
+    return 0 if args.func(args) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,354 @@
+"""
+Cache nội dung (content-addressed) cho các file sinh ra: âm thanh TTS, ảnh, video.
+
+Khóa cache là SHA-256 của model, prompt đã chuẩn hóa, các tham số
+(giọng, phong cách, tỉ lệ khung hình, ...) và nội dung của ảnh đầu vào (nếu có).
+Hai tầng lưu trữ:
+- bộ nhớ: LRU giới hạn theo tổng số byte, chỉ giữ các artifact nhỏ;
+- đĩa: thư mục giới hạn dung lượng, xóa các file ít dùng nhất khi vượt ngưỡng.
+  Ghi file theo kiểu atomic (file tạm + os.replace) và dọn dẹp dưới khóa file,
+  nên nhiều process có thể dùng chung một thư mục cache.
+
+Cache mặc định bị tắt. Bật bằng:
+    from utils.artifact_cache import configure_artifact_cache
+    configure_artifact_cache("~/.cache/litellm-note", max_disk_bytes=5 * 1024**3)
+hoặc đặt biến môi trường ARTIFACT_CACHE_DIR.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows: không có flock, chỉ dựa vào ghi atomic
+    fcntl = None
+
+
+def normalize_prompt(text: str) -> str:
+    """Chuẩn hóa prompt để các biến thể chỉ khác khoảng trắng/Unicode cho cùng một khóa."""
+    text = unicodedata.normalize("NFC", text).replace("\r\n", "\n")
+    return "\n".join(line.strip() for line in text.strip().split("\n"))
+
+
+def make_cache_key(kind: str, model: str, prompt: str, params: Optional[dict] = None,
+                   input_bytes: Optional[bytes] = None) -> str:
+    """
+    Tạo khóa cache.
+
+    Parameters
+    ----------
+    kind : str
+        Loại tác vụ, ví dụ "gemini_tts", "imagen", "veo" (tránh trùng khóa giữa các endpoint).
+    model : str
+        Model được gọi.
+    prompt : str
+        Prompt/văn bản đầu vào (sẽ được chuẩn hóa).
+    params : dict | None
+        Các tham số ảnh hưởng tới kết quả (giọng, style, aspect ratio, ...).
+    input_bytes : bytes | None
+        Nội dung ảnh đầu vào, nếu có.
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(
+        {"kind": kind, "model": model, "prompt": normalize_prompt(prompt), "params": params or {}},
+        sort_keys=True, ensure_ascii=False, default=str,
+    ).encode("utf-8"))
+    if input_bytes is not None:
+        h.update(b"\0input\0")
+        h.update(hashlib.sha256(input_bytes).digest())
+    return h.hexdigest()
+
+
+class ArtifactCache:
+    """Cache hai tầng (bộ nhớ + đĩa) cho artifact dạng bytes."""
+
+    def __init__(self, directory: Optional[str] = None, max_memory_bytes: int = 64 * 1024 * 1024,
+                 max_memory_item_bytes: int = 8 * 1024 * 1024, max_disk_bytes: int = 2 * 1024 ** 3):
+        """
+        Parameters
+        ----------
+        directory : str | None
+            Thư mục của tầng đĩa. None = chỉ dùng tầng bộ nhớ.
+        max_memory_bytes : int
+            Tổng dung lượng tối đa của tầng bộ nhớ.
+        max_memory_item_bytes : int
+            Artifact lớn hơn ngưỡng này (ví dụ video) chỉ được lưu trên đĩa.
+        max_disk_bytes : int
+            Dung lượng tối đa của tầng đĩa; vượt ngưỡng sẽ xóa các file ít dùng nhất.
+        """
+        self.directory = os.path.expanduser(directory) if directory else None
+        self.max_memory_bytes = max_memory_bytes
+        self.max_memory_item_bytes = max_memory_item_bytes
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_size = 0
+        self._disk_usage: Optional[int] = None  # ước lượng, được đo lại khi dọn dẹp
+        self._lock = threading.Lock()
+        self._stats = {
+            "memory_hits": 0, "disk_hits": 0, "misses": 0, "stores": 0,
+            "memory_evictions": 0, "disk_evictions": 0,
+        }
+
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+    # ---- API chính ----
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Trả về nội dung đã cache hoặc None."""
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return data
+
+        path = self._disk_path(key)
+        if path:
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path)  # đánh dấu vừa dùng cho chính sách LRU trên đĩa
+            except FileNotFoundError:  # chưa có hoặc vừa bị process khác dọn
+                data = None
+            if data is not None:
+                self._remember(key, data)
+                self._count("disk_hits")
+                return data
+
+        self._count("misses")
+        return None
+
+    def put(self, key: str, data: bytes) -> None:
+        """Lưu nội dung vào cả hai tầng."""
+        self._remember(key, data)
+        if self.directory:
+            self._write_disk(key, lambda f: f.write(data), len(data))
+        self._count("stores")
+
+    def get_to_file(self, key: str, output_path: str) -> bool:
+        """
+        Ghi artifact đã cache ra output_path (tạo thư mục nếu cần; ghi vào
+        output_path + ".tmp" rồi os.replace nên không để lại file dở dang).
+        Trả về False nếu không có trong cache.
+        """
+        with self._lock:
+            data = self._memory.get(key)
+            if data is not None:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+
+        if data is not None:
+            _write_atomic(output_path, lambda f: f.write(data))
+            return True
+
+        # Sao chép thẳng từ tầng đĩa, không cần nạp artifact lớn (video) vào bộ nhớ.
+        # Chỉ việc file cache không tồn tại mới là miss; lỗi ghi output_path được raise.
+        path = self._disk_path(key)
+        try:
+            src = open(path, "rb") if path else None
+        except FileNotFoundError:  # chưa có hoặc vừa bị process khác dọn
+            src = None
+        if src is None:
+            self._count("misses")
+            return False
+        with src:
+            _write_atomic(output_path, lambda f: shutil.copyfileobj(src, f))
+        try:
+            os.utime(path)  # đánh dấu vừa dùng cho chính sách LRU trên đĩa
+        except FileNotFoundError:
+            pass
+
+        self._count("disk_hits")
+        if os.path.getsize(output_path) <= self.max_memory_item_bytes:
+            with open(output_path, "rb") as f:
+                self._remember(key, f.read())
+        return True
+
+    def put_file(self, key: str, path: str) -> None:
+        """Lưu nội dung của một file đã sinh ra vào cache."""
+        size = os.path.getsize(path)
+        if size <= self.max_memory_item_bytes:
+            with open(path, "rb") as f:
+                self.put(key, f.read())
+            return
+
+        if self.directory:
+            with open(path, "rb") as src:
+                self._write_disk(key, lambda f: shutil.copyfileobj(src, f), size)
+        self._count("stores")
+
+    def stats(self) -> dict:
+        """Thống kê hit/miss của cache."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_bytes"] = self._memory_size
+            stats["memory_items"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+    def clear(self) -> None:
+        """Xóa toàn bộ cache (cả trên đĩa)."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_size = 0
+        if self.directory:
+            with self._disk_lock():
+                for path, _, _ in self._scan_disk():
+                    _remove_quietly(path)
+                self._disk_usage = 0
+
+    # ---- Tầng bộ nhớ ----
+
+    def _remember(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_memory_item_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_size -= len(old)
+            self._memory[key] = data
+            self._memory_size += len(data)
+            while self._memory_size > self.max_memory_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_size -= len(evicted)
+                self._stats["memory_evictions"] += 1
+
+    # ---- Tầng đĩa ----
+
+    def _disk_path(self, key: str) -> Optional[str]:
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, key[:2], key)
+
+    def _write_disk(self, key: str, write, size: int) -> None:
+        path = self._disk_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Ghi vào file tạm cùng thư mục rồi os.replace: người đọc không bao giờ thấy file dở dang
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, path)
+        except BaseException:
+            _remove_quietly(tmp_path)
+            raise
+
+        with self._lock:
+            if self._disk_usage is not None:
+                self._disk_usage += size
+            needs_eviction = self._disk_usage is None or self._disk_usage > self.max_disk_bytes
+        if needs_eviction:
+            self._evict_disk()
+
+    def _evict_disk(self) -> None:
+        with self._disk_lock():
+            entries = sorted(self._scan_disk(), key=lambda e: e[2])  # cũ nhất trước
+            total = sum(size for _, size, _ in entries)
+            # Dọn xuống 90% ngưỡng để không phải dọn lại ở mỗi lần ghi
+            target = self.max_disk_bytes * 0.9 if total > self.max_disk_bytes else total
+            evicted = 0
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                if _remove_quietly(path):
+                    total -= size
+                    evicted += 1
+        with self._lock:
+            self._disk_usage = total
+            self._stats["disk_evictions"] += evicted
+
+    def _scan_disk(self):
+        """Liệt kê (path, size, mtime) của mọi artifact trên đĩa."""
+        for shard in os.scandir(self.directory):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.startswith(".tmp-"):
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                yield entry.path, st.st_size, st.st_mtime
+
+    @contextmanager
+    def _disk_lock(self):
+        """Khóa độc quyền giữa các process khi dọn dẹp tầng đĩa."""
+        if fcntl is None:
+            yield
+            return
+        with open(os.path.join(self.directory, ".lock"), "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+
+def _write_atomic(output_path: str, write) -> None:
+    """Ghi output_path qua file tạm output_path + ".tmp" rồi os.replace."""
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = output_path + ".tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+
+
+def _remove_quietly(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+# ---- Cache dùng chung cho các module trong utils/ ----
+
+_default_cache: Optional[ArtifactCache] = None
+_default_lock = threading.Lock()
+
+
+def configure_artifact_cache(directory: Optional[str] = None, **options) -> ArtifactCache:
+    """Bật cache dùng chung cho mọi generator (xem ArtifactCache để biết các tùy chọn)."""
+    global _default_cache
+    with _default_lock:
+        _default_cache = ArtifactCache(directory, **options)
+    return _default_cache
+
+
+def disable_artifact_cache() -> None:
+    """Tắt cache dùng chung."""
+    global _default_cache
+    with _default_lock:
+        _default_cache = None
+
+
+def get_artifact_cache() -> Optional[ArtifactCache]:
+    """Trả về cache dùng chung, hoặc None nếu cache đang tắt."""
+    global _default_cache
+    if _default_cache is None and os.getenv("ARTIFACT_CACHE_DIR"):
+        with _default_lock:
+            if _default_cache is None:
+                _default_cache = ArtifactCache(os.getenv("ARTIFACT_CACHE_DIR"))
+    return _default_cache
@@ -0,0 +1,18 @@
+"""
+Các hàm đọc/ghi âm thanh dùng chung cho các module TTS.
+"""
+
+import wave
+
+
+def open_pcm_wav(output_path: str, channels: int = 1, sample_width: int = 2,
+                 sample_rate: int = 24000) -> wave.Wave_write:
+    """
+    Mở file WAV để ghi PCM thô (như inlineData của Gemini TTS) theo từng đoạn
+    bằng writeframesraw(). Header được cập nhật độ dài đúng khi đóng file.
+    """
+    wf = wave.open(output_path, "wb")
+    wf.setnchannels(channels)
+    wf.setsampwidth(sample_width)
+    wf.setframerate(sample_rate)
+    return wf
@@ -0,0 +1,307 @@
+"""
+Hậu xử lý âm thanh cho các file WAV PCM 16-bit mà các module TTS ghi ra.
+
+Ghép nhiều đoạn gemini_tts/tts_multi_speakers thành một tập thường bị âm lượng
+không đều giữa các đoạn, khoảng lặng thừa ở đầu/cuối mỗi đoạn và tiếng "click"
+ở chỗ nối. stitch_wav():
+- cắt khoảng lặng đầu/cuối mỗi đoạn (dưới silence_db dBFS), giữ lại keep_silence_ms;
+- chuẩn hóa âm lượng từng đoạn về cùng một mức: "peak" (đỉnh = target_db dBFS,
+  mặc định -1) hoặc "rms" (RMS = target_db dBFS, mặc định -20; hệ số bị giới hạn
+  để đỉnh không vượt peak_ceiling_db);
+- nối bằng khoảng lặng cố định gap_ms, với fade_ms fade vào/ra ở hai đầu mỗi
+  đoạn để không bị click, hoặc chồng hai đoạn liền nhau crossfade_ms (equal-power);
+- tùy chọn đổi tần số lấy mẫu (sample_rate, nội suy tuyến tính; các file đầu
+  vào khác tần số được đưa về cùng tần số của file đầu tiên).
+
+Mọi bước là phép toán NumPy vector hóa trên np.memmap của phần data trong file
+WAV, theo từng khối block_frames khung: bộ nhớ dùng không phụ thuộc độ dài file
+(một tập podcast dài hàng giờ vẫn chỉ tốn vài MB), file đích được ghi dần qua
+open_pcm_wav().
+
+    from utils.audio_post import stitch_wav
+    stitch_wav(["logs/intro.wav", "logs/part_1.wav", "logs/part_2.wav"], "logs/episode.wav",
+               gap_ms=400, normalize="rms", target_db=-20)
+
+hoặc `python -m utils stitch logs/intro.wav logs/part_1.wav -o logs/episode.wav`.
+Cần numpy.
+"""
+
+import asyncio
+import math
+import os
+import struct
+import time
+from typing import Optional, Sequence
+
+from .audio_io import open_pcm_wav
+
+
+_FULL_SCALE = 32768.0
+_NORMALIZE_MODES = ("peak", "rms", None)
+_DEFAULT_TARGET_DB = {"peak": -1.0, "rms": -20.0}
+
+
+class PCMFile:
+    """Vị trí và định dạng phần data PCM 16-bit của một file WAV; pcm() là np.memmap (khung x kênh)."""
+
+    __slots__ = ("path", "offset", "frames", "channels", "sample_rate")
+
+    def __init__(self, path: str, offset: int, frames: int, channels: int, sample_rate: int):
+        self.path = path
+        self.offset = offset
+        self.frames = frames
+        self.channels = channels
+        self.sample_rate = sample_rate
+
+    @classmethod
+    def open(cls, path: str) -> "PCMFile":
+        with open(path, "rb") as f:
+            head = f.read(12)
+            if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+                raise ValueError(f"{path}: không phải file WAV")
+            fmt = None
+            while True:
+                chunk = f.read(8)
+                if len(chunk) < 8:
+                    raise ValueError(f"{path}: không tìm thấy chunk data")
+                chunk_id, size = chunk[:4], struct.unpack("<I", chunk[4:])[0]
+                if chunk_id == b"fmt ":
+                    fmt = struct.unpack("<HHIIHH", f.read(size)[:16])
+                    f.seek(size & 1, 1)
+                elif chunk_id == b"data":
+                    offset = f.tell()
+                    available = os.fstat(f.fileno()).st_size - offset
+                    if size == 0 or size > available:
+                        size = available  # header chưa được cập nhật (file đang ghi dở hoặc bị ngắt)
+                    break
+                else:
+                    f.seek(size + (size & 1), 1)
+        if fmt is None:
+            raise ValueError(f"{path}: thiếu chunk fmt")
+        audio_format, channels, sample_rate, _, _, bits = fmt
+        if audio_format not in (1, 0xFFFE) or bits != 16:
+            raise ValueError(f"{path}: chỉ hỗ trợ PCM 16-bit (format {audio_format}, {bits} bit)")
+        return cls(path, offset, size // (channels * 2), channels, sample_rate)
+
+    def pcm(self):
+        import numpy as np
+
+        if not self.frames:
+            return np.zeros((0, self.channels), dtype="<i2")
+        return np.memmap(self.path, dtype="<i2", mode="r", offset=self.offset, shape=(self.frames, self.channels))
+
+    @property
+    def seconds(self) -> float:
+        return self.frames / self.sample_rate
+
+
+def stitch_wav(
+    inputs: Sequence[str],
+    output_path: str,
+    trim_silence: bool = True,
+    silence_db: float = -50.0,
+    keep_silence_ms: float = 80.0,
+    gap_ms: float = 250.0,
+    crossfade_ms: float = 0.0,
+    fade_ms: float = 5.0,
+    normalize: Optional[str] = "rms",
+    target_db: Optional[float] = None,
+    peak_ceiling_db: float = -1.0,
+    sample_rate: Optional[int] = None,
+    block_frames: int = 1 << 18,
+) -> dict:
+    """
+    Ghép (và hậu xử lý) các file WAV PCM 16-bit theo thứ tự thành output_path.
+
+    Một file đầu vào cũng được: dùng để cắt khoảng lặng/chuẩn hóa/đổi tần số một
+    file. crossfade_ms > 0 thay cho gap_ms. normalize=None giữ nguyên âm lượng.
+    output_path có thể trùng một file đầu vào (kết quả được ghi vào file tạm rồi
+    đổi tên). Đoạn chỉ toàn khoảng lặng bị bỏ qua khi trim_silence.
+
+    Returns: dict thống kê {"segments", "skipped", "input_s", "output_s",
+    "trimmed_s", "gains_db", "elapsed_s"}.
+    """
+    import numpy as np
+
+    if normalize not in _NORMALIZE_MODES:
+        raise ValueError(f"normalize phải là một trong {_NORMALIZE_MODES}")
+    if not inputs:
+        raise ValueError("Không có file nào để ghép.")
+    started = time.perf_counter()
+    files = [PCMFile.open(path) for path in inputs]
+    channels = files[0].channels
+    if any(f.channels != channels for f in files):
+        raise ValueError("Các file đầu vào phải có cùng số kênh.")
+    out_rate = sample_rate or files[0].sample_rate
+    block = max(1024, block_frames)
+    if target_db is None and normalize:
+        target_db = _DEFAULT_TARGET_DB[normalize]
+    threshold = int(_FULL_SCALE * 10 ** (silence_db / 20))
+    ceiling = _FULL_SCALE * 10 ** (peak_ceiling_db / 20)
+
+    # Lượt 1: biên đoạn có tiếng và hệ số âm lượng của từng đoạn (chỉ đọc, theo khối)
+    segments = []
+    input_s = sum(f.seconds for f in files)
+    stats = {"segments": 0, "skipped": 0, "input_s": input_s, "trimmed_s": input_s, "gains_db": []}
+    for f in files:
+        pcm = f.pcm()
+        start, end = 0, len(pcm)
+        if trim_silence:
+            bounds = _loud_bounds(np, pcm, threshold, block)
+            if bounds is None:
+                stats["skipped"] += 1
+                continue
+            keep = int(keep_silence_ms * f.sample_rate / 1000)
+            start, end = max(0, bounds[0] - keep), min(len(pcm), bounds[1] + keep)
+        pcm = pcm[start:end]
+        stats["trimmed_s"] -= len(pcm) / f.sample_rate
+        gain = 1.0
+        if normalize:
+            peak, rms = _levels(np, pcm, block)
+            if peak:
+                level = peak if normalize == "peak" else rms
+                gain = min(_FULL_SCALE * 10 ** (target_db / 20) / level, ceiling / peak)
+        stats["gains_db"].append(round(20 * math.log10(gain), 2))
+        frames = len(pcm) if f.sample_rate == out_rate else len(pcm) * out_rate // f.sample_rate
+        segments.append((pcm, f.sample_rate, gain, frames))
+    stats["segments"] = len(segments)
+
+    # Lượt 2: ghi dần ra file tạm
+    fade = int(fade_ms * out_rate / 1000)
+    overlap = int(crossfade_ms * out_rate / 1000)
+    gap = 0 if overlap else int(gap_ms * out_rate / 1000)
+    tmp_path = f"{output_path}.part"
+    written = 0
+    try:
+        with open_pcm_wav(tmp_path, channels, 2, out_rate) as wf:
+            def write(y):
+                nonlocal written
+                np.rint(y, out=y)
+                np.clip(y, -_FULL_SCALE, _FULL_SCALE - 1, out=y)
+                wf.writeframesraw(y.astype("<i2").tobytes())
+                written += len(y)
+
+            tail = None  # phần cuối đoạn trước, giữ lại để crossfade với đầu đoạn sau
+            for k, (pcm, rate, gain, frames) in enumerate(segments):
+                last = k == len(segments) - 1
+                head = len(tail) if tail is not None else 0
+                hold = 0 if last or not overlap else min(overlap, frames // 2, segments[k + 1][3] // 2)
+                fade_in = min(fade, frames // 2) if not head else 0
+                fade_out = min(fade, frames // 2) if not hold else 0
+                if k and gap:
+                    for s in range(0, gap, block):
+                        write(np.zeros((min(block, gap - s), channels), dtype=np.float32))
+                held = []
+                pos = 0
+                for y in _render(np, pcm, rate, out_rate, frames, block):
+                    n = len(y)
+                    if gain != 1.0:
+                        y *= np.float32(gain)
+                    _ramp(np, y, pos, 0, fade_in, rising=True)
+                    _ramp(np, y, pos, frames - fade_out, fade_out, rising=False)
+                    if pos < head:
+                        # Crossfade equal-power: đoạn trước nhỏ dần (cos), đoạn này to dần (sin)
+                        m = min(head - pos, n)
+                        t = ((np.arange(pos, pos + m, dtype=np.float32) + 0.5) / head * (np.pi / 2))[:, None]
+                        y[:m] = tail[pos:pos + m] * np.cos(t) + y[:m] * np.sin(t)
+                    cut = max(frames - hold - pos, 0)
+                    if cut < n:
+                        held.append(y[cut:].copy())
+                        y = y[:cut]
+                    if len(y):
+                        write(y)
+                    pos += n
+                tail = np.concatenate(held) if held else None
+            if tail is not None:
+                write(tail)
+        # Bỏ tham chiếu tới các memmap trước khi đổi tên (output_path có thể là một file đầu vào)
+        segments = pcm = None
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    stats["output_s"] = written / out_rate
+    stats["elapsed_s"] = time.perf_counter() - started
+    return stats
+
+
+async def stitch_wav_async(inputs: Sequence[str], output_path: str, **options) -> dict:
+    """Bản async của stitch_wav() (cùng tùy chọn); chạy trong thread."""
+    return await asyncio.to_thread(stitch_wav, inputs, output_path, **options)
+
+
+def postprocess_wav(input_path: str, output_path: Optional[str] = None, **options) -> dict:
+    """Cắt khoảng lặng/chuẩn hóa/đổi tần số một file (mặc định ghi đè input_path); tùy chọn như stitch_wav()."""
+    return stitch_wav([input_path], output_path or input_path, **options)
+
+
+def _loud_bounds(np, pcm, threshold: int, block: int):
+    """(khung đầu, khung cuối + 1) có biên độ vượt threshold, hoặc None nếu cả đoạn là khoảng lặng."""
+    def loud(b):
+        # So sánh trên int16, không lấy abs (tránh tràn số với -32768 và không phải chép mảng)
+        return np.flatnonzero(((b > threshold) | (b < -threshold)).any(axis=1))
+
+    n = len(pcm)
+    start = None
+    for s in range(0, n, block):
+        idx = loud(pcm[s:s + block])
+        if idx.size:
+            start = s + int(idx[0])
+            break
+    if start is None:
+        return None
+    for e in range(n, start, -block):
+        s = max(start, e - block)
+        idx = loud(pcm[s:e])
+        if idx.size:
+            return start, s + int(idx[-1]) + 1
+    return start, start + 1
+
+
+def _levels(np, pcm, block: int):
+    """(đỉnh tuyệt đối, RMS) của đoạn, theo thang int16."""
+    peak = 0
+    squares = 0.0
+    for s in range(0, len(pcm), block):
+        b = pcm[s:s + block]
+        if not b.size:
+            continue
+        peak = max(peak, int(b.max()), -int(b.min()))
+        x = b.astype(np.float32)
+        np.square(x, out=x)
+        squares += float(x.sum(dtype=np.float64))
+    return peak, math.sqrt(squares / pcm.size) if pcm.size else 0.0
+
+
+def _render(np, pcm, rate: int, out_rate: int, frames: int, block: int):
+    """Các khối float32 (khung x kênh) của đoạn ở tần số out_rate."""
+    if rate == out_rate:
+        for s in range(0, frames, block):
+            yield pcm[s:s + block].astype(np.float32)
+        return
+    step = rate / out_rate
+    last = len(pcm) - 1
+    for s in range(0, frames, block):
+        position = np.arange(s, min(s + block, frames), dtype=np.float64) * step
+        index = position.astype(np.int64)
+        frac = (position - index).astype(np.float32)[:, None]
+        lo = int(index[0])
+        src = pcm[lo:min(int(index[-1]) + 2, last + 1)].astype(np.float32)
+        i = index - lo
+        a = src[i]
+        b = src[np.minimum(i + 1, len(src) - 1)]
+        b -= a
+        b *= frac
+        a += b
+        yield a
+
+
+def _ramp(np, y, pos: int, start: int, length: int, rising: bool) -> None:
+    """Nhân phần của khối y (bắt đầu ở khung pos) nằm trong [start, start + length) với đường fade tuyến tính."""
+    lo, hi = max(pos, start), min(pos + len(y), start + length)
+    if length <= 0 or lo >= hi:
+        return
+    t = (np.arange(lo, hi, dtype=np.float32) - start + 0.5) / length
+    y[lo - pos:hi - pos] *= (t if rising else 1 - t)[:, None]
@@ -1,39 +1,35 @@
-import requests
+import asyncio
 import json
 import base64
-import io
-from PIL import Image
-import matplotlib.pyplot as plt
-import cv2
-import numpy as np
 import os
+from typing import Optional, Union
 
+from .artifact_cache import get_artifact_cache, make_cache_key
+from .file_refs import chat_image_part, get_file_ref_async, invalidate_file_ref, is_file_ref_rejection
+from .http_client import api_url, get_async_http_client, bearer_headers, run_sync
+from .image_prep import edit_target, prepare_input_image_async
+from .instrumentation import clock, record_phase
+from .media_sink import ImageData, ImageResult, save_image_bytes_async, show_image
+from .single_flight import get_single_flight, share_file_async
 
-# sinh hình ảnh theo kiểu chat, nghĩa là có thể mô tả qua 1 nhân vật có trước
-def api_chat_completions(content: str, image_filename: str, api_key: str, input_image_path: str = None):
-    url = "https://api.thucchien.ai/chat/completions"
-    
-    parts = []
+
+# sinh hình ảnh theo kiểu chat, nghĩa là có thể mô tả qua 1 nhân vật có trước (bản async, không hiển thị ảnh)
+# input_image_path: đường dẫn file hoặc ImageData; image_filename=None: trả về ImageData, không ghi đĩa.
+async def api_chat_completions_async(content: str, image_filename: Optional[str], api_key: str,
+                                     input_image_path: Union[str, ImageData] = None):
+    url = api_url("/chat/completions")
+    model = "gemini-2.5-flash-image-preview"
     
-    # Luôn thêm phần văn bản vào parts
-    parts.append({
-        "type": "text",
-        "text": content
-    })
+    image = None
+    input_bytes = None
     
-    # Nếu có đường dẫn ảnh, đọc và mã hóa nó, sau đó thêm vào parts
+    # Nếu có đường dẫn ảnh, đọc và thu nhỏ nó (part ảnh được thêm khi dựng payload)
     if input_image_path:
         try:
-            with open(input_image_path, "rb") as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
-            # Giả sử định dạng là PNG, bạn có thể thay đổi nếu cần (ví dụ: image/jpeg)
-            base64_image_url = f"data:image/png;base64,{encoded_string}"
-            parts.append({
-                "type": "image_url",
-                "image_url": {
-                    "url": base64_image_url
-                }
-            })
+            source = await ImageData.load_async(input_image_path)
+            input_bytes = source.data
+            # Thu nhỏ, bỏ metadata; data URL mang đúng mime type của ảnh đã mã hóa
+            image = await prepare_input_image_async(source, edit_target())
         except FileNotFoundError:
             print(f"Lỗi: Không tìm thấy file ảnh tại đường dẫn {input_image_path}. Bỏ qua hình ảnh đầu vào.")
             return # Thoát hàm nếu không tìm thấy ảnh đầu vào
@@ -41,68 +37,118 @@ def api_chat_completions(content: str, image_filename: str, api_key: str, input_
             print(f"Lỗi khi đọc hoặc mã hóa hình ảnh {input_image_path}: {e}. Bỏ qua hình ảnh đầu vào.")
             return # Thoát hàm nếu có lỗi xử lý ảnh
 
-    # Cấu trúc messages_list với một tin nhắn duy nhất chứa list các parts
-    messages_list = [
-        {
-          "role": "user",
-          "content": parts
-        }
-    ]
-
-    payload = json.dumps({
-      "model": "gemini-2.5-flash-image-preview",
-      "messages": messages_list,
-      "modalities": [
-        "image"
-      ]
-    })
-    headers = {
-      'Content-Type': 'application/json',
-      'Authorization': f'Bearer {api_key}'
-    }
-
-    response = requests.request("POST", url, headers=headers, data=payload)
-    data = json.loads(response.text)
-    print(data)
-    try:
-        image_data_url = data['choices'][0]['message']['images'][0]['image_url']['url']
-        base64_string = image_data_url.split(',')[1]
-
-        img_data = base64.b64decode(base64_string)
-        img = Image.open(io.BytesIO(img_data))
+    # Dùng lại ảnh đã sinh nếu cùng nội dung và ảnh đầu vào (định dạng lưu theo extension của file đích)
+    cache_key = make_cache_key("chat_image", model, content,
+                               {"output_format": os.path.splitext(image_filename or "")[1].lower()},
+                               input_bytes=input_bytes)
+    cache = get_artifact_cache()
+    if cache and image_filename is None:
+        cached = await asyncio.to_thread(cache.get, cache_key)
+        if cached is not None:
+            print("♻️ Lấy từ cache (trong bộ nhớ)")
+            return ImageData(cached)
+    elif cache and await asyncio.to_thread(cache.get_to_file, cache_key, image_filename):
+        print(f"♻️ Lấy từ cache: {image_filename}")
+        return ImageResult(image_filename)
 
-        # Optional: Hiển thị hình ảnh (có thể bỏ qua nếu chỉ muốn lưu)
-        plt.imshow(img)
-        plt.axis('off')
-        plt.title(f"Generated Image: {image_filename}")
-        plt.show()
+    def build_payload(ref):
+        # Luôn thêm phần văn bản vào parts; ảnh là file URI đã tải lên hoặc data URL
+        parts = [{
+            "type": "text",
+            "text": content
+        }]
+        if image is not None:
+            parts.append(chat_image_part(image, ref))
+        # Cấu trúc messages_list với một tin nhắn duy nhất chứa list các parts
+        messages_list = [
+            {
+              "role": "user",
+              "content": parts
+            }
+        ]
 
-        img_np = np.array(img)
-        cv2.imwrite(image_filename, cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR))
-        print(f"Hình ảnh đã được lưu thành: {image_filename}")
-    except (KeyError, IndexError) as e:
-        print(f"Không thể lấy dữ liệu hình ảnh từ phản hồi API: {e}")
-        print(f"Phản hồi API: {response.text}")
+        return json.dumps({
+          "model": model,
+          "messages": messages_list,
+          "modalities": [
+            "image"
+          ]
+        })
+
+    async def generate():
+        # Ảnh tham chiếu dùng lại nhiều lần: gửi file URI thay cho base64 (xem utils/file_refs.py)
+        file_ref = await get_file_ref_async(image, api_key) if image is not None else None
+        client = get_async_http_client()
+        response = await client.post(url, headers=bearer_headers(api_key), content=build_payload(file_ref))
+        if file_ref is not None and is_file_ref_rejection(response.status_code):
+            # File URI bị từ chối (hết hạn, bị xóa): gửi lại một lần với ảnh inline
+            invalidate_file_ref(image, api_key)
+            response = await client.post(url, headers=bearer_headers(api_key), content=build_payload(None))
+        data = json.loads(response.text)
+        print(data)
+        try:
+            image_data_url = data['choices'][0]['message']['images'][0]['image_url']['url']
+            header, base64_string = image_data_url.split(',', 1)
+            mime_type = header[len("data:"):].split(";")[0] or None
 
+            t = clock()
+            image_bytes = base64.b64decode(base64_string)
+            record_phase("decode", "data_url", t, len(image_bytes), model)
+            if image_filename is None:
+                result = ImageData(image_bytes, mime_type)
+                if cache:
+                    await asyncio.to_thread(cache.put, cache_key, result.data)
+                print(f"Hình ảnh đã được sinh trong bộ nhớ: {result}")
+                return result
+            result = await save_image_bytes_async(image_bytes, image_filename, mime_type)
+            if cache:
+                await asyncio.to_thread(cache.put_file, cache_key, image_filename)
+            print(f"Hình ảnh đã được lưu thành: {image_filename}")
+            return result
+        except (KeyError, IndexError) as e:
+            print(f"Không thể lấy dữ liệu hình ảnh từ phản hồi API: {e}")
+            print(f"Phản hồi API: {response.text}")
+
+    # Cùng nội dung và ảnh đầu vào đang được sinh ở lời gọi khác: dùng chung request đó rồi chép file
+    if image_filename is None:
+        return await get_single_flight().do_async(f"{cache_key}:memory", generate, kind="chat_image")
+    produced = await get_single_flight().do_async(cache_key, generate, kind="chat_image")
+    if produced is None:
+        return None
+    await share_file_async(produced, image_filename)
+    return ImageResult(image_filename, produced.mime_type)
+
+
+def api_chat_completions(content: str, image_filename: Optional[str], api_key: str,
+                         input_image_path: Union[str, ImageData] = None, show: bool = True):
+    """Bản đồng bộ của api_chat_completions_async(), có hiển thị ảnh kết quả (tắt bằng show=False)."""
+    saved_filename = run_sync(api_chat_completions_async(
+        content, image_filename, api_key, input_image_path=input_image_path
+    ))
+    if saved_filename and show:
+        # Optional: Hiển thị hình ảnh (có thể bỏ qua nếu chỉ muốn lưu)
+        show_image(saved_filename, f"Generated Image: {image_filename or saved_filename}")
+    return saved_filename
 
 
-api_key = os.getenv("API_KEY", "sk-1234")
+if __name__ == "__main__":
+    api_key = os.getenv("API_KEY", "sk-1234")
 
-# # --- Ví dụ 1: Chỉ với nội dung văn bản (tương tự cURL bạn cung cấp) ---
-# print("\n--- Ví dụ 1: Chỉ với nội dung văn bản ---")
-# content_only_text = "A breathtaking scene where a majestic waterfall cascades down rugged cliffs, shimmering like silver threads under the warm sunlight. Lush greenery surrounds the falls—towering trees, vibrant flowers, and soft moss painting nature’s perfect canvas. Mist rises gently, forming a magical rainbow that arches across the sky, while birds soar gracefully above as if dancing to the music of nature. A dreamlike moment that blends serenity and beauty in one stunning view."
-# filename_only_text = "waterfall_scene.png"
-# api_chat_completions(content_only_text, filename_only_text, api_key)
+    # # --- Ví dụ 1: Chỉ với nội dung văn bản (tương tự cURL bạn cung cấp) ---
+    # print("\n--- Ví dụ 1: Chỉ với nội dung văn bản ---")
+    # content_only_text = "A breathtaking scene where a majestic waterfall cascades down rugged cliffs, shimmering like silver threads under the warm sunlight. Lush greenery surrounds the falls—towering trees, vibrant flowers, and soft moss painting nature’s perfect canvas. Mist rises gently, forming a magical rainbow that arches across the sky, while birds soar gracefully above as if dancing to the music of nature. A dreamlike moment that blends serenity and beauty in one stunning view."
+    # filename_only_text = "waterfall_scene.png"
+    # api_chat_completions(content_only_text, filename_only_text, api_key)
 
-# --- Ví dụ 2: Với nội dung văn bản và đường dẫn ảnh đầu vào ---
-print("\n--- Ví dụ 2: Với nội dung văn bản và đường dẫn ảnh đầu vào ---")
-new_content = """
+    # --- Ví dụ 2: Với nội dung văn bản và đường dẫn ảnh đầu vào ---
+    print("\n--- Ví dụ 2: Với nội dung văn bản và đường dẫn ảnh đầu vào ---")
+    new_content = """
 The Phantom Thief's design is characterized by a white suit, fedora, long cape, 
 and signature monocle, creating an image that is both elegant and mysterious. 
 He often appears amidst white smoke or under the moonlight, making each of his heists look like a grand magic show. 
 The thief's features are similar to the man below.
 """
 
-image_with_path_filename = "character_from_image_description.png"
-sample_image_path = "assets/sherlock.png" # Sử dụng ảnh của bạn
-api_chat_completions(new_content, image_with_path_filename, api_key, input_image_path=sample_image_path)
+    image_with_path_filename = "character_from_image_description.png"
+    sample_image_path = "assets/sherlock.png" # Sử dụng ảnh của bạn
+    api_chat_completions(new_content, image_with_path_filename, api_key, input_image_path=sample_image_path)
@@ -0,0 +1,268 @@
+"""
+Tải file lớn (video Veo) theo nhiều đoạn byte song song và có thể tải tiếp.
+
+Cách cũ stream cả file qua một kết nối với các khối 8 KB: rớt mạng ở 90% là
+phải tải lại từ đầu. Ở đây:
+- gửi một request "Range: bytes=0-0" để biết kích thước file và server có hỗ
+  trợ Range hay không;
+- cấp phát trước file tạm `<output>.part` đúng kích thước rồi tải các đoạn
+  song song qua pool kết nối dùng chung, ghi từng đoạn vào đúng offset bằng
+  os.pwrite;
+- ghi danh sách các đoạn đã xong vào file trạng thái `<output>.part.json`; lần
+  chạy sau (cùng URL, cùng kích thước/ETag) chỉ tải các đoạn còn thiếu;
+- nếu server không hỗ trợ Range thì tải một luồng như cũ;
+- file rỗng (server trả 416 với "Content-Range: bytes */0") được tạo rỗng.
+"""
+
+import asyncio
+import json
+import os
+import random
+import re
+import threading
+from typing import Callable, Mapping, Optional
+
+import httpx
+
+from .http_client import get_async_http_client, run_sync
+from .instrumentation import phase_timer
+
+
+_CONTENT_RANGE = re.compile(r"bytes\s+(?:(\d+)-(\d+)|\*)/(\d+|\*)")
+
+
+class RangeNotSupported(Exception):
+    """Server trả về toàn bộ file thay vì đoạn byte được yêu cầu."""
+
+
+async def download_file_async(url: str, output_path: str, headers: Optional[Mapping[str, str]] = None,
+                              part_size: int = 8 * 1024 * 1024, max_connections: int = 4,
+                              max_retries: int = 3,
+                              progress: Optional[Callable[[int, int], None]] = None) -> int:
+    """
+    Tải url về output_path. Trả về số byte của file.
+
+    Parameters
+    ----------
+    headers : Mapping | None
+        Header gửi kèm mọi request (ví dụ gemini_headers(api_key)).
+    part_size : int
+        Kích thước mỗi đoạn byte.
+    max_connections : int
+        Số đoạn được tải đồng thời.
+    max_retries : int
+        Số lần thử lại cho mỗi đoạn; đoạn bị ngắt giữa chừng được tải tiếp từ
+        byte cuối cùng đã nhận.
+    progress : callable(downloaded, total) | None
+        Được gọi mỗi khi tải xong một đoạn (total = 0 nếu không biết kích thước).
+
+    Lỗi HTTP được raise dạng httpx.HTTPError; file tạm và file trạng thái được
+    giữ lại để lần gọi sau tải tiếp.
+    """
+    headers = dict(headers or {})
+    client = get_async_http_client()
+
+    probe_headers = {**headers, "Range": "bytes=0-0"}
+    async with client.stream("GET", url, headers=probe_headers, follow_redirects=True) as response:
+        if response.status_code == 416 and _total_size(response) == 0:
+            # File rỗng: không có byte 0 nào để trả về cho Range bytes=0-0
+            await response.aread()
+            return await asyncio.to_thread(_write_empty, output_path)
+        if response.is_error:
+            await response.aread()
+            response.raise_for_status()
+        size = _total_size(response)
+        if response.status_code != 206 or size is None:
+            # Server bỏ qua Range: chính phản hồi này đã là toàn bộ file
+            return await _finish_single_stream(response, output_path, progress)
+        validator = response.headers.get("etag") or response.headers.get("last-modified")
+
+    try:
+        return await _download_ranges(client, url, headers, output_path, size, validator,
+                                      part_size, max_connections, max_retries, progress)
+    except RangeNotSupported as e:
+        print(f"⚠️ {e}; chuyển sang tải một luồng.")
+        async with client.stream("GET", url, headers=headers, follow_redirects=True) as response:
+            response.raise_for_status()
+            return await _finish_single_stream(response, output_path, progress)
+
+
+def download_file(url: str, output_path: str, headers: Optional[Mapping[str, str]] = None, **options) -> int:
+    """Bản đồng bộ của download_file_async() (cùng tham số)."""
+    return run_sync(download_file_async(url, output_path, headers, **options))
+
+
+async def _download_ranges(client: httpx.AsyncClient, url: str, headers: dict, output_path: str,
+                           size: int, validator: Optional[str], part_size: int, max_connections: int,
+                           max_retries: int, progress: Optional[Callable[[int, int], None]]) -> int:
+    part_path, state_path = f"{output_path}.part", f"{output_path}.part.json"
+
+    state = _load_state(state_path)
+    if not (state and state.get("url") == url and state.get("size") == size
+            and state.get("validator") == validator and state.get("part_size") == part_size
+            and os.path.exists(part_path)):
+        state = {"url": url, "size": size, "validator": validator, "part_size": part_size, "done": []}
+        _remove_quietly(part_path)
+
+    parts = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+    done = set(state["done"])
+    pending = asyncio.Queue()
+    for index in range(len(parts)):
+        if index not in done:
+            pending.put_nowait(index)
+    if done:
+        print(f"↩️ Tải tiếp {output_path}: đã có {len(done)}/{len(parts)} đoạn")
+
+    fd = os.open(part_path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if os.fstat(fd).st_size != size:
+            os.ftruncate(fd, size)
+        writer = _PositionalWriter(fd)
+        downloaded = sum(parts[i][1] - parts[i][0] + 1 for i in done)
+        save_lock = asyncio.Lock()
+
+        async def worker():
+            nonlocal downloaded
+            while True:
+                try:
+                    index = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                start, end = parts[index]
+                await _download_range(client, url, headers, start, end, writer, max_retries)
+                done.add(index)
+                downloaded += end - start + 1
+                # Dữ liệu của đoạn phải nằm trên đĩa trước khi đoạn được đánh dấu là xong
+                async with save_lock:
+                    state["done"] = sorted(done)
+                    await asyncio.to_thread(_sync_and_save_state, fd, state_path, dict(state))
+                if progress:
+                    progress(downloaded, size)
+
+        workers = [asyncio.create_task(worker()) for _ in range(min(max_connections, pending.qsize()))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+    finally:
+        os.close(fd)
+
+    os.replace(part_path, output_path)
+    _remove_quietly(state_path)
+    return size
+
+
+async def _download_range(client: httpx.AsyncClient, url: str, headers: dict, start: int, end: int,
+                          writer: "_PositionalWriter", max_retries: int) -> None:
+    offset = start
+    timer = phase_timer("file_download")
+    for attempt in range(max_retries + 1):
+        try:
+            range_headers = {**headers, "Range": f"bytes={offset}-{end}"}
+            async with client.stream("GET", url, headers=range_headers, follow_redirects=True) as response:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+                if response.status_code != 206:
+                    raise RangeNotSupported(f"{url} trả về {response.status_code} cho Range bytes={offset}-{end}")
+                async for chunk in response.aiter_bytes(256 * 1024):
+                    chunk = chunk[:end + 1 - offset]
+                    t = timer.clock()
+                    writer.write(chunk, offset)
+                    timer.lap("write", t, len(chunk))
+                    offset += len(chunk)
+            if offset > end:
+                timer.finish()
+                return
+            raise httpx.RemoteProtocolError(f"Đoạn bytes={start}-{end} bị cắt ở byte {offset}")
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code < 500 or attempt == max_retries:
+                raise
+        except httpx.TransportError:
+            if attempt == max_retries:
+                raise
+        await asyncio.sleep(min(2 ** attempt, 30) * (0.5 + random.random()))
+
+
+async def _finish_single_stream(response: httpx.Response, output_path: str,
+                               progress: Optional[Callable[[int, int], None]]) -> int:
+    part_path, state_path = f"{output_path}.part", f"{output_path}.part.json"
+    _remove_quietly(state_path)  # không tải tiếp được khi không có Range
+    total = int(response.headers.get("content-length") or 0)
+    written = 0
+    timer = phase_timer("file_download")
+    with open(part_path, "wb") as f:
+        async for chunk in response.aiter_bytes(256 * 1024):
+            t = timer.clock()
+            f.write(chunk)
+            timer.lap("write", t, len(chunk))
+            written += len(chunk)
+            if progress:
+                progress(written, total)
+    timer.finish()
+    os.replace(part_path, output_path)
+    return written
+
+
+def _write_empty(output_path: str) -> int:
+    _remove_quietly(f"{output_path}.part")
+    _remove_quietly(f"{output_path}.part.json")
+    open(output_path, "wb").close()
+    return 0
+
+
+def _total_size(response: httpx.Response) -> Optional[int]:
+    m = _CONTENT_RANGE.match(response.headers.get("content-range", ""))
+    if not m or m.group(3) == "*":
+        return None
+    return int(m.group(3))
+
+
+class _PositionalWriter:
+    """Ghi vào file theo offset; các đoạn song song không cần chung vị trí con trỏ file."""
+
+    def __init__(self, fd: int):
+        self.fd = fd
+        self._lock = None if hasattr(os, "pwrite") else threading.Lock()
+
+    def write(self, data: bytes, offset: int) -> None:
+        if self._lock is None:
+            while data:
+                n = os.pwrite(self.fd, data, offset)
+                data, offset = data[n:], offset + n
+            return
+        with self._lock:  # Windows: không có os.pwrite
+            os.lseek(self.fd, offset, os.SEEK_SET)
+            while data:
+                n = os.write(self.fd, data)
+                data = data[n:]
+
+
+def _load_state(path: str) -> Optional[dict]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _sync_and_save_state(fd: int, path: str, state: dict) -> None:
+    getattr(os, "fdatasync", os.fsync)(fd)
+    _save_state(path, state)
+
+
+def _save_state(path: str, state: dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -1,130 +1,215 @@
-import requests
+import asyncio
 import json
-import base64
-import io
-from PIL import Image
-import matplotlib.pyplot as plt
-import cv2
-import numpy as np
 import os
-
-
-# Hàm mới để sinh hoặc sửa ảnh bằng API Google Gemini
-def generate_or_modify_image_gemini(prompt: str, output_filepath: str, api_key: str, 
-                                    input_image_path: str = None, aspect_ratio: str = "1:1"):
-    url = "https://api.thucchien.ai/gemini/v1beta/models/gemini-2.5-flash-image-preview:generateContent"
+from typing import Optional, Union
+
+import httpx
+
+from .artifact_cache import get_artifact_cache, make_cache_key
+from .file_refs import gemini_image_part, get_file_ref_async, invalidate_file_ref, is_file_ref_rejection
+from .http_client import api_url, gemini_headers, run_sync
+from .image_prep import edit_target, prepare_input_image_async
+from .inline_data_stream import InlineDataNotFound, stream_inline_data_async, stream_inline_data_to_file_async
+from .single_flight import get_single_flight, share_file_async
+from .media_sink import ImageData, ImageResult, resolve_output_path, save_image_bytes_async, save_image_file_async, show_image, sniff_image_mime
+
+
+# Hàm mới để sinh hoặc sửa ảnh bằng API Google Gemini (bản async, không hiển thị ảnh)
+# input_image_path: đường dẫn file hoặc ImageData (ví dụ kết quả của lần gọi trước).
+# output_filepath=None: không ghi đĩa, trả về ImageData trong bộ nhớ để dùng tiếp cho bước sau.
+async def generate_or_modify_image_gemini_async(prompt: str, output_filepath: Optional[str], api_key: str,
+                                                input_image_path: Union[str, ImageData] = None,
+                                                aspect_ratio: str = "1:1"):
+    model = "gemini-2.5-flash-image-preview"
+    url = api_url(f"/gemini/v1beta/models/{model}:generateContent")
     
-    parts_list = [
-        {"text": prompt}
-    ]
+    image = None
+    input_bytes = None
     
     if input_image_path:
         try:
-            with open(input_image_path, "rb") as image_file:
-                encoded_string = base64.b64encode(image_file.read()).decode("utf-8")
-            # Cố gắng suy luận mime_type từ phần mở rộng file hoặc mặc định là image/png
-            mime_type = "image/png"
-            if input_image_path.lower().endswith(('.jpg', '.jpeg')):
-                mime_type = "image/jpeg"
-            elif input_image_path.lower().endswith('.gif'):
-                mime_type = "image/gif"
-
-            parts_list.append({
-                "inline_data": {
-                    "mime_type": mime_type,
-                    "data": encoded_string
-                }
-            })
+            source = await ImageData.load_async(input_image_path)
+            input_bytes = source.data
+            # Thu nhỏ, bỏ metadata; mime_type nhận dạng theo nội dung ảnh
+            image = await prepare_input_image_async(source, edit_target())
         except FileNotFoundError:
             print(f"Lỗi: Không tìm thấy file ảnh đầu vào tại đường dẫn {input_image_path}. Chỉ sinh ảnh từ prompt.")
             input_image_path = None # Đảm bảo không cố gắng sửa đổi nếu không tìm thấy ảnh
+            input_bytes = None
         except Exception as e:
             print(f"Lỗi khi đọc hoặc mã hóa hình ảnh đầu vào {input_image_path}: {e}. Chỉ sinh ảnh từ prompt.")
             input_image_path = None
-
-    payload = json.dumps({
-      "contents": [
-        {
-          "parts": parts_list
-        }
-      ],
-      "generationConfig": {
-          "imageConfig": {
-              "aspectRatio": aspect_ratio
+            input_bytes = None
+
+    # Định dạng file đầu ra do extension quyết định; "auto" = theo mimeType trả về
+    extension = output_filepath.split('.')[-1] if output_filepath and '.' in output_filepath else None
+    output_format = extension if extension in ['png', 'jpeg', 'jpg', 'gif'] else "auto"
+
+    # Dùng lại ảnh đã sinh nếu cùng prompt, tham số và ảnh đầu vào
+    cache_key = make_cache_key("gemini_image", model, prompt,
+                               {"aspect_ratio": aspect_ratio, "output_format": output_format},
+                               input_bytes=input_bytes)
+    cache = get_artifact_cache()
+    if cache:
+        cached = await asyncio.to_thread(cache.get, cache_key)
+        if cached is not None:
+            if output_filepath is None:
+                print("♻️ Lấy từ cache (trong bộ nhớ)")
+                return ImageData(cached)
+            final_output_filepath = resolve_output_path(output_filepath, sniff_image_mime(cached))
+            result = await save_image_bytes_async(cached, final_output_filepath)
+            print(f"♻️ Lấy từ cache: {final_output_filepath}")
+            return result
+
+    # Ảnh tham chiếu dùng lại nhiều lần: gửi file URI đã tải lên thay cho base64 (xem utils/file_refs.py)
+    file_ref = await get_file_ref_async(image, api_key) if image is not None else None
+
+    def build_payload(ref):
+        parts_list = [
+            {"text": prompt}
+        ]
+        if image is not None:
+            parts_list.append(gemini_image_part(image, ref))
+        return json.dumps({
+          "contents": [
+            {
+              "parts": parts_list
+            }
+          ],
+          "generationConfig": {
+              "imageConfig": {
+                  "aspectRatio": aspect_ratio
+              }
           }
-      }
-    })
-    
-    headers = {
-      'Content-Type': 'application/json',
-      'x-goog-api-key': api_key  # Sử dụng x-goog-api-key thay vì Authorization cho API Gemini
-    }
+        })
 
-    print(f"\nĐang gửi yêu cầu tới API Gemini với prompt: '{prompt[:50]}...' và ảnh đầu vào: {input_image_path is not None}\n")
-    response = requests.request("POST", url, headers=headers, data=payload)
-    data = json.loads(response.text)
-    print("Phản hồi API Gemini:", data)
+    payload = build_payload(file_ref)
 
-    try:
-        # API Gemini trả về hình ảnh trong candidates[0].content.parts[0].inlineData.data
-        image_base64_data = data['candidates'][0]['content']['parts'][0]['inlineData']['data']
-        mime_type = data['candidates'][0]['content']['parts'][0]['inlineData']['mimeType']  # Sửa từ mime_type thành mimeType
+    async def send(stream):
+        # File URI bị từ chối (hết hạn, bị xóa): bỏ URI và gửi lại một lần với ảnh inline
+        try:
+            return await stream(payload)
+        except httpx.HTTPStatusError as e:
+            if file_ref is None or not is_file_ref_rejection(e.response.status_code):
+                raise
+            invalidate_file_ref(image, api_key)
+            return await stream(build_payload(None))
 
-        img_data = base64.b64decode(image_base64_data)
-        img = Image.open(io.BytesIO(img_data))
+    print(f"\nĐang gửi yêu cầu tới API Gemini với prompt: '{prompt[:50]}...' và ảnh đầu vào: {input_image_path is not None}\n")
 
-        # Lưu ảnh
-        # Cố gắng đảm bảo định dạng file đầu ra khớp với mime_type trả về nếu output_filepath không có extension
-        final_output_filepath = output_filepath
-        if '.' not in output_filepath or not output_filepath.split('.')[-1] in ['png', 'jpeg', 'jpg', 'gif']:
-            extension = mime_type.split('/')[-1] if '/' in mime_type else 'png'
-            final_output_filepath = f"{output_filepath}.{extension}"
+    async def generate():
+        try:
+            # API Gemini trả về hình ảnh trong candidates[0].content.parts[0].inlineData.data.
+            # Ảnh được giải mã từng đoạn vào file tạm ngay khi body đang về, không parse cả phản hồi.
+            # Sử dụng x-goog-api-key thay vì Authorization cho API Gemini
+            tmp_path, mime_type = await send(lambda body: stream_inline_data_to_file_async(
+                url, gemini_headers(api_key), body, output_filepath
+            ))
+        except (httpx.HTTPStatusError, InlineDataNotFound) as e:
+            _report_error(e)
+            return None
 
-        img_np = np.array(img)
-        cv2.imwrite(final_output_filepath, cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR)) # OpenCV lưu theo BGR
-        print(f"Hình ảnh đã được lưu thành: {final_output_filepath}")
+        try:
+            # Lưu ảnh
+            # Cố gắng đảm bảo định dạng file đầu ra khớp với mime_type trả về nếu output_filepath không có extension.
+            # Nếu định dạng khớp, file tạm chỉ được đổi tên (không giải mã/mã hóa lại ảnh)
+            final_output_filepath = resolve_output_path(output_filepath, mime_type)
+            result = await save_image_file_async(tmp_path, final_output_filepath, mime_type)
+            if cache:
+                await asyncio.to_thread(cache.put_file, cache_key, final_output_filepath)
+            print(f"Hình ảnh đã được lưu thành: {final_output_filepath}")
+            return result
+        except Exception as e:
+            print(f"Lỗi khi xử lý hình ảnh từ phản hồi API Gemini: {e}")
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return None
+
+    async def generate_in_memory():
+        # Giải mã thẳng vào bộ nhớ: không có file tạm, không đọc lại từ đĩa
+        async def stream(body):
+            buffer = bytearray()
+            return buffer, await stream_inline_data_async(url, gemini_headers(api_key), body, buffer.extend)
 
+        try:
+            buffer, mime_type = await send(stream)
+        except (httpx.HTTPStatusError, InlineDataNotFound) as e:
+            _report_error(e)
+            return None
+        result = ImageData(buffer, mime_type)
+        if cache:
+            await asyncio.to_thread(cache.put, cache_key, result.data)
+        print(f"Hình ảnh đã được sinh trong bộ nhớ: {result}")
+        return result
+
+    # Cùng prompt, tham số và ảnh đầu vào đang được sinh ở lời gọi khác: dùng chung request đó
+    if output_filepath is None:
+        return await get_single_flight().do_async(f"{cache_key}:memory", generate_in_memory, kind="gemini_image")
+    produced = await get_single_flight().do_async(cache_key, generate, kind="gemini_image")
+    if produced is None:
+        return None
+    final_output_filepath = resolve_output_path(output_filepath, produced.mime_type)
+    await share_file_async(produced, final_output_filepath)
+    return ImageResult(final_output_filepath, produced.mime_type)
+
+
+def _report_error(e: Exception) -> None:
+    if isinstance(e, httpx.HTTPStatusError):
+        print(f"Lỗi từ API Gemini: {e.response.status_code}")
+        print(f"Phản hồi đầy đủ: {e.response.text}")
+    else:
+        print("Lỗi: Không tìm thấy inlineData trong phản hồi API Gemini. Có thể không có ứng viên hoặc phần nội dung nào.")
+        print(f"Phản hồi: {e.preview}")
+
+
+def generate_or_modify_image_gemini(prompt: str, output_filepath: Optional[str], api_key: str,
+                                    input_image_path: Union[str, ImageData] = None, aspect_ratio: str = "1:1",
+                                    show: bool = True):
+    """Bản đồng bộ của generate_or_modify_image_gemini_async(), có hiển thị ảnh kết quả (tắt bằng show=False)."""
+    final_output_filepath = run_sync(generate_or_modify_image_gemini_async(
+        prompt, output_filepath, api_key, input_image_path=input_image_path, aspect_ratio=aspect_ratio
+    ))
+    if final_output_filepath and show:
         # Hiển thị ảnh (tùy chọn)
-        plt.imshow(img)
-        plt.axis('off')
-        plt.title(f"Generated/Modified Image: {final_output_filepath}")
-        plt.show()
-        return final_output_filepath
-    except KeyError as e:
-        print(f"Lỗi: Không tìm thấy khóa {e} trong phản hồi API Gemini. Kiểm tra cấu trúc phản hồi.")
-        print(f"Phản hồi đầy đủ: {data}")
-    except IndexError as e:
-        print(f"Lỗi: Index ngoài phạm vi. Có thể không có ứng viên hoặc phần nội dung nào trong phản hồi API Gemini: {e}")
-        print(f"Phản hồi đầy đủ: {data}")
-    except Exception as e:
-        print(f"Lỗi khi xử lý hình ảnh từ phản hồi API Gemini: {e}")
-        print(f"Phản hồi API đầy đủ: {data}")
-    return None
-
-
-api_key = os.getenv("API_KEY", "sk-1234")
-
-# --- Ví dụ 1: Sinh ảnh mới từ prompt bằng API Gemini ---
-print("\n--- Ví dụ 1: Sinh ảnh mới từ prompt bằng API Gemini ---")
-gemini_prompt_new_image = "the gray cat is going down the stairs"
-gemini_output_new_image_filepath = "assets/cat_1.png"
-generate_or_modify_image_gemini(gemini_prompt_new_image, gemini_output_new_image_filepath, api_key, aspect_ratio="16:9")
-
-# --- Ví dụ 2: Sửa đổi ảnh hiện có bằng API Gemini ---
-print("\n--- Ví dụ 2: Sửa đổi ảnh hiện có bằng API Gemini ---")
-gemini_prompt_modify_image = "change the cat fur in the photo above to orange"
-gemini_output_modified_image_filepath = "assets/cat_2.png"
-
-# Đảm bảo file ảnh này tồn tại. Sử dụng ảnh vừa tạo hoặc một ảnh khác.
-# Lưu ý: Nếu bạn chưa chạy Ví dụ 1, mystical_forest.png sẽ không tồn tại.
-sample_input_image_to_modify_path = "assets/cat_1.png"
-
-generate_or_modify_image_gemini(
-    gemini_prompt_modify_image,
-    gemini_output_modified_image_filepath,
-    api_key,
-    input_image_path=sample_input_image_to_modify_path,
-    aspect_ratio="16:9"
-)
-
-print("\nCác file ảnh sẽ được lưu vào thư mục hiện tại.")
+        show_image(final_output_filepath, f"Generated/Modified Image: {output_filepath or final_output_filepath}")
+    return final_output_filepath
+
+
+if __name__ == "__main__":
+    api_key = os.getenv("API_KEY", "sk-1234")
+
+    # --- Ví dụ 1: Sinh ảnh mới từ prompt bằng API Gemini ---
+    print("\n--- Ví dụ 1: Sinh ảnh mới từ prompt bằng API Gemini ---")
+    gemini_prompt_new_image = "the gray cat is going down the stairs"
+    gemini_output_new_image_filepath = "assets/cat_1.png"
+    generate_or_modify_image_gemini(gemini_prompt_new_image, gemini_output_new_image_filepath, api_key, aspect_ratio="16:9")
+
+    # --- Ví dụ 2: Sửa đổi ảnh hiện có bằng API Gemini ---
+    print("\n--- Ví dụ 2: Sửa đổi ảnh hiện có bằng API Gemini ---")
+    gemini_prompt_modify_image = "change the cat fur in the photo above to orange"
+    gemini_output_modified_image_filepath = "assets/cat_2.png"
+
+    # Đảm bảo file ảnh này tồn tại. Sử dụng ảnh vừa tạo hoặc một ảnh khác.
+    # Lưu ý: Nếu bạn chưa chạy Ví dụ 1, mystical_forest.png sẽ không tồn tại.
+    sample_input_image_to_modify_path = "assets/cat_1.png"
+
+    generate_or_modify_image_gemini(
+        gemini_prompt_modify_image,
+        gemini_output_modified_image_filepath,
+        api_key,
+        input_image_path=sample_input_image_to_modify_path,
+        aspect_ratio="16:9"
+    )
+
+    # --- Ví dụ 3: Chuỗi sửa ảnh trong bộ nhớ (không ghi/đọc file ở các bước giữa) ---
+    print("\n--- Ví dụ 3: Chuỗi sửa ảnh trong bộ nhớ ---")
+    cat = generate_or_modify_image_gemini("a gray cat sitting on a sofa", None, api_key, show=False)
+    for step in ["make the sofa red", "add a window with rain behind the sofa"]:
+        if cat is None:
+            break
+        cat = generate_or_modify_image_gemini(step, None, api_key, input_image_path=cat, show=False)
+    if cat is not None:
+        cat.save("assets/cat_3.png")  # chỉ ghi kết quả cuối cùng
+
+    print("\nCác file ảnh sẽ được lưu vào thư mục hiện tại.")
@@ -0,0 +1,275 @@
+"""
+Tải ảnh tham chiếu lên một lần qua route files của Gemini và gửi file URI thay cho base64.
+
+Một ảnh tham chiếu (ví dụ assets/sherlock.png làm nhân vật) thường được dùng
+cho hàng trăm request generateContent/chat; gửi inline thì mỗi request lại
+mang theo vài MB base64. Khi bật:
+- lần đầu gặp một ảnh (đã qua image_prep), ảnh được tải lên
+  `/gemini/upload/v1beta/files` (multipart, một request) và file URI trả về
+  được nhớ theo hash nội dung ảnh + API key, kèm thời điểm hết hạn
+  (`expirationTime`, mặc định 48 giờ);
+- các request sau chỉ gửi `file_data {file_uri}` (Gemini) hoặc `image_url`
+  trỏ tới file URI (chat/completions qua LiteLLM);
+- URI sắp hết hạn (trong expiry_margin giây) được tải lên lại; URI bị server
+  từ chối (400/403/404) bị bỏ và request được gửi lại inline; nếu proxy không
+  có route upload (404/405/501) thì mọi request sau trong process gửi inline.
+Nhiều request đồng thời cùng một ảnh chỉ tải lên một lần (single-flight). URI
+được lưu cả trong artifact cache (nếu bật) để dùng lại giữa các lần chạy.
+
+Veo (`predictLongRunning`) chỉ nhận ảnh inline hoặc gcsUri nên luôn gửi inline.
+
+Bật:
+    from utils.file_refs import configure_file_refs
+    configure_file_refs(min_bytes=128 * 1024)
+hoặc biến môi trường GEMINI_FILE_REFS=1. Ảnh nhỏ hơn min_bytes vẫn gửi inline
+(một request upload tốn hơn vài KB base64). Số liệu: file_ref_metrics().
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Optional
+
+import httpx
+
+from .artifact_cache import get_artifact_cache, make_cache_key
+from .http_client import api_url, get_async_http_client
+from .media_sink import ImageData
+from .single_flight import get_single_flight
+
+
+_config = {
+    "enabled": os.getenv("GEMINI_FILE_REFS", "0").lower() in ("1", "true", "on", "yes"),
+    "min_bytes": 256 * 1024,     # ảnh nhỏ hơn vẫn gửi inline
+    "expiry_margin": 3600.0,     # coi URI là hết hạn sớm hơn bấy nhiêu giây
+}
+_DEFAULT_TTL = 48 * 3600.0       # thời hạn file của Gemini khi server không trả expirationTime
+_UNSUPPORTED_STATUSES = {404, 405, 501}
+_REJECTED_STATUSES = {400, 403, 404}
+
+
+class FileRef:
+    """File đã tải lên: name (files/...), uri, mime_type và thời điểm hết hạn (epoch giây)."""
+
+    __slots__ = ("name", "uri", "mime_type", "expires_at")
+
+    def __init__(self, name: str, uri: str, mime_type: str, expires_at: float):
+        self.name = name
+        self.uri = uri
+        self.mime_type = mime_type
+        self.expires_at = expires_at
+
+    def expired(self, margin: float = 0.0) -> bool:
+        return time.time() + margin >= self.expires_at
+
+    def to_json(self) -> bytes:
+        return json.dumps({"name": self.name, "uri": self.uri, "mime_type": self.mime_type,
+                           "expires_at": self.expires_at}).encode()
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "FileRef":
+        d = json.loads(data)
+        return cls(d["name"], d["uri"], d["mime_type"], d["expires_at"])
+
+    def __repr__(self) -> str:
+        return f"FileRef({self.name}, {self.mime_type}, còn {max(0, self.expires_at - time.time()) / 3600:.1f} giờ)"
+
+
+class _FileRefStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refs: Dict[str, FileRef] = {}
+        self._rejected = set()       # khóa có URI bị server từ chối: bỏ qua bản trên đĩa
+        self.unsupported = False     # proxy không có route upload
+        self._counts = dict.fromkeys(("uploads", "uploaded_bytes", "references", "inline_bytes_saved",
+                                      "expired", "rejected", "upload_failures"), 0)
+
+    def get(self, key: str) -> Optional[FileRef]:
+        with self._lock:
+            ref = self._refs.get(key)
+            rejected = key in self._rejected
+        if ref is None and not rejected:
+            cache = get_artifact_cache()
+            data = cache.get(key) if cache else None
+            if data is not None:
+                try:
+                    ref = FileRef.from_json(data)
+                except (ValueError, KeyError):
+                    ref = None
+        if ref is not None and ref.expired(_config["expiry_margin"]):
+            self.forget(key)
+            self.count("expired")
+            return None
+        if ref is not None:
+            with self._lock:
+                self._refs[key] = ref
+        return ref
+
+    def put(self, key: str, ref: FileRef) -> None:
+        with self._lock:
+            self._refs[key] = ref
+            self._rejected.discard(key)
+        cache = get_artifact_cache()
+        if cache:
+            cache.put(key, ref.to_json())
+
+    def forget(self, key: str, rejected: bool = False) -> None:
+        with self._lock:
+            self._refs.pop(key, None)
+            if rejected:
+                self._rejected.add(key)
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counts[name] += value
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {**self._counts, "known_refs": len(self._refs), "unsupported": self.unsupported}
+
+    def reset_metrics(self) -> None:
+        with self._lock:
+            for name in self._counts:
+                self._counts[name] = 0
+
+
+_store = _FileRefStore()
+
+
+def configure_file_refs(enabled: bool = True, **options) -> None:
+    """Bật/tắt file reference; tùy chọn: min_bytes, expiry_margin."""
+    unknown = set(options) - set(_config)
+    if unknown:
+        raise ValueError(f"Tùy chọn không hợp lệ: {', '.join(sorted(unknown))}")
+    _config.update(options, enabled=enabled)
+    if enabled:
+        _store.unsupported = False
+
+
+def disable_file_refs() -> None:
+    """Gửi mọi ảnh inline như trước."""
+    _config["enabled"] = False
+
+
+def file_refs_enabled() -> bool:
+    return _config["enabled"] and not _store.unsupported
+
+
+async def get_file_ref_async(image: ImageData, api_key: str) -> Optional[FileRef]:
+    """
+    FileRef của ảnh (tải lên nếu chưa có hoặc sắp hết hạn), hoặc None nếu ảnh
+    nên được gửi inline (đang tắt, ảnh nhỏ, upload lỗi hoặc không được hỗ trợ).
+    """
+    if not file_refs_enabled() or len(image.data) < _config["min_bytes"]:
+        return None
+    key = _ref_key(image, api_key)
+    # Bản lưu trong artifact cache nằm trên đĩa: đọc trong thread
+    ref = await asyncio.to_thread(_store.get, key) if get_artifact_cache() else _store.get(key)
+    if ref is None:
+        try:
+            # Nhiều request đồng thời cùng một ảnh: chỉ tải lên một lần
+            ref = await get_single_flight().do_async(key, lambda: _upload_async(image, api_key, key),
+                                                     kind="file_upload")
+        except httpx.HTTPError as e:
+            _store.count("upload_failures")
+            print(f"⚠️ Không tải được ảnh tham chiếu lên ({e}); gửi inline.")
+            return None
+        if ref is None:
+            return None
+    _store.count("references")
+    _store.count("inline_bytes_saved", (len(image.data) + 2) // 3 * 4)
+    return ref
+
+
+def invalidate_file_ref(image: ImageData, api_key: str) -> None:
+    """Bỏ URI của ảnh (ví dụ server trả 404 vì file đã bị xóa); lần sau ảnh được tải lên lại."""
+    _store.forget(_ref_key(image, api_key), rejected=True)
+    _store.count("rejected")
+
+
+def is_file_ref_rejection(status_code: int) -> bool:
+    """Mã lỗi cho thấy server không nhận file URI (hết hạn, bị xóa, endpoint không hỗ trợ)."""
+    return status_code in _REJECTED_STATUSES
+
+
+def gemini_image_part(image: ImageData, ref: Optional[FileRef]) -> dict:
+    """Part của generateContent: file_data nếu có FileRef, ngược lại inline_data."""
+    if ref is not None:
+        return {"file_data": {"mime_type": ref.mime_type, "file_uri": ref.uri}}
+    return {"inline_data": {"mime_type": image.mime_type, "data": image.base64()}}
+
+
+def chat_image_part(image: ImageData, ref: Optional[FileRef]) -> dict:
+    """Part image_url của chat/completions; với file URI, "format" báo mimeType cho LiteLLM."""
+    if ref is not None:
+        return {"type": "image_url", "image_url": {"url": ref.uri, "format": ref.mime_type}}
+    return {"type": "image_url", "image_url": {"url": image.data_url()}}
+
+
+def file_ref_metrics() -> dict:
+    """
+    uploads/uploaded_bytes: số lần và số byte đã tải lên; references: số request
+    gửi file URI thay cho ảnh; inline_bytes_saved: số byte base64 các request đó
+    không phải gửi; expired/rejected: URI hết hạn/bị server từ chối.
+    """
+    return _store.metrics()
+
+
+def reset_file_ref_metrics() -> None:
+    _store.reset_metrics()
+
+
+def _ref_key(image: ImageData, api_key: str) -> str:
+    # File thuộc về project của API key và chỉ dùng được qua đúng proxy đã tải lên
+    return make_cache_key("file_ref", "", "", {"base_url": api_url(), "api_key": api_key},
+                          input_bytes=image.data)
+
+
+async def _upload_async(image: ImageData, api_key: str, key: str) -> Optional[FileRef]:
+    boundary = uuid.uuid4().hex
+    metadata = json.dumps({"file": {"display_name": f"ref-{key[:16]}"}})
+    body = b"".join([
+        f"--{boundary}\r\nContent-Type: application/json; charset=UTF-8\r\n\r\n{metadata}\r\n"
+        f"--{boundary}\r\nContent-Type: {image.mime_type}\r\n\r\n".encode(),
+        image.data,
+        f"\r\n--{boundary}--\r\n".encode(),
+    ])
+    headers = {
+        "x-goog-api-key": api_key,
+        "X-Goog-Upload-Protocol": "multipart",
+        "Content-Type": f"multipart/related; boundary={boundary}",
+    }
+    response = await get_async_http_client().post(api_url("/gemini/upload/v1beta/files"), headers=headers,
+                                                  content=body)
+    if response.status_code in _UNSUPPORTED_STATUSES:
+        _store.unsupported = True
+        print(f"⚠️ Proxy không hỗ trợ tải file lên (HTTP {response.status_code}); ảnh được gửi inline.")
+        return None
+    response.raise_for_status()
+    info = response.json().get("file") or {}
+    if not info.get("uri") or info.get("state") == "FAILED":
+        _store.count("upload_failures")
+        return None
+    ref = FileRef(info.get("name", ""), info["uri"], info.get("mimeType") or image.mime_type,
+                  _parse_time(info.get("expirationTime")) or time.time() + _DEFAULT_TTL)
+    await asyncio.to_thread(_store.put, key, ref)
+    _store.count("uploads")
+    _store.count("uploaded_bytes", len(image.data))
+    return ref
+
+
+def _parse_time(value: Optional[str]) -> Optional[float]:
+    """RFC 3339 (ví dụ 2025-01-01T00:00:00.123456789Z) -> epoch giây."""
+    if not value:
+        return None
+    # fromisoformat chỉ nhận tối đa 6 chữ số phần lẻ của giây và không nhận "Z" ở Python < 3.11
+    value = re.sub(r"(\.\d{6})\d+", r"\1", value.replace("Z", "+00:00"))
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
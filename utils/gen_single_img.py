@@ -1,77 +1,214 @@
-import requests
+import asyncio
 import json
-import base64
-import io
-from PIL import Image
-import matplotlib.pyplot as plt
-import cv2
-import numpy as np
 import os
+from typing import Optional
 
+from .artifact_cache import get_artifact_cache, make_cache_key
+from .http_client import api_url, get_async_http_client, bearer_headers, iterate_sync, run_sync
+from .media_sink import ImageData, ImageResult, decode_image_b64_async, save_image_bytes_async, show_image
+from .single_flight import get_single_flight, share_file_async
 
-def generate_image_from_prompt(prompt: str, image_filename: str, 
-                               api_key: str, n: int = 1, aspect_ratio: str = "1:1"):
-    url = "https://api.thucchien.ai/images/generations"
 
+# Số ảnh tối đa trong một request /images/generations (Imagen nhận n từ 1 tới 4)
+MAX_IMAGES_PER_REQUEST = 4
+
+
+async def iter_images_from_prompt_async(prompt: str, image_filename: Optional[str], api_key: str,
+                                        n: int = 1, aspect_ratio: str = "1:1",
+                                        per_request: int = MAX_IMAGES_PER_REQUEST, max_concurrency: int = 8):
+    """
+    Sinh n ảnh bằng endpoint /images/generations, chia thành các request song song
+    (tối đa per_request ảnh mỗi request, tối đa max_concurrency request cùng lúc).
+
+    Async iterator yield (chỉ số ảnh, kết quả) theo thứ tự hoàn thành, không theo
+    chỉ số: kết quả là ImageResult (ảnh i lưu tại <image_filename>_<i>.png) hoặc
+    ImageData khi image_filename=None. Ảnh của mỗi phản hồi được giải mã và ghi
+    trong thread pool của media_sink trong lúc các request khác vẫn đang chạy.
+    Ảnh đã có trong artifact cache được trả về ngay, chỉ các ảnh còn thiếu được
+    gửi request. Request lỗi được in ra và bỏ qua (các ảnh khác vẫn được trả về).
+    """
+    model = "imagen-4"
+
+    def filename(i: int) -> Optional[str]:
+        return f"{image_filename.split('.')[0]}_{i}.png" if image_filename is not None else None
+
+    # Mỗi ảnh trong n ảnh được cache riêng
+    cache = get_artifact_cache()
+    cache_keys = [
+        make_cache_key("imagen", model, prompt, {"n": n, "aspect_ratio": aspect_ratio, "index": i})
+        for i in range(n)
+    ]
+    missing = []
+    for i, key in enumerate(cache_keys):
+        data = await asyncio.to_thread(cache.get, key) if cache else None
+        if data is None:
+            missing.append(i)
+        elif image_filename is None:
+            yield i, ImageData(data)
+        else:
+            yield i, await save_image_bytes_async(data, filename(i))
+    if cache and len(missing) < n:
+        print(f"♻️ Lấy {n - len(missing)}/{n} ảnh từ cache")
+    if not missing:
+        return
+
+    per_request = max(1, per_request)
+    groups = [missing[j:j + per_request] for j in range(0, len(missing), per_request)]
+    semaphore = asyncio.Semaphore(max_concurrency)
+    done = asyncio.Queue()  # (chỉ số, kết quả), hoặc None khi một nhóm đã xong
+    errors = []
+
+    async def run_group(indices):
+        emitted = set()
+
+        def emit(i, result):
+            emitted.add(i)
+            done.put_nowait((i, result))
+
+        try:
+            async with semaphore:
+                # Cùng prompt/tham số/nhóm ảnh đang được sinh ở lời gọi khác: dùng chung request đó
+                flight_key = make_cache_key("imagen", model, prompt, {
+                    "n": n, "aspect_ratio": aspect_ratio, "indices": indices,
+                    "memory": image_filename is None})
+                produced = await get_single_flight().do_async(
+                    flight_key, lambda: _generate_group(prompt, model, aspect_ratio, api_key, indices,
+                                                        filename, cache_keys if cache else None, emit), kind="imagen")
+            for i, src in produced:
+                if i in emitted:
+                    continue
+                if image_filename is not None:
+                    # Ảnh do lời gọi khác sinh ra: chép file sang tên của mình
+                    await share_file_async(src, filename(i))
+                    src = ImageResult(filename(i), src.mime_type)
+                emit(i, src)
+        except Exception as e:
+            errors.append(e)
+            print(f"Lỗi khi tạo ảnh {indices[0]}..{indices[-1]}: {e}")
+        finally:
+            done.put_nowait(None)
+
+    tasks = [asyncio.create_task(run_group(indices)) for indices in groups]
+    received = 0
+    try:
+        pending = len(tasks)
+        while pending:
+            item = await done.get()
+            if item is None:
+                pending -= 1
+            else:
+                received += 1
+                yield item
+    finally:
+        for task in tasks:
+            task.cancel()
+    if errors and not received:
+        # Mọi request đều lỗi (ví dụ mất mạng): báo lỗi như khi chỉ có một request
+        raise errors[0]
+
+
+async def _generate_group(prompt, model, aspect_ratio, api_key, indices, filename, cache_keys, emit):
+    """Một request cho các ảnh indices; mỗi ảnh được emit ngay khi đã giải mã/lưu xong."""
     payload = json.dumps({
-      "model": "imagen-4",
+      "model": model,
       "prompt": prompt,
-      "n": n,
+      "n": len(indices),
       "aspect_ratio": aspect_ratio
     })
-    headers = {
-      'Content-Type': 'application/json',
-      'Authorization': f'Bearer {api_key}'
-    }
-
-    print(f"Đang tạo ảnh với prompt: '{prompt[:50]}...'\n")
-    response = requests.request("POST", url, headers=headers, data=payload)
-    data = json.loads(response.text)
-    print("Phản hồi API tạo ảnh:", data)
+    print(f"Đang tạo {len(indices)} ảnh với prompt: '{prompt[:50]}...'\n")
+    response = await get_async_http_client().post(api_url("/images/generations"), headers=bearer_headers(api_key),
+                                                  content=payload)
+    if response.is_error:
+        print(f"Lỗi từ API tạo ảnh: {response.status_code}")
+        print(f"Phản hồi đầy đủ: {response.text[:4096]}")
+        return []
+    # Body có thể chứa nhiều ảnh base64 (vài MB mỗi ảnh): parse ngoài event loop
+    data = await asyncio.to_thread(json.loads, response.content)
+    del response
 
-    try:
+    async def process(i, item):
         # API này trả về một list các đối tượng data, mỗi đối tượng có b64_json
-        for i, item in enumerate(data['data']):
-            if 'b64_json' in item:
-                base64_string = item['b64_json']
-                img_data = base64.b64decode(base64_string)
-                img = Image.open(io.BytesIO(img_data))
-
-                # Lưu ảnh
-                current_filename = f"{image_filename.split('.')[0]}_{i}.png"
-                img_np = np.array(img)
-                cv2.imwrite(current_filename, cv2.cvtColor(img_np, cv2.COLOR_RGB2BGR))
-                print(f"Hình ảnh đã được lưu thành: {current_filename}")
-
-                # Hiển thị ảnh (tùy chọn)
-                plt.imshow(img)
-                plt.axis('off')
-                plt.title(f"Generated Image ({i+1}/{n}): {current_filename}")
-                plt.show()
-            elif 'url' in item:
-                # Nếu API trả về URL, bạn sẽ cần một cách khác để tải và lưu ảnh
-                print(f"API trả về URL: {item['url']}. Hiện tại chưa hỗ trợ tải ảnh từ URL.")
-            else:
-                print(f"Phản hồi không chứa b64_json hoặc url cho ảnh thứ {i+1}.")
-    except KeyError as e:
-        print(f"Lỗi: Không tìm thấy khóa {e} trong phản hồi API. Đảm bảo phản hồi có trường 'data' và 'b64_json'.")
-        print(f"Phản hồi đầy đủ: {data}")
-    except Exception as e:
-        print(f"Lỗi khi xử lý hình ảnh: {e}")
-        print(f"Phản hồi API đầy đủ: {data}")
+        if 'b64_json' in item:
+            result = await decode_image_b64_async(item['b64_json'], filename(i), model)
+            if cache_keys:
+                if isinstance(result, ImageData):
+                    await asyncio.to_thread(get_artifact_cache().put, cache_keys[i], result.data)
+                else:
+                    await asyncio.to_thread(get_artifact_cache().put_file, cache_keys[i], result)
+                    print(f"Hình ảnh đã được lưu thành: {result}")
+            elif not isinstance(result, ImageData):
+                print(f"Hình ảnh đã được lưu thành: {result}")
+            emit(i, result)
+            return i, result
+        if 'url' in item:
+            # Nếu API trả về URL, bạn sẽ cần một cách khác để tải và lưu ảnh
+            print(f"API trả về URL: {item['url']}. Hiện tại chưa hỗ trợ tải ảnh từ URL.")
+        else:
+            print(f"Phản hồi không chứa b64_json hoặc url cho ảnh thứ {i+1}.")
+        return None
+
+    items = data.get('data') if isinstance(data, dict) else None
+    if items is None:
+        print("Lỗi: Không tìm thấy khóa 'data' trong phản hồi API. Đảm bảo phản hồi có trường 'data' và 'b64_json'.")
+        print(f"Phản hồi đầy đủ: {str(data)[:4096]}")
+        return []
+    # Server trả về nhiều ảnh hơn yêu cầu: bỏ phần thừa
+    results = await asyncio.gather(*(process(i, item) for i, item in zip(indices, items)))
+    return [r for r in results if r is not None]
+
+
+async def generate_image_from_prompt_async(prompt: str, image_filename: Optional[str],
+                                           api_key: str, n: int = 1, aspect_ratio: str = "1:1",
+                                           per_request: int = MAX_IMAGES_PER_REQUEST, max_concurrency: int = 8):
+    """
+    Sinh n ảnh bằng endpoint /images/generations (bản async, không hiển thị ảnh).
+    Trả về danh sách đường dẫn các ảnh đã lưu, hoặc danh sách ImageData (không
+    ghi đĩa) khi image_filename=None, theo thứ tự chỉ số ảnh.
+
+    n lớn được chia thành nhiều request song song, xem iter_images_from_prompt_async().
+    """
+    produced = [item async for item in iter_images_from_prompt_async(
+        prompt, image_filename, api_key, n=n, aspect_ratio=aspect_ratio,
+        per_request=per_request, max_concurrency=max_concurrency)]
+    return [result for _, result in sorted(produced, key=lambda item: item[0])]
+
+
+def generate_image_from_prompt(prompt: str, image_filename: Optional[str],
+                               api_key: str, n: int = 1, aspect_ratio: str = "1:1", show: bool = True,
+                               per_request: int = MAX_IMAGES_PER_REQUEST, max_concurrency: int = 8):
+    """Bản đồng bộ của generate_image_from_prompt_async(), có hiển thị từng ảnh (tắt bằng show=False)."""
+    saved_files = run_sync(generate_image_from_prompt_async(
+        prompt, image_filename, api_key, n=n, aspect_ratio=aspect_ratio,
+        per_request=per_request, max_concurrency=max_concurrency
+    ))
+    for i, current_filename in enumerate(saved_files if show else []):
+        # Hiển thị ảnh (tùy chọn)
+        show_image(current_filename, f"Generated Image ({i+1}/{n}): {image_filename or current_filename}")
+    return saved_files
+
+
+def iter_images_from_prompt(prompt: str, image_filename: Optional[str], api_key: str,
+                            n: int = 1, aspect_ratio: str = "1:1",
+                            per_request: int = MAX_IMAGES_PER_REQUEST, max_concurrency: int = 8):
+    """Bản đồng bộ của iter_images_from_prompt_async(): iterator (chỉ số ảnh, kết quả) theo thứ tự hoàn thành."""
+    return iterate_sync(iter_images_from_prompt_async(
+        prompt, image_filename, api_key, n=n, aspect_ratio=aspect_ratio,
+        per_request=per_request, max_concurrency=max_concurrency
+    ))
 
 
-print("\n--- Ví dụ 3: Tạo ảnh từ prompt bằng API images/generations ---")
+if __name__ == "__main__":
+    print("\n--- Ví dụ 3: Tạo ảnh từ prompt bằng API images/generations ---")
 
-prompt_text = """
+    prompt_text = """
 The anime-style thief's design is characterized by a white suit, fedora, long coat, and signature monocle, 
 creating an image that is both elegant and mysterious. He often appears amidst white smoke or under the moonlight, 
 making each of his heists look like a grand magic show.
 """
 
-output_image_filename = "assets/anime_thief.png"
-api_key = os.getenv("API_KEY", "sk-1234")
+    output_image_filename = "assets/anime_thief.png"
+    api_key = os.getenv("API_KEY", "sk-1234")
 
-generate_image_from_prompt(prompt_text, output_image_filename, api_key, n=1, aspect_ratio="1:1")
+    generate_image_from_prompt(prompt_text, output_image_filename, api_key, n=1, aspect_ratio="1:1")
 
-print("\nCác file ảnh sẽ được lưu vào thư mục hiện tại.")
+    print("\nCác file ảnh sẽ được lưu vào thư mục hiện tại.")
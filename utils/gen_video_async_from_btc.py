@@ -14,59 +14,90 @@ Requirements:
 # This file is forked and adapted from: https://github.com/BerriAI/litellm/blob/main/docs/my-website/docs/proxy/veo_video_generation.md .Please refer to the original for license details.
 """
 
+import asyncio
 import json
 import os
 import time
-import requests
-from typing import Optional
+import uuid
+from typing import Optional, Union
+
+import httpx
+
+from .artifact_cache import get_artifact_cache, make_cache_key
+from .downloader import download_file_async
+from .http_client import api_url, get_async_http_client, gemini_headers, run_sync
+from .image_prep import prepare_input_image_async, video_target
+from .job_journal import get_job_journal
+from .media_sink import ImageData
+from .polling import AdaptivePoller, register_operation
+
+
+class _OperationNotFound(Exception):
+    """The operation is unknown to the server or has expired (poll returned 404)."""
 
 
 class VeoVideoGenerator:
-    """Complete Veo video generation client using LiteLLM proxy."""
+    """
+    Complete Veo video generation client using LiteLLM proxy.
+
+    Every step has an asyncio-native ``*_async`` method, so one event loop can
+    drive many generations at once; the plain methods are blocking wrappers.
+    """
 
-    def __init__(self, base_url: str = "https://api.thucchien.ai/gemini/v1beta", 
-                api_key: str = "sk-1234"):
+    def __init__(self, base_url: Optional[str] = None,
+                api_key: str = "sk-1234", model: str = "veo-3.0-generate-preview"):
         """
         Initialize the Veo video generator.
         
         Args:
             base_url: Base URL for the LiteLLM proxy with Gemini pass-through
+                (default: api_url("/gemini/v1beta"), i.e. API_BASE_URL + /gemini/v1beta)
             api_key: API key for LiteLLM proxy authentication
+            model: Veo model used for predictLongRunning requests
         """
-        self.base_url = base_url
+        self.base_url = base_url or api_url("/gemini/v1beta")
         self.api_key = api_key
-        self.headers = {
-            "x-goog-api-key": api_key,
-            "Content-Type": "application/json"
-        }
+        self.model = model
+        self.headers = gemini_headers(api_key)
 
-    def generate_video(self, prompt: str) -> Optional[str]:
+    async def generate_video_async(self, prompt: str, image_path: Union[str, ImageData, None] = None,
+                                   **params) -> Optional[str]:
         """
         Initiate video generation with Veo.
         
         Args:
             prompt: Text description of the video to generate
+            image_path: Optional input image (file path or in-memory ImageData) for image-to-video generation
+            **params: Extra generation parameters (aspectRatio, resolution, ...)
             
         Returns:
             Operation name if successful, None otherwise
         """
         print(f"🎬 Generating video with prompt: '{prompt}'")
         
-        url = f"{self.base_url}/models/veo-3.0-generate-preview:predictLongRunning"
-        payload = {
-            "instances": [{
-                "prompt": prompt
-            }]
-        }
+        url = f"{self.base_url}/models/{self.model}:predictLongRunning"
+        instance = {"prompt": prompt}
+        if image_path:
+            instance["image"] = await self._encode_image_async(image_path, params)
+        payload = {"instances": [instance]}
+        if params:
+            payload["parameters"] = params
         
         try:
-            response = requests.post(url, headers=self.headers, json=payload)
+            response = await get_async_http_client().post(url, headers=self.headers, json=payload)
             response.raise_for_status()
             
             data = response.json()
             operation_name = data.get("name")
             
             if operation_name:
+                register_operation(operation_name, self.model, params, has_image=bool(image_path))
+                # Journal the operation so a restarted process can resume it instead of resubmitting
+                journal = get_job_journal()
+                if journal:
+                    # The journal stores paths only; in-memory images are recorded without one
+                    journal.record_submission(operation_name, self.model, prompt, params,
+                                              image_path=image_path if isinstance(image_path, str) else None)
                 print(f"✅ Video generation started: {operation_name}")
                 return operation_name
             else:
@@ -74,7 +105,7 @@ class VeoVideoGenerator:
                 print(f"Response: {json.dumps(data, indent=2)}")
                 return None
                 
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"❌ Failed to start video generation: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 try:
@@ -84,7 +115,7 @@ class VeoVideoGenerator:
                     print(f"Error response: {e.response.text}")
             return None
 
-    def wait_for_completion(self, operation_name: str, max_wait_time: int = 600) -> Optional[str]:
+    async def wait_for_completion_async(self, operation_name: str, max_wait_time: int = 600) -> Optional[str]:
         """
         Poll operation status until video generation is complete.
         
@@ -95,56 +126,107 @@ class VeoVideoGenerator:
         Returns:
             Video URI if successful, None otherwise
         """
+        try:
+            return await self._wait_for_completion_async(operation_name, max_wait_time)
+        except _OperationNotFound:
+            return None
+
+    async def _wait_for_completion_async(self, operation_name: str, max_wait_time: int = 600) -> Optional[str]:
+        # Same as wait_for_completion_async(), but a 404 raises _OperationNotFound
         print("⏳ Waiting for video generation to complete...")
         
-        operation_url = f"{self.base_url}/{operation_name}"
         start_time = time.time()
-        poll_interval = 10  # Start with 10 seconds
+        # Sparse polls before the expected completion time of similar jobs, dense
+        # polls around it, jittered (falls back to 10s x1.2 up to 30s without history)
+        poller = AdaptivePoller.for_operation(operation_name)
+        journal = get_job_journal()
         
         while time.time() - start_time < max_wait_time:
             try:
                 print(f"🔍 Polling status... ({int(time.time() - start_time)}s elapsed)")
                 
-                response = requests.get(operation_url, headers=self.headers)
-                response.raise_for_status()
-                
-                data = response.json()
+                data = await self.poll_operation_async(operation_name)
                 
                 # Check for errors
                 if "error" in data:
                     print("❌ Error in video generation:")
                     print(json.dumps(data["error"], indent=2))
+                    if journal:
+                        journal.mark_failed(operation_name, json.dumps(data["error"]))
                     return None
                 
                 # Check if operation is complete
                 is_done = data.get("done", False)
+                poller.observe(is_done)
                 
                 if is_done:
                     print("🎉 Video generation complete!")
                     
-                    try:
-                        # Extract video URI from nested response
-                        video_uri = data["response"]["generateVideoResponse"]["generatedSamples"][0]["video"]["uri"]
+                    video_uri = self.extract_video_uri(data)
+                    if video_uri:
                         print(f"📹 Video URI: {video_uri}")
+                        if journal:
+                            journal.mark_ready(operation_name, video_uri)
                         return video_uri
-                    except KeyError as e:
-                        print(f"❌ Could not extract video URI: {e}")
-                        print("Full response:")
-                        print(json.dumps(data, indent=2))
-                        return None
+                    print("❌ Could not extract video URI")
+                    print("Full response:")
+                    print(json.dumps(data, indent=2))
+                    if journal:
+                        journal.mark_failed(operation_name, "finished without a video URI")
+                    return None
                 
-                # Wait before next poll, with exponential backoff
-                time.sleep(poll_interval)
-                poll_interval = min(poll_interval * 1.2, 30)  # Cap at 30 seconds
+                # Wait before next poll
+                await asyncio.sleep(poller.next_delay())
                 
-            except requests.RequestException as e:
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 404:
+                    # Unknown or expired operation: polling again will not help
+                    print(f"❌ Operation not found: {operation_name}")
+                    if journal:
+                        journal.mark_failed(operation_name, "operation not found")
+                    raise _OperationNotFound(operation_name)
                 print(f"❌ Error polling operation status: {e}")
-                time.sleep(poll_interval)
+                await asyncio.sleep(poller.next_delay())
+            except (httpx.HTTPError, ValueError) as e:
+                # ValueError: non-JSON or truncated body; the next poll will likely be fine
+                print(f"❌ Error polling operation status: {e!r}")
+                await asyncio.sleep(poller.next_delay())
         
         print(f"⏰ Timeout after {max_wait_time} seconds")
         return None
 
-    def download_video(self, video_uri: str, output_filename: str = "generated_video.mp4") -> bool:
+    async def poll_operation_async(self, operation_name: str) -> dict:
+        """
+        Fetch the current state of a long-running operation once.
+
+        Args:
+            operation_name: Name of the operation to check
+
+        Returns:
+            Operation JSON (contains "done" and either "response" or "error")
+        """
+        response = await get_async_http_client().get(f"{self.base_url}/{operation_name}", headers=self.headers)
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def extract_video_uri(operation: dict) -> Optional[str]:
+        """Extract the generated video URI from a finished operation, or None."""
+        try:
+            return operation["response"]["generateVideoResponse"]["generatedSamples"][0]["video"]["uri"]
+        except (KeyError, IndexError, TypeError):
+            return None
+
+    @staticmethod
+    async def _encode_image_async(image_path: Union[str, ImageData], params: dict) -> dict:
+        # Downscale to the output video frame before base64; mimeType is sniffed from the bytes
+        image = await prepare_input_image_async(image_path, video_target(params))
+        return {
+            "bytesBase64Encoded": image.base64(),
+            "mimeType": image.mime_type,
+        }
+
+    async def download_video_async(self, video_uri: str, output_filename: str = "generated_video.mp4") -> bool:
         """
         Download the generated video file.
         
@@ -177,27 +259,16 @@ class VeoVideoGenerator:
         litellm_download_url = f"{base_path}/{relative_path}"
         print(f"Download URL: {litellm_download_url}")
         
+        def report(downloaded_size: int, total_size: int) -> None:
+            # Progress indicator for large files
+            print(f"📦 Downloaded {downloaded_size / (1024*1024):.1f}"
+                  + (f"/{total_size / (1024*1024):.1f}" if total_size else "") + " MB...")
+
         try:
-            # Download with streaming and redirect handling
-            response = requests.get(
-                litellm_download_url, 
-                headers=self.headers, 
-                stream=True,
-                allow_redirects=True  # Handle redirects automatically
-            )
-            response.raise_for_status()
-            
-            # Save video file
-            with open(output_filename, 'wb') as f:
-                downloaded_size = 0
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-                        downloaded_size += len(chunk)
-                        
-                        # Progress indicator for large files
-                        if downloaded_size % (1024 * 1024) == 0:  # Every MB
-                            print(f"📦 Downloaded {downloaded_size / (1024*1024):.1f} MB...")
+            # Parallel byte ranges (with redirect handling); an interrupted download
+            # resumes from its .part file on the next call
+            await download_file_async(litellm_download_url, output_filename, headers=self.headers,
+                                      progress=report)
             
             # Verify file was created and has content
             if os.path.exists(output_filename):
@@ -215,48 +286,109 @@ class VeoVideoGenerator:
                 print("❌ File was not created")
                 return False
                 
-        except requests.RequestException as e:
+        except httpx.HTTPError as e:
             print(f"❌ Download failed: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 print(f"Status code: {e.response.status_code}")
                 print(f"Response headers: {dict(e.response.headers)}")
             return False
 
-    def generate_and_download(self, prompt: str, output_filename: str = None) -> bool:
+    async def generate_and_download_async(self, prompt: str, output_filename: str = None,
+                                          image_path: Union[str, ImageData, None] = None, **params) -> bool:
         """
         Complete workflow: generate video and download it.
+
+        If the job journal (utils/job_journal.py) holds an unfinished operation
+        for the same model, prompt, params and image - e.g. because an earlier
+        run died - that operation is resumed instead of submitting a new one.
+        Only operations younger than the operation TTL that no live process is
+        following are resumed, and the resumed one is claimed for this call;
+        if the server no longer knows it (404), a new operation is submitted.
         
         Args:
             prompt: Text description for video generation
             output_filename: Output filename (auto-generated if None)
+            image_path: Optional input image for image-to-video generation
+            **params: Extra generation parameters (aspectRatio, resolution, ...)
             
         Returns:
             True if successful, False otherwise
         """
-        # Auto-generate filename if not provided
+        journal = get_job_journal()
+        # In-memory images (ImageData) have no path to match a journaled job against
+        resumable = journal and not isinstance(image_path, ImageData)
+        # Claiming keeps concurrent calls (and other processes) off the same operation and .part file
+        resumed = journal.claim_resumable(self.model, prompt, params, image_path) if resumable else None
+        owned = [resumed["operation_name"]] if resumed else []
+
+        async def submit() -> Optional[str]:
+            name = await self.generate_video_async(prompt, image_path=image_path, **params)
+            if name and journal:
+                journal.claim(name)
+                owned.append(name)
+                journal.update(name, output_path=output_filename)
+            return name
+
+        # Auto-generate filename if not provided (a resumed job keeps its original one)
         if output_filename is None:
-            timestamp = int(time.time())
-            safe_prompt = "".join(c for c in prompt[:30] if c.isalnum() or c in (' ', '-', '_')).rstrip()
-            output_filename = f"assets/veo_video_{safe_prompt.replace(' ', '_')}_{timestamp}.mp4"
+            output_filename = (resumed and resumed["output_path"]) or self.default_output_filename(prompt)
         
         print("=" * 60)
         print("🎬 VEO VIDEO GENERATION WORKFLOW")
         print("=" * 60)
-        
-        # Step 1: Generate video
-        operation_name = self.generate_video(prompt)
-        if not operation_name:
-            return False
-        
-        # Step 2: Wait for completion
-        video_uri = self.wait_for_completion(operation_name)
-        if not video_uri:
-            return False
-        
-        # Step 3: Download video
-        success = self.download_video(video_uri, output_filename)
+
+        try:
+            # Step 0: Reuse a video generated earlier from the same prompt, params and image
+            cache = get_artifact_cache()
+            if cache:
+                cache_key = await asyncio.to_thread(self.video_cache_key, prompt, image_path, params)
+                if await asyncio.to_thread(cache.get_to_file, cache_key, output_filename):
+                    print(f"♻️ Reused cached video: {output_filename}")
+                    if resumed:
+                        journal.mark_succeeded(resumed["operation_name"], output_filename)
+                    return True
+            
+            # Step 1: Generate video, or pick up the journaled operation
+            if resumed:
+                operation_name, video_uri = resumed["operation_name"], resumed["video_uri"]
+                register_operation(operation_name, self.model, params, has_image=bool(image_path),
+                                   submitted_at=resumed["created_at"])
+                print(f"↩️ Resuming journaled operation ({resumed['state']}): {operation_name}")
+                journal.update(operation_name, output_path=output_filename)
+            else:
+                operation_name = await submit()
+                if not operation_name:
+                    return False
+                video_uri = None
+            
+            # Step 2: Wait for completion
+            if not video_uri:
+                try:
+                    video_uri = await self._wait_for_completion_async(operation_name)
+                except _OperationNotFound:
+                    if not resumed:
+                        return False
+                    # The journaled operation expired or is unknown to this server: start over
+                    print("↩️ Journaled operation no longer exists; submitting a new one")
+                    operation_name = await submit()
+                    if not operation_name:
+                        return False
+                    video_uri = await self.wait_for_completion_async(operation_name)
+                if not video_uri:
+                    return False
+            
+            # Step 3: Download video (a partial download resumes from its .part file)
+            success = await self.download_video_async(video_uri, output_filename)
+        finally:
+            if journal:
+                for name in owned:
+                    journal.release(name)
         
         if success:
+            if journal:
+                journal.mark_succeeded(operation_name, output_filename)
+            if cache:
+                await asyncio.to_thread(cache.put_file, cache_key, output_filename)
             print("=" * 60)
             print("🎉 SUCCESS! Video generation complete!")
             print(f"📁 Video saved as: {output_filename}")
@@ -268,6 +400,40 @@ class VeoVideoGenerator:
         
         return success
 
+    def video_cache_key(self, prompt: str, image_path: Optional[str] = None,
+                        params: Optional[dict] = None) -> str:
+        """Artifact-cache key for a video request (model, prompt, params and input image bytes)."""
+        input_bytes = None
+        if isinstance(image_path, ImageData):
+            input_bytes = image_path.data
+        elif image_path:
+            with open(image_path, "rb") as img_file:
+                input_bytes = img_file.read()
+        return make_cache_key("veo", self.model, prompt, params, input_bytes=input_bytes)
+
+    @staticmethod
+    def default_output_filename(prompt: str) -> str:
+        """Build a unique output filename from the prompt and the current timestamp."""
+        timestamp = int(time.time())
+        safe_prompt = "".join(c for c in prompt[:30] if c.isalnum() or c in (' ', '-', '_')).rstrip()
+        # Random suffix: concurrent calls with the same prompt must not share a file (or its .part)
+        return f"assets/veo_video_{safe_prompt.replace(' ', '_')}_{timestamp}_{uuid.uuid4().hex[:6]}.mp4"
+
+    # Blocking wrappers around the async methods above (same arguments).
+
+    def generate_video(self, prompt: str, image_path: Optional[str] = None, **params) -> Optional[str]:
+        return run_sync(self.generate_video_async(prompt, image_path=image_path, **params))
+
+    def wait_for_completion(self, operation_name: str, max_wait_time: int = 600) -> Optional[str]:
+        return run_sync(self.wait_for_completion_async(operation_name, max_wait_time))
+
+    def download_video(self, video_uri: str, output_filename: str = "generated_video.mp4") -> bool:
+        return run_sync(self.download_video_async(video_uri, output_filename))
+
+    def generate_and_download(self, prompt: str, output_filename: str = None,
+                              image_path: Optional[str] = None, **params) -> bool:
+        return run_sync(self.generate_and_download_async(prompt, output_filename, image_path=image_path, **params))
+
 
 def main():
     """
@@ -279,7 +445,7 @@ def main():
     """
 
     # Configuration from environment or defaults
-    base_url = os.getenv("ASE_URL", "https://api.thucchien.ai/gemini/v1beta")
+    base_url = os.getenv("ASE_URL", api_url("/gemini/v1beta"))
     api_key = os.getenv("API_KEY", "sk-1234")
 
     print("🚀 Starting Veo Video Generation Example")
@@ -0,0 +1,234 @@
+"""
+Hedged request: gửi thêm một bản sao khi request chậm bất thường, lấy phản hồi về trước.
+
+Độ trễ của generateContent (sinh ảnh, TTS) có đuôi dài: phần lớn request xong
+trong vài trăm ms nhưng một số ít bị treo ở một replica quá tải lâu gấp nhiều
+lần, kéo p99 của cả lô lên theo. Khi bật, HedgedTransport (gắn ngoài cùng
+client dùng chung, xem utils/http_client.py):
+- ghi thời gian tới khi có phản hồi (header) của các request thành công theo
+  (endpoint, model), giữ `window` mẫu gần nhất;
+- nếu một request chưa có phản hồi sau phân vị `percentile` của các mẫu đó
+  (không sớm hơn min_delay, chỉ khi đã có ít nhất min_samples mẫu), gửi thêm
+  một bản sao y hệt; phản hồi thành công về trước được dùng, request còn lại
+  bị hủy (đóng kết nối, hoặc đóng phản hồi nếu nó đã về);
+- ngân sách bản sao toàn cục: mỗi request nạp budget_ratio lượt, mỗi bản sao
+  tốn một lượt (dồn tối đa budget_burst lượt), nên số request gửi thêm không
+  vượt quá khoảng budget_ratio (mặc định 5%) dù server chậm hàng loạt.
+Mỗi bản sao đi qua token bucket và chính sách thử lại như request thường.
+
+Chỉ áp dụng cho các endpoint trong `endpoints` (mặc định generateContent, tức
+generate_or_modify_image_gemini và gemini_tts) và chỉ với body đã nằm sẵn
+trong bộ nhớ. Không bao giờ áp dụng cho predictLongRunning (bản sao tạo thêm
+video). Với request dạng stream, "có phản hồi" là lúc nhận header.
+
+Bật:
+    from utils.hedging import configure_hedging
+    configure_hedging(percentile=95, budget_ratio=0.05)
+hoặc biến môi trường HEDGE_REQUESTS=1. Số liệu: hedging_metrics().
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import httpx
+
+from .rate_limit import _NON_IDEMPOTENT, RetryBudget, classify_request
+
+
+_config = {
+    "enabled": os.getenv("HEDGE_REQUESTS", "0").lower() in ("1", "true", "on", "yes"),
+    "percentile": 95.0,          # gửi bản sao khi request chậm hơn phân vị này của độ trễ gần đây
+    "min_samples": 20,           # chưa đủ mẫu của (endpoint, model) thì không gửi bản sao
+    "window": 200,               # số mẫu độ trễ gần nhất được giữ cho mỗi (endpoint, model)
+    "min_delay": 0.05,           # không gửi bản sao sớm hơn chừng này giây
+    "budget_ratio": 0.05,        # mỗi request nạp chừng này lượt, mỗi bản sao tốn một lượt
+    "budget_burst": 5.0,         # số lượt tối đa được dồn (cũng là số lượt có sẵn lúc đầu)
+    "endpoints": ("generateContent",),
+}
+
+
+class _HedgeState:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples: Dict[str, deque] = {}
+        self.budget = RetryBudget(_config["budget_ratio"], _config["budget_burst"], _config["budget_burst"])
+        self._counts = dict.fromkeys(("requests", "hedged", "hedge_wins", "budget_exhausted",
+                                      "losers_cancelled"), 0)
+
+    def threshold(self, key: str) -> Optional[float]:
+        """Số giây chờ trước khi gửi bản sao, None nếu chưa đủ mẫu."""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None or len(samples) < _config["min_samples"]:
+                return None
+            ordered = sorted(samples)
+        rank = max(int(-(-_config["percentile"] * len(ordered) // 100)), 1)  # nearest-rank
+        return max(ordered[min(rank, len(ordered)) - 1], _config["min_delay"])
+
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None or samples.maxlen != _config["window"]:
+                samples = self._samples[key] = deque(samples or (), maxlen=_config["window"])
+            samples.append(seconds)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def reset_budget(self) -> None:
+        self.budget = RetryBudget(_config["budget_ratio"], _config["budget_burst"], _config["budget_burst"])
+
+    def metrics(self) -> dict:
+        with self._lock:
+            counts = dict(self._counts)
+            keys = list(self._samples)
+        thresholds = {key: self.threshold(key) for key in keys}
+        counts["extra_ratio"] = round(counts["hedged"] / counts["requests"], 4) if counts["requests"] else 0.0
+        counts["thresholds_s"] = {key: round(value, 4) for key, value in thresholds.items() if value is not None}
+        return counts
+
+    def reset_metrics(self) -> None:
+        with self._lock:
+            self._counts = dict.fromkeys(self._counts, 0)
+
+
+_state = _HedgeState()
+_closing = set()  # giữ tham chiếu tới các tác vụ đóng phản hồi thua cuộc
+
+
+def configure_hedging(enabled: bool = True, **options) -> None:
+    """
+    Bật/tắt hedged request; tùy chọn: percentile, min_samples, window,
+    min_delay, budget_ratio, budget_burst, endpoints.
+    """
+    unknown = set(options) - set(_config)
+    if unknown:
+        raise ValueError(f"Tùy chọn không hợp lệ: {', '.join(sorted(unknown))}")
+    if "endpoints" in options:
+        options["endpoints"] = tuple(options["endpoints"])
+        if set(options["endpoints"]) & _NON_IDEMPOTENT:
+            raise ValueError(f"Không gửi bản sao được cho: {', '.join(sorted(_NON_IDEMPOTENT))}")
+    _config.update(options, enabled=enabled)
+    _state.reset_budget()
+
+
+def disable_hedging() -> None:
+    """Mỗi request chỉ được gửi một lần như trước."""
+    _config["enabled"] = False
+
+
+def hedging_metrics() -> dict:
+    """
+    requests: số request thuộc diện hedge; hedged: số bản sao đã gửi;
+    extra_ratio: hedged / requests; hedge_wins: số lần bản sao về trước;
+    budget_exhausted: số lần lẽ ra gửi bản sao nhưng hết ngân sách;
+    losers_cancelled: số request thua bị hủy giữa chừng; thresholds_s: ngưỡng
+    chờ hiện tại theo endpoint@model.
+    """
+    return _state.metrics()
+
+
+def reset_hedging_metrics() -> None:
+    _state.reset_metrics()
+
+
+class HedgedTransport(httpx.AsyncBaseTransport):
+    """Transport bọc ngoài RateLimitedTransport: gửi bản sao của request chậm, dùng phản hồi về trước."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not _config["enabled"]:
+            return await self._transport.handle_async_request(request)
+        endpoint, model = classify_request(request)
+        if endpoint not in _config["endpoints"] or endpoint in _NON_IDEMPOTENT or not _has_body(request):
+            return await self._transport.handle_async_request(request)
+
+        key = "@".join(part for part in (endpoint, model) if part)
+        _state.count("requests")
+        _state.budget.deposit()
+        delay = _state.threshold(key)
+        if delay is None:
+            return await self._send(request, key)
+
+        tasks = [asyncio.ensure_future(self._send(request, key))]
+        winner = None
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                if _state.budget.withdraw():
+                    _state.count("hedged")
+                    tasks.append(asyncio.ensure_future(self._send(_copy_request(request), key)))
+                else:
+                    _state.count("budget_exhausted")
+            winner = await _first_success(tasks)
+            if winner is not tasks[0]:
+                _state.count("hedge_wins")
+            return winner.result()
+        finally:
+            for task in tasks:
+                if task is not winner:
+                    _discard(task, loser=winner is not None)
+
+    async def _send(self, request: httpx.Request, key: str) -> httpx.Response:
+        started = time.perf_counter()
+        response = await self._transport.handle_async_request(request)
+        if _succeeded(response):
+            _state.record(key, time.perf_counter() - started)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _has_body(request: httpx.Request) -> bool:
+    try:
+        request.content
+    except httpx.RequestNotRead:
+        return False  # body dạng stream: không gửi lại được
+    return True
+
+
+def _copy_request(request: httpx.Request) -> httpx.Request:
+    # Bản sao có extensions riêng: InstrumentedTransport gắn trace vào từng request
+    return httpx.Request(request.method, request.url, headers=request.headers, content=request.content,
+                         extensions=dict(request.extensions))
+
+
+def _succeeded(response: httpx.Response) -> bool:
+    return response.status_code < 500 and response.status_code != 429
+
+
+async def _first_success(tasks: list) -> asyncio.Future:
+    """Task đầu tiên có phản hồi thành công; nếu mọi task đều lỗi thì task xong trước nhất."""
+    pending = set(tasks)
+    first = None
+    while pending:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for task in sorted(done, key=tasks.index):
+            first = first or task
+            if task.exception() is None and _succeeded(task.result()):
+                return task
+    return first
+
+
+def _discard(task: asyncio.Future, loser: bool) -> None:
+    if not task.done():
+        task.cancel()
+        if loser:  # không tính khi chính người gọi hủy request
+            _state.count("losers_cancelled")
+    task.add_done_callback(_close_response)
+
+
+def _close_response(task: asyncio.Future) -> None:
+    if task.cancelled() or task.exception() is not None:
+        return
+    closing = asyncio.ensure_future(task.result().aclose())
+    _closing.add(closing)
+    closing.add_done_callback(_closing.discard)
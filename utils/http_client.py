@@ -0,0 +1,262 @@
+"""
+Lớp HTTP client dùng chung cho mọi module trong utils/.
+
+Mọi lời gọi tới api.thucchien.ai đi qua một client duy nhất cho mỗi event loop
+để tái sử dụng kết nối (keep-alive, pool theo từng host, HTTP/2 nếu có cài
+`h2`), thay vì mỗi lần gọi lại bắt tay TCP + TLS từ đầu.
+
+Các hàm trong utils/ được viết dạng async (`*_async`); bản đồng bộ chỉ là lớp
+bọc mỏng gọi run_sync(), chạy coroutine trên một event loop nền dùng chung nên
+các lời gọi đồng bộ từ nhiều thread vẫn chia sẻ cùng một pool kết nối.
+
+Mọi request đi qua RateLimitedTransport (utils/rate_limit.py): giới hạn tốc độ
+theo endpoint/model và tự thử lại 429/5xx (tôn trọng Retry-After, có ngân sách
+thử lại chung), và mỗi lần gửi đi qua InstrumentedTransport
+(utils/instrumentation.py) để đo thời gian từng pha khi instrumentation bật.
+Khi bật hedged request (utils/hedging.py), HedgedTransport nằm ngoài cùng và
+gửi thêm bản sao của các request chậm bất thường.
+
+Ví dụ:
+    from utils.http_client import configure_http_client, get_async_http_client, gemini_headers
+
+    configure_http_client(max_connections=200, http2=True)
+    client = get_async_http_client()   # gọi bên trong event loop
+    resp = await client.post(url, headers=gemini_headers(api_key), json=payload)
+"""
+
+import asyncio
+import atexit
+import importlib.util
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from types import MappingProxyType
+from typing import List, Mapping, Optional, Tuple
+
+import httpx
+
+from .hedging import HedgedTransport
+from .instrumentation import InstrumentedTransport
+from .rate_limit import RateLimitedTransport, classify_path
+
+
+# API gốc của mọi endpoint; đổi bằng biến môi trường API_BASE_URL hoặc configure_api_base_url()
+# (ví dụ trỏ tới server giả lập benchmarks/mock_server.py).
+_api_base_url = os.getenv("API_BASE_URL", "https://api.thucchien.ai").rstrip("/")
+
+# Cấu hình mặc định của pool kết nối. Có thể thay đổi qua configure_http_client().
+_config = {
+    "max_connections": 100,             # tổng số kết nối đồng thời
+    "max_keepalive_connections": 20,    # số kết nối nhàn rỗi được giữ lại để tái sử dụng
+    "keepalive_expiry": 60.0,           # giây giữ một kết nối nhàn rỗi
+    "http2": importlib.util.find_spec("h2") is not None,  # chỉ bật HTTP/2 khi có cài `h2`
+    "timeout": 600.0,                   # timeout đọc/ghi (giây); sinh video/TTS dài có thể rất lâu
+    "connect_timeout": 10.0,
+    "headers": {"User-Agent": "litellm-note/utils"},
+}
+
+_lock = threading.Lock()
+# Mỗi event loop có một AsyncClient riêng (httpx không cho dùng chung giữa các loop).
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+# Event loop nền dùng cho các hàm đồng bộ (xem run_sync()).
+_runner_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def configure_http_client(**options) -> None:
+    """
+    Thay đổi cấu hình client dùng chung. Các client cũ sẽ bị bỏ, client mới
+    được tạo lại ở lần gọi get_async_http_client() kế tiếp.
+
+    Các tùy chọn hợp lệ: max_connections, max_keepalive_connections,
+    keepalive_expiry, http2, timeout, connect_timeout, headers.
+    """
+    unknown = set(options) - set(_config)
+    if unknown:
+        raise ValueError(f"Tùy chọn không hợp lệ: {', '.join(sorted(unknown))}")
+
+    if options.get("http2") and importlib.util.find_spec("h2") is None:
+        raise ValueError("HTTP/2 cần gói `h2`: pip install 'httpx[http2]'")
+
+    with _lock:
+        _config.update(options)
+    close_http_client()
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """
+    Trả về AsyncClient dùng chung của event loop đang chạy
+    (tạo lười ở lần gọi đầu tiên trong loop đó).
+    """
+    loop = asyncio.get_running_loop()
+    with _lock:
+        client = _clients.get(loop)
+        if client is None or client.is_closed:
+            transport = httpx.AsyncHTTPTransport(
+                http2=_config["http2"],
+                limits=httpx.Limits(
+                    max_connections=_config["max_connections"],
+                    max_keepalive_connections=_config["max_keepalive_connections"],
+                    keepalive_expiry=_config["keepalive_expiry"],
+                ),
+            )
+            client = httpx.AsyncClient(
+                # Token bucket theo endpoint/model + thử lại 429/5xx có ngân sách (utils/rate_limit.py);
+                # mỗi lần thử được đo riêng (utils/instrumentation.py); bản sao của request chậm
+                # (utils/hedging.py) cũng đi qua limiter như request thường
+                transport=HedgedTransport(RateLimitedTransport(InstrumentedTransport(transport))),
+                timeout=httpx.Timeout(_config["timeout"], connect=_config["connect_timeout"]),
+                headers=_config["headers"],
+                event_hooks={"response": [_observe_status]},
+            )
+            _clients[loop] = client
+    return client
+
+
+_observed_statuses: ContextVar[Optional[Tuple[Optional[str], List[int]]]] = ContextVar("observed_statuses",
+                                                                                       default=None)
+
+
+@contextmanager
+def observe_statuses(endpoint: Optional[str] = None):
+    """
+    Thu mã trạng thái HTTP (sau khi transport đã thử lại) của mọi phản hồi nhận
+    được trong khối with, kể cả trong các task được tạo bên trong. Dùng khi hàm
+    được gọi tự nuốt lỗi HTTP mà người gọi vẫn cần biết lỗi thuộc loại nào.
+    endpoint (theo classify_path, ví dụ "generateContent"): chỉ thu phản hồi
+    của endpoint này, bỏ qua các request phụ như tải file lên hay tải kết quả về.
+    """
+    statuses: List[int] = []
+    token = _observed_statuses.set((endpoint, statuses))
+    try:
+        yield statuses
+    finally:
+        _observed_statuses.reset(token)
+
+
+async def _observe_status(response: httpx.Response) -> None:
+    observed = _observed_statuses.get()
+    if observed is None:
+        return
+    endpoint, statuses = observed
+    if endpoint is None or classify_path(response.request.url.path)[0] == endpoint:
+        statuses.append(response.status_code)
+
+
+def run_sync(coro):
+    """
+    Chạy một coroutine trên event loop nền dùng chung và chờ kết quả.
+
+    Dùng để viết các hàm đồng bộ như lớp bọc mỏng của bản async. Không gọi
+    từ bên trong một event loop đang chạy (khi đó hãy `await` trực tiếp).
+    Nếu bị ngắt (Ctrl+C), tác vụ tương ứng trên loop nền sẽ bị hủy.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        coro.close()
+        raise RuntimeError("run_sync() không dùng được bên trong event loop, hãy await bản *_async")
+
+    future = asyncio.run_coroutine_threadsafe(coro, _get_runner_loop())
+    try:
+        return future.result()
+    except KeyboardInterrupt:
+        future.cancel()
+        raise
+
+
+def iterate_sync(agen):
+    """
+    Duyệt một async generator trên event loop nền dùng chung như một iterator
+    thường (bản đồng bộ của các hàm stream). Mỗi phần tử được lấy bằng một lần
+    chạy trên loop nền; dừng sớm (break, lỗi, Ctrl+C) sẽ đóng async generator.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        pass
+    else:
+        raise RuntimeError("iterate_sync() không dùng được bên trong event loop, hãy dùng async for")
+
+    loop = _get_runner_loop()
+    try:
+        while True:
+            future = asyncio.run_coroutine_threadsafe(agen.__anext__(), loop)
+            try:
+                item = future.result()
+            except StopAsyncIteration:
+                return
+            except KeyboardInterrupt:
+                future.cancel()
+                raise
+            yield item
+    finally:
+        asyncio.run_coroutine_threadsafe(agen.aclose(), loop).result()
+
+
+def _get_runner_loop() -> asyncio.AbstractEventLoop:
+    global _runner_loop
+    with _lock:
+        if _runner_loop is None:
+            _runner_loop = asyncio.new_event_loop()
+            threading.Thread(target=_runner_loop.run_forever, name="utils-http-loop", daemon=True).start()
+        return _runner_loop
+
+
+def close_http_client() -> None:
+    """Đóng các client dùng chung và giải phóng mọi kết nối trong pool."""
+    with _lock:
+        clients = list(_clients.items())
+        _clients.clear()
+
+    try:
+        current_loop = asyncio.get_running_loop()
+    except RuntimeError:
+        current_loop = None
+
+    for loop, client in clients:
+        if loop.is_closed():
+            continue
+        if loop is _runner_loop and loop is not current_loop:
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop).result(timeout=10)
+        else:
+            # Không thể chờ loop của người dùng từ đây; lên lịch đóng trên chính loop đó.
+            loop.call_soon_threadsafe(lambda c=client, l=loop: l.create_task(c.aclose()))
+
+
+def configure_api_base_url(base_url: str) -> None:
+    """Đổi API gốc (mặc định https://api.thucchien.ai) cho các lời gọi từ đây về sau."""
+    global _api_base_url
+    _api_base_url = base_url.rstrip("/")
+
+
+def api_url(path: str = "") -> str:
+    """URL đầy đủ của một đường dẫn trên API gốc, ví dụ api_url("/images/generations")."""
+    return _api_base_url + path
+
+
+# Header theo từng kiểu xác thực chỉ được dựng một lần cho mỗi API key.
+# Trả về mapping chỉ-đọc vì cùng một object được dùng lại giữa các lời gọi.
+@lru_cache(maxsize=64)
+def gemini_headers(api_key: str) -> Mapping[str, str]:
+    """Header cho các endpoint Gemini pass-through (`/gemini/...`)."""
+    return MappingProxyType({
+        "x-goog-api-key": api_key,
+        "Content-Type": "application/json",
+    })
+
+
+@lru_cache(maxsize=64)
+def bearer_headers(api_key: str) -> Mapping[str, str]:
+    """Header cho các endpoint kiểu OpenAI (`/chat/completions`, `/images/generations`, ...)."""
+    return MappingProxyType({
+        "Authorization": f"Bearer {api_key}",
+        "Content-Type": "application/json",
+    })
+
+
+atexit.register(close_http_client)
@@ -0,0 +1,214 @@
+"""
+Chuẩn bị ảnh đầu vào trước khi base64 và gửi lên API.
+
+start_video_with_image, VeoVideoGenerator (image-to-video),
+generate_or_modify_image_gemini và api_chat_completions từng base64 nguyên
+file gốc: một ảnh JPEG 12 MP chụp bằng điện thoại được gửi đủ kích thước dù
+video đích chỉ là 720p, và body request còn to thêm ~33% vì base64. Ở đây ảnh
+được:
+- xoay đúng theo EXIF orientation rồi bỏ mọi metadata (EXIF, GPS, XMP, ...);
+- thu nhỏ (không bao giờ phóng to) theo đích:
+    video_target(params)        cắt giữa theo aspectRatio rồi thu về resolution của video
+                                (720p 16:9 -> 1280x720, 1080p 9:16 -> 1080x1920, ...)
+    edit_target()               giữ nguyên tỉ lệ, tối đa edit_max_pixels điểm ảnh
+- mã hóa lại: JPEG chất lượng `quality`, hoặc PNG nếu ảnh có kênh alpha.
+mimeType được nhận dạng theo nội dung (magic bytes), không đoán theo extension.
+
+Kết quả được cache theo hash của ảnh gốc + đích + cấu hình (trong bộ nhớ, và
+trên đĩa nếu artifact cache đang bật), nên một ảnh tham chiếu dùng cho hàng
+trăm request chỉ được xử lý một lần.
+
+Cấu hình:
+    from utils.image_prep import configure_image_prep
+    configure_image_prep(quality=85, edit_max_pixels=1024 * 1024)
+    configure_image_prep(enabled=False)   # gửi nguyên file gốc như trước
+hoặc biến môi trường IMAGE_PREP=0 để tắt. Không có Pillow thì ảnh được gửi
+nguyên vẹn (chỉ nhận dạng mimeType).
+"""
+
+import asyncio
+import io
+import os
+import threading
+from typing import Optional, Union
+
+from .artifact_cache import ArtifactCache, get_artifact_cache, make_cache_key
+from .instrumentation import clock, record_phase
+from .media_sink import ImageData
+
+
+_config = {
+    "enabled": os.getenv("IMAGE_PREP", "1").lower() not in ("0", "false", "off", "no"),
+    "quality": 90,                   # chất lượng JPEG khi mã hóa lại
+    "format": "auto",                # auto (JPEG, PNG nếu có alpha) | jpeg | png
+    "edit_max_pixels": 2_000_000,    # số điểm ảnh tối đa của ảnh đầu vào cho sửa ảnh/chat
+}
+_FORMATS = ("auto", "jpeg", "png")
+
+# Kích thước khung video theo resolution (cạnh ngắn)
+_VIDEO_SHORT_SIDE = {"720p": 720, "1080p": 1080}
+
+# Tầng bộ nhớ luôn bật; tầng đĩa dùng artifact cache dùng chung nếu có
+_memory = ArtifactCache(None, max_memory_bytes=64 * 1024 * 1024, max_memory_item_bytes=16 * 1024 * 1024)
+_warned_no_pil = False
+_warn_lock = threading.Lock()
+
+
+def configure_image_prep(**options) -> None:
+    """Đổi cấu hình: enabled, quality, format (auto/jpeg/png), edit_max_pixels."""
+    unknown = set(options) - set(_config)
+    if unknown:
+        raise ValueError(f"Tùy chọn không hợp lệ: {', '.join(sorted(unknown))}")
+    if options.get("format", "auto") not in _FORMATS:
+        raise ValueError(f"format phải là một trong {_FORMATS}")
+    _config.update(options)
+
+
+def video_target(params: Optional[dict] = None) -> dict:
+    """Đích cho ảnh image-to-video: khung đúng resolution/aspectRatio của video (mặc định 720p 16:9)."""
+    params = params or {}
+    short = _VIDEO_SHORT_SIDE.get(str(params.get("resolution", "720p")), 720)
+    long = short * 16 // 9
+    portrait = str(params.get("aspectRatio", "16:9")) == "9:16"
+    width, height = (short, long) if portrait else (long, short)
+    return {"width": width, "height": height, "crop": True}
+
+
+def edit_target() -> dict:
+    """Đích cho ảnh đầu vào của sửa ảnh/chat: giữ tỉ lệ, tối đa edit_max_pixels điểm ảnh."""
+    return {"max_pixels": _config["edit_max_pixels"]}
+
+
+def prepare_input_image(image: Union[bytes, ImageData], target: Optional[dict] = None) -> ImageData:
+    """
+    Thu nhỏ/bỏ metadata/mã hóa lại ảnh cho đích target; có cache.
+
+    Trả về chính ImageData đầu vào khi ảnh không cần đổi (giữ base64 đã tính).
+    """
+    if not isinstance(image, ImageData):
+        image = ImageData(image)
+    if not _config["enabled"]:
+        return image
+    data = image.data
+
+    spec = {"target": target or {}, "quality": _config["quality"], "format": _config["format"]}
+    variant = repr(sorted(spec.items()))
+    if variant in image.variants:
+        # Cùng ảnh đã được chuẩn bị cho cùng đích (ví dụ ảnh tham chiếu dùng cho nhiều request)
+        return image.variants[variant]
+    key = make_cache_key("image_prep", "", "", spec, input_bytes=data)
+    disk = get_artifact_cache()
+    cached = _memory.get(key)
+    if cached is None and disk:
+        cached = disk.get(key)
+        if cached is not None:
+            _memory.put(key, cached)
+    if cached is None:
+        t = clock()
+        cached = _process(data, target)
+        record_phase("encode", "image_prep", t, len(data))
+        _memory.put(key, cached)
+        if disk:
+            disk.put(key, cached)
+    prepared = image if cached == data else ImageData(cached)
+    image.variants[variant] = prepared
+    return prepared
+
+
+async def prepare_input_image_async(source: Union[str, bytes, ImageData], target: Optional[dict] = None) -> ImageData:
+    """Bản async của prepare_input_image(); source là đường dẫn file, bytes hoặc ImageData. Chạy trong thread."""
+    if isinstance(source, str):
+        return await asyncio.to_thread(_prepare_file, source, target)
+    return await asyncio.to_thread(prepare_input_image, source, target)
+
+
+def _prepare_file(path: str, target: Optional[dict]) -> ImageData:
+    return prepare_input_image(ImageData.from_file(path), target)
+
+
+def _process(data: bytes, target: Optional[dict]) -> bytes:
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        _warn_no_pil()
+        return data
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            source_format = image.format
+            has_metadata = any(k in image.info for k in ("exif", "xmp", "XML:com.adobe.xmp", "comment", "icc_profile"))
+            if target and source_format == "JPEG":
+                # Giải mã JPEG ở độ phân giải thấp hơn (nhanh hơn nhiều) khi ảnh đích nhỏ
+                side = max(target.get("width", 0), target.get("height", 0))
+                if side:
+                    image.draft("RGB", (side, side))
+            image = ImageOps.exif_transpose(image)
+            resized = _resize(image, target)
+            has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        print(f"⚠️ Không xử lý được ảnh đầu vào ({e}); gửi nguyên file gốc.")
+        return data
+
+    fmt = _config["format"]
+    if fmt == "auto":
+        fmt = "png" if has_alpha else "jpeg"
+    out = io.BytesIO()
+    if fmt == "jpeg":
+        if resized.mode != "RGB":
+            resized = _flatten(resized) if has_alpha else resized.convert("RGB")
+        resized.save(out, format="JPEG", quality=_config["quality"])
+    else:
+        resized.save(out, format="PNG")
+    encoded = out.getvalue()
+
+    # Ảnh đã đủ nhỏ, không có metadata và bản gốc còn nhẹ hơn: gửi nguyên bản gốc
+    unchanged = resized.size == image.size and source_format in ("JPEG", "PNG") and not has_metadata
+    if unchanged and len(data) <= len(encoded) and (source_format == "PNG") == (fmt == "png"):
+        return data
+    return encoded
+
+
+def _resize(image, target: Optional[dict]):
+    from PIL import Image
+
+    width, height = image.size
+    if not target:
+        return image
+    if "max_pixels" in target:
+        scale = min(1.0, (target["max_pixels"] / (width * height)) ** 0.5)
+        size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        return image.resize(size, Image.LANCZOS) if scale < 1 else image
+
+    box_w, box_h = target["width"], target["height"]
+    if target.get("crop"):
+        # Cắt giữa theo tỉ lệ khung đích
+        aspect = box_w / box_h
+        if width / height > aspect:
+            crop_w, crop_h = round(height * aspect), height
+        else:
+            crop_w, crop_h = width, round(width / aspect)
+        left, top = (width - crop_w) // 2, (height - crop_h) // 2
+        if (crop_w, crop_h) != (width, height):
+            image = image.crop((left, top, left + crop_w, top + crop_h))
+        width, height = crop_w, crop_h
+    scale = min(1.0, box_w / width, box_h / height)
+    if scale < 1:
+        image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.LANCZOS)
+    return image
+
+
+def _flatten(image):
+    from PIL import Image
+
+    rgba = image.convert("RGBA")
+    background = Image.new("RGB", rgba.size, (255, 255, 255))
+    background.paste(rgba, mask=rgba.getchannel("A"))
+    return background
+
+
+def _warn_no_pil() -> None:
+    global _warned_no_pil
+    with _warn_lock:
+        if not _warned_no_pil:
+            _warned_no_pil = True
+            print("⚠️ Chưa cài Pillow: ảnh đầu vào được gửi nguyên vẹn (pip install Pillow để thu nhỏ trước khi gửi).")
@@ -0,0 +1,334 @@
+"""
+Đọc phản hồi generateContent của Gemini theo kiểu stream.
+
+Phản hồi chứa âm thanh/ảnh dạng base64 trong
+candidates[0].content.parts[0].inlineData.data. Cách cũ (response.json() rồi
+base64.b64decode) giữ cùng lúc body thô, dict đã parse, chuỗi base64 và bytes
+đã giải mã, nên một podcast dài tốn RAM gấp nhiều lần kích thước file.
+
+InlineDataDecoder tìm trường inlineData ngay khi body đang về và giải mã
+base64 từng đoạn, ghi thẳng ra file WAV/ảnh. Bộ nhớ dùng gần như không đổi
+bất kể kích thước payload.
+"""
+
+import asyncio
+import base64
+import binascii
+import os
+import random
+import re
+import time
+from collections import deque
+from typing import Callable, Deque, Optional, Sequence
+
+import httpx
+
+from .artifact_cache import get_artifact_cache
+from .single_flight import get_single_flight
+from .audio_io import open_pcm_wav
+from .http_client import get_async_http_client
+from .instrumentation import clock, model_from_url, phase_timer, record_phase
+
+
+_INLINE_DATA_KEY = re.compile(rb'"inline_?[dD]ata"\s*:\s*\{')
+_DATA_KEY = re.compile(rb'"data"\s*:\s*"')
+_MIME_TYPE = re.compile(rb'"mime_?[tT]ype"\s*:\s*"([^"]*)"')
+
+# Giữ lại tối đa chừng này byte đầu của body để in khi phản hồi không như mong đợi
+_PREVIEW_BYTES = 4096
+# Số byte cuối được giữ lại giữa hai đoạn, đủ để chứa một khóa/giá trị bị cắt ngang
+_TAIL_BYTES = 256
+
+
+class InlineDataNotFound(ValueError):
+    """Phản hồi không chứa inlineData.data (ví dụ bị chặn bởi safety filter)."""
+
+    def __init__(self, preview: str):
+        super().__init__(f"Không tìm thấy inlineData trong phản hồi: {preview}")
+        self.preview = preview
+
+
+class InlineDataDecoder:
+    """
+    Bộ giải mã tăng dần cho trường inlineData.data đầu tiên trong một body JSON.
+
+    Gọi feed() với từng đoạn byte của body; mỗi lần gọi trả về phần dữ liệu đã
+    giải mã được. Gọi close() khi body kết thúc.
+    """
+
+    def __init__(self):
+        self.mime_type: Optional[str] = None
+        self.found = False      # đã gặp "data": "
+        self.finished = False   # đã gặp dấu " kết thúc chuỗi base64
+        self.decoded_bytes = 0
+        self._state = "seek_inline"
+        self._pending = b""     # byte chưa xử lý xong (token có thể nằm vắt qua 2 đoạn)
+        self._b64_rest = b""    # phần base64 chưa đủ bội số của 4
+        self._escape = False
+        self._preview = bytearray()
+
+    def feed(self, chunk: bytes) -> bytes:
+        if len(self._preview) < _PREVIEW_BYTES:
+            self._preview += chunk[:_PREVIEW_BYTES - len(self._preview)]
+
+        buf = self._pending + chunk
+        self._pending = b""
+
+        if self._state == "done":
+            self._scan_mime_type(buf)
+            self._pending = buf[-_TAIL_BYTES:]
+            return b""
+
+        if self._state == "seek_inline":
+            m = _INLINE_DATA_KEY.search(buf)
+            if not m:
+                self._pending = buf[-_TAIL_BYTES:]
+                return b""
+            buf = buf[m.end():]
+            self._state = "seek_data"
+
+        if self._state == "seek_data":
+            m = _DATA_KEY.search(buf)
+            if not m:
+                self._scan_mime_type(buf)
+                self._pending = buf[-_TAIL_BYTES:]
+                return b""
+            self._scan_mime_type(buf[:m.start()])
+            buf = buf[m.end():]
+            self._state = "data"
+            self.found = True
+
+        # self._state == "data": buf bắt đầu từ giữa chuỗi base64
+        end = self._find_string_end(buf)
+        data, tail = (buf, b"") if end < 0 else (buf[:end], buf[end + 1:])
+        out = self._decode(data)
+        if end >= 0:
+            out += self._decode_final()
+            self._state = "done"
+            self.finished = True
+            self._scan_mime_type(tail)
+            self._pending = tail[-_TAIL_BYTES:]
+        return out
+
+    def close(self) -> bytes:
+        """Kết thúc body. Báo lỗi nếu không tìm thấy dữ liệu inlineData hoàn chỉnh."""
+        if not self.finished:
+            raise InlineDataNotFound(self.preview)
+        return b""
+
+    @property
+    def preview(self) -> str:
+        """Phần đầu của body (để in khi có lỗi)."""
+        return self._preview.decode("utf-8", errors="replace")
+
+    def _find_string_end(self, buf: bytes) -> int:
+        # Base64 không chứa dấu ", nên dấu " đầu tiên không bị escape là điểm kết thúc chuỗi
+        start = 0
+        while True:
+            i = buf.find(b'"', start)
+            if i <= 0 or buf[i - 1:i] != b"\\":
+                return i
+            start = i + 1
+
+    def _decode(self, data: bytes) -> bytes:
+        if b"\\" in data or self._escape:
+            data = self._unescape(data)
+        data = self._b64_rest + data
+        usable = len(data) - len(data) % 4
+        self._b64_rest = data[usable:]
+        if not usable:
+            return b""
+        out = binascii.a2b_base64(data[:usable])
+        self.decoded_bytes += len(out)
+        return out
+
+    def _decode_final(self) -> bytes:
+        rest, self._b64_rest = self._b64_rest, b""
+        if not rest:
+            return b""
+        out = base64.b64decode(rest + b"=" * (-len(rest) % 4))
+        self.decoded_bytes += len(out)
+        return out
+
+    def _unescape(self, data: bytes) -> bytes:
+        # JSON có thể escape "/" thành "\/" hoặc chèn "\n"; bảng chữ base64 không có "\"
+        if not self._escape and not data.endswith(b"\\"):
+            return data.replace(b"\\/", b"/").replace(b"\\n", b"").replace(b"\\r", b"")
+        out = bytearray()
+        for b in data:
+            if self._escape:
+                self._escape = False
+                if b == ord("/"):
+                    out.append(b)
+            elif b == ord("\\"):
+                self._escape = True
+            else:
+                out.append(b)
+        return bytes(out)
+
+    def _scan_mime_type(self, buf: bytes) -> None:
+        if self.mime_type is None:
+            m = _MIME_TYPE.search(buf)
+            if m:
+                self.mime_type = m.group(1).replace(b"\\/", b"/").decode("utf-8", errors="replace")
+
+
+async def stream_inline_data_async(url: str, headers, payload, write: Callable[[bytes], None],
+                                   chunk_size: int = 64 * 1024) -> str:
+    """
+    POST payload tới một endpoint generateContent và ghi dữ liệu inlineData đã
+    giải mã vào write() ngay khi nhận được. Trả về mimeType của dữ liệu.
+
+    payload có thể là dict (gửi dạng JSON) hoặc chuỗi JSON đã dựng sẵn.
+    Lỗi HTTP được raise dạng httpx.HTTPStatusError (body lỗi đã được đọc sẵn);
+    phản hồi không có inlineData raise InlineDataNotFound.
+    """
+    body = {"content": payload} if isinstance(payload, (str, bytes)) else {"json": payload}
+    decoder = InlineDataDecoder()
+    timer = phase_timer("inline_data", model_from_url(url))
+    async with get_async_http_client().stream("POST", url, headers=headers, **body) as response:
+        if response.is_error:
+            await response.aread()
+            response.raise_for_status()
+        async for chunk in response.aiter_bytes(chunk_size):
+            t = timer.clock()
+            data = decoder.feed(chunk)
+            if data:
+                t = timer.lap("decode", t, len(data))
+                write(data)
+                timer.lap("write", t, len(data))
+    decoder.close()
+    timer.finish()
+    return decoder.mime_type
+
+
+async def stream_inline_data_to_wav_async(url: str, headers, payload, output_path: str,
+                                          channels: int = 1, sample_width: int = 2,
+                                          sample_rate: int = 24000) -> str:
+    """Stream PCM trong inlineData thẳng vào file WAV (header được cập nhật khi đóng file)."""
+    try:
+        with open_pcm_wav(output_path, channels, sample_width, sample_rate) as wf:
+            await stream_inline_data_async(url, headers, payload, wf.writeframesraw)
+    except BaseException:
+        _remove_quietly(output_path)
+        raise
+    return output_path
+
+
+async def stream_inline_data_to_file_async(url: str, headers, payload, output_path: str) -> tuple:
+    """
+    Stream dữ liệu inlineData (ví dụ ảnh) thẳng vào một file tạm cạnh output_path.
+
+    Returns: (đường dẫn file tạm, mimeType). Người gọi quyết định tên file cuối
+    cùng (có thể phụ thuộc mimeType) rồi os.replace() file tạm.
+    """
+    tmp_path = f"{output_path}.part"
+    try:
+        with open(tmp_path, "wb") as f:
+            mime_type = await stream_inline_data_async(url, headers, payload, f.write)
+    except BaseException:
+        _remove_quietly(tmp_path)
+        raise
+    return tmp_path, mime_type
+
+
+async def stream_segments_to_wav_async(url: str, headers, payloads: Sequence, output_path: str,
+                                       channels: int = 1, sample_width: int = 2,
+                                       sample_rate: int = 24000,
+                                       segment_keys: Optional[Sequence[Optional[str]]] = None,
+                                       max_workers: int = 4, max_retries: int = 3) -> dict:
+    """
+    Gọi TTS song song cho nhiều payload (mỗi payload là một đoạn của cùng một
+    bài đọc) và ghép PCM vào một file WAV theo đúng thứ tự của payloads.
+
+    Đoạn i được ghi ngay khi nó và mọi đoạn trước nó đã xong; trong lúc chờ,
+    tối đa 2 * max_workers đoạn tính từ đoạn i được sinh trước (bộ nhớ không
+    tăng theo độ dài bài). Một đoạn bị đứt giữa chừng hoặc thiếu
+    inlineData được thử lại tối đa max_retries lần (backoff lũy thừa có jitter);
+    lỗi HTTP không được thử lại ở đây. Nếu một đoạn vẫn lỗi, các đoạn còn lại bị
+    hủy, file dở dang bị xóa và lỗi được raise lại.
+
+    segment_keys (nếu có, cùng độ dài với payloads) là khóa của PCM từng đoạn
+    (xem make_cache_key): dùng cho artifact cache (nếu bật) và để các đoạn
+    giống hệt nhau đang được sinh cùng lúc, trong cùng bài hay ở các lời gọi
+    khác, chỉ gửi một request (single-flight). None ở vị trí nào thì đoạn đó
+    luôn được sinh riêng.
+
+    Returns: dict thống kê {"segments", "first_segment_s", "elapsed_s", "audio_s"}.
+    """
+    payloads = list(payloads)
+    cache = get_artifact_cache()
+    flight = get_single_flight()
+    semaphore = asyncio.Semaphore(max_workers)
+    started = time.time()
+    stats = {"segments": len(payloads), "first_segment_s": None, "elapsed_s": None, "audio_s": 0.0}
+
+    async def fetch(index: int) -> bytes:
+        async with semaphore:
+            for attempt in range(max_retries + 1):
+                pcm = bytearray()
+                try:
+                    await stream_inline_data_async(url, headers, payloads[index], pcm.extend)
+                    break
+                except (httpx.TransportError, InlineDataNotFound) as e:
+                    # Lỗi kết nối trước khi có dữ liệu đã được RateLimitedTransport thử lại;
+                    # ở đây chỉ thử lại khi đứt giữa body hoặc phản hồi thiếu inlineData.
+                    # Lỗi HTTP (4xx, hay 429/5xx đã hết lượt thử lại) được raise ngay.
+                    if attempt == max_retries or (isinstance(e, httpx.TransportError) and not pcm):
+                        raise
+                    delay = min(2 ** attempt, 30) * (0.5 + random.random())
+                    print(f"⚠️ Đoạn {index + 1}/{len(payloads)} lỗi ({e}), thử lại sau {delay:.1f}s...")
+                    await asyncio.sleep(delay)
+        return bytes(pcm)
+
+    async def synthesize(index: int) -> bytes:
+        key = segment_keys[index] if segment_keys else None
+        if key is None:
+            return await fetch(index)
+        if cache:
+            cached = await asyncio.to_thread(cache.get, key)
+            if cached is not None:
+                return cached
+
+        async def fetch_and_store() -> bytes:
+            pcm = await fetch(index)
+            if cache:
+                await asyncio.to_thread(cache.put, key, pcm)
+            return pcm
+
+        return await flight.do_async(key, fetch_and_store, kind="tts_segment")
+
+    # Cửa sổ trượt: chỉ tạo trước tối đa 2 * max_workers đoạn tính từ đoạn đang chờ ghi, để
+    # khi một đoạn đầu chậm/đang thử lại, PCM của các đoạn sau không dồn hết vào RAM
+    window = 2 * max(max_workers, 1)
+    tasks: Deque[asyncio.Task] = deque()
+    scheduled = 0
+    try:
+        with open_pcm_wav(output_path, channels, sample_width, sample_rate) as wf:
+            for i in range(len(payloads)):
+                while scheduled < len(payloads) and scheduled < i + window:
+                    tasks.append(asyncio.create_task(synthesize(scheduled)))
+                    scheduled += 1
+                pcm = await tasks[0]
+                tasks.popleft()
+                t = clock()
+                await asyncio.to_thread(wf.writeframesraw, pcm)
+                record_phase("write", "tts_segments", t, len(pcm), model_from_url(url))
+                stats["audio_s"] += len(pcm) / (channels * sample_width * sample_rate)
+                if i == 0:
+                    stats["first_segment_s"] = time.time() - started
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        _remove_quietly(output_path)
+        raise
+
+    stats["elapsed_s"] = time.time() - started
+    return stats
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
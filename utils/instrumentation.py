@@ -0,0 +1,485 @@
+"""
+Đo thời gian từng pha của mọi request và các bước xử lý cục bộ trong utils/.
+
+Khi bật, mỗi request HTTP (mỗi lần thử, kể cả lần bị 429/5xx rồi được thử lại)
+tạo một sự kiện "http" gồm endpoint, model, mã trạng thái, kết quả, số byte gửi/
+nhận và thời gian các pha:
+
+    pool_wait  chờ lấy kết nối từ pool
+    connect    phân giải DNS + bắt tay TCP (chỉ khi mở kết nối mới)
+    tls        bắt tay TLS (chỉ khi mở kết nối mới)
+    upload     gửi header + body request
+    ttfb       từ lúc gửi xong tới khi nhận được header phản hồi
+    download   đọc body phản hồi (gồm cả thời gian người gọi xử lý từng đoạn)
+
+Các bước cục bộ (giải mã base64, ghi WAV/ảnh/video, mã hóa ảnh đầu vào,
+chuyển định dạng ảnh) tạo sự kiện "local" với pha decode / encode / write, tên
+bước (operation), model và số byte.
+
+Sự kiện được:
+- gộp thành counter/histogram, xem bằng instrumentation_metrics() hoặc xuất ra
+  file text theo định dạng Prometheus (textfile collector của node_exporter);
+- chuyển cho các callback đăng ký bằng add_instrumentation_callback(fn), fn(event: dict).
+
+Bật:
+    configure_instrumentation(metrics_path="logs/metrics.prom")   # ghi file mỗi export_interval giây và khi thoát
+    add_instrumentation_callback(print)
+hoặc biến môi trường METRICS_PATH=logs/metrics.prom.
+
+Khi tắt (mặc định), mỗi request chỉ tốn thêm một lần kiểm tra cờ và các bước
+cục bộ không gọi đồng hồ.
+"""
+
+import atexit
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from .rate_limit import classify_path, classify_request
+
+
+HTTP_PHASES = ("pool_wait", "connect", "tls", "upload", "ttfb", "download")
+LOCAL_PHASES = ("decode", "encode", "write")
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+_enabled = False
+_callbacks: List[Callable[[dict], None]] = []
+
+
+# ---- Gộp số liệu ----
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count", "max")
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+
+class MetricsRegistry:
+    """Counter và histogram theo nhãn, xuất được dạng Prometheus text."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters: Dict[Tuple[str, tuple], float] = {}
+            self._histograms: Dict[Tuple[str, tuple], _Histogram] = {}
+
+    def record(self, event: dict) -> None:
+        with self._lock:
+            if event["type"] == "http":
+                labels = (("endpoint", event["endpoint"]), ("model", event["model"] or ""))
+                self._inc("utils_http_requests_total",
+                          labels + (("outcome", event["outcome"]), ("status", str(event["status"] or ""))))
+                self._inc("utils_http_bytes_total", labels + (("direction", "sent"),), event["bytes_sent"])
+                self._inc("utils_http_bytes_total", labels + (("direction", "received"),), event["bytes_received"])
+                for phase, seconds in event["phases"].items():
+                    self._observe("utils_http_phase_seconds", labels + (("phase", phase),), seconds)
+                self._observe("utils_http_request_seconds", labels, event["seconds"])
+            else:
+                labels = (("operation", event["operation"]), ("model", event["model"] or ""),
+                          ("phase", event["phase"]))
+                self._observe("utils_local_phase_seconds", labels, event["seconds"])
+                self._inc("utils_local_bytes_total", labels, event["bytes"])
+
+    def _inc(self, name: str, labels: tuple, value: float = 1) -> None:
+        key = (name, labels)
+        self._counters[key] = self._counters.get(key, 0) + value
+
+    def _observe(self, name: str, labels: tuple, value: float) -> None:
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = _Histogram()
+        histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        """Số request, byte và thời gian (count/total_s/max_s) theo endpoint@model và theo bước cục bộ."""
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (h.count, h.total, h.max) for key, h in self._histograms.items()}
+        http, local = {}, {}
+        for (name, labels), value in counters.items():
+            d = dict(labels)
+            if name == "utils_http_requests_total":
+                entry = http.setdefault(_series_name(d["endpoint"], d["model"]), _http_entry())
+                entry["requests"] += value
+                entry["outcomes"][d["outcome"]] = entry["outcomes"].get(d["outcome"], 0) + value
+            elif name == "utils_http_bytes_total":
+                entry = http.setdefault(_series_name(d["endpoint"], d["model"]), _http_entry())
+                entry[f"bytes_{d['direction']}"] += value
+            elif name == "utils_local_bytes_total":
+                phases = local.setdefault(_series_name(d["operation"], d["model"]), {})
+                phases.setdefault(d["phase"], {})["bytes"] = value
+        for (name, labels), (count, total, peak) in histograms.items():
+            d = dict(labels)
+            stats = {"count": count, "total_s": round(total, 6), "max_s": round(peak, 6)}
+            if name == "utils_http_phase_seconds":
+                http.setdefault(_series_name(d["endpoint"], d["model"]), _http_entry())["phases"][d["phase"]] = stats
+            elif name == "utils_http_request_seconds":
+                http.setdefault(_series_name(d["endpoint"], d["model"]), _http_entry())["seconds"] = stats
+            elif name == "utils_local_phase_seconds":
+                local.setdefault(_series_name(d["operation"], d["model"]), {}).setdefault(d["phase"], {}).update(stats)
+        return {"http": http, "local": local}
+
+    def prometheus_text(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(((key, (list(h.counts), h.total, h.count)) for key, h in self._histograms.items()),
+                                key=lambda item: item[0])
+        lines, declared = [], set()
+        for (name, labels), value in counters:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        for (name, labels), (counts, total, count) in histograms:
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, n in zip(BUCKETS, counts):
+                cumulative += n
+                lines.append(f"{name}_bucket{_labels(labels + (('le', f'{bound:g}'),))} {cumulative}")
+            lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+            lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+            lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def _http_entry() -> dict:
+    return {"requests": 0, "outcomes": {}, "bytes_sent": 0, "bytes_received": 0, "seconds": None, "phases": {}}
+
+
+def _series_name(name: str, model: str) -> str:
+    return f"{name}@{model}" if model else name
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _labels(labels: tuple) -> str:
+    escaped = (f'{k}="{str(v).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for k, v in labels)
+    return "{" + ",".join(escaped) + "}"
+
+
+_registry = MetricsRegistry()
+
+
+# ---- Phát sự kiện ----
+
+def _emit(event: dict) -> None:
+    _registry.record(event)
+    for callback in list(_callbacks):
+        try:
+            callback(event)
+        except Exception as e:
+            # Callback hỏng không được làm hỏng request
+            print(f"⚠️ Callback instrumentation {callback!r} lỗi: {e}")
+    _exporter.maybe_export()
+
+
+def clock() -> float:
+    """Mốc thời gian để truyền cho record_phase(); 0.0 khi instrumentation đang tắt."""
+    return time.perf_counter() if _enabled else 0.0
+
+
+def record_phase(phase: str, operation: str, started: float, nbytes: int = 0, model: Optional[str] = None) -> None:
+    """Ghi một bước cục bộ bắt đầu ở clock() = started. Không làm gì khi đang tắt."""
+    if _enabled and started:
+        _emit({"type": "local", "phase": phase, "operation": operation, "model": model,
+               "bytes": nbytes, "seconds": time.perf_counter() - started})
+
+
+class PhaseTimer:
+    """
+    Cộng dồn thời gian các bước cục bộ lặp lại nhiều lần (ví dụ giải mã + ghi
+    từng đoạn của một body stream) rồi phát một sự kiện cho mỗi pha khi finish().
+
+        timer = phase_timer("inline_data", model)
+        t = timer.clock()
+        data = decoder.feed(chunk)
+        t = timer.lap("decode", t, len(data))
+        write(data)
+        timer.lap("write", t, len(data))
+        ...
+        timer.finish()
+    """
+
+    __slots__ = ("operation", "model", "_phases")
+
+    def __init__(self, operation: str, model: Optional[str] = None):
+        self.operation = operation
+        self.model = model
+        self._phases: Dict[str, list] = {}
+
+    @staticmethod
+    def clock() -> float:
+        return time.perf_counter()
+
+    def lap(self, phase: str, started: float, nbytes: int = 0) -> float:
+        """Cộng thời gian từ started tới giờ vào phase; trả về mốc hiện tại cho bước kế tiếp."""
+        now = time.perf_counter()
+        entry = self._phases.get(phase)
+        if entry is None:
+            entry = self._phases[phase] = [0.0, 0]
+        entry[0] += now - started
+        entry[1] += nbytes
+        return now
+
+    def finish(self) -> None:
+        for phase, (seconds, nbytes) in self._phases.items():
+            _emit({"type": "local", "phase": phase, "operation": self.operation, "model": self.model,
+                   "bytes": nbytes, "seconds": seconds})
+        self._phases.clear()
+
+
+class _NullPhaseTimer:
+    """PhaseTimer khi instrumentation tắt: mọi thao tác đều rỗng."""
+
+    __slots__ = ()
+
+    @staticmethod
+    def clock() -> float:
+        return 0.0
+
+    @staticmethod
+    def lap(phase: str, started: float, nbytes: int = 0) -> float:
+        return 0.0
+
+    def finish(self) -> None:
+        pass
+
+
+_NULL_TIMER = _NullPhaseTimer()
+
+
+def phase_timer(operation: str, model: Optional[str] = None):
+    """PhaseTimer mới, hoặc một timer rỗng dùng chung khi instrumentation đang tắt."""
+    return PhaseTimer(operation, model) if _enabled else _NULL_TIMER
+
+
+def model_from_url(url: str) -> Optional[str]:
+    """Model nằm trong URL dạng .../models/<model>:..., hoặc None."""
+    return classify_path(url)[1]
+
+
+# ---- Request HTTP ----
+
+class _RequestTrace:
+    """Mốc thời gian các sự kiện trace của httpcore cho một lần gửi request."""
+
+    def __init__(self, request: httpx.Request, chained=None):
+        self.request = request
+        self.chained = chained  # trace extension của người gọi (nếu có) vẫn được gọi
+        self.started = time.perf_counter()
+        self.marks: Dict[str, float] = {}
+        self.bytes_received = 0
+        self.finished = False
+
+    async def on_event(self, name: str, info: dict) -> None:
+        # "http11.send_request_body.complete" -> "send_request_body.complete"
+        self.marks.setdefault(name.split(".", 1)[1], time.perf_counter())
+        if self.chained is not None:
+            await self.chained(name, info)
+
+    def finish(self, status: Optional[int], outcome: str) -> None:
+        if self.finished:
+            return
+        self.finished = True
+        now = time.perf_counter()
+        m = self.marks
+        phases = {}
+        first = m.get("connect_tcp.started", m.get("send_request_headers.started"))
+        if first is not None:
+            phases["pool_wait"] = first - self.started
+        _span(phases, "connect", m.get("connect_tcp.started"), m.get("connect_tcp.complete"))
+        _span(phases, "tls", m.get("start_tls.started"), m.get("start_tls.complete"))
+        _span(phases, "upload", m.get("send_request_headers.started"), m.get("send_request_body.complete"))
+        _span(phases, "ttfb", m.get("send_request_body.complete"), m.get("receive_response_headers.complete"))
+        _span(phases, "download", m.get("receive_response_headers.complete"),
+              m.get("receive_response_body.complete", now if "receive_response_body.started" in m else None))
+
+        endpoint, model = classify_request(self.request)
+        _emit({
+            "type": "http", "method": self.request.method, "endpoint": endpoint, "model": model,
+            "status": status, "outcome": outcome, "bytes_sent": _request_size(self.request),
+            "bytes_received": self.bytes_received, "phases": phases, "seconds": now - self.started,
+        })
+
+
+def _span(phases: dict, name: str, start: Optional[float], end: Optional[float]) -> None:
+    if start is not None and end is not None:
+        phases[name] = max(end - start, 0.0)
+
+
+def _request_size(request: httpx.Request) -> int:
+    try:
+        return len(request.content)
+    except httpx.RequestNotRead:
+        return int(request.headers.get("content-length") or 0)
+
+
+class _InstrumentedStream(httpx.AsyncByteStream):
+    """Body phản hồi: đếm byte nhận được và phát sự kiện khi đóng."""
+
+    def __init__(self, stream, trace: _RequestTrace, status: int):
+        self._stream = stream
+        self._trace = trace
+        self._status = status
+        self._outcome = "ok" if status < 400 else "http_error"
+
+    async def __aiter__(self):
+        try:
+            async for chunk in self._stream:
+                self._trace.bytes_received += len(chunk)
+                yield chunk
+        except BaseException as e:
+            self._outcome = _outcome_of(e)
+            raise
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            self._trace.finish(self._status, self._outcome)
+
+
+def _outcome_of(error: BaseException) -> str:
+    return "cancelled" if not isinstance(error, Exception) else type(error).__name__
+
+
+class InstrumentedTransport(httpx.AsyncBaseTransport):
+    """Transport bọc ngoài transport thật, ghi thời gian từng pha của mỗi request khi instrumentation bật."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if not _enabled:
+            return await self._transport.handle_async_request(request)
+
+        chained = request.extensions.get("trace")
+        if isinstance(getattr(chained, "__self__", None), _RequestTrace):
+            chained = chained.__self__.chained  # lần thử lại: bỏ trace của lần trước
+        trace = _RequestTrace(request, chained)
+        request.extensions["trace"] = trace.on_event
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException as e:
+            trace.finish(None, _outcome_of(e))
+            raise
+        response.stream = _InstrumentedStream(response.stream, trace, response.status_code)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+# ---- Xuất file Prometheus ----
+
+class _Exporter:
+    def __init__(self):
+        self.path: Optional[str] = None
+        self.interval = 15.0
+        self._last = 0.0
+        self._lock = threading.Lock()
+
+    def maybe_export(self) -> None:
+        if self.path and time.monotonic() - self._last >= self.interval:
+            self.export()
+
+    def export(self) -> None:
+        path = self.path
+        if not path:
+            return
+        with self._lock:
+            self._last = time.monotonic()
+            try:
+                write_prometheus(path)
+            except OSError as e:
+                print(f"⚠️ Không ghi được metrics ra {path}: {e}")
+
+
+_exporter = _Exporter()
+
+
+def write_prometheus(path: str) -> None:
+    """Ghi toàn bộ metrics ra path (định dạng Prometheus text, ghi nguyên tử)."""
+    path = os.path.expanduser(path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(_registry.prometheus_text())
+    os.replace(tmp_path, path)
+
+
+# ---- Cấu hình ----
+
+def configure_instrumentation(enabled: bool = True, metrics_path: Optional[str] = None,
+                              export_interval: float = 15.0) -> None:
+    """
+    Bật/tắt instrumentation. metrics_path: file Prometheus text được ghi lại
+    tối đa mỗi export_interval giây (khi có sự kiện mới) và khi process thoát.
+    """
+    global _enabled
+    _exporter.path = metrics_path
+    _exporter.interval = export_interval
+    _enabled = enabled
+
+
+def disable_instrumentation() -> None:
+    global _enabled
+    _enabled = False
+
+
+def instrumentation_enabled() -> bool:
+    return _enabled
+
+
+def add_instrumentation_callback(callback: Callable[[dict], None]) -> None:
+    """Gọi callback(event) cho mọi sự kiện (trên event loop/thread phát ra sự kiện; nên xử lý nhanh)."""
+    _callbacks.append(callback)
+
+
+def remove_instrumentation_callback(callback: Callable[[dict], None]) -> None:
+    if callback in _callbacks:
+        _callbacks.remove(callback)
+
+
+def instrumentation_metrics() -> dict:
+    """Số liệu đã gộp: {"http": {endpoint@model: ...}, "local": {operation@model: {phase: ...}}}."""
+    return _registry.snapshot()
+
+
+def prometheus_metrics() -> str:
+    """Metrics hiện tại dạng Prometheus text."""
+    return _registry.prometheus_text()
+
+
+def reset_instrumentation_metrics() -> None:
+    _registry.reset()
+
+
+if os.getenv("METRICS_PATH"):
+    configure_instrumentation(metrics_path=os.getenv("METRICS_PATH"))
+
+atexit.register(_exporter.export)
@@ -0,0 +1,344 @@
+"""
+Nhật ký (SQLite) các tác vụ sinh video Veo, để tác vụ không bị mất khi process chết.
+
+Mỗi operation được ghi lại ngay khi gửi thành công, kèm prompt, tham số, ảnh
+đầu vào, đường dẫn file đích, trạng thái và video URI:
+
+    running    -> đã gửi, đang chờ Veo sinh video
+    ready      -> video đã sinh xong (có video URI), chưa tải về
+    succeeded  -> đã tải về output_path
+    failed     -> lỗi (xem cột error)
+
+Khi chạy lại, VeoVideoGenerator.generate_and_download() dùng lại operation
+đang dở của cùng model/prompt/tham số/ảnh thay vì gửi lại, và
+utils.veo_batch.resume_jobs() tiếp tục poll/tải mọi tác vụ còn dở (kể cả các
+tác vụ gửi bằng utils/video_generator.py). Video đang tải dở được tải tiếp từ
+file .part (xem utils/downloader.py).
+
+Tác vụ đang được một process theo dõi thì được "giữ" (ghi pid + host vào
+owner_pid/owner_host, xem claim()): process khác (hay lời gọi khác trong cùng
+process) không tiếp tục tác vụ đó cho tới khi nó được trả lại (release()) hoặc
+process giữ nó đã chết. Tác vụ cũ hơn OPERATION_TTL không được dùng lại vì
+Veo đã xóa operation/video.
+
+Nhật ký mặc định nằm ở ~/.cache/litellm-note/jobs.sqlite3; đổi bằng
+configure_job_journal(path) hoặc biến môi trường JOB_JOURNAL_PATH, tắt bằng
+disable_job_journal() (hoặc JOB_JOURNAL_PATH="").
+
+Mỗi lần ghi là một transaction nhỏ ở chế độ WAL + synchronous=NORMAL (không
+fsync mỗi lần commit) nên có thể gọi thẳng từ event loop.
+
+Xem nhanh:
+    python -m utils jobs            # các tác vụ đang dở
+    python -m utils jobs --all      # tất cả
+    python -m utils jobs --resume   # tiếp tục các tác vụ đang dở
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+
+RUNNING = "running"
+READY = "ready"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+IN_FLIGHT_STATES = (RUNNING, READY)
+
+# Veo giữ operation và video đã sinh trong 2 ngày
+OPERATION_TTL = 48 * 3600.0
+
+_COLUMNS = ("operation_name", "model", "prompt", "params", "image_path", "output_path",
+            "state", "video_uri", "error", "created_at", "updated_at", "owner_pid", "owner_host")
+_OWNER_COLUMNS = {"owner_pid": "INTEGER", "owner_host": "TEXT"}
+_UPDATABLE = {"output_path", "state", "video_uri", "error"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS veo_jobs (
+    operation_name TEXT PRIMARY KEY,
+    model          TEXT NOT NULL,
+    prompt         TEXT NOT NULL,
+    params         TEXT NOT NULL,
+    image_path     TEXT,
+    output_path    TEXT,
+    state          TEXT NOT NULL,
+    video_uri      TEXT,
+    error          TEXT,
+    created_at     REAL NOT NULL,
+    updated_at     REAL NOT NULL,
+    owner_pid      INTEGER,
+    owner_host     TEXT
+);
+CREATE INDEX IF NOT EXISTS veo_jobs_state ON veo_jobs (state, updated_at);
+"""
+
+
+class JobJournal:
+    """Bảng veo_jobs trong một file SQLite (WAL, dùng được từ nhiều thread/process)."""
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # Nhật ký tạo trước khi có cột owner_*: thêm cột (ở cuối, đúng thứ tự _COLUMNS)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(veo_jobs)")}
+        for name, kind in _OWNER_COLUMNS.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE veo_jobs ADD COLUMN {name} {kind}")
+
+    # ---- Ghi ----
+
+    def record_submission(self, operation_name: str, model: str, prompt: str,
+                          params: Optional[dict] = None, image_path: Optional[str] = None,
+                          output_path: Optional[str] = None) -> None:
+        """Ghi một operation vừa được gửi thành công (trạng thái running, chưa ai giữ)."""
+        now = time.time()
+        self._write(
+            "INSERT OR REPLACE INTO veo_jobs (operation_name, model, prompt, params, image_path, output_path,"
+            " state, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (operation_name, model, prompt, _dump_params(params), image_path, output_path,
+             RUNNING, now, now),
+        )
+
+    def update(self, operation_name: str, **fields) -> None:
+        """Cập nhật output_path / state / video_uri / error của một operation."""
+        unknown = set(fields) - _UPDATABLE
+        if unknown:
+            raise TypeError(f"Không cập nhật được các cột: {sorted(unknown)}")
+        if not fields:
+            return
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self._write(
+            f"UPDATE veo_jobs SET {assignments}, updated_at = ? WHERE operation_name = ?",
+            (*fields.values(), time.time(), operation_name),
+        )
+
+    def mark_ready(self, operation_name: str, video_uri: str) -> None:
+        self.update(operation_name, state=READY, video_uri=video_uri)
+
+    def mark_succeeded(self, operation_name: str, output_path: Optional[str] = None) -> None:
+        fields = {"state": SUCCEEDED, "error": None}
+        if output_path:
+            fields["output_path"] = output_path
+        self.update(operation_name, **fields)
+
+    def mark_failed(self, operation_name: str, error: str) -> None:
+        self.update(operation_name, state=FAILED, error=error)
+
+    # ---- Quyền giữ tác vụ ----
+
+    def claim(self, operation_name: str) -> bool:
+        """
+        Giữ một tác vụ cho process này. False nếu nó đang được giữ bởi một
+        process còn sống (kể cả chính process này, ở một lời gọi khác).
+        """
+        return bool(self._claim("SELECT * FROM veo_jobs WHERE operation_name = ?", (operation_name,), 1))
+
+    def claim_resumable(self, model: str, prompt: str, params: Optional[dict] = None,
+                        image_path: Optional[str] = None, max_age: float = OPERATION_TTL) -> Optional[dict]:
+        """Như find_resumable() nhưng giữ luôn tác vụ tìm được (tìm và giữ trong cùng một transaction)."""
+        sql, args = _resumable_query(model, prompt, params, image_path, max_age)
+        rows = self._claim(sql, args, 1)
+        return rows[0] if rows else None
+
+    def claim_in_flight(self, max_age: float = OPERATION_TTL) -> List[dict]:
+        """
+        Giữ mọi tác vụ chưa xong, không quá max_age giây, mà không process nào
+        còn sống đang giữ; trả về các tác vụ đã giữ.
+        """
+        sql = f"SELECT * FROM veo_jobs WHERE state IN ({', '.join('?' * len(IN_FLIGHT_STATES))})" \
+              " AND created_at >= ? ORDER BY updated_at DESC"
+        return self._claim(sql, (*IN_FLIGHT_STATES, time.time() - max_age), None)
+
+    def release(self, operation_name: str) -> None:
+        """Trả lại tác vụ process này đang giữ (không làm gì nếu process khác đang giữ)."""
+        self._write(
+            "UPDATE veo_jobs SET owner_pid = NULL, owner_host = NULL"
+            " WHERE operation_name = ? AND owner_pid = ? AND owner_host = ?",
+            (operation_name, os.getpid(), socket.gethostname()),
+        )
+
+    def _claim(self, sql: str, args, limit: Optional[int]) -> List[dict]:
+        # BEGIN IMMEDIATE khóa ghi ngay từ đầu: hai process không giữ được cùng một tác vụ
+        try:
+            with self._lock:
+                self._conn.execute("BEGIN IMMEDIATE")
+                try:
+                    claimed = []
+                    for row in self._conn.execute(sql, tuple(args)).fetchall():
+                        job = _job(row)
+                        if _owner_alive(job["owner_pid"], job["owner_host"]):
+                            continue
+                        self._conn.execute(
+                            "UPDATE veo_jobs SET owner_pid = ?, owner_host = ? WHERE operation_name = ?",
+                            (os.getpid(), socket.gethostname(), job["operation_name"]),
+                        )
+                        job["owner_pid"], job["owner_host"] = os.getpid(), socket.gethostname()
+                        claimed.append(job)
+                        if limit is not None and len(claimed) >= limit:
+                            break
+                    self._conn.execute("COMMIT")
+                except BaseException:
+                    self._conn.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            print(f"⚠️ Không ghi được nhật ký tác vụ {self.path}: {e}")
+            return []
+        return claimed
+
+    # ---- Truy vấn ----
+
+    def get(self, operation_name: str) -> Optional[dict]:
+        rows = self._query("SELECT * FROM veo_jobs WHERE operation_name = ?", (operation_name,))
+        return rows[0] if rows else None
+
+    def jobs(self, states: Optional[tuple] = None, limit: Optional[int] = 100) -> List[dict]:
+        """Các tác vụ (mới nhất trước), lọc theo trạng thái nếu có."""
+        sql, args = "SELECT * FROM veo_jobs", []
+        if states:
+            sql += f" WHERE state IN ({', '.join('?' * len(states))})"
+            args.extend(states)
+        sql += " ORDER BY updated_at DESC"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        return self._query(sql, args)
+
+    def in_flight(self) -> List[dict]:
+        """Các tác vụ chưa xong: đang sinh (running) hoặc chờ tải về (ready)."""
+        return self.jobs(IN_FLIGHT_STATES, limit=None)
+
+    def completed(self, limit: Optional[int] = 100) -> List[dict]:
+        """Các tác vụ đã kết thúc (succeeded hoặc failed)."""
+        return self.jobs((SUCCEEDED, FAILED), limit=limit)
+
+    def find_resumable(self, model: str, prompt: str, params: Optional[dict] = None,
+                       image_path: Optional[str] = None, max_age: float = OPERATION_TTL) -> Optional[dict]:
+        """
+        Tác vụ đang dở mới nhất có cùng model, prompt, tham số và ảnh đầu vào,
+        không quá max_age giây và không bị process nào còn sống giữ.
+        """
+        sql, args = _resumable_query(model, prompt, params, image_path, max_age)
+        for job in self._query(sql, args):
+            if not _owner_alive(job["owner_pid"], job["owner_host"]):
+                return job
+        return None
+
+    def find_by_video_id(self, video_id: str) -> Optional[dict]:
+        """Tác vụ có video URI chứa .../files/<video_id>."""
+        rows = self._query(
+            "SELECT * FROM veo_jobs WHERE video_uri LIKE ? ORDER BY updated_at DESC LIMIT 1",
+            (f"%/files/{video_id}%",),
+        )
+        return rows[0] if rows else None
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+    def _write(self, sql: str, args) -> None:
+        # Nhật ký chỉ hỗ trợ tải tiếp: lỗi ghi (đĩa đầy, file bị khóa quá lâu, ...)
+        # không được làm hỏng tác vụ đang chạy
+        try:
+            with self._lock:
+                self._conn.execute(sql, args)
+        except sqlite3.Error as e:
+            print(f"⚠️ Không ghi được nhật ký tác vụ {self.path}: {e}")
+
+    def _query(self, sql: str, args) -> List[dict]:
+        with self._lock:
+            rows = self._conn.execute(sql, tuple(args)).fetchall()
+        return [_job(row) for row in rows]
+
+
+def _job(row) -> dict:
+    job = dict(zip(_COLUMNS, row))
+    job["params"] = json.loads(job["params"])
+    return job
+
+
+def _resumable_query(model: str, prompt: str, params: Optional[dict], image_path: Optional[str],
+                     max_age: float):
+    return (
+        "SELECT * FROM veo_jobs WHERE model = ? AND prompt = ? AND params = ? AND image_path IS ?"
+        f" AND state IN ({', '.join('?' * len(IN_FLIGHT_STATES))}) AND created_at >= ?"
+        " ORDER BY created_at DESC",
+        (model, prompt, _dump_params(params), image_path, *IN_FLIGHT_STATES, time.time() - max_age),
+    )
+
+
+def _owner_alive(pid: Optional[int], host: Optional[str]) -> bool:
+    """Process đang giữ tác vụ còn sống không (process ở máy khác: coi như còn, OPERATION_TTL là giới hạn)."""
+    if pid is None:
+        return False
+    if host != socket.gethostname() or pid == os.getpid():
+        return True
+    if os.name == "nt":
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        code = ctypes.c_ulong()
+        ok = kernel32.GetExitCodeProcess(handle, ctypes.byref(code))
+        kernel32.CloseHandle(handle)
+        return not ok or code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # process của người dùng khác
+        return True
+    return True
+
+
+def _dump_params(params: Optional[dict]) -> str:
+    return json.dumps(params or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+
+# ---- Nhật ký dùng chung ----
+
+_DEFAULT_PATH = "~/.cache/litellm-note/jobs.sqlite3"
+_UNSET = object()
+_default_journal = _UNSET
+_default_lock = threading.Lock()
+
+
+def configure_job_journal(path: str) -> JobJournal:
+    """Ghi nhật ký vào file SQLite ở path."""
+    global _default_journal
+    with _default_lock:
+        _default_journal = JobJournal(path)
+    return _default_journal
+
+
+def disable_job_journal() -> None:
+    """Tắt nhật ký dùng chung."""
+    global _default_journal
+    with _default_lock:
+        _default_journal = None
+
+
+def get_job_journal() -> Optional[JobJournal]:
+    """Nhật ký dùng chung, hoặc None nếu đã tắt (hay không mở được file)."""
+    global _default_journal
+    if _default_journal is _UNSET:
+        with _default_lock:
+            if _default_journal is _UNSET:
+                path = os.getenv("JOB_JOURNAL_PATH", _DEFAULT_PATH)
+                try:
+                    _default_journal = JobJournal(path) if path else None
+                except (OSError, sqlite3.Error) as e:
+                    print(f"⚠️ Không mở được nhật ký tác vụ {path}: {e}. Tác vụ sẽ không được ghi lại.")
+                    _default_journal = None
+    return _default_journal
@@ -0,0 +1,329 @@
+"""
+Lưu ảnh trả về từ API ra đĩa.
+
+Cách cũ giải mã mọi ảnh bằng PIL, chép sang mảng NumPy, đổi RGB→BGR bằng
+cv2.cvtColor rồi mã hóa lại bằng cv2.imwrite: ba bản sao của cả ảnh, một lần
+giải mã và một lần mã hóa cho mỗi ảnh, và hỏng màu/kênh alpha với ảnh RGBA.
+
+Ở đây bytes của server được ghi nguyên vẹn khi định dạng của file đích trùng
+với định dạng ảnh trả về. Chỉ khi người gọi thực sự yêu cầu định dạng khác
+(ví dụ lưu .jpg trong khi server trả về PNG) ảnh mới được chuyển định dạng,
+bằng PIL, trong một thread pool riêng để không chặn event loop.
+
+Kết quả là ImageResult: dùng được như đường dẫn (str) và chỉ giải mã ảnh khi
+gọi .open() / .to_numpy().
+
+ImageData là ảnh chỉ nằm trong bộ nhớ (bytes gốc + mime_type + base64 tính một
+lần): các hàm sinh ảnh trả về ImageData khi không truyền đường dẫn file đích,
+và nhận ImageData làm ảnh đầu vào, nên một chuỗi sửa ảnh không phải ghi/đọc
+đĩa và base64 lại ở mỗi bước. Ghi ra đĩa là tùy chọn: image.save_async(path).
+"""
+
+import asyncio
+import base64
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from .instrumentation import clock, record_phase
+
+
+_EXTENSION_MIME = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "jpeg": "image/jpeg",
+    "gif": "image/gif",
+    "webp": "image/webp",
+    "bmp": "image/bmp",
+}
+_MIME_EXTENSION = {
+    "image/png": "png",
+    "image/jpeg": "jpeg",
+    "image/gif": "gif",
+    "image/webp": "webp",
+    "image/bmp": "bmp",
+}
+_PIL_FORMAT = {
+    "image/png": "PNG",
+    "image/jpeg": "JPEG",
+    "image/gif": "GIF",
+    "image/webp": "WEBP",
+    "image/bmp": "BMP",
+}
+
+
+class ImageResult(str):
+    """
+    Ảnh đã lưu trên đĩa.
+
+    Là một str (đường dẫn file) nên các chỗ đang dùng đường dẫn trả về vẫn chạy
+    như cũ; thêm mime_type và các hàm giải mã lười (chỉ đọc file khi được gọi).
+    """
+
+    def __new__(cls, path: str, mime_type: Optional[str] = None):
+        result = super().__new__(cls, path)
+        result.mime_type = mime_type
+        result._image = None
+        return result
+
+    @property
+    def path(self) -> str:
+        return str(self)
+
+    def read_bytes(self) -> bytes:
+        """Nội dung file ảnh (đã mã hóa)."""
+        with open(self, "rb") as f:
+            return f.read()
+
+    def open(self):
+        """Ảnh PIL, được giải mã ở lần gọi đầu tiên và giữ lại cho các lần sau."""
+        if self._image is None:
+            from PIL import Image
+
+            image = Image.open(self.path)
+            image.load()
+            self._image = image
+        return self._image
+
+    def to_numpy(self):
+        """Mảng NumPy theo thứ tự kênh RGB/RGBA của ảnh (không đổi sang BGR)."""
+        import numpy as np
+
+        return np.asarray(self.open())
+
+    def __reduce__(self):
+        return (ImageResult, (self.path, self.mime_type))
+
+
+class ImageData:
+    """
+    Ảnh trong bộ nhớ: bytes đã mã hóa (PNG/JPEG/...) đúng như server trả về.
+
+        image = await generate_or_modify_image_gemini_async(prompt, None, api_key)
+        image = await generate_or_modify_image_gemini_async(prompt2, None, api_key, input_image_path=image)
+        asyncio.create_task(image.save_async("assets/cat_2.png"))   # ghi đĩa nếu cần, không chặn
+
+    base64() được tính ở lần gọi đầu tiên rồi giữ lại, nên dùng cùng một ảnh làm
+    đầu vào cho nhiều request chỉ mã hóa một lần.
+    """
+
+    __slots__ = ("data", "mime_type", "_base64", "_image", "variants")
+
+    def __init__(self, data: bytes, mime_type: Optional[str] = None):
+        self.data = bytes(data)
+        self.mime_type = sniff_image_mime(self.data) or mime_type or "image/png"
+        self._base64 = None
+        self._image = None
+        self.variants = {}  # các bản đã xử lý (ví dụ đã thu nhỏ, xem image_prep), giữ cùng ảnh gốc
+
+    @classmethod
+    def from_file(cls, path: str) -> "ImageData":
+        """Đọc ảnh từ file."""
+        with open(path, "rb") as f:
+            return cls(f.read(), mime_for_path(path))
+
+    @classmethod
+    async def load_async(cls, source) -> "ImageData":
+        """ImageData từ đường dẫn file (đọc trong thread), bytes hoặc chính một ImageData."""
+        if isinstance(source, ImageData):
+            return source
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            return cls(source)
+        return await asyncio.to_thread(cls.from_file, source)
+
+    def base64(self) -> str:
+        """Ảnh dạng base64 (tính một lần)."""
+        if self._base64 is None:
+            t = clock()
+            self._base64 = base64.b64encode(self.data).decode("ascii")
+            record_phase("encode", "input_image", t, len(self.data))
+        return self._base64
+
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.base64()}"
+
+    def open(self):
+        """Ảnh PIL, được giải mã ở lần gọi đầu tiên và giữ lại cho các lần sau."""
+        if self._image is None:
+            from PIL import Image
+
+            image = Image.open(io.BytesIO(self.data))
+            image.load()
+            self._image = image
+        return self._image
+
+    def to_numpy(self):
+        """Mảng NumPy theo thứ tự kênh RGB/RGBA của ảnh (không đổi sang BGR)."""
+        import numpy as np
+
+        return np.asarray(self.open())
+
+    def save(self, output_path: str) -> ImageResult:
+        """Ghi ra output_path (thêm extension theo mime_type nếu thiếu); xem save_image_bytes()."""
+        return save_image_bytes(self.data, resolve_output_path(output_path, self.mime_type), self.mime_type)
+
+    async def save_async(self, output_path: str) -> ImageResult:
+        """Bản async của save(), chạy trong thread pool riêng."""
+        return await save_image_bytes_async(self.data, resolve_output_path(output_path, self.mime_type),
+                                            self.mime_type)
+
+    def __repr__(self) -> str:
+        return f"ImageData({self.mime_type}, {len(self.data)} bytes)"
+
+
+def show_image(image, title: Optional[str] = None) -> None:
+    """Hiển thị ảnh (ImageResult, ImageData hoặc đường dẫn) bằng matplotlib (chỉ import matplotlib khi cần)."""
+    import matplotlib.pyplot as plt
+
+    if not isinstance(image, (ImageResult, ImageData)):
+        image = ImageResult(image)
+    plt.imshow(image.open())
+    plt.axis('off')
+    if title:
+        plt.title(title)
+    plt.show()
+
+
+def sniff_image_mime(data: bytes) -> Optional[str]:
+    """Nhận dạng định dạng ảnh theo magic bytes. None nếu không nhận ra."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if data.startswith(b"\xff\xd8"):
+        return "image/jpeg"
+    if data.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data.startswith(b"BM"):
+        return "image/bmp"
+    return None
+
+
+def mime_for_path(path: str) -> Optional[str]:
+    """mimeType ứng với extension của path, hoặc None nếu extension không phải ảnh quen thuộc."""
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    return _EXTENSION_MIME.get(extension)
+
+
+def resolve_output_path(output_path: str, mime_type: Optional[str]) -> str:
+    """Thêm extension theo mimeType nếu output_path chưa có extension ảnh hợp lệ."""
+    if mime_for_path(output_path):
+        return output_path
+    return f"{output_path}.{_MIME_EXTENSION.get(mime_type, 'png')}"
+
+
+def save_image_bytes(data: bytes, output_path: str, mime_type: Optional[str] = None) -> ImageResult:
+    """
+    Lưu ảnh đã mã hóa ra output_path.
+
+    Ghi nguyên bytes nếu định dạng của output_path trùng với định dạng của ảnh
+    (hoặc output_path không có extension ảnh quen thuộc); ngược lại chuyển định
+    dạng theo extension của output_path.
+    """
+    source_mime = sniff_image_mime(data) or mime_type
+    target_mime = mime_for_path(output_path) or source_mime
+    t = clock()
+    if target_mime == source_mime or target_mime not in _PIL_FORMAT:
+        _write_atomic(output_path, lambda f: f.write(data))
+        record_phase("write", "image_save", t, len(data))
+    else:
+        _transcode(io.BytesIO(data), output_path, target_mime)
+        record_phase("encode", "image_transcode", t, len(data))
+    return ImageResult(output_path, target_mime)
+
+
+def save_image_file(src_path: str, output_path: str, mime_type: Optional[str] = None) -> ImageResult:
+    """
+    Như save_image_bytes() nhưng nguồn là một file tạm (ví dụ file .part của
+    stream_inline_data_to_file_async). File tạm được đổi tên thành output_path
+    khi không cần chuyển định dạng, và bị xóa sau khi chuyển định dạng.
+    """
+    with open(src_path, "rb") as f:
+        source_mime = sniff_image_mime(f.read(16)) or mime_type
+    target_mime = mime_for_path(output_path) or source_mime
+    if target_mime == source_mime or target_mime not in _PIL_FORMAT:
+        os.replace(src_path, output_path)
+    else:
+        t = clock()
+        _transcode(src_path, output_path, target_mime)
+        record_phase("encode", "image_transcode", t, os.path.getsize(src_path))
+        os.remove(src_path)
+    return ImageResult(output_path, target_mime)
+
+
+async def save_image_bytes_async(data: bytes, output_path: str, mime_type: Optional[str] = None) -> ImageResult:
+    """Bản async của save_image_bytes(); việc chuyển định dạng chạy trong thread pool riêng."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), save_image_bytes, data, output_path, mime_type)
+
+
+def decode_image_b64(b64: str, output_path: Optional[str] = None, model: Optional[str] = None):
+    """
+    Giải mã một ảnh base64 (ví dụ b64_json của /images/generations) rồi lưu ra
+    output_path (trả về ImageResult), hoặc trả về ImageData nếu output_path=None.
+    """
+    t = clock()
+    data = base64.b64decode(b64)
+    record_phase("decode", "b64_json", t, len(data), model)
+    if output_path is None:
+        return ImageData(data)
+    return save_image_bytes(data, output_path)
+
+
+async def decode_image_b64_async(b64: str, output_path: Optional[str] = None, model: Optional[str] = None):
+    """Bản async của decode_image_b64(); chạy trong thread pool của module (song song giữa nhiều ảnh)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), decode_image_b64, b64, output_path, model)
+
+
+async def save_image_file_async(src_path: str, output_path: str, mime_type: Optional[str] = None) -> ImageResult:
+    """Bản async của save_image_file()."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), save_image_file, src_path, output_path, mime_type)
+
+
+def _transcode(source, output_path: str, target_mime: str) -> None:
+    from PIL import Image
+
+    with Image.open(source) as image:
+        if target_mime in ("image/jpeg", "image/bmp") and (
+            image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+        ):
+            # JPEG/BMP không có kênh alpha: ghép lên nền trắng thay vì làm hỏng màu
+            rgba = image.convert("RGBA")
+            background = Image.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.getchannel("A"))
+            image = background
+        elif target_mime == "image/jpeg" and image.mode not in ("RGB", "L", "CMYK"):
+            image = image.convert("RGB")
+        _write_atomic(output_path, lambda f: image.save(f, format=_PIL_FORMAT[target_mime]))
+
+
+def _write_atomic(output_path: str, write) -> None:
+    # Ghi vào file tạm rồi os.replace: không để lại ảnh dở dang khi bị ngắt giữa chừng
+    tmp_path = f"{output_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        with open(tmp_path, "wb") as f:
+            write(f)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    # PIL nhả GIL trong lúc giải mã/mã hóa nên thread pool đủ để chạy song song
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=min(8, os.cpu_count() or 1),
+                                           thread_name_prefix="utils-media-sink")
+    return _pool
@@ -0,0 +1,306 @@
+"""
+Lịch poll thích ứng cho các operation Veo, dựa trên thời gian hoàn thành thực tế.
+
+Poll với khoảng cố định (hoặc backoff 10s → 30s) tốn request ở đầu tác vụ và
+phát hiện video xong trễ tới 30s. Ở đây mỗi "hồ sơ" tác vụ (model, resolution,
+aspectRatio, có ảnh đầu vào hay không) có lịch sử thời gian hoàn thành; từ đó
+lấy các phân vị p10/p50/p90 và:
+- trước p10: poll thưa (nhảy thẳng tới đầu cửa sổ dự kiến, tối đa sparse_max_interval);
+- trong khoảng p10–p90: poll dày (khoảng cách ~ 1/5 độ rộng cửa sổ);
+- sau p90: backoff dần tới max_interval.
+Khi chưa đủ lịch sử thì dùng lịch cũ (10s, ×1.2, tối đa 30s). Mọi khoảng chờ
+đều có jitter để nhiều tác vụ không poll cùng một lúc.
+
+Số request trạng thái và "cửa sổ phát hiện" (khoảng giữa lần poll cuối cùng
+thấy chưa xong và lần poll thấy đã xong, tức cận trên của độ trễ phát hiện)
+được ghi lại, xem polling_metrics().
+
+Lịch sử mặc định chỉ nằm trong bộ nhớ. Lưu ra file để dùng lại giữa các lần chạy:
+    from utils.polling import configure_poll_history
+    configure_poll_history("~/.cache/litellm-note/poll_history.json")
+hoặc đặt biến môi trường POLL_HISTORY_PATH.
+"""
+
+import json
+import os
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+def poll_profile_key(model: str, params: Optional[dict] = None, has_image: bool = False) -> str:
+    """Khóa nhóm các tác vụ có thời gian sinh tương tự nhau."""
+    params = params or {}
+    return "|".join([
+        model or "?",
+        str(params.get("resolution", "-")),
+        str(params.get("aspectRatio", "-")),
+        "image" if has_image else "text",
+    ])
+
+
+class CompletionHistory:
+    """Thời gian hoàn thành gần đây của từng hồ sơ tác vụ (có thể lưu ra file JSON)."""
+
+    def __init__(self, path: Optional[str] = None, max_samples: int = 50, min_samples: int = 3):
+        """
+        Parameters
+        ----------
+        path : str | None
+            File JSON để lưu lịch sử. None = chỉ giữ trong bộ nhớ.
+        max_samples : int
+            Số mẫu gần nhất được giữ cho mỗi hồ sơ.
+        min_samples : int
+            Số mẫu tối thiểu trước khi dùng lịch sử để lập lịch poll.
+        """
+        self.path = os.path.expanduser(path) if path else None
+        self.max_samples = max_samples
+        self.min_samples = min_samples
+        self._samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        if self.path:
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    self._samples = {k: list(v) for k, v in json.load(f).items()}
+            except (FileNotFoundError, ValueError):
+                pass
+
+    def record(self, key: str, duration: float) -> None:
+        with self._lock:
+            samples = self._samples.setdefault(key, [])
+            samples.append(round(duration, 2))
+            del samples[:-self.max_samples]
+            snapshot = {k: list(v) for k, v in self._samples.items()} if self.path else None
+        if snapshot is not None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp_path = f"{self.path}.tmp-{os.getpid()}-{threading.get_ident()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.path)
+
+    def quantiles(self, key: str) -> Optional[Tuple[float, float, float]]:
+        """(p10, p50, p90) thời gian hoàn thành của hồ sơ, hoặc None nếu chưa đủ mẫu."""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if len(samples) < self.min_samples:
+            return None
+
+        def pick(q: float) -> float:
+            return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+        return pick(0.1), pick(0.5), pick(0.9)
+
+
+class AdaptivePoller:
+    """
+    Lịch poll cho một operation.
+
+        poller = AdaptivePoller.for_operation(operation_name)
+        while True:
+            data = await poll(...)
+            poller.observe(data.get("done", False))
+            if data.get("done"):
+                break
+            await asyncio.sleep(poller.next_delay())
+    """
+
+    def __init__(self, key: str, started_at: Optional[float] = None,
+                 history: Optional[CompletionHistory] = None, first_interval: float = 10,
+                 min_interval: float = 2, max_interval: float = 30,
+                 sparse_max_interval: float = 60, backoff: float = 1.2, jitter: float = 0.15):
+        """
+        Parameters
+        ----------
+        key : str
+            Hồ sơ tác vụ (xem poll_profile_key).
+        started_at : float | None
+            Thời điểm gửi tác vụ (time.time()). None = lúc tạo poller; khi đó
+            thời gian hoàn thành không được ghi vào lịch sử vì không chính xác.
+        first_interval, backoff, max_interval :
+            Lịch dùng khi chưa có lịch sử (và sau p90).
+        min_interval : float
+            Khoảng cách nhỏ nhất giữa hai lần poll.
+        sparse_max_interval : float
+            Khoảng chờ dài nhất trước cửa sổ dự kiến.
+        jitter : float
+            Dao động ngẫu nhiên tương đối của mỗi khoảng chờ.
+        """
+        self.key = key
+        self.history = history if history is not None else get_poll_history()
+        self.started_at = started_at if started_at is not None else time.time()
+        self.record_duration = started_at is not None
+        self.first_interval = first_interval
+        self.min_interval = min(min_interval, first_interval)
+        self.max_interval = max_interval
+        self.sparse_max_interval = sparse_max_interval
+        self.backoff = backoff
+        self.jitter = jitter
+
+        self.polls = 0
+        self._interval = first_interval
+        self._last_pending_at: Optional[float] = None
+        self._finished = False
+
+    @classmethod
+    def for_operation(cls, operation_name: str, **options) -> "AdaptivePoller":
+        """Poller cho một operation đã đăng ký bằng register_operation() (hoặc suy ra model từ tên)."""
+        with _registry_lock:
+            entry = _operations.get(operation_name)
+        if entry:
+            key, started_at = entry
+        else:
+            # "models/<model>/operations/<id>": vẫn tách được model, nhưng không biết thời điểm gửi
+            parts = operation_name.split("/")
+            model = parts[1] if len(parts) > 3 and parts[0] == "models" else "?"
+            key, started_at = poll_profile_key(model), None
+        return cls(key, started_at=started_at, **options)
+
+    def elapsed(self, now: Optional[float] = None) -> float:
+        return (now if now is not None else time.time()) - self.started_at
+
+    def next_delay(self, now: Optional[float] = None) -> float:
+        """Số giây cần chờ trước lần poll tiếp theo."""
+        elapsed = self.elapsed(now)
+        window = self.history.quantiles(self.key)
+        if window is None:
+            delay = self._interval
+            self._interval = min(self._interval * self.backoff, self.max_interval)
+            return self._jittered(delay)
+
+        p10, _, p90 = window
+        dense = min(max((p90 - p10) / 5, self.min_interval), self.max_interval)
+        if elapsed < p10 - dense:
+            # Chưa tới cửa sổ dự kiến: chờ thẳng tới đầu cửa sổ, jitter chỉ về phía sớm hơn
+            delay = min(p10 - elapsed, self.sparse_max_interval)
+            return max(delay * (1 - random.random() * self.jitter), self.min_interval)
+        if elapsed <= p90:
+            return self._jittered(dense)
+        # Quá p90: tác vụ chậm bất thường, giãn dần khoảng poll
+        overdue = min(dense * self.backoff ** ((elapsed - p90) / dense), self.max_interval)
+        return self._jittered(overdue)
+
+    def observe(self, done: bool, now: Optional[float] = None) -> None:
+        """Ghi nhận kết quả của một lần poll."""
+        now = now if now is not None else time.time()
+        self.polls += 1
+        _metrics.count_poll()
+        if not done:
+            self._last_pending_at = now
+            return
+        if self._finished:
+            return
+        self._finished = True
+        window = now - self._last_pending_at if self._last_pending_at is not None else None
+        _metrics.count_completion(self.key, self.polls, window)
+        if self.record_duration:
+            # Video xong ở đâu đó giữa lần poll cuối còn chạy và lần poll này: ghi điểm giữa,
+            # không ghi thời điểm phát hiện (luôn trễ thêm tới một khoảng poll)
+            finished_at = (self._last_pending_at + now) / 2 if self._last_pending_at is not None else now
+            self.history.record(self.key, self.elapsed(finished_at))
+
+    def _jittered(self, delay: float) -> float:
+        return max(delay * (1 + (random.random() * 2 - 1) * self.jitter), self.min_interval)
+
+
+# ---- Đăng ký operation: thời điểm gửi + hồ sơ tác vụ ----
+
+_operations: Dict[str, Tuple[str, float]] = {}
+_registry_lock = threading.Lock()
+_MAX_OPERATIONS = 10000
+
+
+def register_operation(operation_name: str, model: str, params: Optional[dict] = None,
+                       has_image: bool = False, submitted_at: Optional[float] = None) -> None:
+    """
+    Ghi lại hồ sơ và thời điểm gửi của một operation vừa được tạo
+    (submitted_at: thời điểm gửi thật khi tiếp tục một operation cũ, mặc định là bây giờ).
+    """
+    with _registry_lock:
+        if len(_operations) >= _MAX_OPERATIONS:
+            _operations.pop(next(iter(_operations)))
+        _operations[operation_name] = (poll_profile_key(model, params, has_image),
+                                       submitted_at if submitted_at is not None else time.time())
+
+
+# ---- Metrics ----
+
+class _PollingMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._polls = 0
+            self._completed = 0
+            self._completed_polls = 0
+            self._windows: List[float] = []
+            self._by_key: Dict[str, Dict[str, float]] = {}
+
+    def count_poll(self) -> None:
+        with self._lock:
+            self._polls += 1
+
+    def count_completion(self, key: str, polls: int, window: Optional[float]) -> None:
+        with self._lock:
+            self._completed += 1
+            self._completed_polls += polls
+            if window is not None:
+                self._windows.append(window)
+                del self._windows[:-1000]
+            entry = self._by_key.setdefault(key, {"completed": 0, "polls": 0})
+            entry["completed"] += 1
+            entry["polls"] += polls
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            windows = sorted(self._windows)
+            return {
+                "status_requests": self._polls,
+                "completed_operations": self._completed,
+                "polls_per_operation": self._completed_polls / self._completed if self._completed else 0.0,
+                "detection_window_mean_s": sum(windows) / len(windows) if windows else 0.0,
+                "detection_window_p90_s": windows[min(len(windows) - 1, int(0.9 * len(windows)))] if windows else 0.0,
+                "by_profile": {k: dict(v) for k, v in self._by_key.items()},
+            }
+
+
+_metrics = _PollingMetrics()
+
+
+def polling_metrics() -> dict:
+    """
+    Thống kê poll: tổng số request trạng thái, số request trung bình cho mỗi
+    operation hoàn thành và cửa sổ phát hiện (cận trên của độ trễ từ lúc video
+    xong tới lúc được phát hiện).
+    """
+    return _metrics.snapshot()
+
+
+def reset_polling_metrics() -> None:
+    _metrics.reset()
+
+
+# ---- Lịch sử dùng chung ----
+
+_default_history: Optional[CompletionHistory] = None
+_history_lock = threading.Lock()
+
+
+def configure_poll_history(path: Optional[str] = None, **options) -> CompletionHistory:
+    """Đặt lịch sử dùng chung (path=None: chỉ trong bộ nhớ). Xem CompletionHistory."""
+    global _default_history
+    with _history_lock:
+        _default_history = CompletionHistory(path, **options)
+    return _default_history
+
+
+def get_poll_history() -> CompletionHistory:
+    """Lịch sử dùng chung (tạo từ POLL_HISTORY_PATH nếu có, ngược lại chỉ trong bộ nhớ)."""
+    global _default_history
+    if _default_history is None:
+        with _history_lock:
+            if _default_history is None:
+                _default_history = CompletionHistory(os.getenv("POLL_HISTORY_PATH"))
+    return _default_history
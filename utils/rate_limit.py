@@ -0,0 +1,366 @@
+"""
+Giới hạn tốc độ phía client và thử lại có kiểm soát cho mọi request của utils/.
+
+Lớp transport RateLimitedTransport được gắn vào HTTP client dùng chung (xem
+utils/http_client.py), nên mọi hàm trong utils/ đều đi qua nó mà không cần sửa
+từng chỗ gọi:
+
+- Token bucket theo endpoint (`audio/speech`, `images/generations`,
+  `chat/completions`, `generateContent`, `predictLongRunning`, `operations`,
+  `download`, `upload`) và theo model nếu được cấu hình riêng. Mặc định không giới hạn.
+- Thử lại 429/503 (và 500/502/504 trừ POST `:predictLongRunning`) bằng backoff
+  lũy thừa có jitter; nếu server gửi `Retry-After` thì chờ đúng thời gian đó,
+  và mọi request khác cùng bucket cũng tạm dừng. Lỗi transport chỉ được thử
+  lại với GET/HEAD; POST chỉ thử lại lỗi kết nối (request chắc chắn chưa tới
+  server), vì POST đứt giữa chừng có thể đã được xử lý và tính phí.
+- Ngân sách thử lại toàn cục: mỗi request "nạp" budget_ratio lượt, mỗi lần
+  thử lại tốn một lượt. Khi server quá tải, số lần thử lại bị chặn ở khoảng
+  budget_ratio × số request thay vì nhân lên (không có "bão retry").
+
+Cấu hình:
+    from utils.rate_limit import configure_rate_limit, configure_retries
+    configure_rate_limit("generateContent", rate=2, burst=4)                   # 2 req/s cho mọi model
+    configure_rate_limit("images/generations", rate=0.5, model="imagen-4")    # riêng một model
+    configure_retries(max_retries=5, budget_ratio=0.1)
+hoặc biến môi trường RATE_LIMITS="generateContent=2:4,images/generations@imagen-4=0.5"
+(endpoint[@model]=req/s[:burst]).
+
+Thời gian chờ ở limiter và số lần thử lại: rate_limit_metrics().
+"""
+
+import asyncio
+import email.utils
+import os
+import random
+import re
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import httpx
+
+
+_PATH_ENDPOINTS = ("audio/speech", "images/generations", "chat/completions")
+_MODEL_IN_PATH = re.compile(r"/models/([^/:?]+)")
+_MODEL_IN_BODY = re.compile(rb'"model"\s*:\s*"([^"]+)"')
+
+# Các endpoint mà thử lại một request có thể đã được xử lý sẽ tạo thêm tác vụ mới
+_NON_IDEMPOTENT = {"predictLongRunning"}
+# Lỗi chắc chắn request chưa được xử lý: thử lại được với mọi endpoint
+_SAFE_STATUSES = {429, 503}
+_SAFE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_RETRY_DEFAULTS = {
+    "max_retries": 3,        # số lần thử lại tối đa cho mỗi request
+    "base_delay": 0.5,       # backoff: base_delay * 2^lần, có jitter
+    "max_delay": 30.0,
+    "max_retry_after": 120.0,  # Retry-After dài hơn mức này thì trả lỗi ngay cho người gọi
+    "budget_ratio": 0.2,     # mỗi request nạp thêm bấy nhiêu lượt thử lại vào ngân sách chung
+    "budget_initial": 10.0,  # số lượt thử lại có sẵn lúc đầu
+}
+
+
+def classify_path(path: str) -> Tuple[str, Optional[str]]:
+    """(endpoint, model) suy ra từ đường dẫn URL; model là None nếu không nằm trong đường dẫn."""
+    last = path.split("?", 1)[0].rsplit("/", 1)[-1]
+    if ":" in last:
+        endpoint = last.rsplit(":", 1)[-1]  # generateContent, predictLongRunning, download, ...
+    elif "/operations/" in path:
+        endpoint = "operations"
+    elif "/download/" in path:
+        endpoint = "download"
+    elif "/upload/" in path:
+        endpoint = "upload"
+    else:
+        endpoint = next((name for name in _PATH_ENDPOINTS if path.endswith(name)), "other")
+    match = _MODEL_IN_PATH.search(path)
+    return endpoint, match.group(1) if match else None
+
+
+def classify_request(request: httpx.Request) -> Tuple[str, Optional[str]]:
+    """(endpoint, model) của một request, dùng để chọn token bucket."""
+    endpoint, model = classify_path(request.url.path)
+    if model:
+        return endpoint, model
+    try:
+        head = request.content[:512]
+    except httpx.RequestNotRead:
+        return endpoint, None
+    match = _MODEL_IN_BODY.search(head)
+    return endpoint, match.group(1).decode() if match else None
+
+
+class TokenBucket:
+    """
+    Token bucket (dạng GCRA): rate request/giây, cho phép dồn tối đa burst
+    request. rate=None = không giới hạn (chỉ còn tác dụng tạm dừng khi bị 429).
+    """
+
+    def __init__(self, rate: Optional[float] = None, burst: int = 1):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._interval = 1.0 / rate if rate else 0.0
+        self._tolerance = (self.burst - 1) * self._interval
+        self._tat = 0.0           # thời điểm "đến lượt" lý thuyết của request kế tiếp
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Giữ chỗ cho một request; trả về số giây phải chờ trước khi gửi."""
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._paused_until)
+            if self._interval:
+                start = max(start, self._tat - self._tolerance)
+                self._tat = max(self._tat, start) + self._interval
+            return start - now
+
+    def pause(self, seconds: float) -> None:
+        """Không cho request nào của bucket đi trong seconds giây (server báo Retry-After)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RetryBudget:
+    """Ngân sách thử lại: mỗi request nạp ratio lượt, mỗi lần thử lại tốn một lượt."""
+
+    def __init__(self, ratio: float = 0.2, initial: float = 10, max_tokens: float = 100):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self._tokens = min(initial, max_tokens)
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self._tokens = min(self._tokens + self.ratio, self.max_tokens)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+class RateLimiter:
+    """Các token bucket theo (endpoint, model), cấu hình retry và thống kê."""
+
+    def __init__(self, **retry_options):
+        self._limits: Dict[Tuple[str, Optional[str]], Tuple[float, int]] = {}
+        self._buckets: Dict[Tuple[str, Optional[str]], TokenBucket] = {}
+        self._lock = threading.Lock()
+        self.retry_options = dict(_RETRY_DEFAULTS)
+        self.configure_retries(**retry_options)
+        self.reset_metrics()
+
+    def configure_retries(self, **options) -> None:
+        """Đổi một phần chính sách thử lại (xem _RETRY_DEFAULTS); các tùy chọn khác giữ nguyên."""
+        unknown = set(options) - set(_RETRY_DEFAULTS)
+        if unknown:
+            raise ValueError(f"Tùy chọn không hợp lệ: {', '.join(sorted(unknown))}")
+        self.retry_options.update(options)
+        self.max_retries = self.retry_options["max_retries"]
+        self.base_delay = self.retry_options["base_delay"]
+        self.max_delay = self.retry_options["max_delay"]
+        self.max_retry_after = self.retry_options["max_retry_after"]
+        self.budget = RetryBudget(self.retry_options["budget_ratio"], self.retry_options["budget_initial"])
+
+    def set_limit(self, endpoint: str, rate: Optional[float], burst: int = 1, model: Optional[str] = None) -> None:
+        with self._lock:
+            if rate:
+                self._limits[(endpoint, model)] = (rate, burst)
+            else:
+                self._limits.pop((endpoint, model), None)
+            self._buckets.clear()  # dựng lại bucket theo cấu hình mới ở lần dùng tiếp theo
+
+    def bucket(self, endpoint: str, model: Optional[str]) -> Tuple[str, TokenBucket]:
+        with self._lock:
+            if (endpoint, model) in self._limits or (endpoint, None) not in self._limits:
+                key = (endpoint, model)
+            else:
+                key = (endpoint, None)  # giới hạn chung cho mọi model của endpoint
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                rate, burst = self._limits.get(key, (None, 1))
+                bucket = self._buckets[key] = TokenBucket(rate, burst)
+        return "@".join(part for part in key if part), bucket
+
+    def backoff(self, attempt: int) -> float:
+        return min(self.base_delay * 2 ** attempt, self.max_delay) * (0.5 + random.random())
+
+    # ---- Thống kê ----
+
+    def reset_metrics(self) -> None:
+        with self._lock:
+            self._retries: Dict[str, int] = {}
+            self._budget_exhausted = 0
+            self._retry_after_honored = 0
+            self._bucket_stats: Dict[str, Dict[str, float]] = {}
+
+    def record_wait(self, name: str, waited: float) -> None:
+        with self._lock:
+            stats = self._bucket_stats.setdefault(
+                name, {"requests": 0, "delayed": 0, "wait_s_total": 0.0, "wait_s_max": 0.0, "throttled": 0}
+            )
+            stats["requests"] += 1
+            if waited > 0:
+                stats["delayed"] += 1
+                stats["wait_s_total"] += waited
+                stats["wait_s_max"] = max(stats["wait_s_max"], waited)
+
+    def record_retry(self, name: str, reason: str, retry_after: bool) -> None:
+        with self._lock:
+            self._retries[reason] = self._retries.get(reason, 0) + 1
+            if retry_after:
+                self._retry_after_honored += 1
+            if reason == "429" and name in self._bucket_stats:
+                self._bucket_stats[name]["throttled"] += 1
+
+    def record_budget_exhausted(self) -> None:
+        with self._lock:
+            self._budget_exhausted += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "retries": sum(self._retries.values()),
+                "retries_by_reason": dict(self._retries),
+                "retry_after_honored": self._retry_after_honored,
+                "retry_budget_exhausted": self._budget_exhausted,
+                "buckets": {name: dict(stats) for name, stats in self._bucket_stats.items()},
+            }
+
+
+class RateLimitedTransport(httpx.AsyncBaseTransport):
+    """Transport bọc ngoài transport thật: chờ token bucket rồi gửi, thử lại khi lỗi tạm thời."""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limiter = get_rate_limiter()
+        endpoint, model = classify_request(request)
+        name, bucket = limiter.bucket(endpoint, model)
+        safe_method = request.method in ("GET", "HEAD")
+        idempotent = safe_method or endpoint not in _NON_IDEMPOTENT
+        limiter.budget.deposit()
+
+        attempt = 0
+        while True:
+            waited = bucket.reserve()
+            if waited > 0:
+                await asyncio.sleep(waited)
+            limiter.record_wait(name, waited)
+
+            retry_after = None
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError as e:
+                if not (safe_method or isinstance(e, _SAFE_ERRORS)) or not self._may_retry(limiter, attempt):
+                    raise
+                reason = type(e).__name__
+            else:
+                status = response.status_code
+                if status not in _RETRY_STATUSES or not (idempotent or status in _SAFE_STATUSES):
+                    return response
+                retry_after = _parse_retry_after(response.headers.get("retry-after"))
+                if retry_after is not None and retry_after > limiter.max_retry_after:
+                    return response  # server yêu cầu chờ quá lâu: trả lỗi cho người gọi
+                if not self._may_retry(limiter, attempt):
+                    return response
+                await response.aclose()
+                reason = str(status)
+
+            if retry_after is not None:
+                # Chờ đúng Retry-After (+ một chút jitter) và cho cả bucket nghỉ theo
+                delay = retry_after * (1 + 0.1 * random.random())
+                bucket.pause(delay)
+            else:
+                delay = limiter.backoff(attempt)
+            limiter.record_retry(name, reason, retry_after is not None)
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _may_retry(limiter: RateLimiter, attempt: int) -> bool:
+        if attempt >= limiter.max_retries:
+            return False
+        if not limiter.budget.withdraw():
+            limiter.record_budget_exhausted()
+            return False
+        return True
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After dạng số giây hoặc ngày giờ HTTP; None nếu không có/không đọc được."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# ---- Limiter dùng chung ----
+
+_default_limiter: Optional[RateLimiter] = None
+_default_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Limiter dùng chung (đọc giới hạn từ biến môi trường RATE_LIMITS ở lần gọi đầu)."""
+    global _default_limiter
+    if _default_limiter is None:
+        with _default_lock:
+            if _default_limiter is None:
+                limiter = RateLimiter()
+                for endpoint, model, rate, burst in _parse_limits(os.getenv("RATE_LIMITS", "")):
+                    limiter.set_limit(endpoint, rate, burst, model)
+                _default_limiter = limiter
+    return _default_limiter
+
+
+def configure_rate_limit(endpoint: str, rate: Optional[float], burst: int = 1, model: Optional[str] = None) -> None:
+    """
+    Giới hạn endpoint (hoặc một model của endpoint) ở rate request/giây, cho
+    phép dồn tối đa burst request. rate=None bỏ giới hạn.
+    """
+    get_rate_limiter().set_limit(endpoint, rate, burst, model)
+
+
+def configure_retries(**options) -> None:
+    """
+    Đổi chính sách thử lại: max_retries, base_delay, max_delay (giây),
+    max_retry_after (Retry-After dài hơn mức này thì trả lỗi ngay),
+    budget_ratio, budget_initial (ngân sách thử lại toàn cục).
+    """
+    get_rate_limiter().configure_retries(**options)
+
+
+def rate_limit_metrics() -> dict:
+    """
+    Thống kê: số lần thử lại (theo mã lỗi/loại lỗi), số lần chờ theo Retry-After,
+    số lần hết ngân sách thử lại, và theo từng bucket: số request đã gửi (kể cả
+    thử lại), số request phải chờ, tổng/lớn nhất thời gian chờ, số lần bị 429.
+    """
+    return get_rate_limiter().metrics()
+
+
+def reset_rate_limit_metrics() -> None:
+    get_rate_limiter().reset_metrics()
+
+
+def _parse_limits(spec: str):
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        target, _, value = item.partition("=")
+        endpoint, _, model = target.strip().partition("@")
+        rate, _, burst = value.partition(":")
+        yield endpoint, model or None, float(rate), int(burst or 1)
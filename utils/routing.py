@@ -0,0 +1,412 @@
+"""
+Định tuyến theo sức khỏe giữa các route tương đương, có circuit breaker và model dự phòng.
+
+Cùng một việc đi được qua nhiều route của proxy:
+- sinh ảnh: `/images/generations` với imagen-4 (generate_image_from_prompt),
+  Gemini `:generateContent` (generate_or_modify_image_gemini) và
+  `/chat/completions` với modality ảnh (api_chat_completions);
+- TTS: Gemini `:generateContent` (gemini_tts) và `/audio/speech` (text_to_speech).
+Gọi thẳng một hàm thì khi route đó xuống cấp, job vẫn tiếp tục dồn request vào
+nó. generate_image_routed() / text_to_speech_routed() đi theo danh sách route
+ưu tiên (cấu hình được), mỗi route là "endpoint@model" và có một breaker:
+- breaker giữ các lời gọi trong window_s giây gần nhất: tỉ lệ lỗi (ngoại lệ
+  hoặc hàm trả về rỗng) và độ trễ p50/p90 của các lời gọi thành công. Điểm sức
+  khỏe = 1 - tỉ lệ lỗi, nhân thêm max_latency_s / p90 khi p90 vượt max_latency_s;
+- có ít nhất min_requests lời gọi mà điểm dưới min_health thì breaker mở: route
+  bị bỏ qua, request đi thẳng sang route kế tiếp;
+- sau open_s giây breaker sang half-open: half_open_probes lời gọi thật được
+  gửi thử; đủ chừng ấy lời gọi thành công thì breaker đóng (xóa số liệu cũ),
+  một lời gọi lỗi thì mở lại với thời gian gấp đôi (tối đa max_open_s);
+- lời gọi lỗi được gửi lại ở route khỏe kế tiếp; nếu mọi breaker đều mở thì
+  vẫn gửi theo route đầu danh sách thay vì từ chối.
+Route imagen chỉ sinh ảnh mới nên bị bỏ qua khi có ảnh đầu vào.
+
+Danh sách route cũng là cách khai báo model dự phòng (route TTS nhận model bất kỳ):
+    from utils.routing import configure_routing, text_to_speech_routed
+    configure_routing(tts_routes=["generateContent@gemini-2.5-flash-preview-tts",
+                                  "generateContent@gemini-2.5-pro-preview-tts",
+                                  "audio/speech@gemini-2.5-pro-preview-tts"], min_health=0.6)
+    text_to_speech_routed(api_key, "Xin chào", output_path="logs/hello.wav")
+Quyết định định tuyến và trạng thái từng breaker: routing_metrics().
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional, Union
+
+import httpx
+
+from .chat_gen_img import api_chat_completions_async
+from .edit_img_from_prompt import generate_or_modify_image_gemini_async
+from .gen_single_img import generate_image_from_prompt_async
+from .http_client import observe_statuses, run_sync
+from .media_sink import ImageData, resolve_output_path, save_image_bytes_async
+from .rate_limit import classify_path
+from .text_to_speech import text_to_speech_async
+from .text_to_speech_gemini_single import gemini_tts_async
+
+
+IMAGEN_ROUTE = "images/generations@imagen-4"
+GEMINI_IMAGE_ROUTE = "generateContent@gemini-2.5-flash-image-preview"
+CHAT_IMAGE_ROUTE = "chat/completions@gemini-2.5-flash-image-preview"
+_TTS_ENDPOINTS = ("generateContent", "audio/speech")
+
+_config = {
+    "image_routes": (IMAGEN_ROUTE, GEMINI_IMAGE_ROUTE, CHAT_IMAGE_ROUTE),
+    "tts_routes": ("generateContent@gemini-2.5-flash-preview-tts", "audio/speech@gemini-2.5-pro-preview-tts"),
+    "window_s": 60.0,            # chỉ tính các lời gọi trong chừng này giây gần nhất
+    "min_requests": 5,           # ít lời gọi hơn thì chưa đánh giá sức khỏe
+    "min_health": 0.5,           # điểm sức khỏe dưới mức này thì mở breaker
+    "max_latency_s": None,       # p90 vượt mức này thì điểm bị giảm theo tỉ lệ; None = chỉ xét lỗi
+    "open_s": 30.0,              # thời gian mở breaker lần đầu
+    "max_open_s": 300.0,         # mở lại liên tiếp thì thời gian gấp đôi, tối đa chừng này
+    "half_open_probes": 1,       # số lời gọi thử thành công cần có để đóng breaker
+}
+
+
+class CircuitBreaker:
+    """Sức khỏe và trạng thái (closed / open / half_open) của một route."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = "closed"
+        self._lock = threading.Lock()
+        self._calls = deque()    # (thời điểm, thành công, độ trễ)
+        self._opened_at = 0.0
+        self._open_for = 0.0
+        self._probes = 0         # lời gọi thử đang chạy hoặc đã thành công trong lượt half-open này
+        self._probe_ok = 0
+        self._counts = dict.fromkeys(("requests", "failures", "served", "opened", "probes"), 0)
+
+    def acquire(self) -> Optional[bool]:
+        """None nếu route đang bị chặn; True nếu lời gọi là lời gọi thử half-open, False nếu gửi bình thường."""
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() < self._opened_at + self._open_for:
+                    return None
+                self.state = "half_open"
+                self._probes = self._probe_ok = 0
+            if self.state == "half_open":
+                if self._probes >= _config["half_open_probes"]:
+                    return None
+                self._probes += 1
+                self._counts["probes"] += 1
+                return True
+            return False
+
+    def release(self, probe: bool) -> None:
+        """Lời gọi bị hủy trước khi có kết quả: trả lại lượt thử."""
+        with self._lock:
+            if probe and self.state == "half_open":
+                self._probes -= 1
+
+    def record(self, ok: bool, latency: float, probe: bool) -> None:
+        with self._lock:
+            now = time.monotonic()
+            self._counts["requests"] += 1
+            self._counts["served" if ok else "failures"] += 1
+            if probe and self.state == "half_open":
+                if not ok:
+                    self._open(now, self._open_for * 2)
+                    return
+                self._probe_ok += 1
+                if self._probe_ok >= _config["half_open_probes"]:
+                    self.state = "closed"
+                    self._calls.clear()
+                    self._open_for = 0.0
+                    print(f"✅ Route {self.name} đã hồi phục, dùng lại bình thường.")
+                return
+            self._calls.append((now, ok, latency))
+            self._prune(now)
+            if self.state == "closed" and len(self._calls) >= _config["min_requests"]:
+                health = self._health()
+                if health < _config["min_health"]:
+                    self._open(now, _config["open_s"])
+                    print(f"🔌 Route {self.name} xuống cấp (sức khỏe {health:.2f}); "
+                          f"chuyển sang route khác trong {self._open_for:g}s.")
+
+    def reset(self) -> None:
+        with self._lock:
+            self.state = "closed"
+            self._calls.clear()
+            self._open_for = 0.0
+            self._counts = dict.fromkeys(self._counts, 0)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            now = time.monotonic()
+            self._prune(now)
+            latencies = sorted(latency for _, ok, latency in self._calls if ok)
+            failures = sum(1 for _, ok, _ in self._calls if not ok)
+            result = {
+                "state": self.state,
+                **self._counts,
+                "window_requests": len(self._calls),
+                "error_rate": round(failures / len(self._calls), 4) if self._calls else 0.0,
+                "latency_p50_s": _percentile(latencies, 50),
+                "latency_p90_s": _percentile(latencies, 90),
+                "health": round(self._health(), 4),
+            }
+            if self.state == "open":
+                result["open_remaining_s"] = round(max(0.0, self._opened_at + self._open_for - now), 3)
+        return result
+
+    def _open(self, now: float, duration: float) -> None:
+        self.state = "open"
+        self._opened_at = now
+        self._open_for = min(max(duration, _config["open_s"]), _config["max_open_s"])
+        self._counts["opened"] += 1
+
+    def _prune(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - _config["window_s"]:
+            self._calls.popleft()
+
+    def _health(self) -> float:
+        if not self._calls:
+            return 1.0
+        failures = sum(1 for _, ok, _ in self._calls if not ok)
+        health = 1.0 - failures / len(self._calls)
+        limit = _config["max_latency_s"]
+        p90 = _percentile(sorted(latency for _, ok, latency in self._calls if ok), 90)
+        if limit and p90 and p90 > limit:
+            health *= limit / p90
+        return health
+
+
+def _percentile(ordered: list, q: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, len(ordered) * int(q) // 100)], 4)
+
+
+class _Router:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._decisions = dict.fromkeys(("calls", "primary", "fallback", "forced", "failed", "skipped_open",
+                                         "client_errors"), 0)
+        self._reroutes: Dict[str, int] = {}
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name)
+            return breaker
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._decisions[name] += value
+
+    def reroute(self, source: str, target: str) -> None:
+        with self._lock:
+            key = f"{source} -> {target}"
+            self._reroutes[key] = self._reroutes.get(key, 0) + 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            decisions = dict(self._decisions)
+            reroutes = dict(self._reroutes)
+            breakers = list(self._breakers.values())
+        return {**decisions, "reroutes": reroutes, "routes": {b.name: b.snapshot() for b in breakers}}
+
+    def reset(self) -> None:
+        with self._lock:
+            breakers = list(self._breakers.values())
+            self._decisions = dict.fromkeys(self._decisions, 0)
+            self._reroutes.clear()
+        for breaker in breakers:
+            breaker.reset()
+
+    async def call(self, routes: list, send):
+        """
+        Gửi theo routes (đã xếp theo ưu tiên), bỏ qua route có breaker đang mở,
+        chuyển sang route kế tiếp khi lỗi. send(route) trả về kết quả (rỗng = lỗi).
+        Lỗi 4xx (trừ 408, 429) không được tính vào breaker và không chuyển route:
+        HTTPStatusError được raise lại, hoặc trả về None nếu send() đã nuốt lỗi.
+        """
+        self.count("calls")
+        name, probe = self._next(routes, 0)
+        if name is None:
+            # Mọi breaker đều mở: vẫn thử route ưu tiên nhất thay vì từ chối
+            self.count("forced")
+            name, probe = routes[0], False
+        while True:
+            breaker = self.breaker(name)
+            started = time.perf_counter()
+            error = None
+            endpoint = name.partition("@")[0]
+            with observe_statuses(endpoint) as statuses:
+                try:
+                    result = await send(name)
+                except asyncio.CancelledError:
+                    breaker.release(probe)
+                    raise
+                except Exception as e:
+                    result, error = None, e
+            if not result and _is_client_error(error, endpoint, statuses):
+                # Lỗi do chính request (400, 401, 403, 404...): route khác cũng sẽ từ chối,
+                # và route này không có lỗi gì nên không tính vào sức khỏe của nó
+                breaker.release(probe)
+                self.count("client_errors")
+                if error is not None:
+                    raise error
+                return None
+            breaker.record(bool(result), time.perf_counter() - started, probe)
+            if result:
+                if name == routes[0]:
+                    self.count("primary")
+                else:
+                    self.count("fallback")
+                    self.reroute(routes[0], name)
+                return result
+            failed = name
+            name, probe = self._next(routes, routes.index(failed) + 1)
+            if name is None:
+                self.count("failed")
+                if error is not None:
+                    raise error
+                return None
+            print(f"⚠️ Route {failed} lỗi; thử lại qua {name}.")
+
+    def _next(self, routes: list, start: int):
+        """(route, có phải lời gọi thử) của route đầu tiên từ vị trí start còn nhận request."""
+        for name in routes[start:]:
+            probe = self.breaker(name).acquire()
+            if probe is not None:
+                return name, probe
+            self.count("skipped_open")
+        return None, None
+
+
+def _is_client_error(error: Optional[Exception], endpoint: str, statuses: list) -> bool:
+    """
+    Lời gọi hỏng vì chính request (4xx trừ 408/429) chứ không vì route? Chỉ xét
+    request sinh nội dung của route: upload 404 hay tải kết quả 403 không nói gì
+    về việc route khác có nhận request này không.
+    """
+    if isinstance(error, httpx.HTTPStatusError) and classify_path(error.response.request.url.path)[0] == endpoint:
+        status = error.response.status_code
+    elif statuses:
+        status = statuses[-1]  # phản hồi cuối cùng của endpoint quyết định kết quả của send()
+    else:
+        return False
+    return 400 <= status < 500 and status not in (408, 429)
+
+
+_router = _Router()
+
+
+def configure_routing(**options) -> None:
+    """
+    Đổi cấu hình router; tùy chọn: image_routes, tts_routes (danh sách
+    "endpoint@model" theo thứ tự ưu tiên), window_s, min_requests, min_health,
+    max_latency_s, open_s, max_open_s, half_open_probes.
+    """
+    unknown = set(options) - set(_config)
+    if unknown:
+        raise ValueError(f"Tùy chọn không hợp lệ: {', '.join(sorted(unknown))}")
+    for key in ("image_routes", "tts_routes"):
+        if key in options:
+            options[key] = tuple(options[key])
+            if not options[key]:
+                raise ValueError(f"{key} không được rỗng")
+    unsupported = [name for name in options.get("image_routes", ())
+                   if name not in (IMAGEN_ROUTE, GEMINI_IMAGE_ROUTE, CHAT_IMAGE_ROUTE)]
+    unsupported += [name for name in options.get("tts_routes", ())
+                    if name.partition("@")[0] not in _TTS_ENDPOINTS or not name.partition("@")[2]]
+    if unsupported:
+        raise ValueError(f"Route không hỗ trợ: {', '.join(unsupported)}")
+    _config.update(options)
+
+
+def routing_metrics() -> dict:
+    """
+    calls: số lời gọi qua router; primary/fallback: số lời gọi được phục vụ bởi
+    route ưu tiên nhất/route dự phòng; forced: số lời gọi gửi dù mọi breaker
+    đều mở; failed: số lời gọi mọi route đều lỗi; client_errors: số lời gọi
+    dừng vì lỗi 4xx của chính request; skipped_open: số lần bỏ qua
+    một route vì breaker đang mở; reroutes: số lời gọi theo "route ưu tiên ->
+    route đã phục vụ"; routes: trạng thái, sức khỏe, tỉ lệ lỗi, độ trễ p50/p90
+    và số lần mở breaker của từng route.
+    """
+    return _router.metrics()
+
+
+def reset_routing() -> None:
+    """Đóng mọi breaker và xóa số liệu định tuyến."""
+    _router.reset()
+
+
+def _ordered(routes: tuple, prefer: Optional[str]) -> list:
+    if prefer is None:
+        return list(routes)
+    if prefer not in routes:
+        raise ValueError(f"Route {prefer} không có trong danh sách: {', '.join(routes)}")
+    return [prefer] + [name for name in routes if name != prefer]
+
+
+async def generate_image_routed_async(prompt: str, output_path: Optional[str], api_key: str,
+                                      input_image_path: Union[str, ImageData] = None, aspect_ratio: str = "1:1",
+                                      prefer: Optional[str] = None):
+    """
+    Sinh (hoặc sửa, khi có input_image_path) một ảnh qua route khỏe nhất theo
+    image_routes. Trả về ImageResult (hoặc ImageData khi output_path=None),
+    hoặc None nếu mọi route đều lỗi. prefer: route được thử trước.
+    """
+    routes = _ordered(_config["image_routes"], prefer)
+    if input_image_path is not None:
+        routes = [name for name in routes if name != IMAGEN_ROUTE]  # imagen không sửa ảnh
+        if not routes:
+            raise ValueError("Không có route nào trong image_routes sửa được ảnh đầu vào")
+
+    async def send(route: str):
+        if route == IMAGEN_ROUTE:
+            images = await generate_image_from_prompt_async(prompt, None, api_key, n=1, aspect_ratio=aspect_ratio)
+            if not images or output_path is None:
+                return images[0] if images else None
+            image = images[0]
+            return await save_image_bytes_async(image.data, resolve_output_path(output_path, image.mime_type),
+                                                image.mime_type)
+        if route == GEMINI_IMAGE_ROUTE:
+            return await generate_or_modify_image_gemini_async(prompt, output_path, api_key,
+                                                               input_image_path=input_image_path,
+                                                               aspect_ratio=aspect_ratio)
+        return await api_chat_completions_async(prompt, output_path, api_key, input_image_path=input_image_path)
+
+    return await _router.call(routes, send)
+
+
+def generate_image_routed(prompt: str, output_path: Optional[str], api_key: str,
+                          input_image_path: Union[str, ImageData] = None, aspect_ratio: str = "1:1",
+                          prefer: Optional[str] = None):
+    """Bản đồng bộ của generate_image_routed_async() (cùng tham số)."""
+    return run_sync(generate_image_routed_async(prompt, output_path, api_key, input_image_path=input_image_path,
+                                                aspect_ratio=aspect_ratio, prefer=prefer))
+
+
+async def text_to_speech_routed_async(api_key: str, text: str, voice_name: str = "Kore",
+                                      output_path: str = "output.wav", prefer: Optional[str] = None):
+    """
+    Đọc text thành file WAV qua route khỏe nhất theo tts_routes. Trả về
+    output_path, hoặc None nếu mọi route đều lỗi. prefer: route được thử trước.
+    """
+    routes = _ordered(_config["tts_routes"], prefer)
+
+    async def send(route: str):
+        endpoint, _, model = route.partition("@")
+        if endpoint == "audio/speech":
+            ok = await text_to_speech_async(text, output_path, model=model, voice=voice_name, api_key=api_key)
+            return output_path if ok else None
+        return await gemini_tts_async(api_key, text, model=model, voice_name=voice_name, output_path=output_path)
+
+    return await _router.call(routes, send)
+
+
+def text_to_speech_routed(api_key: str, text: str, voice_name: str = "Kore", output_path: str = "output.wav",
+                          prefer: Optional[str] = None):
+    """Bản đồng bộ của text_to_speech_routed_async() (cùng tham số)."""
+    return run_sync(text_to_speech_routed_async(api_key, text, voice_name=voice_name, output_path=output_path,
+                                                prefer=prefer))
@@ -0,0 +1,186 @@
+"""
+Gộp các request giống hệt nhau đang chạy đồng thời (single-flight).
+
+Trong một dịch vụ, nhiều người dùng thường yêu cầu cùng một câu TTS hay cùng
+một prompt ảnh trong vòng vài giây. Lời gọi đầu tiên với một khóa (model +
+payload đã chuẩn hóa + hash ảnh đầu vào, chính là khóa của artifact cache)
+gửi request lên API; các lời gọi cùng khóa đến trong lúc request đó còn chạy
+chỉ chờ và nhận chung kết quả thay vì gửi request riêng.
+
+- Gộp được giữa các task trên cùng event loop và giữa các event loop/thread
+  khác nhau (các hàm đồng bộ đều chạy qua run_sync() nên cũng được gộp).
+- Lỗi của request chung được raise cho mọi lời gọi đang chờ. Khóa được bỏ
+  ngay khi request xong, nên lời gọi đến sau sẽ gửi request mới (lỗi không bị
+  "cache" lại).
+- Hủy: một lời gọi bị hủy chỉ rời khỏi nhóm; request chung chỉ bị hủy khi mọi
+  lời gọi đang chờ nó đều đã bị hủy.
+
+Số request đã tiết kiệm được xem bằng single_flight_metrics().
+"""
+
+import asyncio
+import concurrent.futures
+import os
+import shutil
+import threading
+from typing import Awaitable, Callable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class _Call:
+    """Một request upstream đang chạy và các lời gọi đang chờ nó."""
+
+    __slots__ = ("future", "loop", "task", "waiters", "kind")
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, kind: str):
+        self.future = concurrent.futures.Future()  # chờ được từ mọi event loop/thread
+        self.loop = loop
+        self.task = None
+        self.waiters = 0
+        self.kind = kind
+
+
+class SingleFlight:
+    """
+    Bảng các request đang chạy theo khóa.
+
+        flight = get_single_flight()
+        result = await flight.do_async(key, lambda: call_api(...), kind="gemini_tts")
+
+    fn chỉ được gọi bởi lời gọi đầu tiên của mỗi khóa; kết quả của nó phải dùng
+    chung được cho mọi lời gọi (ví dụ bytes, hoặc đường dẫn file để chép sang).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, _Call] = {}
+        self._counts: Dict[str, Dict[str, int]] = {}
+
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[T]], kind: str = "default") -> T:
+        """Chạy fn() một lần cho mọi lời gọi đồng thời cùng key và trả về kết quả chung."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            call = self._calls.get(key)
+            if call is None:
+                call = self._calls[key] = _Call(loop, kind)
+                # Request chạy trong task riêng để không bị hủy theo lời gọi đầu tiên
+                call.task = loop.create_task(self._run(key, call, fn))
+                self._count(kind, "upstream_calls")
+            else:
+                self._count(kind, "saved_calls")
+            call.waiters += 1
+
+        waiter = loop.create_future()
+        call.future.add_done_callback(lambda f: _transfer_threadsafe(f, waiter, loop))
+        try:
+            return await waiter
+        finally:
+            self._leave(key, call)
+
+    async def _run(self, key: str, call: _Call, fn: Callable[[], Awaitable[T]]) -> None:
+        try:
+            result = await fn()
+        except Exception as e:
+            self._forget(key, call, failed=True)
+            call.future.set_exception(e)
+        except BaseException:
+            self._forget(key, call)
+            call.future.cancel()
+            raise
+        else:
+            self._forget(key, call)
+            call.future.set_result(result)
+
+    def _forget(self, key: str, call: _Call, failed: bool = False) -> None:
+        # Bỏ khóa trước khi trả kết quả: lời gọi mới từ lúc này sẽ gửi request mới
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+            if failed:
+                self._count(call.kind, "failures")
+
+    def _leave(self, key: str, call: _Call) -> None:
+        with self._lock:
+            call.waiters -= 1
+            abandoned = call.waiters == 0 and not call.future.done()
+            if abandoned:
+                # Không còn ai chờ: hủy request chung (và bỏ khóa ngay, dưới cùng khóa
+                # với lúc tham gia, để không lời gọi mới nào nhận phải kết quả bị hủy)
+                if self._calls.get(key) is call:
+                    del self._calls[key]
+                self._count(call.kind, "cancelled")
+        if abandoned and not call.loop.is_closed():
+            call.loop.call_soon_threadsafe(call.task.cancel)
+
+    def _count(self, kind: str, name: str) -> None:
+        counts = self._counts.setdefault(kind, {"upstream_calls": 0, "saved_calls": 0, "failures": 0, "cancelled": 0})
+        counts[name] += 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            by_kind = {kind: dict(counts) for kind, counts in self._counts.items()}
+            in_flight = len(self._calls)
+        totals = {name: sum(counts[name] for counts in by_kind.values())
+                  for name in ("upstream_calls", "saved_calls", "failures", "cancelled")}
+        return {**totals, "in_flight": in_flight, "by_kind": by_kind}
+
+    def reset_metrics(self) -> None:
+        with self._lock:
+            self._counts.clear()
+
+
+def _transfer_threadsafe(source: concurrent.futures.Future, waiter: asyncio.Future,
+                         loop: asyncio.AbstractEventLoop) -> None:
+    if not loop.is_closed():
+        loop.call_soon_threadsafe(_transfer, source, waiter)
+
+
+def _transfer(source: concurrent.futures.Future, waiter: asyncio.Future) -> None:
+    if waiter.done():  # lời gọi này đã bị hủy
+        return
+    if source.cancelled():
+        waiter.cancel()
+    elif source.exception() is not None:
+        waiter.set_exception(source.exception())
+    else:
+        waiter.set_result(source.result())
+
+
+async def share_file_async(src_path: str, output_path: str) -> None:
+    """Chép file kết quả của request chung sang đường dẫn của lời gọi hiện tại (nếu khác)."""
+    if os.path.abspath(src_path) != os.path.abspath(output_path):
+        await asyncio.to_thread(_copy_atomic, src_path, output_path)
+
+
+def _copy_atomic(src_path: str, output_path: str) -> None:
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    tmp_path = f"{output_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        shutil.copyfile(src_path, tmp_path)
+        os.replace(tmp_path, output_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+_default_flight = SingleFlight()
+
+
+def get_single_flight() -> SingleFlight:
+    """Bảng single-flight dùng chung của mọi module trong utils/."""
+    return _default_flight
+
+
+def single_flight_metrics() -> dict:
+    """
+    Thống kê single-flight: upstream_calls (request thực sự được gửi),
+    saved_calls (lời gọi dùng chung kết quả thay vì gửi request riêng),
+    failures, cancelled, in_flight và chi tiết theo loại tác vụ (by_kind).
+    """
+    return _default_flight.metrics()
+
+
+def reset_single_flight_metrics() -> None:
+    _default_flight.reset_metrics()
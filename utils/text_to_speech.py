@@ -1,29 +1,30 @@
-import requests
 import os
 
-def text_to_speech(text_input, output_path, model="gemini-2.5-pro-preview-tts", voice="Puck"):
+import httpx
+
+from .http_client import api_url, get_async_http_client, bearer_headers, run_sync
+from .instrumentation import phase_timer
+
+async def text_to_speech_async(text_input, output_path, model="gemini-2.5-pro-preview-tts", voice="Puck", api_key=None):
     """
-    Converts text to speech using the thucchien.ai API and saves it to a file.
+    Converts text to speech using the thucchien.ai API and saves it to a file (async version).
 
     Args:
         text_input (str): The text to convert to speech.
         output_path (str): The path to save the output audio file.
         model (str, optional): The TTS model to use. Defaults to "gemini-2.5-pro-preview-tts".
         voice (str, optional): The voice to use. Defaults to "Puck".
+        api_key (str, optional): The API key. Defaults to the API_KEY environment variable.
     """
     # --- Configuration ---
-    AI_API_BASE = "https://api.thucchien.ai"
-    AI_API_KEY = os.getenv("API_KEY")
+    AI_API_BASE = api_url()
+    AI_API_KEY = api_key or os.getenv("API_KEY")
     
     if not AI_API_KEY:
-        raise ValueError("API_KEY environment variable not set. Please set it before running.")
+        raise ValueError("API_KEY environment variable not set. Please set it or pass api_key.")
 
     # --- Execution ---
     url = f"{AI_API_BASE}/audio/speech"
-    headers = {
-      "Content-Type": "application/json",
-      "Authorization": f"Bearer {AI_API_KEY}"
-    }
     data = {
       "model": model,
       "input": text_input,
@@ -31,24 +32,35 @@ def text_to_speech(text_input, output_path, model="gemini-2.5-pro-preview-tts",
     }
 
     try:
-        response = requests.post(url, headers=headers, json=data, stream=True)
-        response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
+        async with get_async_http_client().stream("POST", url, headers=bearer_headers(AI_API_KEY), json=data) as response:
+            if response.is_error:
+                await response.aread()  # Read the error body so it can be printed below
+            response.raise_for_status()  # Raise an exception for bad status codes (4xx or 5xx)
 
-        with open(output_path, "wb") as f:
-            for chunk in response.iter_content(chunk_size=8192):
-                f.write(chunk)
+            timer = phase_timer("speech", model)
+            with open(output_path, "wb") as f:
+                async for chunk in response.aiter_bytes(chunk_size=8192):
+                    t = timer.clock()
+                    f.write(chunk)
+                    timer.lap("write", t, len(chunk))
+            timer.finish()
         print(f"Audio file successfully created at: {output_path}")
         return True
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Error calling API: {e}")
         # Try to print more details from the response if available
-        if 'response' in locals() and response is not None:
+        if 'response' in locals() and response is not None and response.is_error:
             try:
                 print(f"Error details: {response.json()}")
             except ValueError:
                 print(f"Error details: {response.text}")
         return False
 
+
+def text_to_speech(text_input, output_path, model="gemini-2.5-pro-preview-tts", voice="Puck", api_key=None):
+    """Synchronous wrapper around text_to_speech_async() (same arguments)."""
+    return run_sync(text_to_speech_async(text_input, output_path, model=model, voice=voice, api_key=api_key))
+
 if __name__ == "__main__":
     # Example usage of the function
     
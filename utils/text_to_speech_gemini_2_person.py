@@ -1,10 +1,11 @@
-import requests
-import base64
 import json
-import wave
 import os
 
-def tts_two_speakers(
+from .http_client import api_url, gemini_headers, run_sync
+from .inline_data_stream import stream_inline_data_to_wav_async
+from .tts_stream import PCMStream
+
+async def tts_two_speakers_async(
     api_key: str,
     model: str,
     speaker1: str,
@@ -20,7 +21,7 @@ def tts_two_speakers(
     output_path: str = "output.wav"
 ) -> None:
     """
-    Gọi API text-to-speech với 2 người nói và lưu file WAV.
+    Gọi API text-to-speech với 2 người nói và lưu file WAV (bản async).
 
     Parameters:
     - api_key: khóa API của AI Thực Chiến.
@@ -35,14 +36,68 @@ def tts_two_speakers(
     Returns: None (lưu file trên đĩa).
     """
 
-    url = f"https://api.thucchien.ai/gemini/v1beta/models/{model}:generateContent"
+    url = api_url(f"/gemini/v1beta/models/{model}:generateContent")
 
-    headers = {
-        "x-goog-api-key": api_key,
-        "Content-Type": "application/json"
-    }
+    payload = _build_payload(speaker1, voice1, speaker2, voice2, text)
+
+    # giả sử lấy phần ứng viên đầu tiên; âm thanh được giải mã và ghi vào WAV ngay khi body đang về
+    await stream_inline_data_to_wav_async(url, gemini_headers(api_key), payload, output_path,
+                                          channels, sample_width, sample_rate)
+
+    print(f"✅ File âm thanh đã lưu tại: {output_path}")
+    print(f"🎤 Giọng: {voice_name} | Phong cách: {style or 'Mặc định'} | Tần số: {sample_rate}Hz")
 
-    payload = {
+    print(f"Saved audio to {output_path}")
+
+
+def tts_two_speakers(
+    api_key: str,
+    model: str,
+    speaker1: str,
+    voice1: str,
+    speaker2: str,
+    voice2: str,
+    text: str,
+    voice_name: str = "Kore",
+    sample_rate: int = 24000,
+    channels: int = 1,
+    sample_width: int = 2,
+    style: str | None = None,
+    output_path: str = "output.wav"
+) -> None:
+    """Bản đồng bộ của tts_two_speakers_async() (cùng tham số)."""
+    return run_sync(tts_two_speakers_async(
+        api_key, model, speaker1, voice1, speaker2, voice2, text,
+        voice_name=voice_name, sample_rate=sample_rate, channels=channels,
+        sample_width=sample_width, style=style, output_path=output_path
+    ))
+
+
+def tts_two_speakers_stream(
+    api_key: str,
+    model: str,
+    speaker1: str,
+    voice1: str,
+    speaker2: str,
+    voice2: str,
+    text: str,
+    sample_rate: int = 24000,
+    channels: int = 1,
+    sample_width: int = 2,
+    output_path: str | None = None
+) -> PCMStream:
+    """
+    Như tts_two_speakers_async() nhưng dùng streamGenerateContent: trả về
+    PCMStream yield từng đoạn PCM ngay khi nhận được (`for` hoặc `async for`),
+    xem utils/tts_stream.py. output_path (tùy chọn): ghi dần vào file WAV.
+    """
+    url = api_url(f"/gemini/v1beta/models/{model}:streamGenerateContent?alt=sse")
+    return PCMStream(url, gemini_headers(api_key), _build_payload(speaker1, voice1, speaker2, voice2, text),
+                     output_path, channels, sample_width, sample_rate)
+
+
+def _build_payload(speaker1: str, voice1: str, speaker2: str, voice2: str, text: str) -> dict:
+    return {
         "contents": [
             {
                 "parts": [
@@ -77,42 +132,24 @@ def tts_two_speakers(
         }
     }
 
-    resp = requests.post(url, headers=headers, json=payload)
-    resp.raise_for_status()
-    result = resp.json()
-
-    # giả sử lấy phần ứng viên đầu tiên
-    audio_b64 = result["candidates"][0]["content"]["parts"][0]["inlineData"]["data"]
-    audio_bytes = base64.b64decode(audio_b64)
-
-    with wave.open(output_path, "wb") as wf:
-        wf.setnchannels(channels)
-        wf.setsampwidth(sample_width)
-        wf.setframerate(sample_rate)
-        wf.writeframes(audio_bytes)
-
-    print(f"✅ File âm thanh đã lưu tại: {output_path}")
-    print(f"🎤 Giọng: {voice_name} | Phong cách: {style or 'Mặc định'} | Tần số: {sample_rate}Hz")
-
-    print(f"Saved audio to {output_path}")
-
 
-api_key = os.getenv("API_KEY", "sk-1234")
-model   = "gemini-2.5-flash-preview-tts"
+if __name__ == "__main__":
+    api_key = os.getenv("API_KEY", "sk-1234")
+    model   = "gemini-2.5-flash-preview-tts"
 
-speaker1 = "Speaker1"
-voice1   = "Kore"
+    speaker1 = "Speaker1"
+    voice1   = "Kore"
 
-speaker2 = "Speaker2"
-voice2   = "Puck"
+    speaker2 = "Speaker2"
+    voice2   = "Puck"
 
-text = """Make Speaker1 sound tired and bored, and Speaker2 sound excited and happy:
+    text = """Make Speaker1 sound tired and bored, and Speaker2 sound excited and happy:
 Speaker1: So... what's on the agenda today?
 Speaker2: You're never going to guess!"""
 
-output_path = "logs/test_dialogue.wav"
+    output_path = "logs/test_dialogue.wav"
 
-tts_two_speakers(api_key, model,
-                 speaker1, voice1,
-                 speaker2, voice2,
-                 text, output_path=output_path)
+    tts_two_speakers(api_key, model,
+                     speaker1, voice1,
+                     speaker2, voice2,
+                     text, output_path=output_path)
@@ -1,23 +1,30 @@
-import requests
-import base64
+import asyncio
 import json
-import wave
 from typing import List, Dict
 import os
 
-def tts_multi_speakers(
+import httpx
+
+from .artifact_cache import get_artifact_cache, make_cache_key
+from .http_client import api_url, gemini_headers, run_sync
+from .inline_data_stream import stream_inline_data_to_wav_async, stream_segments_to_wav_async
+from .single_flight import get_single_flight, share_file_async
+from .tts_stream import PCMStream
+from .tts_text import batch_dialogue_turns, parse_dialogue
+
+async def tts_multi_speakers_async(
     api_key: str,
     model: str,
     speakers_config: List[Dict[str, str]],
     text: str,
-    base_url: str = "https://api.thucchien.ai",
+    base_url: str | None = None,
     sample_rate: int = 24000,
     channels: int = 1,
     sample_width: int = 2,
     output_path: str = "output.wav"
 ) -> None:
     # """
-    # Gọi API text-to-speech với nhiều người nói và lưu file WAV.
+    # Gọi API text-to-speech với nhiều người nói và lưu file WAV (bản async).
 
     # Parameters:
     # - api_key: khóa API của AI Thực Chiến.
@@ -25,19 +32,178 @@ def tts_multi_speakers(
     # - speakers_config: Danh sách các dictionary, mỗi dictionary chứa thông tin
     #   về một người nói. Ví dụ: [{"speaker": "Tên1", "voice": "Giọng1"}, ...].
     # - text: Đoạn hội thoại có tên của tất cả người nói.
-    # - base_url: URL cơ sở của API.
+    # - base_url: URL cơ sở của API (mặc định: api_url(), xem utils/http_client.py).
     # - output_path: Đường dẫn để lưu file WAV đầu ra.
 
     # Returns: None (lưu file trên đĩa).
     # """
 
-    url = f"{base_url}/gemini/v1beta/models/{model}:generateContent"
+    url = f"{base_url or api_url()}/gemini/v1beta/models/{model}:generateContent"
+
+    payload = _build_payload(text, speakers_config)
+
+    cache_key = make_cache_key("gemini_tts_multi", model, text, {
+        "speakers": speakers_config, "sample_rate": sample_rate,
+        "channels": channels, "sample_width": sample_width,
+    })
+
+    # Dùng lại kết quả cũ nếu đã sinh cùng kịch bản với cùng cấu hình giọng
+    cache = get_artifact_cache()
+    if cache and await asyncio.to_thread(cache.get_to_file, cache_key, output_path):
+        print(f"♻️ Lấy từ cache: {output_path}")
+        return
+
+    async def synthesize():
+        # print(json.dumps(payload))
+        print("===== Call API =======")
+        try:
+            # Giả sử lấy phần ứng viên đầu tiên; âm thanh được giải mã và ghi vào WAV ngay khi body đang về
+            await stream_inline_data_to_wav_async(url, gemini_headers(api_key), payload, output_path,
+                                                  channels, sample_width, sample_rate)
+        except httpx.HTTPStatusError as e:
+            # Kiểm tra và in ra lỗi chi tiết nếu có
+            print(f"Lỗi từ API: {e.response.status_code}")
+            print("Nội dung phản hồi:")
+            print(e.response.text)
+            raise
+        if cache:
+            await asyncio.to_thread(cache.put_file, cache_key, output_path)
+        return output_path
+
+    # Cùng kịch bản đang được đọc ở lời gọi khác: dùng chung request đó rồi chép file
+    produced = await get_single_flight().do_async(cache_key, synthesize, kind="gemini_tts_multi")
+    await share_file_async(produced, output_path)
+
+    print(f"✅ File âm thanh đã lưu tại: {output_path}")
+    print(f"🎤 Tần số: {sample_rate}Hz")
+
+
+def tts_multi_speakers(
+    api_key: str,
+    model: str,
+    speakers_config: List[Dict[str, str]],
+    text: str,
+    base_url: str | None = None,
+    sample_rate: int = 24000,
+    channels: int = 1,
+    sample_width: int = 2,
+    output_path: str = "output.wav"
+) -> None:
+    """Bản đồng bộ của tts_multi_speakers_async() (cùng tham số)."""
+    return run_sync(tts_multi_speakers_async(
+        api_key, model, speakers_config, text, base_url=base_url, sample_rate=sample_rate,
+        channels=channels, sample_width=sample_width, output_path=output_path
+    ))
+
+
+def tts_multi_speakers_stream(
+    api_key: str,
+    model: str,
+    speakers_config: List[Dict[str, str]],
+    text: str,
+    base_url: str | None = None,
+    sample_rate: int = 24000,
+    channels: int = 1,
+    sample_width: int = 2,
+    output_path: str | None = None
+) -> PCMStream:
+    """
+    Như tts_multi_speakers_async() nhưng dùng streamGenerateContent: trả về
+    PCMStream yield từng đoạn PCM ngay khi nhận được (`for` hoặc `async for`),
+    xem utils/tts_stream.py. output_path (tùy chọn): ghi dần vào file WAV.
+    """
+    url = f"{base_url or api_url()}/gemini/v1beta/models/{model}:streamGenerateContent?alt=sse"
+    return PCMStream(url, gemini_headers(api_key), _build_payload(text, speakers_config), output_path,
+                     channels, sample_width, sample_rate)
 
-    headers = {
-        "x-goog-api-key": api_key,
-        "Content-Type": "application/json"
-    }
 
+async def tts_dialogue_async(
+    api_key: str,
+    model: str,
+    speakers_config: List[Dict[str, str]],
+    text: str,
+    base_url: str | None = None,
+    sample_rate: int = 24000,
+    channels: int = 1,
+    sample_width: int = 2,
+    output_path: str = "output.wav",
+    max_chars: int = 1500,
+    max_workers: int = 4,
+    max_retries: int = 3,
+) -> dict:
+    """
+    Đọc kịch bản hội thoại dài theo từng lượt nói thay vì một request duy nhất.
+
+    Kịch bản được tách thành các lượt theo tên trong speakers_config
+    ("**Tên:** ..." hoặc "Tên: ..."), gộp thành các lô liên tiếp (tối đa
+    max_chars ký tự, tối đa 2 người nói mỗi lô), các lô được đọc song song với
+    đúng giọng của từng người rồi ghép vào một file WAV theo thứ tự kịch bản.
+    Lô chỉ có một người nói dùng voiceConfig đơn (không đọc tên người nói).
+    Phần giới thiệu trước lượt nói đầu tiên bị bỏ qua.
+
+    Một lô lỗi chỉ được thử lại lô đó (max_retries lần) chứ không phải cả tập.
+
+    Returns: dict thống kê (số lô, thời gian tới lô đầu tiên, tổng thời gian,
+    độ dài âm thanh).
+    """
+    voices = {config["speaker"]: config["voice"] for config in speakers_config}
+    turns = parse_dialogue(text, list(voices))
+    if not turns:
+        raise ValueError("Không tìm thấy lượt nói nào khớp với tên trong speakers_config.")
+    batches = batch_dialogue_turns(turns, max_chars)
+
+    payloads = []
+    segment_keys = []
+    for batch in batches:
+        names = list(dict.fromkeys(speaker for speaker, _ in batch))
+        if len(names) == 1:
+            batch_text = "\n".join(words for _, words in batch)
+            payload = _build_single_voice_payload(batch_text, voices[names[0]])
+        else:
+            batch_text = "\n".join(f"{speaker}: {words}" for speaker, words in batch)
+            payload = _build_payload(batch_text, [{"speaker": n, "voice": voices[n]} for n in names])
+        payloads.append(payload)
+        segment_keys.append(make_cache_key("gemini_tts_pcm", model, batch_text, {
+            "speakers": {n: voices[n] for n in names}, "sample_rate": sample_rate,
+            "channels": channels, "sample_width": sample_width,
+        }))
+
+    url = f"{base_url or api_url()}/gemini/v1beta/models/{model}:generateContent"
+    print(f"===== Call API ({len(turns)} lượt nói, {len(batches)} lô) =======")
+    stats = await stream_segments_to_wav_async(
+        url, gemini_headers(api_key), payloads, output_path, channels, sample_width, sample_rate,
+        segment_keys=segment_keys, max_workers=max_workers, max_retries=max_retries,
+    )
+
+    print(f"✅ File âm thanh đã lưu tại: {output_path}")
+    print(f"⏱️ {stats['audio_s']:.0f}s âm thanh sau {stats['elapsed_s']:.1f}s "
+          f"(lô đầu tiên sau {stats['first_segment_s']:.1f}s)")
+    return stats
+
+
+def tts_dialogue(
+    api_key: str,
+    model: str,
+    speakers_config: List[Dict[str, str]],
+    text: str,
+    base_url: str | None = None,
+    sample_rate: int = 24000,
+    channels: int = 1,
+    sample_width: int = 2,
+    output_path: str = "output.wav",
+    max_chars: int = 1500,
+    max_workers: int = 4,
+    max_retries: int = 3,
+) -> dict:
+    """Bản đồng bộ của tts_dialogue_async() (cùng tham số)."""
+    return run_sync(tts_dialogue_async(
+        api_key, model, speakers_config, text, base_url=base_url, sample_rate=sample_rate,
+        channels=channels, sample_width=sample_width, output_path=output_path,
+        max_chars=max_chars, max_workers=max_workers, max_retries=max_retries
+    ))
+
+
+def _build_payload(text: str, speakers_config: List[Dict[str, str]]) -> dict:
     # Tự động tạo cấu hình giọng nói từ danh sách đầu vào
     speaker_voice_configs = [
         {
@@ -51,7 +217,7 @@ def tts_multi_speakers(
         for config in speakers_config
     ]
 
-    payload = {
+    return {
         "contents": [
             {
                 "parts": [
@@ -69,47 +235,42 @@ def tts_multi_speakers(
         }
     }
 
-    # print(json.dumps(payload))
-    print("===== Call API =======")
-    resp = requests.post(url, headers=headers, json=payload)
-
-    # Kiểm tra và in ra lỗi chi tiết nếu có
-    if resp.status_code != 200:
-        print(f"Lỗi từ API: {resp.status_code}")
-        print("Nội dung phản hồi:")
-        print(resp.text)
-        resp.raise_for_status()
-
-    result = resp.json()
 
-    # Giả sử lấy phần ứng viên đầu tiên
-    audio_b64 = result["candidates"][0]["content"]["parts"][0]["inlineData"]["data"]
-    audio_bytes = base64.b64decode(audio_b64)
-
-    with wave.open(output_path, "wb") as wf:
-        wf.setnchannels(channels)
-        wf.setsampwidth(sample_width)
-        wf.setframerate(sample_rate)
-        wf.writeframes(audio_bytes)
-
-    print(f"✅ File âm thanh đã lưu tại: {output_path}")
-    print(f"🎤 Tần số: {sample_rate}Hz")
+def _build_single_voice_payload(text: str, voice: str) -> dict:
+    return {
+        "contents": [
+            {
+                "parts": [
+                    { "text": text }
+                ]
+            }
+        ],
+        "generationConfig": {
+            "responseModalities": ["AUDIO"],
+            "speechConfig": {
+                "voiceConfig": {
+                    "prebuiltVoiceConfig": {"voiceName": voice}
+                }
+            }
+        }
+    }
 
 
-# --- VÍ DỤ SỬ DỤNG ---
-# !!! QUAN TRỌNG: Vui lòng thay thế bằng API key hợp lệ của bạn.
-# API key trong ví dụ có thể đã hết hạn.
-api_key = os.getenv("API_KEY", "sk-1234")
-model   = "gemini-2.5-flash-preview-tts"
+if __name__ == "__main__":
+    # --- VÍ DỤ SỬ DỤNG ---
+    # !!! QUAN TRỌNG: Vui lòng thay thế bằng API key hợp lệ của bạn.
+    # API key trong ví dụ có thể đã hết hạn.
+    api_key = os.getenv("API_KEY", "sk-1234")
+    model   = "gemini-2.5-flash-preview-tts"
 
-# Cấu hình cho 3 người nói khác nhau (sử dụng các giọng đã biết là hoạt động)
-speakers_config = [
-    {"speaker": "Minh Anh", "voice": "Kore"},
-    {"speaker": "Quốc Trung", "voice": "Puck"},
-]
+    # Cấu hình cho 3 người nói khác nhau (sử dụng các giọng đã biết là hoạt động)
+    speakers_config = [
+        {"speaker": "Minh Anh", "voice": "Kore"},
+        {"speaker": "Quốc Trung", "voice": "Puck"},
+    ]
 
-# Đoạn hội thoại với tên người nói tương ứng (xóa khoảng trắng thừa ở đầu)
-text = '''
+    # Đoạn hội thoại với tên người nói tương ứng (xóa khoảng trắng thừa ở đầu)
+    text = '''
 **KỊCH BẢN PODCAST**
 **Chủ đề:** Vai trò của trí tuệ nhân tạo (AI) trong phát triển giáo dục và xã hội
 **Nhân vật:**
@@ -124,13 +285,13 @@ text = '''
 **Quốc Trung:** Đó là một lo ngại phổ biến, nhưng tôi lại có góc nhìn khác. AI không thay thế giáo viên, mà sẽ trở thành một trợ thủ đắc lực. Khi AI đảm nhận các công việc lặp đi lặp lại như chấm bài trắc nghiệm, quản lý tài liệu, giáo viên sẽ có nhiều thời gian hơn để tập trung vào việc truyền cảm hứng, hướng dẫn kỹ năng mềm và tương tác sâu hơn với học sinh. Vai trò của họ được nâng tầm lên thành người cố vấn, người định hướng.
 '''
 
-# Sửa tên file đầu ra cho đúng định dạng
-output_path = "logs/test_multi_speaker_dialogue.wav"
+    # Sửa tên file đầu ra cho đúng định dạng
+    output_path = "logs/test_multi_speaker_dialogue.wav"
 
-# Gọi hàm mới
-tts_multi_speakers(api_key=api_key,
-                   model=model,
-                   speakers_config=speakers_config,
-                   text=text,
-                #    base_url="https://generativelanguage.googleapis.com", # Có thể thay đổi nếu cần
-                   output_path=output_path)
+    # Gọi hàm mới
+    tts_multi_speakers(api_key=api_key,
+                       model=model,
+                       speakers_config=speakers_config,
+                       text=text,
+                    #    base_url="https://generativelanguage.googleapis.com", # Có thể thay đổi nếu cần
+                       output_path=output_path)
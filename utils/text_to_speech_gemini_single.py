@@ -1,10 +1,15 @@
-import requests
-import base64
-import wave
+import asyncio
 import os
 
+from .artifact_cache import get_artifact_cache, make_cache_key
+from .http_client import api_url, gemini_headers, run_sync
+from .inline_data_stream import stream_inline_data_to_wav_async, stream_segments_to_wav_async
+from .single_flight import get_single_flight, share_file_async
+from .tts_stream import PCMStream
+from .tts_text import split_text_for_tts
 
-def gemini_tts(
+
+async def gemini_tts_async(
     api_key: str,
     text: str,
     model: str = "gemini-2.5-flash-preview-tts",
@@ -17,7 +22,7 @@ def gemini_tts(
 ):
     """
     Hàm gọi API Text-to-Speech của Gemini (AI Thực Chiến)
-    và lưu kết quả thành file .wav có thể nghe được.
+    và lưu kết quả thành file .wav có thể nghe được (bản async).
 
     Parameters
     ----------
@@ -42,12 +47,164 @@ def gemini_tts(
         File âm thanh đầu ra (.wav)
     """
 
+    payload = _build_payload(text, voice_name, style)
+    url = api_url(f"/gemini/v1beta/models/{model}:generateContent")
+
+    cache_key = make_cache_key("gemini_tts", model, text, {
+        "voice_name": voice_name, "style": style, "sample_rate": sample_rate,
+        "channels": channels, "sample_width": sample_width,
+    })
+
+    # Dùng lại kết quả cũ nếu đã sinh cùng văn bản với cùng tham số
+    cache = get_artifact_cache()
+    if cache and await asyncio.to_thread(cache.get_to_file, cache_key, output_path):
+        print(f"♻️ Lấy từ cache: {output_path}")
+        return output_path
+
+    async def synthesize():
+        # Gọi API; âm thanh base64 được giải mã từng đoạn và ghi thẳng vào WAV (PCM 16-bit, 24kHz)
+        # ngay khi body đang về, không giữ cả phản hồi trong bộ nhớ
+        await stream_inline_data_to_wav_async(url, gemini_headers(api_key), payload, output_path,
+                                              channels, sample_width, sample_rate)
+        if cache:
+            await asyncio.to_thread(cache.put_file, cache_key, output_path)
+        return output_path
+
+    # Các lời gọi giống hệt nhau đang chạy cùng lúc chỉ gửi một request; file kết quả được chép sang
+    produced = await get_single_flight().do_async(cache_key, synthesize, kind="gemini_tts")
+    await share_file_async(produced, output_path)
+
+    print(f"✅ File âm thanh đã lưu tại: {output_path}")
+    print(f"🎤 Giọng: {voice_name} | Phong cách: {style or 'Mặc định'} | Tần số: {sample_rate}Hz")
+
+    return output_path
+
+
+def gemini_tts(
+    api_key: str,
+    text: str,
+    model: str = "gemini-2.5-flash-preview-tts",
+    voice_name: str = "Kore",
+    sample_rate: int = 24000,
+    channels: int = 1,
+    sample_width: int = 2,
+    style: str | None = None,
+    output_path: str = "output.wav"
+):
+    """Bản đồng bộ của gemini_tts_async() (cùng tham số)."""
+    return run_sync(gemini_tts_async(
+        api_key, text, model=model, voice_name=voice_name, sample_rate=sample_rate,
+        channels=channels, sample_width=sample_width, style=style, output_path=output_path
+    ))
+
+
+def gemini_tts_stream(
+    api_key: str,
+    text: str,
+    model: str = "gemini-2.5-flash-preview-tts",
+    voice_name: str = "Kore",
+    sample_rate: int = 24000,
+    channels: int = 1,
+    sample_width: int = 2,
+    style: str | None = None,
+    output_path: str | None = None
+) -> PCMStream:
+    """
+    Như gemini_tts_async() nhưng dùng streamGenerateContent: trả về PCMStream
+    yield từng đoạn PCM ngay khi nhận được (`for` hoặc `async for`), xem
+    utils/tts_stream.py. Request chỉ được gửi khi bắt đầu duyệt stream.
+
+    output_path : str | None
+        Nếu có, PCM được ghi dần vào file WAV này trong lúc duyệt.
+    """
+    url = api_url(f"/gemini/v1beta/models/{model}:streamGenerateContent?alt=sse")
+    return PCMStream(url, gemini_headers(api_key), _build_payload(text, voice_name, style), output_path,
+                     channels, sample_width, sample_rate)
+
+
+async def gemini_tts_long_async(
+    api_key: str,
+    text: str,
+    model: str = "gemini-2.5-flash-preview-tts",
+    voice_name: str = "Kore",
+    sample_rate: int = 24000,
+    channels: int = 1,
+    sample_width: int = 2,
+    style: str | None = None,
+    output_path: str = "output.wav",
+    max_chars: int = 1500,
+    max_workers: int = 4,
+    max_retries: int = 3,
+):
+    """
+    Đọc văn bản dài: chia theo đoạn văn/câu, gọi TTS song song cho từng đoạn
+    và ghi PCM của từng đoạn vào cùng một file WAV theo đúng thứ tự ngay khi
+    đoạn đó (và mọi đoạn trước nó) đã xong.
+
+    Các tham số giống gemini_tts_async(), thêm:
+
+    max_chars : int
+        Độ dài tối đa (ký tự) của mỗi đoạn gửi lên API.
+    max_workers : int
+        Số request TTS chạy đồng thời.
+    max_retries : int
+        Số lần thử lại cho mỗi đoạn bị lỗi trước khi bỏ cả file.
+
+    Cùng giọng và cùng style được áp dụng cho mọi đoạn. Nếu bật artifact cache,
+    mỗi đoạn được cache riêng nên khi sửa kịch bản chỉ các đoạn thay đổi bị đọc lại;
+    các đoạn giống hệt nhau đang được đọc cùng lúc chỉ gửi một request.
+    """
+    chunks = split_text_for_tts(text, max_chars)
+    if not chunks:
+        raise ValueError("Văn bản rỗng, không có gì để đọc.")
+
+    url = api_url(f"/gemini/v1beta/models/{model}:generateContent")
+    payloads = [_build_payload(chunk, voice_name, style) for chunk in chunks]
+    params = {
+        "voice_name": voice_name, "style": style, "sample_rate": sample_rate,
+        "channels": channels, "sample_width": sample_width,
+    }
+    segment_keys = [make_cache_key("gemini_tts_pcm", model, chunk, params) for chunk in chunks]
+
+    stats = await stream_segments_to_wav_async(
+        url, gemini_headers(api_key), payloads, output_path, channels, sample_width, sample_rate,
+        segment_keys=segment_keys, max_workers=max_workers, max_retries=max_retries,
+    )
+
+    print(f"✅ File âm thanh đã lưu tại: {output_path} ({len(chunks)} đoạn, {stats['elapsed_s']:.1f}s)")
+    print(f"🎤 Giọng: {voice_name} | Phong cách: {style or 'Mặc định'} | Tần số: {sample_rate}Hz")
+    return output_path
+
+
+def gemini_tts_long(
+    api_key: str,
+    text: str,
+    model: str = "gemini-2.5-flash-preview-tts",
+    voice_name: str = "Kore",
+    sample_rate: int = 24000,
+    channels: int = 1,
+    sample_width: int = 2,
+    style: str | None = None,
+    output_path: str = "output.wav",
+    max_chars: int = 1500,
+    max_workers: int = 4,
+    max_retries: int = 3,
+):
+    """Bản đồng bộ của gemini_tts_long_async() (cùng tham số)."""
+    return run_sync(gemini_tts_long_async(
+        api_key, text, model=model, voice_name=voice_name, sample_rate=sample_rate,
+        channels=channels, sample_width=sample_width, style=style, output_path=output_path,
+        max_chars=max_chars, max_workers=max_workers, max_retries=max_retries
+    ))
+
+
+def _build_payload(text: str, voice_name: str, style: str | None) -> dict:
     # Chuẩn bị payload text
     text_prompt = text
     if style:
         text_prompt = f"Make the voice sound {style}.\n{text}"
 
-    payload = {
+    return {
         "contents": [
             {"parts": [{"text": text_prompt}]}
         ],
@@ -61,49 +218,22 @@ def gemini_tts(
         }
     }
 
-    url = f"https://api.thucchien.ai/gemini/v1beta/models/{model}:generateContent"
-    headers = {
-        "x-goog-api-key": api_key,
-        "Content-Type": "application/json"
-    }
-
-    # Gọi API
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
-    data = response.json()
-
-    # Giải mã âm thanh base64
-    audio_base64 = data["candidates"][0]["content"]["parts"][0]["inlineData"]["data"]
-    audio_bytes = base64.b64decode(audio_base64)
-
-    # Lưu thành WAV (PCM 16-bit, 24kHz)
-    with wave.open(output_path, "wb") as wf:
-        wf.setnchannels(channels)
-        wf.setsampwidth(sample_width)
-        wf.setframerate(sample_rate)
-        wf.writeframes(audio_bytes)
-
-    print(f"✅ File âm thanh đã lưu tại: {output_path}")
-    print(f"🎤 Giọng: {voice_name} | Phong cách: {style or 'Mặc định'} | Tần số: {sample_rate}Hz")
-
-    return output_path
-
-
 
-print("======= start ======")
-# --- Ví dụ sử dụng 1 dọng ---
-AI_API_KEY = os.getenv("API_KEY", "sk-1234") # Thay bằng API key của bạn
+if __name__ == "__main__":
+    print("======= start ======")
+    # --- Ví dụ sử dụng 1 dọng ---
+    AI_API_KEY = os.getenv("API_KEY", "sk-1234") # Thay bằng API key của bạn
 
-prompt = """
+    prompt = """
     Chúc bạn một ngày thật vui vẻ!
 """
 
-gemini_tts(
-    api_key=AI_API_KEY, 
-    text=prompt, 
-    model= "gemini-2.5-flash-preview-tts", 
-    voice_name="Kore", 
-    style="cheerful",
-    output_path="logs/single_speech.wav"
-)
-print("======= end ======")
\ No newline at end of file
+    gemini_tts(
+        api_key=AI_API_KEY, 
+        text=prompt, 
+        model= "gemini-2.5-flash-preview-tts", 
+        voice_name="Kore", 
+        style="cheerful",
+        output_path="logs/single_speech.wav"
+    )
+    print("======= end ======")
@@ -0,0 +1,231 @@
+"""
+TTS dạng stream qua `:streamGenerateContent?alt=sse` của Gemini.
+
+generateContent chỉ trả về âm thanh khi cả đoạn đã được sinh xong, nên với
+một đoạn văn dài người nghe phải chờ toàn bộ thời gian sinh trước khi nghe
+được âm thanh đầu tiên. Biến thể stream trả về nhiều sự kiện SSE, mỗi sự kiện
+chứa một đoạn PCM (inlineData) ngay khi model sinh ra. PCMStream:
+- yield từng đoạn PCM theo thứ tự nhận được, dùng được với `async for` (trong
+  event loop) lẫn `for` (code đồng bộ, chạy trên event loop nền dùng chung);
+- tùy chọn ghi dần vào file WAV (header được cập nhật độ dài khi đóng file;
+  file dở dang bị xóa nếu stream lỗi hoặc bị dừng giữa chừng);
+- đo thời gian tới đoạn PCM đầu tiên (first_chunk_s), gửi pha "first_chunk"
+  cho instrumentation và cộng vào tts_stream_metrics().
+
+    from utils.text_to_speech_gemini_single import gemini_tts_stream
+    stream = gemini_tts_stream(api_key, "Xin chào", output_path="logs/hello.wav")
+    for pcm in stream:
+        player.write(pcm)
+    print(stream.first_chunk_s, stream.audio_s)
+
+Stream không dùng artifact cache và single-flight (mỗi lần duyệt là một request).
+"""
+
+import asyncio
+import base64
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Optional
+
+from .audio_io import open_pcm_wav
+from .http_client import get_async_http_client, iterate_sync
+from .inline_data_stream import InlineDataNotFound
+from .instrumentation import clock, model_from_url, record_phase
+
+
+_PREVIEW_CHARS = 4096
+_SAMPLES_KEPT = 1024  # số mẫu first_chunk_s giữ lại để tính phân vị
+
+
+class TTSStreamError(RuntimeError):
+    """Server gửi sự kiện lỗi giữa stream (sau khi đã trả HTTP 200)."""
+
+    def __init__(self, error):
+        super().__init__(f"Lỗi giữa stream TTS: {json.dumps(error, ensure_ascii=False)[:_PREVIEW_CHARS]}")
+        self.error = error
+
+
+class PCMStream:
+    """
+    Các đoạn PCM của một request TTS dạng stream, theo thứ tự nhận được.
+
+    Mỗi stream chỉ duyệt được một lần. Sau khi duyệt xong: first_chunk_s (giây
+    từ lúc gửi request tới đoạn PCM đầu tiên), elapsed_s, audio_bytes, audio_s.
+    """
+
+    def __init__(self, url: str, headers: dict, payload: dict, output_path: Optional[str] = None,
+                 channels: int = 1, sample_width: int = 2, sample_rate: int = 24000):
+        self.url = url
+        self.headers = headers
+        self.payload = payload
+        self.output_path = output_path
+        self.channels = channels
+        self.sample_width = sample_width
+        self.sample_rate = sample_rate
+        self.first_chunk_s: Optional[float] = None
+        self.elapsed_s: Optional[float] = None
+        self.audio_bytes = 0
+        self._agen = None
+
+    @property
+    def audio_s(self) -> float:
+        return self.audio_bytes / (self.channels * self.sample_width * self.sample_rate)
+
+    def __aiter__(self) -> AsyncIterator[bytes]:
+        if self._agen is not None:
+            raise RuntimeError("PCMStream chỉ duyệt được một lần")
+        self._agen = self._iterate()
+        return self._agen
+
+    def __iter__(self):
+        return iterate_sync(self.__aiter__())
+
+    async def aclose(self) -> None:
+        """Dừng stream giữa chừng khi dùng `async for` (đóng kết nối, xóa file WAV dở dang)."""
+        if self._agen is not None:
+            await self._agen.aclose()
+
+    async def read_async(self) -> bytes:
+        """Toàn bộ PCM (chờ stream kết thúc)."""
+        return b"".join([pcm async for pcm in self])
+
+    def read(self) -> bytes:
+        """Bản đồng bộ của read_async()."""
+        return b"".join(self)
+
+    def __repr__(self) -> str:
+        ttfc = f"{self.first_chunk_s:.2f}s" if self.first_chunk_s is not None else "-"
+        return f"PCMStream({model_from_url(self.url)}, đoạn đầu sau {ttfc}, {self.audio_s:.1f}s âm thanh)"
+
+    async def _iterate(self):
+        model = model_from_url(self.url)
+        started = time.perf_counter()
+        t0 = clock()
+        wf = (open_pcm_wav(self.output_path, self.channels, self.sample_width, self.sample_rate)
+              if self.output_path else None)
+        try:
+            async with get_async_http_client().stream("POST", self.url, headers=self.headers,
+                                                      json=self.payload) as response:
+                if response.is_error:
+                    await response.aread()
+                    response.raise_for_status()
+                preview = None
+                async for event in _events(response):
+                    if preview is None:
+                        preview = json.dumps(event, ensure_ascii=False)[:_PREVIEW_CHARS]
+                    if "error" in event:
+                        raise TTSStreamError(event["error"])
+                    t = clock()
+                    pcm = _pcm_from_event(event)
+                    if not pcm:
+                        continue
+                    record_phase("decode", "tts_stream", t, len(pcm), model)
+                    if self.first_chunk_s is None:
+                        self.first_chunk_s = time.perf_counter() - started
+                        record_phase("first_chunk", "tts_stream", t0, model=model)
+                    if wf is not None:
+                        wf.writeframesraw(pcm)
+                    self.audio_bytes += len(pcm)
+                    yield pcm
+            if not self.audio_bytes:
+                raise InlineDataNotFound(preview or "")
+        except BaseException as e:
+            # Người dùng dừng giữa chừng (break/aclose/hủy task) không tính là lỗi
+            _metrics.count("cancelled" if isinstance(e, (GeneratorExit, asyncio.CancelledError)) else "failures")
+            if wf is not None:
+                wf.close()
+                _remove_quietly(self.output_path)
+            raise
+        if wf is not None:
+            wf.close()
+        self.elapsed_s = time.perf_counter() - started
+        _metrics.record(self)
+
+
+async def _events(response):
+    """Các sự kiện JSON của phản hồi: SSE (`data: {...}`), hoặc mảng JSON nếu proxy bỏ qua alt=sse."""
+    if not response.headers.get("content-type", "").startswith("text/event-stream"):
+        body = json.loads(await response.aread())
+        for event in body if isinstance(body, list) else [body]:
+            yield event
+        return
+    data = []
+    async for line in response.aiter_lines():
+        if line.startswith("data:"):
+            data.append(line[6:] if line.startswith("data: ") else line[5:])
+        elif not line and data:
+            yield json.loads("\n".join(data))
+            data = []
+    if data:
+        yield json.loads("\n".join(data))
+
+
+def _pcm_from_event(event: dict) -> bytes:
+    chunks = []
+    for candidate in event.get("candidates") or []:
+        for part in (candidate.get("content") or {}).get("parts") or []:
+            inline = part.get("inlineData") or part.get("inline_data")
+            if inline and inline.get("data"):
+                chunks.append(base64.b64decode(inline["data"]))
+        break  # chỉ lấy ứng viên đầu tiên, như generateContent
+    return chunks[0] if len(chunks) == 1 else b"".join(chunks)
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class _StreamMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._first_chunk = deque(maxlen=_SAMPLES_KEPT)
+        self._counts = dict.fromkeys(("streams", "failures", "cancelled", "audio_bytes"), 0)
+        self._audio_s = 0.0
+
+    def record(self, stream: PCMStream) -> None:
+        with self._lock:
+            self._counts["streams"] += 1
+            self._counts["audio_bytes"] += stream.audio_bytes
+            self._audio_s += stream.audio_s
+            self._first_chunk.append(stream.first_chunk_s)
+
+    def count(self, name: str) -> None:
+        with self._lock:
+            self._counts[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            samples = sorted(self._first_chunk)
+            result = {**self._counts, "audio_s": round(self._audio_s, 3)}
+        for q in (50, 95):
+            result[f"first_chunk_p{q}_s"] = (samples[min(len(samples) - 1, len(samples) * q // 100)]
+                                             if samples else None)
+        return result
+
+    def reset(self) -> None:
+        with self._lock:
+            self._first_chunk.clear()
+            self._counts = dict.fromkeys(self._counts, 0)
+            self._audio_s = 0.0
+
+
+_metrics = _StreamMetrics()
+
+
+def tts_stream_metrics() -> dict:
+    """
+    streams/failures/cancelled: số stream đã xong/bị lỗi/bị dừng giữa chừng; audio_bytes, audio_s: tổng PCM
+    đã nhận; first_chunk_p50_s/p95_s: phân vị thời gian tới đoạn PCM đầu tiên
+    (trên tối đa 1024 stream gần nhất).
+    """
+    return _metrics.snapshot()
+
+
+def reset_tts_stream_metrics() -> None:
+    _metrics.reset()
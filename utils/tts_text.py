@@ -0,0 +1,127 @@
+"""
+Xử lý văn bản đầu vào cho các module TTS.
+"""
+
+import re
+from typing import List, Tuple
+
+
+# Kết thúc câu: . ! ? … (có thể kèm dấu đóng ngoặc/nháy, được giữ lại trong câu) rồi tới khoảng trắng
+_SENTENCE_END = re.compile(r'(?<=[.!?…])(["\'”’)\]]*)\s+')
+_PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+def split_text_for_tts(text: str, max_chars: int = 1500) -> List[str]:
+    """
+    Chia văn bản dài thành các đoạn <= max_chars ký tự để đọc song song.
+
+    Ưu tiên cắt ở ranh giới đoạn văn, sau đó ở ranh giới câu; một câu dài hơn
+    max_chars mới bị cắt ở dấu phẩy/khoảng trắng. Các câu ngắn liền nhau trong
+    cùng đoạn văn được gộp lại để giảm số request.
+    """
+    chunks: List[str] = []
+    current = ""
+
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+
+        # Cả đoạn văn vừa với phần còn lại của chunk hiện tại
+        if current and len(current) + 2 + len(paragraph) <= max_chars:
+            current = f"{current}\n\n{paragraph}"
+            continue
+        if current:
+            chunks.append(current)
+            current = ""
+
+        for sentence in _split_sentences(paragraph):
+            for piece in _split_long_sentence(sentence, max_chars):
+                if current and len(current) + 1 + len(piece) > max_chars:
+                    chunks.append(current)
+                    current = ""
+                current = f"{current} {piece}" if current else piece
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _split_sentences(paragraph: str) -> List[str]:
+    parts = _SENTENCE_END.split(paragraph)
+    # split() trả về xen kẽ câu và nhóm dấu đóng của nó: gắn dấu đóng lại vào cuối câu
+    return [sentence + closing for sentence, closing in zip(parts[::2], parts[1::2] + [""])]
+
+
+def _split_long_sentence(sentence: str, max_chars: int) -> List[str]:
+    if len(sentence) <= max_chars:
+        return [sentence]
+
+    pieces = []
+    while len(sentence) > max_chars:
+        window = sentence[:max_chars]
+        cut = max(window.rfind(", "), window.rfind("; "), window.rfind(": "))
+        if cut <= 0:
+            cut = window.rfind(" ")
+        if cut <= 0:
+            cut = max_chars - 1
+        pieces.append(sentence[:cut + 1].strip())
+        sentence = sentence[cut + 1:].strip()
+    if sentence:
+        pieces.append(sentence)
+    return pieces
+
+
+def parse_dialogue(text: str, speakers: List[str]) -> List[Tuple[str, str]]:
+    """
+    Tách kịch bản hội thoại thành các lượt nói (speaker, lời thoại).
+
+    Một lượt bắt đầu ở dòng có dạng "**Tên:** ..." hoặc "Tên: ..." với Tên nằm
+    trong speakers; các dòng tiếp theo không mở lượt mới được nối vào lượt hiện
+    tại. Phần trước lượt đầu tiên (tiêu đề, danh sách nhân vật dạng
+    "*   **Tên:** ...") được coi là phần giới thiệu và bị bỏ qua.
+    """
+    names = "|".join(re.escape(name) for name in sorted(speakers, key=len, reverse=True))
+    turn_start = re.compile(rf'^(?:\*\*\s*({names})\s*:\s*\*\*|\*\*\s*({names})\s*\*\*\s*:|({names})\s*:)\s*')
+
+    turns: List[Tuple[str, str]] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        m = turn_start.match(line)
+        if m:
+            turns.append((m.group(1) or m.group(2) or m.group(3), line[m.end():]))
+        elif turns:
+            speaker, words = turns[-1]
+            turns[-1] = (speaker, f"{words} {line}".strip())
+    return [(speaker, words) for speaker, words in turns if words]
+
+
+def batch_dialogue_turns(turns: List[Tuple[str, str]], max_chars: int = 1500,
+                         max_speakers: int = 2) -> List[List[Tuple[str, str]]]:
+    """
+    Gộp các lượt nói liên tiếp thành từng lô để gửi trong một request.
+
+    Mỗi lô dài tối đa max_chars ký tự (tính cả "Tên: ") và có không quá
+    max_speakers người nói (multiSpeakerVoiceConfig của Gemini nhận đúng 2).
+    Một lượt dài hơn max_chars được cắt theo câu thành nhiều lượt của cùng
+    người nói.
+    """
+    batches: List[List[Tuple[str, str]]] = []
+    current: List[Tuple[str, str]] = []
+    size = 0
+
+    for speaker, words in turns:
+        for piece in split_text_for_tts(words, max(max_chars - len(speaker) - 2, 1)):
+            line_len = len(speaker) + 2 + len(piece) + 1
+            speakers = {s for s, _ in current} | {speaker}
+            if current and (size + line_len > max_chars or len(speakers) > max_speakers):
+                batches.append(current)
+                current, size = [], 0
+            current.append((speaker, piece))
+            size += line_len
+
+    if current:
+        batches.append(current)
+    return batches
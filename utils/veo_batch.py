@@ -0,0 +1,354 @@
+"""
+Batch scheduler for Veo video generation.
+
+VeoVideoGenerator.generate_and_download() runs one prompt from start to
+finish, so N videos take the sum of their generation times. The scheduler
+below submits many prompts (text-to-video or image-to-video) with bounded
+concurrency, polls every pending operation from a single loop ordered by
+each operation's next due time, and starts a download as soon as any
+operation finishes. Each operation's due times come from an AdaptivePoller
+(utils/polling.py), so polls are sparse until similar jobs usually finish,
+dense around that point, and jittered across jobs. A batch therefore takes roughly as long as its slowest
+job instead of the sum of all jobs.
+
+Example:
+    from utils.gen_video_async_from_btc import VeoVideoGenerator
+    from utils.veo_batch import VeoBatchScheduler, VeoJob
+
+    generator = VeoVideoGenerator(api_key=api_key, model="veo-3.0-generate-001")
+    jobs = [
+        VeoJob("Vietnamese flag flying in Ba Dinh Square", "assets/flag.mp4", params={"aspectRatio": "16:9"}),
+        VeoJob("Wedding dress fitting session", "assets/wedding.mp4", image_path="assets/quang_anh.jpeg"),
+    ]
+    VeoBatchScheduler(generator, max_in_flight=8).run(jobs)
+
+Every operation is recorded in the job journal (utils/job_journal.py). After a
+crash or restart, resume_jobs(generator) polls the unfinished operations and
+downloads the finished ones instead of generating them again.
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, List, Optional
+
+import httpx
+
+from .artifact_cache import get_artifact_cache
+from .gen_video_async_from_btc import VeoVideoGenerator
+from .http_client import run_sync
+from .job_journal import JobJournal, get_job_journal
+from .polling import AdaptivePoller, register_operation
+
+
+@dataclass
+class VeoJob:
+    """One video to generate, plus its progress as the scheduler runs it."""
+
+    prompt: str
+    output_path: Optional[str] = None
+    image_path: Optional[str] = None
+    params: dict = field(default_factory=dict)
+
+    # Filled in by the scheduler (operation_name / video_uri are preset for resumed jobs)
+    state: str = "queued"  # queued -> running -> downloading -> succeeded | failed
+    operation_name: Optional[str] = None
+    video_uri: Optional[str] = None
+    error: Optional[str] = None
+    polls: int = 0
+    cache_key: Optional[str] = None
+    submitted_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    poller: Optional[AdaptivePoller] = field(default=None, repr=False)
+
+
+class VeoBatchScheduler:
+    """Run many Veo jobs concurrently with one shared polling loop."""
+
+    def __init__(self, generator: VeoVideoGenerator, max_in_flight: int = 8,
+                 max_concurrent_downloads: int = 4, poll_interval: float = 10,
+                 max_poll_interval: float = 30, max_wait_time: float = 600,
+                 on_job_done: Optional[Callable[[VeoJob], None]] = None):
+        """
+        Args:
+            generator: Client used for submit/poll/download requests
+            max_in_flight: Maximum number of operations submitted but not yet finished
+            max_concurrent_downloads: Maximum number of downloads running at once
+            poll_interval: Delay before the first poll when there is no completion
+                history for the job's model/parameters yet (seconds)
+            max_poll_interval: Upper bound for the delay between polls of one operation (seconds)
+            max_wait_time: Give up on an operation after this many seconds
+            on_job_done: Optional callback invoked when a job succeeds or fails
+        """
+        self.generator = generator
+        self.max_in_flight = max_in_flight
+        self.max_concurrent_downloads = max_concurrent_downloads
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_wait_time = max_wait_time
+        self.on_job_done = on_job_done
+
+    async def run_async(self, jobs: Iterable[VeoJob]) -> List[VeoJob]:
+        """
+        Submit, poll and download every job.
+
+        Returns:
+            The same jobs, each ending in state "succeeded" or "failed"
+        """
+        jobs = list(jobs)
+        for job in jobs:
+            if job.output_path is None:
+                job.output_path = self.generator.default_output_filename(job.prompt)
+
+        # Pending polls ordered by due time: (due_at, seq, job)
+        self._due = []
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        self._download_slots = asyncio.Semaphore(self.max_concurrent_downloads)
+        self._downloads = set()
+
+        started = time.time()
+        print(f"🚀 Starting batch of {len(jobs)} videos (max {self.max_in_flight} in flight)")
+
+        submitters = [asyncio.create_task(self._submit(job)) for job in jobs]
+        poller = asyncio.create_task(self._poll_loop(submitters))
+        try:
+            await asyncio.gather(*submitters)
+            await poller
+            # New downloads are only started by the submitters and the poller, so this set is final now
+            await asyncio.gather(*self._downloads)
+        except BaseException:
+            for task in [*submitters, poller, *self._downloads]:
+                task.cancel()
+            raise
+
+        succeeded = sum(job.state == "succeeded" for job in jobs)
+        print(f"🏁 Batch finished: {succeeded}/{len(jobs)} succeeded in {time.time() - started:.1f}s")
+        return jobs
+
+    def run(self, jobs: Iterable[VeoJob]) -> List[VeoJob]:
+        """Blocking wrapper around run_async()."""
+        return run_sync(self.run_async(jobs))
+
+    async def _submit(self, job: VeoJob) -> None:
+        cache = get_artifact_cache()
+        if cache:
+            try:
+                job.cache_key = await asyncio.to_thread(
+                    self.generator.video_cache_key, job.prompt, job.image_path, job.params
+                )
+            except OSError:
+                job.cache_key = None  # missing input image: reported below on submission
+            if job.cache_key and await asyncio.to_thread(cache.get_to_file, job.cache_key, job.output_path):
+                print(f"♻️ Reused cached video: {job.output_path}")
+                if job.operation_name:
+                    self._journal_succeeded(job)
+                job.state = "succeeded"
+                job.finished_at = time.time()
+                if self.on_job_done:
+                    self.on_job_done(job)
+                self._wakeup.set()
+                return
+
+        await self._slots.acquire()
+        if job.operation_name is None:
+            try:
+                job.operation_name = await self.generator.generate_video_async(
+                    job.prompt, image_path=job.image_path, **job.params
+                )
+            except OSError as e:  # e.g. missing input image
+                print(f"❌ Could not read input for '{job.prompt[:50]}': {e}")
+
+            if not job.operation_name:
+                self._finish(job, error="submission failed")
+                self._wakeup.set()  # let the poll loop re-check whether all submissions are done
+                return
+
+        journal = get_job_journal()
+        if journal:
+            journal.update(job.operation_name, output_path=job.output_path)
+        job.state = "running"
+        job.submitted_at = time.time()
+        if job.video_uri:
+            # Resumed job whose video was already generated: only the download is left
+            self._start_download(job)
+            self._wakeup.set()
+            return
+        job.poller = AdaptivePoller.for_operation(
+            job.operation_name, first_interval=self.poll_interval, max_interval=self.max_poll_interval
+        )
+        self._schedule(job, job.poller.next_delay())
+
+    def _schedule(self, job: VeoJob, delay: float) -> None:
+        heapq.heappush(self._due, (time.time() + delay, next(self._seq), job))
+        self._wakeup.set()
+
+    async def _poll_loop(self, submitters: List[asyncio.Task]) -> None:
+        while self._due or not all(task.done() for task in submitters):
+            if not self._due:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._due[0][0] - time.time()
+            if delay > 0:
+                # Sleep until the earliest due poll, but wake up early if a new job arrives
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = time.time()
+            batch = []
+            while self._due and self._due[0][0] <= now:
+                batch.append(heapq.heappop(self._due)[2])
+
+            # Every due operation is checked in parallel over the shared connection pool
+            results = await asyncio.gather(
+                *(self.generator.poll_operation_async(job.operation_name) for job in batch),
+                return_exceptions=True,
+            )
+            for job, result in zip(batch, results):
+                self._handle_poll(job, result)
+
+    def _handle_poll(self, job: VeoJob, result) -> None:
+        job.polls += 1
+        elapsed = time.time() - job.submitted_at
+
+        if isinstance(result, Exception):
+            # HTTP errors and bad bodies (e.g. truncated JSON) only affect this job: poll it again later
+            print(f"⚠️ Error polling {job.operation_name}: {result!r}")
+        elif isinstance(result, BaseException):
+            raise result  # cancellation
+        elif "error" in result:
+            self._finish(job, error=str(result["error"]))
+            return
+        else:
+            job.poller.observe(bool(result.get("done")))
+
+        if isinstance(result, httpx.HTTPStatusError) and result.response.status_code == 404:
+            # Unknown or expired operation (e.g. a journaled job resumed days later)
+            self._finish(job, error="operation not found")
+            return
+
+        if not isinstance(result, BaseException) and result.get("done"):
+            job.video_uri = self.generator.extract_video_uri(result)
+            if not job.video_uri:
+                self._finish(job, error="finished without a video URI")
+                return
+            print(f"🎉 Operation finished after {elapsed:.0f}s: {job.operation_name}")
+            journal = get_job_journal()
+            if journal:
+                journal.mark_ready(job.operation_name, job.video_uri)
+            self._start_download(job)
+            return
+
+        if elapsed > self.max_wait_time:
+            # The operation may still finish: keep it resumable in the journal
+            self._finish(job, error=f"timeout after {self.max_wait_time}s", final=False)
+            return
+        self._schedule(job, job.poller.next_delay())
+
+    def _start_download(self, job: VeoJob) -> None:
+        job.state = "downloading"
+        self._slots.release()
+        self._downloads.add(asyncio.create_task(self._download(job)))
+
+    async def _download(self, job: VeoJob) -> None:
+        async with self._download_slots:
+            ok = await self.generator.download_video_async(job.video_uri, job.output_path)
+        if ok:
+            self._journal_succeeded(job)
+            cache = get_artifact_cache()
+            if cache and job.cache_key:
+                await asyncio.to_thread(cache.put_file, job.cache_key, job.output_path)
+            job.state = "succeeded"
+            job.finished_at = time.time()
+            if self.on_job_done:
+                self.on_job_done(job)
+        else:
+            # The journal keeps the job "ready", so resume_jobs() retries just the download
+            self._finish(job, error="download failed", release_slot=False, final=False)
+
+    @staticmethod
+    def _journal_succeeded(job: VeoJob) -> None:
+        journal = get_job_journal()
+        if journal:
+            journal.mark_succeeded(job.operation_name, job.output_path)
+
+    def _finish(self, job: VeoJob, error: str, release_slot: bool = True, final: bool = True) -> None:
+        """Mark a job failed; final=False leaves it unfinished in the journal so it can be resumed."""
+        print(f"❌ Job failed ({error}): '{job.prompt[:50]}'")
+        journal = get_job_journal()
+        if journal and job.operation_name and final:
+            journal.mark_failed(job.operation_name, error)
+        job.state = "failed"
+        job.error = error
+        job.finished_at = time.time()
+        if release_slot:
+            self._slots.release()
+        if self.on_job_done:
+            self.on_job_done(job)
+
+
+async def resume_jobs_async(generator: VeoVideoGenerator, journal: Optional[JobJournal] = None,
+                            **scheduler_options) -> List[VeoJob]:
+    """
+    Resume every unfinished operation recorded in the job journal.
+
+    Operations still generating are polled again; finished ones whose download
+    never completed are downloaded (continuing from their .part file). Nothing
+    is resubmitted. Jobs without a recorded output path get a default filename.
+    Jobs another live process is following, and jobs older than the operation
+    TTL (Veo has dropped them), are skipped; the rest are claimed for the
+    duration of the call.
+
+    Args:
+        generator: Client used for poll/download requests (its base_url and api_key)
+        journal: Journal to read (default: get_job_journal())
+        **scheduler_options: Passed to VeoBatchScheduler
+
+    Returns:
+        The resumed jobs, each ending in state "succeeded" or "failed"
+    """
+    journal = journal if journal is not None else get_job_journal()
+    if journal is None:
+        return []
+
+    # Jobs are grouped per model so artifact-cache keys are built with the right model
+    by_model = {}
+    claimed = journal.claim_in_flight()
+    for entry in claimed:
+        register_operation(entry["operation_name"], entry["model"], entry["params"],
+                           has_image=bool(entry["image_path"]), submitted_at=entry["created_at"])
+        by_model.setdefault(entry["model"], []).append(VeoJob(
+            entry["prompt"], entry["output_path"], image_path=entry["image_path"], params=entry["params"],
+            operation_name=entry["operation_name"], video_uri=entry["video_uri"],
+        ))
+    if not by_model:
+        print("✅ No unfinished jobs in the journal")
+        return []
+
+    try:
+        results = await asyncio.gather(*(
+            VeoBatchScheduler(
+                VeoVideoGenerator(base_url=generator.base_url, api_key=generator.api_key, model=model),
+                **scheduler_options,
+            ).run_async(jobs)
+            for model, jobs in by_model.items()
+        ))
+    finally:
+        for entry in claimed:
+            journal.release(entry["operation_name"])
+    return [job for jobs in results for job in jobs]
+
+
+def resume_jobs(generator: VeoVideoGenerator, journal: Optional[JobJournal] = None,
+                **scheduler_options) -> List[VeoJob]:
+    """Blocking wrapper around resume_jobs_async()."""
+    return run_sync(resume_jobs_async(generator, journal, **scheduler_options))
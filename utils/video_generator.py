@@ -1,56 +1,75 @@
-import requests
-import base64
+import asyncio
+import json
 import time
 import re
 import os
 
+from .downloader import download_file_async
+from .http_client import api_url, get_async_http_client, gemini_headers, run_sync
+from .image_prep import prepare_input_image_async, video_target
+from .job_journal import get_job_journal
+from .polling import AdaptivePoller, register_operation
 
-BASE_URL = "https://api.thucchien.ai/gemini/v1beta"
-DOWNLOAD_URL = "https://api.thucchien.ai/gemini/download/v1beta/files"
 
-def start_video_generation(prompt, model, api_key, **params):
+def _base_url():
+    return api_url("/gemini/v1beta")
+
+
+def _download_url():
+    return api_url("/gemini/download/v1beta/files")
+
+
+async def start_video_generation_async(prompt, model, api_key, **params):
     """
     Bắt đầu tạo video bất đồng bộ.
     Returns: operation_name
     """
-    url = f"{BASE_URL}/models/{model}:predictLongRunning"
-    headers = {
-        "Content-Type": "application/json",
-        "x-goog-api-key": api_key
-    }
+    url = f"{_base_url()}/models/{model}:predictLongRunning"
     payload = {
         "instances": [{"prompt": prompt}],
         "parameters": params
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = await get_async_http_client().post(url, headers=gemini_headers(api_key), json=payload)
     response.raise_for_status()
     data = response.json()
     operation_name = data.get("name")
+    if operation_name:
+        register_operation(operation_name, model, params)
+        _record_submission(operation_name, model, prompt, params)
     print(f"✅ Tạo tác vụ thành công, operation_name = {operation_name}")
     return operation_name
 
 
-def check_video_status(operation_name, api_key, wait=True, interval=10, timeout=300):
+async def check_video_status_async(operation_name, api_key, wait=True, interval=None, timeout=300):
     """
     Kiểm tra trạng thái tạo video.
-    Nếu wait=True, sẽ poll cho đến khi hoàn thành hoặc timeout.
+    Nếu wait=True, sẽ poll cho đến khi hoàn thành hoặc timeout
+    (chờ bằng asyncio.sleep nên không chặn các tác vụ khác trên cùng event loop).
+    interval=None: lịch poll thích ứng theo thời gian hoàn thành của các tác vụ
+    cùng loại trước đó (xem utils/polling.py); truyền số giây để poll đều như cũ.
     Returns: video_id hoặc None nếu chưa xong.
     """
-    headers = {"x-goog-api-key": api_key}
-    url = f"{BASE_URL}/{operation_name}"
+    headers = gemini_headers(api_key)
+    url = f"{_base_url()}/{operation_name}"
+    client = get_async_http_client()
     start_time = time.time()
+    poller = AdaptivePoller.for_operation(operation_name)
+    journal = get_job_journal()
 
     while True:
-        response = requests.get(url, headers=headers)
+        response = await client.get(url, headers=headers)
         response.raise_for_status()
         data = response.json()
         done = data.get("done", False)
+        poller.observe(done)
 
         if done:
             try:
                 uri = data["response"]["generateVideoResponse"]["generatedSamples"][0]["video"]["uri"]
                 print(f"🎬 Video sẵn sàng: {uri}")
+                if journal:
+                    journal.mark_ready(operation_name, uri)
                 # Trích video_id từ URI Google API
                 match = re.search(r'/files/([^:/]+)', uri)
                 video_id = match.group(1) if match else None
@@ -58,6 +77,8 @@ def check_video_status(operation_name, api_key, wait=True, interval=10, timeout=
                 return video_id
             except Exception:
                 print("⚠️ Không tìm thấy URI trong response.")
+                if journal:
+                    journal.mark_failed(operation_name, json.dumps(data.get("error") or data, ensure_ascii=False))
                 return None
 
         if not wait:
@@ -68,98 +89,119 @@ def check_video_status(operation_name, api_key, wait=True, interval=10, timeout=
             print("⏰ Hết thời gian chờ, tác vụ chưa hoàn tất.")
             return None
 
-        print(f"⏳ Chưa xong... chờ {interval}s rồi kiểm tra lại.")
-        time.sleep(interval)
+        delay = interval if interval is not None else poller.next_delay()
+        print(f"⏳ Chưa xong... chờ {delay:.0f}s rồi kiểm tra lại.")
+        await asyncio.sleep(delay)
 
 
-def download_video(video_id, api_key, output_path="output.mp4"):
+async def download_video_async(video_id, api_key, output_path="output.mp4"):
     """
-    Tải video đã sinh về máy.
+    Tải video đã sinh về máy (nhiều đoạn song song, tải tiếp được nếu bị ngắt).
     """
-    headers = {"x-goog-api-key": api_key}
-    url = f"{DOWNLOAD_URL}/{video_id}:download?alt=media"
+    url = f"{_download_url()}/{video_id}:download?alt=media"
 
-    with requests.get(url, headers=headers, stream=True) as r:
-        r.raise_for_status()
-        with open(output_path, "wb") as f:
-            for chunk in r.iter_content(chunk_size=8192):
-                f.write(chunk)
+    await download_file_async(url, output_path, headers=gemini_headers(api_key))
 
+    journal = get_job_journal()
+    job = journal.find_by_video_id(video_id) if journal else None
+    if job:
+        journal.mark_succeeded(job["operation_name"], output_path)
     print(f"💾 Video đã tải về: {output_path}")
     return output_path
 
 
-def start_video_with_image(prompt, image_path, model, api_key, **params):
+async def start_video_with_image_async(prompt, image_path, model, api_key, **params):
     """
     Bắt đầu tạo video từ prompt + hình ảnh (image-to-video).
-    Hình ảnh sẽ được mã hóa base64 và gửi kèm.
+    image_path là đường dẫn file hoặc ImageData (ví dụ ảnh vừa sinh, chưa ghi đĩa).
+    Hình ảnh được thu nhỏ về khung của video (resolution/aspectRatio trong params),
+    mã hóa base64 và gửi kèm.
     """
-    if not os.path.exists(image_path):
+    if isinstance(image_path, str) and not os.path.exists(image_path):
         raise FileNotFoundError(f"Không tìm thấy ảnh: {image_path}")
 
-    # Đọc file và mã hóa base64
-    with open(image_path, "rb") as img_file:
-        img_base64 = base64.b64encode(img_file.read()).decode("utf-8")
-
-    # Xác định mime type
-    ext = os.path.splitext(image_path)[1].lower()
-    mime = "image/png" if ext == ".png" else "image/jpeg"
-
-    url = f"{BASE_URL}/models/{model}:predictLongRunning"
-    headers = {
-        "Content-Type": "application/json",
-        "x-goog-api-key": api_key
-    }
+    image = await prepare_input_image_async(image_path, video_target(params))
 
+    url = f"{_base_url()}/models/{model}:predictLongRunning"
     payload = {
         "instances": [{
             "prompt": prompt,
             "image": {
-                "bytesBase64Encoded": img_base64,
-                "mimeType": mime
+                "bytesBase64Encoded": image.base64(),
+                "mimeType": image.mime_type
             }
         }],
         "parameters": params
     }
 
-    response = requests.post(url, headers=headers, json=payload)
+    response = await get_async_http_client().post(url, headers=gemini_headers(api_key), json=payload)
     response.raise_for_status()
     data = response.json()
     operation_name = data.get("name")
+    if operation_name:
+        register_operation(operation_name, model, params, has_image=True)
+        # Nhật ký chỉ lưu được đường dẫn; ảnh trong bộ nhớ được ghi là không có ảnh
+        _record_submission(operation_name, model, prompt, params, image_path if isinstance(image_path, str) else None)
     print(f"✅ Đã tạo tác vụ image-to-video, operation_name = {operation_name}")
     return operation_name
 
 
-# -------------------------
-# 🧪 Ví dụ sử dụng: text 2 video
+def _record_submission(operation_name, model, prompt, params, image_path=None):
+    # Ghi operation vào nhật ký để utils.veo_batch.resume_jobs() tiếp tục được nếu process chết
+    journal = get_job_journal()
+    if journal:
+        journal.record_submission(operation_name, model, prompt, params, image_path=image_path)
+
+
+# Các bản đồng bộ: lớp bọc mỏng quanh các hàm async ở trên (cùng tham số).
+
+def start_video_generation(prompt, model, api_key, **params):
+    return run_sync(start_video_generation_async(prompt, model, api_key, **params))
 
-API_KEY = os.getenv("API_KEY", "sk-1234")
-MODEL = "veo-3.0-generate-001"
-PROMPT = "Video of the Vietnamese flag flying in Ba Dinh Square"
 
-operation = start_video_generation(PROMPT, MODEL, API_KEY, aspectRatio="16:9", resolution="720p")
-video_id = check_video_status(operation, API_KEY, wait=True, interval=15, timeout=600)
-if video_id:
-    download_video(video_id, API_KEY, output_path="assets/video_test_1.mp4")
+def check_video_status(operation_name, api_key, wait=True, interval=None, timeout=300):
+    return run_sync(check_video_status_async(operation_name, api_key, wait=wait, interval=interval, timeout=timeout))
 
 
-# -------------------------
-# 🧪 Ví dụ sử dụng: image 2 video
+def download_video(video_id, api_key, output_path="output.mp4"):
+    return run_sync(download_video_async(video_id, api_key, output_path=output_path))
 
-API_KEY = os.getenv("API_KEY", "sk-1234")
-MODEL = "veo-3.0-generate-001"
-PROMPT = "Video of Quang and Anh's wedding dress fitting session"
-path_image = "assets/quang_anh.jpeg"
 
-operation = start_video_with_image(
-        prompt=PROMPT,
-        image_path=path_image,
-        model=MODEL,
-        api_key=API_KEY,
-        aspectRatio="16:9",
-        resolution="720p",
-        personGeneration="allow_adult"
-    )
-video_id = check_video_status(operation, API_KEY, wait=True, interval=15, timeout=600)
-if video_id:
-    download_video(video_id, API_KEY, output_path="assets/ba_dinh_video.mp4")
\ No newline at end of file
+def start_video_with_image(prompt, image_path, model, api_key, **params):
+    return run_sync(start_video_with_image_async(prompt, image_path, model, api_key, **params))
+
+
+if __name__ == "__main__":
+    # -------------------------
+    # 🧪 Ví dụ sử dụng: text 2 video
+
+    API_KEY = os.getenv("API_KEY", "sk-1234")
+    MODEL = "veo-3.0-generate-001"
+    PROMPT = "Video of the Vietnamese flag flying in Ba Dinh Square"
+
+    operation = start_video_generation(PROMPT, MODEL, API_KEY, aspectRatio="16:9", resolution="720p")
+    video_id = check_video_status(operation, API_KEY, wait=True, timeout=600)
+    if video_id:
+        download_video(video_id, API_KEY, output_path="assets/video_test_1.mp4")
+
+
+    # -------------------------
+    # 🧪 Ví dụ sử dụng: image 2 video
+
+    API_KEY = os.getenv("API_KEY", "sk-1234")
+    MODEL = "veo-3.0-generate-001"
+    PROMPT = "Video of Quang and Anh's wedding dress fitting session"
+    path_image = "assets/quang_anh.jpeg"
+
+    operation = start_video_with_image(
+            prompt=PROMPT,
+            image_path=path_image,
+            model=MODEL,
+            api_key=API_KEY,
+            aspectRatio="16:9",
+            resolution="720p",
+            personGeneration="allow_adult"
+        )
+    video_id = check_video_status(operation, API_KEY, wait=True, timeout=600)
+    if video_id:
+        download_video(video_id, API_KEY, output_path="assets/ba_dinh_video.mp4")